@@ -0,0 +1,32 @@
+# --- File: admin_auth.py ---
+
+import hmac
+from functools import wraps
+
+from flask import current_app, jsonify, request
+
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+
+
+def is_admin_request() -> bool:
+    """
+    Kiểm tra request có mang đúng admin token hay không.
+    Nếu ứng dụng không cấu hình ADMIN_TOKEN thì mọi chức năng quản trị đều bị tắt.
+    """
+    expected = current_app.config.get('ADMIN_TOKEN')
+    if not expected:
+        return False
+    provided = request.headers.get(ADMIN_TOKEN_HEADER) or request.args.get('admin_token') or ''
+    return hmac.compare_digest(provided.encode('utf-8'), expected.encode('utf-8'))
+
+
+def require_admin(view):
+    """Decorator cho các endpoint quản trị: trả về 403 nếu thiếu/sai admin token."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({"success": False, "error": "Yêu cầu quyền quản trị (admin token không hợp lệ)."}), 403
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -1,35 +1,63 @@
-from typing import Dict, List
+from typing import Any, Callable, Dict, List, Mapping, Optional
+import functools
 import json
-import traceback
+import logging
+import os
+import threading
+import time
 from urllib.parse import quote_plus
 
-from flask import Flask, request, jsonify
+_IMPORT_START = time.perf_counter()
+
+from flask import Flask, Response, current_app, request, jsonify
 from flask_cors import CORS
 from collections import deque
 
 # Import modules
+import calculation_index
+import fact_closure
+import forward_chaining
+import http_cache
+import jobs
+import kb_flat
+import kb_reload
+import kb_snapshot
+import knowledge_base
+import metrics
 import models
+import profiling
+import reaction_import
+import reaction_index
+import request_log
+import result_cache
+import response_view
+import sessions
+import startup
+import worker_pool
+import balancer
 from balancer import balance_equation
-from forward_chaining import run_forward_chaining
+from calculation_path import calculate_along_path
+from forward_chaining import run_forward_chaining, iter_forward_chaining, batch_key, run_forward_chaining_batch
 from identification import identify_chemicals
 from models import db, ReactionModel, ChemicalRuleModel
 
 # Import các hàm từ logic hóa học
 from chemistry_data import (
-    load_reactions_from_db, get_reaction_rules,
-    load_chemical_rules_from_db, get_chemical_rules,
-    execute_rule_expression, find_calculation_path,
-    get_molar_mass, load_elements_from_db,
+    execute_rule_expression, reload_knowledge_base, enable_change_tracking, keep_reaction_rules_in_memory,
     Compound
 )
-from reaction_path import find_reaction_path
+from reaction_path import find_reaction_path, iter_reaction_path
+from stoichiometry import calculate_stoichiometry
+from streaming import stream_events
+from metrics import stage
+from response_view import ResponseView, ViewError
+from task_context import TaskContext
+from worker_pool import PoolBusyError, TaskTimeoutError
 
-# Khởi tạo Flask App
-app = Flask(__name__)
-CORS(app)
+logger = logging.getLogger(__name__)
 
 # ======================================================================
-# CẤU HÌNH CSDL (Giữ nguyên)
+# CẤU HÌNH (đọc từ biến môi trường CHEM_*)
 # ======================================================================
 
 DB_USER = 'root'
@@ -37,85 +65,332 @@ DB_PASSWORD_ENCODED = quote_plus('June1996@')
 DB_HOST = '127.0.0.1'
 DB_NAME = 'chemistry'
 
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD_ENCODED}@{DB_HOST}/{DB_NAME}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Cách tải cơ sở tri thức khi tạo app (CHEM_KB_LOAD):
+# - 'background' (mặc định): luồng nền, app nhận request ngay (/readyz trả 503 tới khi tải xong)
+# - 'eager': tải xong rồi create_app mới trả về; lỗi được đẩy lên người gọi
+# - 'off': không tải (công cụ dòng lệnh chỉ cần CSDL, hoặc người gọi tự gọi start(app))
+KB_LOAD_BACKGROUND = 'background'
+KB_LOAD_EAGER = 'eager'
+KB_LOAD_OFF = 'off'
+KB_LOAD_MODES = (KB_LOAD_BACKGROUND, KB_LOAD_EAGER, KB_LOAD_OFF)
+
+
+def load_config(environ: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
+    """Cấu hình app từ biến môi trường (mặc định os.environ)."""
+    env = os.environ if environ is None else environ
+    config: Dict[str, Any] = {}
+
+    # CHEM_DATABASE_URL: dùng CSDL khác (vd: sqlite:////tmp/chem.db khi phát lại request log trên máy cục bộ)
+    config['SQLALCHEMY_DATABASE_URI'] = (env.get('CHEM_DATABASE_URL')
+                                         or f'mysql+pymysql://{DB_USER}:{DB_PASSWORD_ENCODED}@{DB_HOST}/{DB_NAME}')
+    config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    config['KB_LOAD'] = env.get('CHEM_KB_LOAD', KB_LOAD_BACKGROUND)
+
+    # Token quản trị (bật profile theo yêu cầu và các endpoint /api/admin/*). Để trống = tắt.
+    config['ADMIN_TOKEN'] = env.get('CHEM_ADMIN_TOKEN', '')
+
+    # Worker pool cho các engine nặng CPU: số worker, độ dài hàng đợi, deadline mỗi request (giây)
+    config['WORKER_MODE'] = env.get('CHEM_WORKER_MODE', worker_pool.MODE_PROCESS)
+    config['WORKER_COUNT'] = int(env.get('CHEM_WORKER_COUNT', os.cpu_count() or 2))
+    config['WORKER_QUEUE_LIMIT'] = int(env.get('CHEM_WORKER_QUEUE_LIMIT', 16))
+    config['REQUEST_DEADLINE_S'] = float(env.get('CHEM_REQUEST_DEADLINE_S', 10))
+
+    # Cache kết quả suy luận tiến (mỗi worker một cache): số mục tối đa (0 = tắt) và tổng kích thước
+    # (số phản ứng + số chất trong các kết quả được giữ)
+    config['RESULT_CACHE_ENTRIES'] = int(env.get('CHEM_RESULT_CACHE_ENTRIES', 4096))
+    config['RESULT_CACHE_SIZE'] = int(env.get('CHEM_RESULT_CACHE_SIZE', 1_000_000))
+
+    # Số phần tử tối đa trong một lời gọi /api/forward-chaining/batch
+    config['BATCH_MAX_ITEMS'] = int(env.get('CHEM_BATCH_MAX_ITEMS', 5000))
+
+    # Job bất đồng bộ (/api/jobs): deadline mỗi job, số job tối đa giữ trong bộ nhớ, TTL của kết quả (giây)
+    config['JOB_DEADLINE_S'] = float(env.get('CHEM_JOB_DEADLINE_S', 300))
+    config['JOB_MAX_JOBS'] = int(env.get('CHEM_JOB_MAX_JOBS', 1000))
+    config['JOB_RESULT_TTL_S'] = float(env.get('CHEM_JOB_RESULT_TTL_S', 600))
+
+    # Phiên suy luận tăng dần (/api/sessions): số phiên tối đa giữ trong bộ nhớ (loại phiên ít dùng nhất)
+    # và thời gian (giây) một phiên không được dùng trước khi bị xóa
+    config['SESSION_MAX'] = int(env.get('CHEM_SESSION_MAX', 1000))
+    config['SESSION_TTL_S'] = float(env.get('CHEM_SESSION_TTL_S', 1800))
+
+    # File snapshot cơ sở tri thức biên dịch sẵn (python kb_snapshot.py compile). Để trống = luôn đọc từ CSDL
+    config['KB_SNAPSHOT_PATH'] = env.get('CHEM_KB_SNAPSHOT_PATH', '')
+
+    # Bố cục cơ sở tri thức trong bộ nhớ: 'objects' (mặc định) hoặc 'flat' (mảng trong vùng mmap dùng chung
+    # giữa các worker). CHEM_KB_FLAT_PATH: giữ file phẳng ở đường dẫn cố định cho các tiến trình độc lập
+    config['KB_LAYOUT'] = env.get('CHEM_KB_LAYOUT', 'objects')
+    config['KB_FLAT_PATH'] = env.get('CHEM_KB_FLAT_PATH') or None
+
+    # Nguồn luật phản ứng cho engine: 'memory' (mặc định, chỉ mục chất -> luật trong snapshot) hoặc 'db'
+    # (truy vấn các bảng chuẩn hóa chemicals/reaction_reactants, cần chạy migrate_normalise.py trước)
+    config['RULE_SOURCE'] = env.get('CHEM_RULE_SOURCE', 'memory')
+
+    # Backend của các engine suy luận: 'agenda' (mặc định) hoặc 'matrix' (tính trước bao đóng bằng ma trận
+    # liên thuộc thưa để bỏ qua các luật không thể kích hoạt; cần numpy/scipy, nếu thiếu dùng bitset Python)
+    config['ENGINE_BACKEND'] = env.get('CHEM_ENGINE_BACKEND', 'agenda')
+
+    # Chu kỳ (giây) kiểm tra CSDL và tự tải lại cơ sở tri thức khi có thay đổi. 0 = tắt (chỉ tải lại qua /api/admin/reload)
+    config['KB_RELOAD_INTERVAL_S'] = float(env.get('CHEM_KB_RELOAD_INTERVAL_S', 0))
+
+    # Ghi lưu lượng thật vào file JSONL để phát lại (benchmarks/replay.py). Để trống = tắt.
+    # CHEM_REQUEST_LOG_SAMPLE: tỷ lệ request được ghi (0..1)
+    config['REQUEST_LOG_PATH'] = env.get('CHEM_REQUEST_LOG_PATH', '')
+    config['REQUEST_LOG_SAMPLE'] = float(env.get('CHEM_REQUEST_LOG_SAMPLE', 1.0))
 
-db.init_app(app)
+    # ETag cho các endpoint tất định (http_cache): số giây proxy được dùng lại phản hồi mà không hỏi lại.
+    # 0 = "Cache-Control: no-cache" (luôn hỏi lại bằng If-None-Match, nhận 304 khi dữ liệu chưa đổi)
+    config['HTTP_CACHE_MAX_AGE'] = int(env.get('CHEM_HTTP_CACHE_MAX_AGE', 0))
+
+    # Số dòng tối đa mỗi lời gọi /api/admin/import (file lớn hơn: python reaction_import.py)
+    config['IMPORT_MAX_ROWS'] = int(env.get('CHEM_IMPORT_MAX_ROWS', reaction_import.DEFAULT_MAX_ROWS))
+    return config
+
+
+# ======================================================================
+# BẢNG ROUTE (đăng ký vào app trong create_app, giữ nguyên tên endpoint = tên hàm)
+# ======================================================================
+
+_ROUTES: List[tuple] = []
+_ERROR_HANDLERS: List[tuple] = []
+
+
+def route(rule: str, **options) -> Callable:
+    def decorator(view: Callable) -> Callable:
+        _ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
+
+def errorhandler(exc_class) -> Callable:
+    def decorator(handler: Callable) -> Callable:
+        _ERROR_HANDLERS.append((exc_class, handler))
+        return handler
+    return decorator
 
 
 # ======================================================================
-# HÀM SETUP CSDL VÀ TẢI DỮ LIỆU VÀO BỘ NHỚ (Giữ nguyên)
+# APP FACTORY VÀ CÁC GIAI ĐOẠN KHỞI ĐỘNG
 # ======================================================================
 
-def setup_database(app):
+_process_configured = False
+
+
+def _configure_process(config: Mapping[str, Any]) -> None:
     """
-    Thiết lập CSDL (tạo bảng nếu chưa có) và tải tất cả luật, bao gồm Bảng Tuần Hoàn, vào bộ nhớ.
+    Cấu hình dùng chung cho cả tiến trình (biến đổi snapshot, cache kết quả, backend engine).
+    Chỉ áp dụng một lần, theo app được tạo đầu tiên.
     """
-    with app.app_context():
+    global _process_configured
+    if _process_configured:
+        return
+    _process_configured = True
+
+    if config['KB_LAYOUT'] == 'flat':
+        flat_path = config['KB_FLAT_PATH']
+        knowledge_base.add_publish_transform(lambda kb: kb_flat.flatten(kb, flat_path))
+    result_cache.configure(config['RESULT_CACHE_ENTRIES'], config['RESULT_CACHE_SIZE'])
+
+    if config['ENGINE_BACKEND'] == 'matrix':
+        fact_closure.enable()
+
+    # Dựng sẵn chỉ mục (chất -> luật) trước khi công bố: worker fork sau đó dùng chung, không tự dựng lại
+    knowledge_base.add_publish_transform(lambda kb: kb.warm())
+
+    # Snapshot mới -> tái tạo worker (fork lại) để tiến trình con dùng dữ liệu mới
+    knowledge_base.on_publish(lambda _kb: worker_pool.get_pool().recycle())
+
+
+def create_app(config: Optional[Mapping[str, Any]] = None) -> Flask:
+    """
+    Tạo app: cấu hình từ môi trường (load_config) rồi ghi đè bằng `config`, đăng ký extension và route,
+    sau đó tải cơ sở tri thức theo KB_LOAD. Thời gian từng giai đoạn có ở /readyz và trong log.
+    """
+    app = Flask(__name__)
+    state = startup.StartupState()
+    state.record('imports', _IMPORT_SECONDS)
+
+    with state.phase('config'):
+        app.config.update(load_config())
+        app.config.update(config or {})
+        if app.config['KB_LOAD'] not in KB_LOAD_MODES:
+            raise ValueError(f"KB_LOAD phải là một trong: {', '.join(KB_LOAD_MODES)}.")
+
+    with state.phase('extensions'):
+        CORS(app)
+        metrics.init_app(app)
+        # Chốt chặn khi chưa sẵn sàng: ngay sau bộ đếm metrics (request bị chặn vẫn được đếm)
+        startup.init_app(app, state)
+        db.init_app(app)
+        profiling.init_app(app)
+        request_log.init_app(app)
+        jobs.init_app(app)
+        sessions.init_app(app)
+        kb_reload.init_app(app, models)
+        reaction_import.init_app(app, models)
+        # Sau kb_reload: ETag dùng đúng snapshot đã ghim cho request
+        http_cache.init_app(app)
+        for rule, view, options in _ROUTES:
+            app.add_url_rule(rule, view_func=view, **options)
+        for exc_class, handler in _ERROR_HANDLERS:
+            app.register_error_handler(exc_class, handler)
+        _configure_process(app.config)
+
+    if app.config['KB_LOAD'] != KB_LOAD_OFF:
+        start(app, background=app.config['KB_LOAD'] == KB_LOAD_BACKGROUND)
+    return app
+
+
+def start(app, background: bool = False) -> Optional[threading.Thread]:
+    """
+    Các giai đoạn tải dữ liệu: schema CSDL -> cơ sở tri thức -> worker pool -> luồng tự tải lại.
+    Pool được tạo SAU khi đã tải dữ liệu để các tiến trình worker (fork) thừa hưởng bộ luật trong bộ nhớ.
+    """
+    phases = [
+        ('schema', lambda: _prepare_schema(app)),
+        ('knowledge_base', lambda: _load_knowledge_base(app)),
+        ('worker_pool', lambda: worker_pool.configure_pool(
+            app.config['WORKER_COUNT'], app.config['WORKER_QUEUE_LIMIT'], app.config['WORKER_MODE'])),
+        ('kb_poller', lambda: kb_reload.start_poller(app, models, app.config['KB_RELOAD_INTERVAL_S'])),
+    ]
+    return startup.run(app, phases, background=background)
+
+
+# ======================================================================
+# ĐIỀU PHỐI ENGINE QUA WORKER POOL (DEADLINE + BACKPRESSURE)
+# ======================================================================
+
+# Các lỗi điều phối phải được đẩy lên errorhandler, không bị nuốt bởi `except Exception` của endpoint
+# (ViewError: cursor không khớp kết quả chỉ phát hiện được khi engine đã chạy)
+ENGINE_DISPATCH_ERRORS = (PoolBusyError, TaskTimeoutError, ViewError)
+
+TIMEOUT_HEADER = 'X-Timeout-Ms'
+
+
+def _request_timeout() -> float:
+    """Deadline của request: mặc định theo cấu hình, client chỉ được phép rút ngắn qua header X-Timeout-Ms."""
+    limit = current_app.config['REQUEST_DEADLINE_S']
+    requested = request.headers.get(TIMEOUT_HEADER, type=int)
+    if requested and requested > 0:
+        return min(limit, requested / 1000.0)
+    return limit
+
+
+def _run_engine(fn, *args, **kwargs):
+    """
+    Chạy engine trên worker pool với deadline của request.
+    Khi đang profile request, engine chạy ngay trên luồng hiện tại để cProfile ghi nhận được.
+    """
+    ctx = TaskContext.with_timeout(_request_timeout(), request.endpoint or '')
+    if profiling.is_active():
+        return fn(*args, ctx=ctx, **kwargs)
+    return worker_pool.get_pool().run(fn, *args, ctx=ctx, **kwargs)
+
+
+def _stream_engine(events_fn, *args, **kwargs) -> Response:
+    """
+    Luồng sự kiện của engine (chạy trên luồng request) với deadline của request. Luồng giữ một chỗ
+    trong giới hạn của worker pool tới khi kết thúc: pool đầy thì trả về 503 như các endpoint khác.
+    """
+    ctx = TaskContext.with_timeout(_request_timeout(), request.endpoint or '')
+    release = worker_pool.get_pool().reserve(ctx.endpoint)
+
+    def events():
         try:
-            db.create_all()
-            print("Đã kiểm tra và đảm bảo các bảng CSDL đã tồn tại.")
-
-            # 1. TẢI DỮ LIỆU BẢNG TUẦN HOÀN (ELEMENTS)
-            print("\n[SETUP] BẮT ĐẦU TẢI DỮ LIỆU BẢNG TUẦN HOÀN VÀO BỘ NHỚ...")
-            loaded_elements = load_elements_from_db(models)
-            print(f"\n--- CHI TIẾT DỮ LIỆU NGUYÊN TỐ ĐÃ TẢI ---")
-            if loaded_elements:
-                print(f"TỔNG CỘNG: ĐÃ TẢI THÀNH CÔNG {len(loaded_elements)} nguyên tố.")
-                first_three = {k: v for i, (k, v) in enumerate(loaded_elements.items()) if i < 3}
-                print(f"[KIỂM TRA] 3 Nguyên tố đầu tiên: {first_three}")
-            else:
-                print("CẢNH BÁO: Không tìm thấy dữ liệu nguyên tố nào.")
-            print("------------------------------------------\n")
-
-            # 2. TẢI LUẬT PHẢN ỨNG (REACTION RULES)
-            print("\n[SETUP] BẮT ĐẦU TẢI DỮ LIỆU PHẢN ỨNG VÀO BỘ NHỚ...")
-            load_reactions_from_db(models)
-            current_reaction_rules = get_reaction_rules()
-            print(f"\n--- DANH SÁCH PHẢN ỨNG ĐÃ TẢI ({len(current_reaction_rules)}) ---")
-            if current_reaction_rules:
-                print(f"[KIỂM TRA] Bản ghi đầu tiên: {current_reaction_rules[0].to_dict()}")
-            else:
-                print("CẢNH BÁO: Không tìm thấy luật phản ứng nào.")
-            print("------------------------------------------\n")
-
-            # 3. TẢI LUẬT HÓA HỌC CHUNG (CHEMICAL RULES)
-            print("[SETUP] BẮT ĐẦU TẢI DỮ LIỆU LUẬT HÓA HỌC CHUNG VÀO BỘ NHỚ...")
-            load_chemical_rules_from_db(models)
-            current_chemical_rules = get_chemical_rules()
-            print(f"\n--- CHI TIẾT LUẬT HÓA HỌC CHUNG ĐÃ TẢI ({len(current_chemical_rules)}) ---")
-            if current_chemical_rules:
-                for i, rule_model in enumerate(current_chemical_rules[:5]):
-                    rule_data = rule_model.to_dict()
-                    print(f"\n[{i + 1}] Tên: {rule_data.get('name')}, Đầu ra: {rule_data.get('output_var')}")
-                    if len(current_chemical_rules) > 5 and i == 4:
-                        print(f"... và {len(current_chemical_rules) - 5} luật khác.")
-            else:
-                print("CẢNH BÁO: Không tìm thấy luật hóa học chung nào.")
-            print("------------------------------------------\n")
+            yield from events_fn(*args, ctx=ctx, **kwargs)
+        finally:
+            release()
+
+    try:
+        response = stream_events(events())
+    except BaseException:
+        release()
+        raise
+    # Client ngắt trước khi luồng bắt đầu: generator không chạy tới finally, nhả chỗ khi đóng response
+    response.call_on_close(release)
+    return response
+
+
+@errorhandler(PoolBusyError)
+def handle_pool_busy(e):
+    response = jsonify({"success": False, "error": str(e)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+@errorhandler(TaskTimeoutError)
+def handle_task_timeout(e):
+    return jsonify({"success": False, "partial": True, "error": str(e)}), 504
 
-        except Exception as e:
-            print(f"\n=======================================================")
-            print(f"LỖI THIẾT LẬP CSDL HOẶC TẢI DỮ LIỆU: {e}")
-            print(f"=======================================================\n")
-            traceback.print_exc()
+
+@errorhandler(ViewError)
+def handle_view_error(e):
+    return jsonify({"success": False, "error": str(e)}), 400
+
+
+def _response_view(data: Dict, fields) -> Optional[ResponseView]:
+    """Tham số fields/verbosity/limit/cursor (response_view) từ thân JSON, nếu không có thì từ query string."""
+    params = {name: data.get(name, request.args.get(name)) for name in response_view.PARAMS}
+    return ResponseView.from_params(params, fields)
+
+
+# ======================================================================
+# TẠO BẢNG VÀ TẢI DỮ LIỆU VÀO BỘ NHỚ (các giai đoạn khởi động)
+# ======================================================================
+
+def _prepare_schema(app) -> None:
+    """Tạo bảng nếu chưa có, bật changelog và cấu hình nguồn luật phản ứng."""
+    with app.app_context():
+        db.create_all()
+        if enable_change_tracking(models):
+            logger.debug("Đã bật changelog cho các bảng luật (hỗ trợ tải lại tăng dần).")
+        if app.config.get('RULE_SOURCE') == 'db':
+            keep_reaction_rules_in_memory(False)
+            reaction_index.configure_db_source(db.engine, models)
+            if not db.session.query(models.ReactionReactantModel.reaction_id).limit(1).first():
+                logger.warning("CHEM_RULE_SOURCE=db nhưng bảng reaction_reactants trống: "
+                               "hãy chạy 'python migrate_normalise.py'.")
+            logger.info("Engine đọc luật phản ứng trực tiếp từ CSDL (không giữ trong bộ nhớ).")
+
+
+def _load_knowledge_base(app) -> None:
+    """
+    Dựng snapshot cơ sở tri thức (bảng tuần hoàn, luật phản ứng, luật hóa học chung) rồi công bố.
+    Nếu có file snapshot biên dịch sẵn và còn mới, CSDL chỉ được dùng để kiểm tra độ mới.
+    """
+    with app.app_context():
+        snapshot_path = app.config.get('KB_SNAPSHOT_PATH')
+        if snapshot_path:
+            kb = kb_snapshot.load_or_build(models, snapshot_path)
+        else:
+            kb = reload_knowledge_base(models)
+    logger.info("Đã tải cơ sở tri thức v%d: %d nguyên tố, %d luật phản ứng, %d luật hóa học chung.",
+                kb.version, len(kb.elements), len(kb.reaction_rules), len(kb.chemical_rules))
+    if not kb.elements:
+        logger.warning("CẢNH BÁO: Không tìm thấy dữ liệu nguyên tố nào.")
+    if not kb.reaction_rules and app.config.get('RULE_SOURCE') != 'db':
+        logger.warning("CẢNH BÁO: Không tìm thấy luật phản ứng nào.")
+    if not kb.chemical_rules:
+        logger.warning("CẢNH BÁO: Không tìm thấy luật hóa học chung nào.")
 
 
 # ======================================================================
 # API ENDPOINT: api_find_and_calculate_path (ĐÃ SỬA)
 # ======================================================================
 
-@app.route('/api/find_and_calculate_path', methods=['POST'])
+@route('/api/find_and_calculate_path', methods=['GET', 'POST'])
+@http_cache.cacheable
 def api_find_and_calculate_path():
     """
     API tìm chuỗi luật tính toán cho 1 chất duy nhất (đã tối ưu hóa).
     """
-    data = request.get_json()
-    print("\n[REQUEST NHẬN] Đã nhận yêu cầu /api/find_and_calculate_path")
-    print(f"[DỮ LIỆU NHẬN] {json.dumps(data, indent=2)}")
+    with stage('parse'):
+        data = http_cache.request_json()
+    logger.debug("[REQUEST NHẬN] /api/find_and_calculate_path: %s", data)
 
     if not data or 'known_vars_with_values' not in data or 'target_var' not in data or 'substance_info' not in data:
-        print("[LỖI] Thiếu dữ liệu trong request.")
+        logger.info("[LỖI] Thiếu dữ liệu trong request.")
         return jsonify({
             "success": False,
             "error": "Thiếu 'known_vars_with_values', 'target_var', hoặc 'substance_info' trong yêu cầu."
@@ -128,214 +403,256 @@ def api_find_and_calculate_path():
     if not primary_formula or not target_var_type:
         return jsonify({"success": False, "error": "Chất hoặc Biến mục tiêu không hợp lệ."}), 400
 
-    current_vars: Dict[str, float] = {}
-    custom_rules = []
-
     try:
-        molar_mass = get_molar_mass(primary_formula)
-
-        # 1. Định nghĩa Tên biến đã Gán nhãn thực tế
-        mass_var = f"m_{primary_formula}"
-        mol_mass_var = f"M_{primary_formula}"
-        mol_var = f"n_{primary_formula}"
-        conc_var = f"C_{primary_formula}"
-
-        # Nhãn biến mục tiêu cuối cùng
-        target_var_labeled = f"{target_var_type}_{primary_formula}"
-
-        # 2. Thêm Khối lượng Mol M_[Chất]
-        current_vars[mol_mass_var] = molar_mass
-
-        # 3. GÁN NHÃN các biến đầu vào (C, V, m) thành biến cụ thể
-        for var_type, value in known_vars_with_values.items():
-            if var_type == 'V':
-                # Gán nhãn V thành V_dd
-                current_vars['V_dd'] = value
-            elif var_type == 'C':
-                # Gán nhãn C thành C_[Chất]
-                current_vars[conc_var] = value
-            elif var_type == 'm':
-                # Gán nhãn m thành m_[Chất]
-                current_vars[mass_var] = value
-            elif var_type == 'n':
-                # Gán nhãn n thành n_[Chất]
-                current_vars[mol_var] = value
-            elif var_type == 'M':
-                # Gán nhãn M thành M_[Chất] (M này sẽ ghi đè lên M tính toán nếu có)
-                current_vars[mol_mass_var] = value
-
-        # 4. TẠO CÁC LUẬT TÙY CHỈNH (Custom Rules)
-        def create_custom_rule(name, formula, inputs, output, expression):
-            return {
-                'name': name, 'formula': formula, 'description': f'Luật tùy chỉnh cho {primary_formula}',
-                'required_inputs': inputs, 'output_var': output, 'expression': expression
-            }
-
-        # Custom Rule 1: n = m / M
-        custom_rules.append(create_custom_rule(
-            f"Custom_n_tu_m_{primary_formula}", f"{mol_var} = {mass_var} / {mol_mass_var}",
-            [mass_var, mol_mass_var], mol_var, f"{mass_var} / {mol_mass_var}"
-        ))
-
-        # Custom Rule 2: C = n / V_dd
-        custom_rules.append(create_custom_rule(
-            f"Custom_C_tu_n_{primary_formula}", f"{conc_var} = {mol_var} / V_dd",
-            [mol_var, 'V_dd'], conc_var, f"{mol_var} / V_dd"
-        ))
-
-        # Custom Rule 3: n = C * V_dd
-        custom_rules.append(create_custom_rule(
-            f"Custom_n_tu_C_{primary_formula}", f"{mol_var} = {conc_var} * V_dd",
-            [conc_var, 'V_dd'], mol_var, f"{conc_var} * V_dd"
-        ))
-
-        # Custom Rule 4: m = n * M
-        custom_rules.append(create_custom_rule(
-            f"Custom_m_tu_n_{primary_formula}", f"{mass_var} = {mol_var} * {mol_mass_var}",
-            [mol_var, mol_mass_var], mass_var, f"{mol_var} * {mol_mass_var}"
-        ))
-
-    except ValueError as e:
-        return jsonify({"success": False, "error": str(e)}), 400
-
-    known_vars_set = set(current_vars.keys())
-
-    # Lấy luật chung từ CSDL
-    all_rules_from_db = get_chemical_rules()
-
-    # Thêm thuộc tính .to_dict() cho custom_rules
-    for rule_dict in custom_rules:
-        rule_dict['to_dict'] = lambda self=rule_dict: self
-
-    all_rules_for_search = all_rules_from_db + custom_rules
-
-    # === 5. Tìm kiếm đường đi (path) ===
-    path_of_rules = find_calculation_path(known_vars_set, target_var_labeled, all_rules_for_search)
-
-    if not path_of_rules:
-        return jsonify({
-            "success": False,
-            "message": f"Không thể tìm thấy chuỗi luật nào để tính toán biến '{target_var_labeled}' từ các biến đã biết.",
-            "initial_vars": list(known_vars_set)
-        }), 404
-
-    # === 6. Thực hiện tính toán theo chuỗi ===
-    calculation_steps = []
+        with stage('search'):
+            body, status = _run_engine(calculate_along_path, known_vars_with_values, primary_formula, target_var_type)
+    except ENGINE_DISPATCH_ERRORS:
+        raise
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
 
-    for i, rule_model_or_dict in enumerate(path_of_rules):
-        try:
-            rule_dict = rule_model_or_dict.to_dict() if hasattr(rule_model_or_dict, 'to_dict') else rule_model_or_dict
+    with stage('serialise'):
+        return jsonify(body), status
 
-            expression = rule_dict['expression']
-            output_var = rule_dict['output_var']
+@route('/api/stoichiometry', methods=['GET', 'POST'])
+@http_cache.cacheable
+def api_stoichiometry():
+    """
+    Tính lượng chất dọc theo chuỗi phản ứng trong một lần gọi (cân bằng từng bước, chất giới hạn):
+        {"path": ["Fe + Cl2 -> FeCl3", ...], "amounts": {"Fe": {"m": 10}}, "target": "FeCl3"}
+    Không có "path": tìm đường từ "reactants" (mặc định: các chất trong "amounts") tới "target".
+    Lượng có thể là mảng ({"m": [10, 20]}) để tính nhiều kịch bản cùng lúc.
+    """
+    with stage('parse'):
+        data = http_cache.request_json(silent=True)
+    if not isinstance(data, dict) or 'amounts' not in data:
+        return jsonify({"success": False, "error": "Thiếu 'amounts' trong yêu cầu."}), 400
+    path = data.get('path')
+    if path is not None and not isinstance(path, list):
+        return jsonify({"success": False, "error": "'path' phải là danh sách phương trình."}), 400
 
-            result_value = execute_rule_expression(expression, current_vars)
+    try:
+        body, status = _run_engine(calculate_stoichiometry, path, data.get('amounts'), data.get('target'),
+                                   data.get('reactants'))
+    except ENGINE_DISPATCH_ERRORS:
+        raise
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
 
-            current_vars[output_var] = result_value
+    with stage('serialise'):
+        return jsonify(body), status
 
-            step_detail = {
-                "step": i + 1,
-                "rule_name": rule_dict.get('name', 'N/A'),
-                "formula": rule_dict.get('formula', 'N/A'),
-                "expression_used": expression,
-                "inputs_used_and_values": {var: current_vars[var] for var in rule_dict['required_inputs']},
-                "output_var": output_var,
-                "result_value": result_value
-            }
-            calculation_steps.append(step_detail)
-
-            if output_var == target_var_labeled:
-                break
-
-        except ValueError as e:
-            return jsonify({
-                "success": False,
-                "error": f"Lỗi tính toán ở bước {i + 1} ({rule_dict.get('name', 'N/A')}): {str(e)}",
-                "path_so_far": calculation_steps
-            }), 400
-
-    # 7. Trả kết quả cuối cùng
-    return jsonify({
-        "success": True,
-        "message": f"Đã tính toán thành công '{target_var_labeled}' sau {len(calculation_steps)} bước.",
-        "target_var_labeled": target_var_labeled,
-        "final_result": current_vars.get(target_var_labeled),
-        "initial_inputs": known_vars_with_values,
-        "calculation_path_details": calculation_steps
-    })
 
 # ... (Giữ nguyên các hàm api_forward_chaining, api_find_reaction_path, api_balance_equation, api_calculate_rule) ...
-@app.route('/api/forward-chaining', methods=['POST'])
+@route('/api/forward-chaining', methods=['GET', 'POST'])
+@http_cache.cacheable
 def api_forward_chaining():
-    data = request.get_json()
+    with stage('parse'):
+        data = http_cache.request_json()
     if not data or 'reactants' not in data:
         return jsonify({"success": False, "error": "Thiếu 'reactants' trong yêu cầu."}), 400
 
     reactants = data.get('reactants', '')
     conditions = data.get('conditions', '')
+    # Tùy chọn: "fields", "verbosity" (summary|compact|full), "limit"/"cursor" phân trang reactions_used
+    view = _response_view(data, forward_chaining.FIELDS)
 
     try:
-        # Giả định run_forward_chaining sử dụng get_reaction_rules() hoặc REACTION_RULES
-        # (sau khi đã được load_reactions_from_db cập nhật)
-        result = run_forward_chaining(reactants, conditions)
-        return jsonify({"success": True, "data": result})
+        # run_forward_chaining đọc luật từ snapshot cơ sở tri thức đã ghim cho request này
+        with stage('search'):
+            result = _run_engine(run_forward_chaining, reactants, conditions, view=view)
+        with stage('serialise'):
+            return jsonify({"success": True, "data": result})
+    except ENGINE_DISPATCH_ERRORS:
+        raise
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route('/api/find-reaction-path', methods=['POST'])
+@route('/api/forward-chaining/stream', methods=['POST'])
+def api_forward_chaining_stream():
+    """
+    Suy luận tiến dạng luồng (NDJSON mặc định, SSE với ?format=sse hoặc Accept: text/event-stream).
+    Mỗi phản ứng được kích hoạt và mỗi chất mới được gửi ngay khi suy ra.
+    """
+    with stage('parse'):
+        data = request.get_json()
+    if not data or 'reactants' not in data:
+        return jsonify({"success": False, "error": "Thiếu 'reactants' trong yêu cầu."}), 400
+
+    return _stream_engine(iter_forward_chaining, data.get('reactants', ''), data.get('conditions', ''))
+
+
+@route('/api/forward-chaining/batch', methods=['GET', 'POST'])
+@http_cache.cacheable
+def api_forward_chaining_batch():
+    """
+    Suy luận tiến cho nhiều đầu vào trong một request:
+        {"items": [{"reactants": "Fe + HCl", "conditions": ""}, ...]}
+    Các đầu vào trùng nhau (sau chuẩn hóa) chỉ được tính một lần; các đầu vào khác nhau được chia
+    thành từng nhóm chạy song song trên worker pool. "results" giữ đúng thứ tự của "items".
+    "fields"/"verbosity"/"limit" áp dụng cho mọi phần tử ("cursor" không dùng được vì mỗi phần tử một kết quả).
+    """
+    with stage('parse'):
+        data = http_cache.request_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "error": "Thiếu danh sách 'items' trong yêu cầu."}), 400
+    max_items = current_app.config['BATCH_MAX_ITEMS']
+    if len(items) > max_items:
+        return jsonify({"success": False, "error": f"Tối đa {max_items} phần tử mỗi lần gọi."}), 413
+    if data.get('cursor'):
+        return jsonify({"success": False, "error": "'cursor' không dùng được với batch."}), 400
+    view = _response_view(data, forward_chaining.FIELDS)
+
+    # Gộp các đầu vào trùng nhau: slot_of[i] là vị trí kết quả của items[i] trong danh sách duy nhất
+    unique: List[tuple] = []
+    slot_by_key: Dict[tuple, int] = {}
+    slot_of: List[int] = []
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or 'reactants' not in item:
+            return jsonify({"success": False, "error": f"Phần tử {position} thiếu 'reactants'."}), 400
+        reactants, conditions = str(item.get('reactants') or ''), str(item.get('conditions') or '')
+        key = batch_key(reactants, conditions)
+        if key not in slot_by_key:
+            slot_by_key[key] = len(unique)
+            unique.append((reactants, conditions))
+        slot_of.append(slot_by_key[key])
+
+    try:
+        with stage('search'):
+            ctx = TaskContext.with_timeout(_request_timeout(), request.endpoint or '')
+            if profiling.is_active():
+                unique_results = run_forward_chaining_batch(unique, ctx=ctx, view=view)
+            else:
+                pool = worker_pool.get_pool()
+                # Chia đều cho các worker (mỗi nhóm một tác vụ) thay vì một tác vụ cho mỗi phần tử
+                chunk_count = min(len(unique), pool.max_workers)
+                chunk_size = -(-len(unique) // chunk_count)
+                chunks = [(unique[i:i + chunk_size],) for i in range(0, len(unique), chunk_size)]
+                unique_results = [result for chunk_results in
+                                  pool.run_many(functools.partial(run_forward_chaining_batch, view=view), chunks, ctx=ctx)
+                                  for result in chunk_results]
+        with stage('serialise'):
+            body = {
+                "success": True,
+                "data": {
+                    "results": [unique_results[slot] for slot in slot_of],
+                    "count": len(items),
+                    "unique": len(unique),
+                }
+            }
+            if any(result.get('partial') for result in unique_results):
+                body["data"]["partial"] = True
+            return jsonify(body)
+    except ENGINE_DISPATCH_ERRORS:
+        raise
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@route('/api/find-reaction-path', methods=['GET', 'POST'])
+@http_cache.cacheable
 def api_find_reaction_path():
-    data = request.get_json()
+    with stage('parse'):
+        data = http_cache.request_json()
     if not data or 'reactants' not in data or 'target' not in data:
         return jsonify({"success": False, "error": "Thiếu 'reactants' hoặc 'target' trong yêu cầu."}), 400
 
     reactants = data.get('reactants', '')
     target = data.get('target', '')
+    # Có 'allowed_conditions' (kể cả rỗng): chỉ dùng phản ứng thỏa các điều kiện này, ít lần đổi điều kiện nhất
+    allowed_conditions = data.get('allowed_conditions')
+    if allowed_conditions is not None:
+        allowed_conditions = str(allowed_conditions)
 
     try:
-        result = find_reaction_path(reactants, target)
-        return jsonify({"success": True, "data": result})
+        with stage('search'):
+            result = _run_engine(find_reaction_path, reactants, target, allowed_conditions=allowed_conditions)
+        with stage('serialise'):
+            return jsonify({"success": True, "data": result})
+    except ENGINE_DISPATCH_ERRORS:
+        raise
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route('/api/balance-equation', methods=['POST'])
+@route('/api/find-reaction-path/stream', methods=['POST'])
+def api_find_reaction_path_stream():
+    """Tìm đường phản ứng dạng luồng; sự kiện cuối "result" chứa đường đi đầy đủ."""
+    with stage('parse'):
+        data = request.get_json()
+    if not data or 'reactants' not in data or 'target' not in data:
+        return jsonify({"success": False, "error": "Thiếu 'reactants' hoặc 'target' trong yêu cầu."}), 400
+
+    allowed_conditions = data.get('allowed_conditions')
+    return _stream_engine(iter_reaction_path, data.get('reactants', ''), data.get('target', ''),
+                          allowed_conditions=None if allowed_conditions is None else str(allowed_conditions))
+
+
+@route('/api/balance-equation', methods=['GET', 'POST'])
+@http_cache.cacheable
 def api_balance_equation():
-    data = request.get_json()
+    with stage('parse'):
+        data = http_cache.request_json()
     if not data or 'equation' not in data:
         return jsonify({"success": False, "error": "Thiếu 'equation' trong yêu cầu."}), 400
 
     equation_str = data.get('equation', '')
+    # Tùy chọn: "fields", "verbosity" (summary|compact bỏ balancing_history, không ghi lịch sử khi chạy)
+    view = _response_view(data, balancer.FIELDS)
 
     try:
-        result = balance_equation(equation_str)
-        return jsonify({"success": True, "data": result})
+        with stage('search'):
+            result = balance_equation(equation_str, view=view)
+        with stage('serialise'):
+            return jsonify({"success": True, "data": result})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route('/api/calculate_rule', methods=['POST'])
+@route('/api/calculate_rule', methods=['GET', 'POST'])
+@http_cache.cacheable
 def api_calculate_rule():
-    # Logic tính toán 1 bước đơn giản (giữ nguyên logic cũ)
-    data = request.get_json()
+    """
+    Tính một bước bằng luật áp dụng được cho các biến đầu vào (tra chỉ mục, không quét bảng luật):
+    - "match": "best" (mặc định): luật dùng nhiều biến đầu vào nhất (cùng số biến: luật đứng trước).
+    - "match": "all": tính với mọi luật áp dụng được, kết quả trong "results".
+    """
+    with stage('parse'):
+        data = http_cache.request_json()
     user_inputs: Dict[str, float] = data.get('inputs', {})
-    print("test" + data)
-    all_rules = get_chemical_rules()
-    matched_rule = None
+    match_mode = data.get('match', 'best')
+    logger.debug("[REQUEST NHẬN] /api/calculate_rule: %s", data)
+    if match_mode not in ('best', 'all'):
+        return jsonify({"success": False, "error": "'match' phải là 'best' hoặc 'all'."}), 400
+    index = calculation_index.current_index()
 
-    for rule_model in all_rules:
-        required_vars = rule_model.required_inputs
-        if all(var in user_inputs for var in required_vars):
-            matched_rule = rule_model
-            break
+    with stage('search'):
+        matches = index.applicable(user_inputs) if match_mode == 'all' else index.most_specific(user_inputs)
 
-    if not matched_rule:
+    if matches is None or matches == []:
         return jsonify({"success": False, "error": "Không tìm thấy luật phù hợp với các biến đầu vào đã cho."}), 404
 
+    if match_mode == 'all':
+        results = []
+        with stage('evaluate'):
+            for position in matches:
+                rule = index.rules[position]
+                item = {"rule_used": rule.to_dict(), "output_var": rule.output_var}
+                try:
+                    item["result"] = execute_rule_expression(index.expression(position), user_inputs)
+                except ValueError as e:
+                    item["error"] = str(e)
+                results.append(item)
+        return jsonify({"success": True, "results": results, "count": len(results)})
+
+    position = matches
+    matched_rule = index.rules[position]
     try:
-        expression = matched_rule.expression
         output_var = matched_rule.output_var
-        result_value = execute_rule_expression(expression, user_inputs)
+        with stage('evaluate'):
+            result_value = execute_rule_expression(index.expression(position), user_inputs)
 
         response_data = {
             "success": True,
@@ -351,21 +668,46 @@ def api_calculate_rule():
         return jsonify({"success": False, "error": f"Lỗi không xác định trong tính toán: {str(e)}"}), 500
 
 
-@app.route('/api/identify-chemicals', methods=['POST'])
+@route('/api/identify-chemicals', methods=['GET', 'POST'])
+@http_cache.cacheable
 def api_identify_chemicals():
-    data = request.get_json()
+    with stage('parse'):
+        data = http_cache.request_json()
     unknown_chemicals = data.get('chemicals', [])
 
     if not unknown_chemicals or len(unknown_chemicals) < 2:
         return jsonify({"success": False, "error": "Cung cấp ít nhất 2 chất cần nhận biết."}), 400
 
     try:
-        identification_result = identify_chemicals(unknown_chemicals)
+        with stage('search'):
+            identification_result = _run_engine(identify_chemicals, unknown_chemicals)
 
-        return jsonify({"success": True, "data": identification_result})
+        with stage('serialise'):
+            return jsonify({"success": True, "data": identification_result})
+    except ENGINE_DISPATCH_ERRORS:
+        raise
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
+
+
+def __getattr__(name: str):
+    """
+    `api_server.app` (vd: gunicorn 'api_server:app') được tạo bằng create_app() ở lần truy cập đầu tiên,
+    nên import module không kết nối CSDL hay tải dữ liệu.
+    """
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == '__main__':
-    setup_database(app)
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    logging.basicConfig(
+        level=os.environ.get('CHEM_LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+    app = create_app()
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -1,7 +1,12 @@
 import math
 import collections
+import functools
+from typing import List, Optional, Tuple
 
 from chemistry_data import ChemicalEquation
+from metrics import record_engine_run
+from response_view import COMPACT, FULL, SUMMARY, ResponseView
+from task_context import TaskContext, expired, report
 
 def _gcd(a, b):
     return math.gcd(a, b)
@@ -97,7 +102,28 @@ def _get_unbalanced_details(eq):
     return unbalanced_list
 
 
-def balance_equation(equation_str: str, max_iterations: int = 50) -> dict:
+# Các trường của kết quả cân bằng (ngoài "success"); trường nào có mặt tùy thành công hay thất bại
+FIELDS = ('iterations', 'balanced_equation', 'balancing_history', 'error_message', 'unbalanced_result',
+          'unbalanced_details')
+DEFAULT_FIELDS = {
+    FULL: FIELDS,
+    COMPACT: tuple(name for name in FIELDS if name != 'balancing_history'),
+    SUMMARY: ('balanced_equation', 'error_message', 'unbalanced_result'),
+}
+
+
+def balance_equation(equation_str: str, max_iterations: int = 50, view: Optional[ResponseView] = None) -> dict:
+    """
+    Cân bằng phương trình bằng luật heuristic, ghi lại từng bước.
+    `view` chọn trường / mức chi tiết (response_view); lịch sử từng bước chỉ được ghi khi
+    'balancing_history' được chọn.
+    """
+    include_history = view is None or 'balancing_history' in view.selected(DEFAULT_FIELDS)
+    result = _balance(equation_str, max_iterations, include_history)
+    return result if view is None else view.filter(result, DEFAULT_FIELDS)
+
+
+def _balance(equation_str: str, max_iterations: int, include_history: bool) -> dict:
     try:
         parts = [p.strip() for p in equation_str.split('->')]
         if len(parts) != 2:
@@ -117,12 +143,23 @@ def balance_equation(equation_str: str, max_iterations: int = 50) -> dict:
 
     iteration_count = 0
     history = []
+    rules_scanned = 0
+    rules_fired = 0
 
     while not known.is_balanced() and iteration_count < max_iterations:
         iteration_count += 1
 
+        rules_scanned += 1
         result = _apply_balancing_rule(known)
 
+        if not include_history:
+            if not result:
+                break
+            target_compound, _unbalanced_element, new_coefficient = result
+            target_compound.coefficient = new_coefficient
+            rules_fired += 1
+            continue
+
         step_details = {
             "step": iteration_count,
             "equation_before": str(known),
@@ -138,6 +175,7 @@ def balance_equation(equation_str: str, max_iterations: int = 50) -> dict:
             )
 
             target_compound.coefficient = new_coefficient
+            rules_fired += 1
         else:
             step_details["action"] = "Không tìm thấy nguyên tố mất cân bằng để tác động."
             break
@@ -145,22 +183,25 @@ def balance_equation(equation_str: str, max_iterations: int = 50) -> dict:
         step_details["equation_after"] = str(known)
         history.append(step_details)
 
+    record_engine_run('balancer', rules_scanned, rules_fired, iteration_count)
+
     if known.is_balanced():
 
-        equation_before_simplify = str(known)
+        coefficients_before = [c.coefficient for c in known.reactants + known.products]
+        equation_before_simplify = str(known) if include_history else None
 
         _simplify_coefficients(known)
 
-        equation_after_simplify = str(known)
-
-        if equation_before_simplify != equation_after_simplify:
+        # So hệ số thay vì so chuỗi phương trình để không phải dựng chuỗi khi không ghi lịch sử
+        if [c.coefficient for c in known.reactants + known.products] != coefficients_before:
             iteration_count += 1
-            history.append({
-                "step": iteration_count,
-                "equation_before": equation_before_simplify,
-                "action": "Rút gọn các hệ số về tỷ lệ số nguyên tối thiểu.",
-                "equation_after": equation_after_simplify
-            })
+            if include_history:
+                history.append({
+                    "step": iteration_count,
+                    "equation_before": equation_before_simplify,
+                    "action": "Rút gọn các hệ số về tỷ lệ số nguyên tối thiểu.",
+                    "equation_after": str(known)
+                })
 
         return {
             "success": True,
@@ -178,4 +219,50 @@ def balance_equation(equation_str: str, max_iterations: int = 50) -> dict:
             "iterations": iteration_count,
             "balancing_history": history,
             "unbalanced_details": _get_unbalanced_details(known)
-        }
\ No newline at end of file
+        }
+
+
+@functools.lru_cache(maxsize=4096)
+def balanced_coefficients(reactants: Tuple[str, ...], products: Tuple[str, ...],
+                          max_iterations: int = 50) -> Optional[Tuple[Tuple[int, ...], Tuple[int, ...]]]:
+    """
+    Hệ số tối giản (vế trái, vế phải) của phương trình, cùng thuật toán với balance_equation
+    nhưng không ghi lịch sử; None nếu không cân bằng được. Kết quả được cache theo phương trình.
+    """
+    eq = ChemicalEquation(list(reactants), list(products))
+    iteration_count = 0
+    while not eq.is_balanced() and iteration_count < max_iterations:
+        iteration_count += 1
+        result = _apply_balancing_rule(eq)
+        if not result:
+            break
+        target_compound, _unbalanced_element, new_coefficient = result
+        target_compound.coefficient = new_coefficient
+    if not eq.is_balanced():
+        return None
+    _simplify_coefficients(eq)
+    return tuple(c.coefficient for c in eq.reactants), tuple(c.coefficient for c in eq.products)
+
+
+def balance_equations(equations: List[str], ctx: Optional[TaskContext] = None) -> dict:
+    """
+    Cân bằng một loạt phương trình (dùng cho job bất đồng bộ).
+    Kết quả giữ đúng thứ tự đầu vào; nếu ctx hết hạn, các phương trình còn lại bị bỏ qua
+    và kết quả có "partial": True.
+    """
+    results = []
+    for i, equation_str in enumerate(equations):
+        if expired(ctx):
+            break
+        results.append(balance_equation(equation_str))
+        report(ctx, balanced=i + 1, total=len(equations))
+
+    summary = {
+        "total": len(equations),
+        "processed": len(results),
+        "balanced": sum(1 for r in results if r.get("success")),
+        "results": results
+    }
+    if ctx is not None and ctx.timed_out:
+        summary["partial"] = True
+    return summary
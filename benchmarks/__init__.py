@@ -0,0 +1,2 @@
+# --- File: benchmarks/__init__.py ---
+# Các script đo hiệu năng, chạy bằng: python -m benchmarks.<tên_module> --help
@@ -0,0 +1,323 @@
+# --- File: benchmarks/bench_engines.py ---
+"""
+Đo hiệu năng từng engine trên dữ liệu tổng hợp (benchmarks/synthetic.py) và so sánh hai lần đo.
+
+    python -m benchmarks.bench_engines run --size 100 --size 10000 --out base.json
+    python -m benchmarks.bench_engines run --size 1000000 --engine kb_load --engine forward_chaining
+    python -m benchmarks.bench_engines compare base.json new.json --threshold 0.15
+
+Engine đo được: kb_load, forward_chaining, reaction_path, balancer, calculation_path,
+calculate_rule, identification.
+
+Mỗi kích thước dùng một CSDL SQLite riêng (/tmp/chem_bench_<size>.db, chỉ tạo lại khi đổi seed).
+Mỗi cặp (engine, kích thước) chạy trong một tiến trình con riêng để RSS đỉnh không lẫn giữa các lần
+đo; tiến trình con nạp cơ sở tri thức, chạy các truy vấn có seed và in một dòng JSON gồm
+phân vị độ trễ (ms), thông lượng (truy vấn/giây) và RSS đỉnh (MB).
+Mỗi truy vấn có giới hạn thời gian (--query-timeout, qua TaskContext như API); số truy vấn quá hạn
+được báo trong 'timeouts'. Cache kết quả của suy luận tiến bị tắt khi đo (trừ khi có --keep-cache) để đo chính engine.
+
+compare đánh dấu hồi quy khi độ trễ p50/p90/p99 hoặc RSS tăng, hay thông lượng giảm, quá ngưỡng
+(mặc định 10%); trả về mã thoát 1 nếu có hồi quy.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks import synthetic
+from task_context import TaskContext
+
+DEFAULT_URL_TEMPLATE = 'sqlite:////tmp/chem_bench_{size}.db'
+DEFAULT_QUERIES = 200
+DEFAULT_MAX_SECONDS = 60.0
+# Giới hạn thời gian của một truy vấn (truy vấn quá hạn được tính vào 'timeouts')
+DEFAULT_QUERY_TIMEOUT_S = 5.0
+DEFAULT_THRESHOLD = 0.10
+# Độ trễ dưới ngưỡng này (ms) bị coi là nhiễu khi so sánh
+DEFAULT_MIN_MS = 0.05
+
+ENGINES = ('kb_load', 'forward_chaining', 'reaction_path', 'balancer', 'calculation_path',
+           'calculate_rule', 'identification')
+
+# (chỉ số, tăng là xấu)
+COMPARED_METRICS = (('p50_ms', True), ('p90_ms', True), ('p99_ms', True),
+                    ('throughput_per_s', False), ('rss_peak_mb', True))
+
+
+def _rss_mb() -> float:
+    # Linux: ru_maxrss tính bằng KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+# ======================================================================
+# TRUY VẤN CỦA TỪNG ENGINE (chạy trong tiến trình con)
+# ======================================================================
+
+def _queries(engine: str, size: int, count: int, seed: int) -> List[Callable[[TaskContext], Any]]:
+    """Danh sách lời gọi (nhận TaskContext giới hạn thời gian), mỗi lời gọi là một truy vấn tới engine."""
+    if engine == 'forward_chaining':
+        from forward_chaining import run_forward_chaining
+        return [lambda ctx, r=r, c=c: run_forward_chaining(r, c, ctx=ctx)
+                for r, c in synthetic.reactant_queries(size, count, seed)]
+    if engine == 'reaction_path':
+        from reaction_path import find_reaction_path
+        return [lambda ctx, s=s, t=t: find_reaction_path(s, t, ctx=ctx) for s, t in synthetic.path_queries(size, count, seed)]
+    if engine == 'balancer':
+        from balancer import balance_equation
+        return [lambda ctx, e=e: balance_equation(e) for e in synthetic.equation_corpus(count, seed)]
+    if engine == 'calculation_path':
+        import knowledge_base
+        from chemistry_data import execute_rule_expression, find_calculation_path
+
+        def solve(ctx: TaskContext, known: Dict[str, float], target: str):
+            path = find_calculation_path(set(known), target, knowledge_base.current().chemical_rules, ctx=ctx)
+            values = dict(known)
+            for step in path or ():
+                values[step['output_var']] = execute_rule_expression(step['expression'], values)
+            return values.get(target)
+        return [lambda ctx, k=k, t=t: solve(ctx, k, t) for k, t in synthetic.calculation_queries(size, count, seed)]
+    if engine == 'calculate_rule':
+        import calculation_index
+        from chemistry_data import execute_rule_expression
+
+        def apply(known: Dict[str, float]):
+            index = calculation_index.current_index()
+            position = index.most_specific(known)
+            return None if position is None else execute_rule_expression(index.expression(position), known)
+        return [lambda ctx, k=k: apply(k) for k, _t in synthetic.calculation_queries(size, count, seed)]
+    if engine == 'identification':
+        from identification import identify_chemicals
+        return [lambda ctx, u=u: identify_chemicals(u, ctx=ctx) for u in synthetic.identification_queries(size, count, seed)]
+    raise ValueError(f"Engine không hợp lệ: {engine}")
+
+
+def _import_engines() -> None:
+    # Các module engine đăng ký cấu trúc dẫn xuất (chỉ mục...) khi import: phải import trước khi nạp
+    # cơ sở tri thức để kb.warm() dựng chúng, nếu không truy vấn đầu tiên sẽ gánh chi phí dựng
+    import balancer, calculation_index, forward_chaining, identification, reaction_path  # noqa: F401
+
+
+def _load_kb(models):
+    import chemistry_data
+    import knowledge_base
+    kb = knowledge_base.publish(chemistry_data.build_knowledge_base(models))
+    kb.warm()
+    return kb
+
+
+def _summary(latencies: List[float], elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        'queries': len(ordered),
+        'p50_ms': round(synthetic.percentile(ordered, 0.50) * 1000, 4),
+        'p90_ms': round(synthetic.percentile(ordered, 0.90) * 1000, 4),
+        'p99_ms': round(synthetic.percentile(ordered, 0.99) * 1000, 4),
+        'max_ms': round(ordered[-1] * 1000, 4) if ordered else 0.0,
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 4) if ordered else 0.0,
+        'throughput_per_s': round(len(ordered) / elapsed, 2) if elapsed > 0 else None,
+    }
+
+
+def _measure(url: str, engine: str, size: int, count: int, seed: int, max_seconds: float,
+             query_timeout_s: float, keep_cache: bool) -> Dict[str, Any]:
+    """Chạy trong tiến trình con: nạp cơ sở tri thức, chạy truy vấn của `engine` và đo."""
+    import result_cache
+    _import_engines()
+    app, models = synthetic.make_app(url)
+    if not keep_cache:
+        result_cache.configure(0, 1)
+    errors = timeouts = 0
+    with app.app_context():
+        rss_before = _rss_mb()
+        if engine == 'kb_load':
+            # Mỗi lần đo là một lần nạp đầy đủ từ CSDL (kể cả dựng chỉ mục dẫn xuất)
+            latencies: List[float] = []
+            start = time.perf_counter()
+            for _ in range(max(1, count)):
+                t0 = time.perf_counter()
+                _load_kb(models)
+                latencies.append(time.perf_counter() - t0)
+                if time.perf_counter() - start > max_seconds:
+                    break
+            elapsed = time.perf_counter() - start
+            setup_s = 0.0
+        else:
+            t0 = time.perf_counter()
+            _load_kb(models)
+            calls = _queries(engine, size, count, seed)
+            setup_s = time.perf_counter() - t0
+            latencies = []
+            start = time.perf_counter()
+            for call in calls:
+                ctx = TaskContext.with_timeout(query_timeout_s, engine)
+                t0 = time.perf_counter()
+                try:
+                    call(ctx)
+                except Exception:
+                    errors += 1
+                timeouts += ctx.timed_out
+                latencies.append(time.perf_counter() - t0)
+                if time.perf_counter() - start > max_seconds:
+                    break
+            elapsed = time.perf_counter() - start
+        rss_peak = _rss_mb()
+
+    result = {'engine': engine, 'size': size, 'setup_s': round(setup_s, 3)}
+    result.update(_summary(latencies, elapsed))
+    result.update({
+        'errors': errors,
+        'timeouts': timeouts,
+        'rss_peak_mb': round(rss_peak, 1),
+        'rss_added_mb': round(rss_peak - rss_before, 1),
+    })
+    return result
+
+
+# ======================================================================
+# CHẠY VÀ SO SÁNH
+# ======================================================================
+
+def _url_for(args, size: int) -> str:
+    template = args.url or os.environ.get('CHEM_BENCH_DB_URL', DEFAULT_URL_TEMPLATE)
+    return template.format(size=size)
+
+
+def run(args) -> int:
+    engines = args.engine or list(ENGINES)
+    sizes = args.size or [100, 1000]
+    results: List[Dict[str, Any]] = []
+    for size in sizes:
+        url = _url_for(args, size)
+        if not args.no_seed:
+            synthetic.seed_database(url, size, args.seed)
+        for engine in engines:
+            command = [sys.executable, '-m', 'benchmarks.bench_engines', 'worker', '--url', url,
+                       '--engine', engine, '--size', str(size), '--queries', str(args.queries),
+                       '--seed', str(args.seed), '--max-seconds', str(args.max_seconds),
+                       '--query-timeout', str(args.query_timeout)]
+            if args.keep_cache:
+                command.append('--keep-cache')
+            out = subprocess.run(command, check=True, capture_output=True, text=True)
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{engine:>17} n={size:<8} p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms  "
+                  f"{result['throughput_per_s']}/s  RSS {result['rss_peak_mb']} MB"
+                  f"{'  lỗi: %d' % result['errors'] if result['errors'] else ''}"
+                  f"{'  quá hạn: %d' % result['timeouts'] if result['timeouts'] else ''}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'seed': args.seed,
+            'queries': args.queries,
+            'query_timeout_s': args.query_timeout,
+            'keep_cache': args.keep_cache,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+def compare_reports(base: Dict[str, Any], new: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD,
+                    min_ms: float = DEFAULT_MIN_MS) -> List[Dict[str, Any]]:
+    """
+    So sánh từng (engine, kích thước) có trong cả hai báo cáo.
+    Mỗi dòng kết quả: engine, size, metric, base, new, change (tỷ lệ, dương là tệ hơn), regression.
+    """
+    baseline = {(r['engine'], r['size']): r for r in base.get('results', [])}
+    rows: List[Dict[str, Any]] = []
+    for result in new.get('results', []):
+        old = baseline.get((result['engine'], result['size']))
+        if old is None:
+            continue
+        for metric, higher_is_worse in COMPARED_METRICS:
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before if higher_is_worse else (before - after) / before
+            noise = metric.endswith('_ms') and max(before, after) < min_ms
+            rows.append({
+                'engine': result['engine'], 'size': result['size'], 'metric': metric,
+                'base': before, 'new': after, 'change': round(change, 4),
+                'regression': change > threshold and not noise,
+            })
+    return rows
+
+
+def compare(args) -> int:
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    rows = compare_reports(base, new, args.threshold, args.min_ms)
+    regressions = [row for row in rows if row['regression']]
+    for row in rows:
+        marker = 'HỒI QUY' if row['regression'] else ''
+        print(f"{row['engine']:>17} n={row['size']:<8} {row['metric']:>16}: {row['base']} -> {row['new']} "
+              f"(tệ hơn {row['change']:+.1%}) {marker}")
+    print(f"{len(regressions)} hồi quy / {len(rows)} chỉ số (ngưỡng {args.threshold:.0%}).")
+    return 1 if regressions else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_common(p):
+        p.add_argument('--seed', type=int, default=synthetic.DEFAULT_SEED)
+        p.add_argument('--queries', type=int, default=DEFAULT_QUERIES, help='Số truy vấn mỗi engine.')
+        p.add_argument('--max-seconds', type=float, default=DEFAULT_MAX_SECONDS,
+                       help='Dừng sớm một engine khi đã chạy quá số giây này.')
+        p.add_argument('--query-timeout', type=float, default=DEFAULT_QUERY_TIMEOUT_S,
+                       help='Giới hạn thời gian (giây) của một truy vấn.')
+        p.add_argument('--keep-cache', action='store_true', help='Giữ cache kết quả suy luận tiến khi đo.')
+
+    run_parser = commands.add_parser('run', help='Đo các engine.')
+    run_parser.add_argument('--size', type=int, action='append',
+                            help='Số phản ứng/luật tổng hợp (lặp lại để đo nhiều kích thước). Mặc định: 100, 1000.')
+    run_parser.add_argument('--engine', action='append', choices=ENGINES, help='Mặc định: tất cả.')
+    run_parser.add_argument('--url', help="URL CSDL, có thể chứa '{size}'. Mặc định: " + DEFAULT_URL_TEMPLATE)
+    run_parser.add_argument('--no-seed', action='store_true', help='Không tạo dữ liệu, dùng CSDL sẵn có.')
+    run_parser.add_argument('--out', help='Ghi báo cáo JSON vào tệp (mặc định: in ra stdout).')
+    add_common(run_parser)
+
+    compare_parser = commands.add_parser('compare', help='So sánh hai báo cáo và đánh dấu hồi quy.')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help='Tỷ lệ tệ đi tối đa cho phép (0.1 = 10%%).')
+    compare_parser.add_argument('--min-ms', type=float, default=DEFAULT_MIN_MS,
+                                help='Bỏ qua độ trễ nhỏ hơn ngưỡng này (ms) khi đánh dấu hồi quy.')
+
+    worker_parser = commands.add_parser('worker')
+    worker_parser.add_argument('--url', required=True)
+    worker_parser.add_argument('--engine', required=True, choices=ENGINES)
+    worker_parser.add_argument('--size', type=int, required=True)
+    add_common(worker_parser)
+
+    args = parser.parse_args(argv)
+    if args.command == 'worker':
+        print(json.dumps(_measure(args.url, args.engine, args.size, args.queries, args.seed,
+                                  args.max_seconds, args.query_timeout, args.keep_cache)))
+        return 0
+    if args.command == 'compare':
+        return compare(args)
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
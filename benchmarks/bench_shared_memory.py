@@ -0,0 +1,126 @@
+# --- File: benchmarks/bench_shared_memory.py ---
+"""
+Đo bộ nhớ riêng (USS) và PSS của từng worker khi dùng chung cơ sở tri thức qua fork:
+
+    python -m benchmarks.bench_shared_memory --rules 300000 --workers 4
+
+Với mỗi bố cục ('objects': list[ReactionRule], 'flat': mảng trong vùng mmap), tiến trình chính
+dựng cơ sở tri thức rồi fork `--workers` tiến trình con; mỗi con duyệt toàn bộ luật `--scans` lần
+giống engine suy luận tiến (đọc chất tham gia/sản phẩm), sau đó đọc /proc/self/smaps_rollup.
+USS là phần bộ nhớ chỉ riêng worker đó (tăng tuyến tính theo số worker); chênh lệch USS giữa hai
+bố cục là lượng bộ nhớ tiết kiệm được trên mỗi worker. Chỉ chạy trên Linux.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+from typing import Dict, List
+
+import kb_flat
+from knowledge_base import KnowledgeBase
+from rule_records import ReactionRule
+
+SPECIES_POOL = 5000
+
+
+def synthetic_rules(count: int, seed: int = 42) -> List[ReactionRule]:
+    rng = random.Random(seed)
+    species = [sys.intern(f"X{i}") for i in range(SPECIES_POOL)]
+    rules = []
+    for i in range(count):
+        reactants = rng.sample(species, rng.randint(1, 3))
+        products = rng.sample(species, rng.randint(1, 3))
+        conditions = ('t°',) if rng.random() < 0.3 else ()
+        rules.append(ReactionRule(
+            i + 1, 'hóa hợp', None, reactants, products, conditions,
+            f"{' + '.join(reactants)} -> {' + '.join(products)}", 'Không hiện tượng', None
+        ))
+    return rules
+
+
+def _smaps_rollup_kb() -> Dict[str, int]:
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values
+
+
+def _scan(kb: KnowledgeBase, scans: int) -> int:
+    touched = 0
+    for _ in range(scans):
+        for rule in kb.reaction_rules:
+            touched += len(rule.required_reactants) + len(rule.products)
+    return touched
+
+
+def measure(kb: KnowledgeBase, workers: int, scans: int) -> List[Dict[str, float]]:
+    """Fork các worker, mỗi worker quét luật rồi gửi số đo bộ nhớ về qua pipe."""
+    gc.collect()
+    gc.freeze()
+    children = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _scan(kb, scans)
+            mem = _smaps_rollup_kb()
+            payload = {
+                'uss_mb': (mem.get('Private_Clean', 0) + mem.get('Private_Dirty', 0)) / 1024.0,
+                'pss_mb': mem.get('Pss', 0) / 1024.0,
+                'rss_mb': mem.get('Rss', 0) / 1024.0,
+            }
+            os.write(write_fd, json.dumps(payload).encode())
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    results = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd, 'rb') as f:
+            results.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    gc.unfreeze()
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rules', type=int, default=200000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--scans', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print("Cần Linux (/proc/self/smaps_rollup).", file=sys.stderr)
+        return 1
+
+    summary = {}
+    for layout in ('objects', 'flat'):
+        kb = KnowledgeBase(synthetic_rules(args.rules), [], {}, source='bench')
+        if layout == 'flat':
+            kb = kb_flat.flatten(kb)
+            gc.collect()
+        results = measure(kb, args.workers, args.scans)
+        avg = {key: round(sum(r[key] for r in results) / len(results), 1) for key in results[0]}
+        summary[layout] = avg
+        print(f"{layout:>7}: USS/worker {avg['uss_mb']} MB, PSS/worker {avg['pss_mb']} MB, RSS/worker {avg['rss_mb']} MB")
+        del kb
+        gc.collect()
+
+    saved = round(summary['objects']['uss_mb'] - summary['flat']['uss_mb'], 1)
+    print(f"Tiết kiệm: {saved} MB bộ nhớ riêng mỗi worker "
+          f"(~{round(saved * args.workers, 1)} MB với {args.workers} worker).")
+    print(json.dumps({'rules': args.rules, 'workers': args.workers, 'layouts': summary,
+                      'uss_saved_per_worker_mb': saved}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+# --- File: benchmarks/replay.py ---
+"""
+Phát lại request log (request_log.py, CHEM_REQUEST_LOG_PATH) để thử tải với đúng tỷ lệ request thật.
+
+    # Trong tiến trình, trên CSDL cục bộ (mặc định CSDL tổng hợp của bench_engines, tạo nếu chưa có)
+    python -m benchmarks.replay requests.log.jsonl --concurrency 8 --rate 200
+    python -m benchmarks.replay requests.log.jsonl --db sqlite:////tmp/chem.db --speed 2 --repeat 3
+    # Tới một máy chủ đang chạy
+    python -m benchmarks.replay requests.log.jsonl --target http://127.0.0.1:5000 --concurrency 32
+
+Nhịp gửi:
+- --rate R: vòng mở, R request/giây đều nhau (--poisson: khoảng cách ngẫu nhiên theo phân phối mũ);
+- --speed S: giữ khoảng cách thời gian như trong log, nhanh gấp S lần;
+- không có cả hai: vòng đóng, `concurrency` luồng gửi liên tục.
+Với vòng mở, độ trễ được tính từ thời điểm lẽ ra phải gửi (gồm cả thời gian chờ khi máy chủ quá tải),
+nên không bị "coordinated omission"; thời gian phục vụ thuần được báo riêng (service_p50_ms...).
+
+Báo cáo theo endpoint: số request, p50/p95/p99 (ms), tỷ lệ lỗi (5xx hoặc lỗi kết nối), số 4xx, số request
+có mã trả về khác log; cùng tỷ lệ trúng cache kết quả đọc từ /metrics trước và sau khi chạy.
+
+Các request gắn với trạng thái trên máy chủ (/api/sessions/<id>, /api/jobs/<id>) bị bỏ qua mặc định
+vì id trong log không tồn tại khi phát lại (--include-stateful để vẫn gửi).
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from benchmarks import synthetic
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_SIZE = 1000
+STATEFUL_PREFIXES = ('/api/sessions/', '/api/jobs/')
+CACHE_METRIC = 'chem_result_cache_requests_total'
+TIMEOUT_HEADER = 'X-Timeout-Ms'
+
+
+# ======================================================================
+# ĐỌC LOG VÀ LẬP LỊCH
+# ======================================================================
+
+def load_records(path: str, include_stateful: bool = False) -> List[Dict[str, Any]]:
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get('body_omitted'):
+                continue
+            if not include_stateful and record.get('path', '').startswith(STATEFUL_PREFIXES):
+                continue
+            records.append(record)
+    return records
+
+
+def schedule(records: List[Dict[str, Any]], repeat: int, rate: Optional[float], speed: Optional[float],
+             poisson: bool, seed: int) -> Iterator[Tuple[Optional[float], Dict[str, Any]]]:
+    """(giây kể từ lúc bắt đầu mà request phải được gửi, hoặc None nếu gửi ngay; bản ghi)."""
+    rng = random.Random(seed)
+    first_ts = records[0].get('ts', 0.0) if records else 0.0
+    offset = last = 0.0
+    for _ in range(repeat):
+        for record in records:
+            if rate:
+                yield offset, record
+                offset += rng.expovariate(rate) if poisson else 1.0 / rate
+            elif speed:
+                last = max(0.0, (record.get('ts', first_ts) - first_ts) / speed)
+                yield offset + last, record
+            else:
+                yield None, record
+        if speed:
+            offset += last
+
+
+# ======================================================================
+# GỬI REQUEST
+# ======================================================================
+
+class HttpClient:
+    def __init__(self, target: str):
+        self.target = target.rstrip('/')
+
+    def send(self, record: Dict[str, Any]) -> int:
+        url = self.target + record['path'] + (('?' + record['query']) if record.get('query') else '')
+        data = None
+        headers = {}
+        if 'body' in record:
+            data = json.dumps(record['body']).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if record.get('timeout_ms'):
+            headers[TIMEOUT_HEADER] = str(record['timeout_ms'])
+        req = urllib.request.Request(url, data=data, headers=headers, method=record.get('method', 'GET'))
+        try:
+            with urllib.request.urlopen(req) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def metrics_text(self) -> str:
+        try:
+            with urllib.request.urlopen(self.target + '/metrics') as response:
+                return response.read().decode('utf-8')
+        except (urllib.error.URLError, OSError):
+            return ''
+
+
+class InProcessClient:
+    """Gửi request qua Flask test client của api_server (mỗi luồng một client)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client
+
+    def send(self, record: Dict[str, Any]) -> int:
+        headers = {TIMEOUT_HEADER: str(record['timeout_ms'])} if record.get('timeout_ms') else {}
+        kwargs: Dict[str, Any] = {'headers': headers, 'query_string': record.get('query') or None}
+        if 'body' in record:
+            kwargs['json'] = record['body']
+        response = self._client().open(record['path'], method=record.get('method', 'GET'), **kwargs)
+        # Đọc hết phản hồi (endpoint luồng chỉ chạy engine khi được đọc)
+        response.get_data()
+        status = response.status_code
+        response.close()
+        return status
+
+    def metrics_text(self) -> str:
+        return self._client().get('/metrics').get_data(as_text=True)
+
+
+def _in_process_app(db_url: str):
+    import api_server
+    return api_server.create_app({
+        'SQLALCHEMY_DATABASE_URI': db_url,
+        'WORKER_MODE': os.environ.get('CHEM_WORKER_MODE', 'thread'),
+        'REQUEST_LOG_PATH': '',
+        'KB_LOAD': api_server.KB_LOAD_EAGER,
+    })
+
+
+# ======================================================================
+# CHẠY VÀ BÁO CÁO
+# ======================================================================
+
+def _cache_counts(text: str) -> Dict[str, float]:
+    """{"hit": ..., "miss": ...} cộng dồn trên mọi cache từ nội dung /metrics."""
+    counts = {'hit': 0.0, 'miss': 0.0}
+    for line in text.splitlines():
+        if not line.startswith(CACHE_METRIC + '{'):
+            continue
+        labels, _, value = line.rpartition(' ')
+        for result in counts:
+            if f'result="{result}"' in labels:
+                counts[result] += float(value)
+    return counts
+
+
+def replay(client, plan: Iterator[Tuple[Optional[float], Dict[str, Any]]], concurrency: int) -> Tuple[List[Dict[str, Any]], float]:
+    """Chạy kế hoạch với `concurrency` luồng; trả về (kết quả từng request, tổng thời gian)."""
+    work: 'queue.Queue[Optional[Tuple[Optional[float], Dict[str, Any]]]]' = queue.Queue(maxsize=concurrency * 4)
+    results: List[Dict[str, Any]] = []
+    results_lock = threading.Lock()
+    start = time.perf_counter()
+
+    def worker():
+        local: List[Dict[str, Any]] = []
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            due, record = item
+            if due is not None:
+                delay = start + due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            try:
+                status: Optional[int] = client.send(record)
+            except Exception:
+                status = None
+            done = time.perf_counter()
+            local.append({
+                'endpoint': record.get('endpoint') or record.get('path'),
+                'status': status,
+                'recorded_status': record.get('status'),
+                'latency': done - (start + due if due is not None else sent),
+                'service': done - sent,
+            })
+        with results_lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for item in plan:
+        work.put(item)
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def _endpoint_summary(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    latencies = sorted(r['latency'] for r in rows)
+    service = sorted(r['service'] for r in rows)
+    errors = sum(1 for r in rows if r['status'] is None or r['status'] >= 500)
+    return {
+        'requests': len(rows),
+        'p50_ms': round(synthetic.percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(synthetic.percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(synthetic.percentile(latencies, 0.99) * 1000, 3),
+        'service_p50_ms': round(synthetic.percentile(service, 0.50) * 1000, 3),
+        'service_p99_ms': round(synthetic.percentile(service, 0.99) * 1000, 3),
+        'error_rate': round(errors / len(rows), 4) if rows else 0.0,
+        'client_errors': sum(1 for r in rows if r['status'] is not None and 400 <= r['status'] < 500),
+        'status_mismatch': sum(1 for r in rows if r['recorded_status'] is not None and r['status'] != r['recorded_status']),
+    }
+
+
+def build_report(results: List[Dict[str, Any]], elapsed: float, cache_before: Dict[str, float],
+                 cache_after: Dict[str, float]) -> Dict[str, Any]:
+    by_endpoint: Dict[str, List[Dict[str, Any]]] = {}
+    for row in results:
+        by_endpoint.setdefault(row['endpoint'], []).append(row)
+    hits = cache_after['hit'] - cache_before['hit']
+    lookups = hits + cache_after['miss'] - cache_before['miss']
+    return {
+        'total': dict(_endpoint_summary(results), throughput_per_s=round(len(results) / elapsed, 2) if elapsed else None,
+                      elapsed_s=round(elapsed, 3)),
+        'endpoints': {name: _endpoint_summary(rows) for name, rows in sorted(by_endpoint.items())},
+        'result_cache': {'lookups': lookups, 'hits': hits,
+                         'hit_ratio': round(hits / lookups, 4) if lookups else None},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log', help='File request log JSONL.')
+    parser.add_argument('--target', help='URL máy chủ đang chạy (mặc định: chạy api_server trong tiến trình).')
+    parser.add_argument('--db', help='URL CSDL khi chạy trong tiến trình. Mặc định: CSDL tổng hợp --size phản ứng.')
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE, help='Kích thước CSDL tổng hợp khi không có --db.')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--rate', type=float, help='Tốc độ đến (request/giây), vòng mở.')
+    parser.add_argument('--poisson', action='store_true', help='Với --rate: khoảng cách ngẫu nhiên (phân phối mũ).')
+    parser.add_argument('--speed', type=float, help='Giữ nhịp thời gian của log, nhanh gấp SPEED lần.')
+    parser.add_argument('--repeat', type=int, default=1, help='Phát lại log bao nhiêu lượt.')
+    parser.add_argument('--limit', type=int, help='Chỉ dùng LIMIT request đầu tiên của log.')
+    parser.add_argument('--seed', type=int, default=synthetic.DEFAULT_SEED)
+    parser.add_argument('--include-stateful', action='store_true')
+    parser.add_argument('--out', help='Ghi báo cáo JSON vào tệp.')
+    args = parser.parse_args(argv)
+    if args.rate and args.speed:
+        parser.error('Chỉ dùng một trong --rate và --speed.')
+
+    records = load_records(args.log, args.include_stateful)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print('Log không có request nào để phát lại.', file=sys.stderr)
+        return 1
+
+    if args.target:
+        client = HttpClient(args.target)
+    else:
+        db_url = args.db
+        if not db_url:
+            db_url = f'sqlite:////tmp/chem_bench_{args.size}.db'
+            synthetic.seed_database(db_url, args.size, args.seed)
+        client = InProcessClient(_in_process_app(db_url))
+
+    cache_before = _cache_counts(client.metrics_text())
+    plan = schedule(records, max(1, args.repeat), args.rate, args.speed, args.poisson, args.seed)
+    results, elapsed = replay(client, plan, max(1, args.concurrency))
+    report = build_report(results, elapsed, cache_before, _cache_counts(client.metrics_text()))
+
+    for name, row in itertools.chain(report['endpoints'].items(), [('TỔNG', report['total'])]):
+        print(f"{name:>36}: {row['requests']:>6} req  p50 {row['p50_ms']:.2f}  p95 {row['p95_ms']:.2f}  "
+              f"p99 {row['p99_ms']:.2f} ms  lỗi {row['error_rate']:.2%}  4xx {row['client_errors']}  "
+              f"khác log {row['status_mismatch']}", file=sys.stderr)
+    cache = report['result_cache']
+    print(f"Thông lượng {report['total']['throughput_per_s']} req/s; cache kết quả: {cache['hits']:.0f}/"
+          f"{cache['lookups']:.0f} trúng", file=sys.stderr)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
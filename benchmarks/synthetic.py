@@ -0,0 +1,272 @@
+# --- File: benchmarks/synthetic.py ---
+"""
+Sinh dữ liệu tổng hợp có seed cho các benchmark (cùng seed + cùng kích thước -> cùng dữ liệu):
+
+- reaction_rows():     mạng phản ứng (bảng 'reactions') có vài chất "trung tâm" như dữ liệu thật
+                       (H2O, HCl... xuất hiện trong rất nhiều phản ứng), tập chất lớn dần theo kích thước.
+- calculation_rows():  đồ thị luật tính toán (bảng 'chemical_rules') dạng DAG trên các biến v0, v1...
+- equation_corpus():   phương trình chưa cân bằng từ các mẫu thật (kim loại + phi kim, kim loại + axit,
+                       trung hòa, đốt cháy hiđrocacbon/ancol) với công thức có nghĩa hóa học.
+- ELEMENTS:            bảng nguyên tố tối thiểu cho mọi công thức được sinh ra.
+
+seed_database() ghi tất cả vào một CSDL (mặc định SQLite cục bộ) bằng executemany theo lô.
+"""
+
+import json
+import math
+import random
+import sys
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+SEED_CHUNK = 10000
+DEFAULT_SEED = 42
+
+# (ký hiệu, số hiệu, khối lượng, hóa trị)
+ELEMENTS: List[Tuple[str, int, float, int]] = [
+    ('H', 1, 1.008, 1), ('C', 6, 12.011, 4), ('N', 7, 14.007, 3), ('O', 8, 15.999, 2), ('F', 9, 18.998, 1),
+    ('Na', 11, 22.99, 1), ('Mg', 12, 24.305, 2), ('Al', 13, 26.982, 3), ('S', 16, 32.06, 2), ('Cl', 17, 35.45, 1),
+    ('K', 19, 39.098, 1), ('Ca', 20, 40.078, 2), ('Fe', 26, 55.845, 3), ('Cu', 29, 63.546, 2), ('Zn', 30, 65.38, 2),
+    ('Br', 35, 79.904, 1), ('Ag', 47, 107.87, 1), ('Ba', 56, 137.33, 2), ('Pb', 82, 207.2, 2), ('Li', 3, 6.94, 1),
+]
+
+_METALS = [('Na', 1), ('K', 1), ('Li', 1), ('Ag', 1), ('Mg', 2), ('Ca', 2), ('Ba', 2), ('Zn', 2), ('Cu', 2),
+           ('Pb', 2), ('Fe', 3), ('Al', 3)]
+# Phi kim dạng phân tử hai nguyên tử: (ký hiệu, hóa trị trong hợp chất)
+_DIATOMIC = [('Cl', 1), ('Br', 1), ('F', 1), ('O', 2)]
+# Gốc axit: (gốc, hóa trị, có cần ngoặc khi nhân)
+_ACID_ROOTS = [('Cl', 1, False), ('Br', 1, False), ('NO3', 1, True), ('SO4', 2, True), ('CO3', 2, True)]
+
+_HUB_SPECIES = ['H2O', 'HCl', 'NaOH', 'O2', 'CO2', 'H2', 'Cl2', 'H2SO4', 'NH3', 'Fe']
+_CONDITIONS = ['t°', 'xt', 'p', 'ánh sáng', 'điện phân']
+_PHENOMENA = ['Không hiện tượng', 'Kết tủa trắng', 'Khí thoát ra', 'Dung dịch chuyển màu xanh',
+              'Kết tủa nâu đỏ', 'Khói trắng', 'Dung dịch mất màu']
+
+
+# ======================================================================
+# MẠNG PHẢN ỨNG
+# ======================================================================
+
+def species_pool(size: int) -> List[str]:
+    """Tập chất của mạng `size` phản ứng: các chất trung tâm + X0, X1... (khoảng size/4 chất)."""
+    return _HUB_SPECIES + [f"X{i}" for i in range(max(50, size // 4))]
+
+
+def reaction_rows(size: int, seed: int = DEFAULT_SEED) -> Iterator[Dict[str, Any]]:
+    """Các dòng của bảng 'reactions' (đúng `size` dòng)."""
+    rng = random.Random(seed)
+    pool = species_pool(size)
+    hubs = len(_HUB_SPECIES)
+    for _ in range(size):
+        reactants = rng.sample(pool, rng.randint(1, 3))
+        # Khoảng một phần ba phản ứng có một chất trung tâm (phân bố bậc lệch như dữ liệu thật)
+        if rng.random() < 0.35:
+            hub = pool[rng.randrange(hubs)]
+            if hub not in reactants:
+                reactants[0] = hub
+        products = rng.sample(pool, rng.randint(1, 3))
+        conditions = rng.sample(_CONDITIONS, 1) if rng.random() < 0.3 else []
+        yield {
+            'type': rng.choice(('hóa hợp', 'phân hủy', 'thế', 'trao đổi')),
+            'description': None,
+            'reactants_json': json.dumps(reactants, ensure_ascii=False),
+            'products_json': json.dumps(products, ensure_ascii=False),
+            'conditions_json': json.dumps(conditions, ensure_ascii=False),
+            'equation_string': f"{' + '.join(reactants)} -> {' + '.join(products)}",
+            'phenomena': rng.choice(_PHENOMENA),
+            'phenomena_detail_json': None,
+        }
+
+
+def reactant_queries(size: int, count: int, seed: int = DEFAULT_SEED) -> List[Tuple[str, str]]:
+    """Đầu vào suy luận tiến: (chất ban đầu "A + B + C", điều kiện) trên tập chất của mạng `size`."""
+    rng = random.Random(seed + 1)
+    pool = species_pool(size)
+    queries = []
+    for _ in range(count):
+        start = rng.sample(_HUB_SPECIES, 1) + rng.sample(pool, rng.randint(1, 3))
+        queries.append((' + '.join(dict.fromkeys(start)), rng.choice(('', '', 't°'))))
+    return queries
+
+
+def path_queries(size: int, count: int, seed: int = DEFAULT_SEED) -> List[Tuple[str, str]]:
+    """Đầu vào tìm đường: (chất ban đầu, chất đích)."""
+    rng = random.Random(seed + 2)
+    pool = species_pool(size)
+    return [(' + '.join(rng.sample(_HUB_SPECIES, 2) + rng.sample(pool, 1)), rng.choice(pool)) for _ in range(count)]
+
+
+def identification_queries(size: int, count: int, seed: int = DEFAULT_SEED) -> List[List[str]]:
+    """Bài nhận biết: 3-4 chất cần phân biệt."""
+    rng = random.Random(seed + 3)
+    pool = species_pool(size)
+    return [rng.sample(pool, rng.randint(3, 4)) for _ in range(count)]
+
+
+# ======================================================================
+# ĐỒ THỊ LUẬT TÍNH TOÁN
+# ======================================================================
+
+def calculation_variables(size: int) -> List[str]:
+    return [f"v{i}" for i in range(max(10, size // 2))]
+
+
+def calculation_rows(size: int, seed: int = DEFAULT_SEED) -> Iterator[Dict[str, Any]]:
+    """
+    Các dòng của bảng 'chemical_rules': mỗi luật tính một biến từ 1-3 biến có chỉ số nhỏ hơn
+    (đồ thị không chu trình, v0..v4 là biến gốc), biểu thức là phép toán thật trên các biến đó.
+    """
+    rng = random.Random(seed + 4)
+    variables = calculation_variables(size)
+    for i in range(size):
+        output_index = rng.randrange(5, len(variables))
+        window = max(5, output_index // 2)
+        inputs = sorted(set(rng.sample(variables[max(0, output_index - window):output_index],
+                                       min(rng.randint(1, 3), output_index))))
+        expression = ' + '.join(inputs) if rng.random() < 0.5 else ' * '.join(inputs)
+        yield {
+            'name': f"rule_{i}",
+            'formula': f"{variables[output_index]} = {expression}",
+            'description': None,
+            'required_inputs': inputs,
+            'output_var': variables[output_index],
+            'expression': expression,
+        }
+
+
+def calculation_queries(size: int, count: int, seed: int = DEFAULT_SEED) -> List[Tuple[Dict[str, float], str]]:
+    """(biến đã biết với giá trị, biến cần tính) cho find_calculation_path/calculate_rule."""
+    rng = random.Random(seed + 5)
+    variables = calculation_variables(size)
+    queries = []
+    for _ in range(count):
+        known = {name: round(rng.uniform(1, 10), 3) for name in rng.sample(variables[:max(5, len(variables) // 8)], 4)}
+        queries.append((known, rng.choice(variables[5:min(len(variables), 40)])))
+    return queries
+
+
+# ======================================================================
+# KHO PHƯƠNG TRÌNH
+# ======================================================================
+
+def _compound(cation: str, cation_valence: int, anion: str, anion_valence: int, group: bool) -> str:
+    g = math.gcd(cation_valence, anion_valence)
+    n_cation, n_anion = anion_valence // g, cation_valence // g
+    left = cation + (str(n_cation) if n_cation > 1 else '')
+    if n_anion == 1:
+        right = anion
+    else:
+        right = f"({anion}){n_anion}" if group else f"{anion}{n_anion}"
+    return left + right
+
+
+def _hydroxide(metal: str, valence: int) -> str:
+    return f"{metal}OH" if valence == 1 else f"{metal}(OH){valence}"
+
+
+def _acid(root: str, valence: int) -> str:
+    return f"H{valence if valence > 1 else ''}{root}"
+
+
+def equation_corpus(size: int, seed: int = DEFAULT_SEED) -> List[str]:
+    """
+    `size` phương trình chưa cân bằng dạng "A + B -> C + D" (có thể lặp lại khi size lớn).
+    Một số phương trình (vd: C2H5OH + O2) vượt quá thuật toán cân bằng heuristic: giữ lại để đo cả nhánh thất bại.
+    """
+    rng = random.Random(seed + 6)
+    corpus = []
+    for _ in range(size):
+        template = rng.randrange(4)
+        metal, mv = rng.choice(_METALS)
+        if template == 0:
+            nonmetal, nv = rng.choice(_DIATOMIC)
+            corpus.append(f"{metal} + {nonmetal}2 -> {_compound(metal, mv, nonmetal, nv, False)}")
+        elif template == 1:
+            root, rv, group = rng.choice(_ACID_ROOTS[:2] + _ACID_ROOTS[3:4])
+            corpus.append(f"{metal} + {_acid(root, rv)} -> {_compound(metal, mv, root, rv, group)} + H2")
+        elif template == 2:
+            root, rv, group = rng.choice(_ACID_ROOTS)
+            corpus.append(f"{_hydroxide(metal, mv)} + {_acid(root, rv)} -> "
+                          f"{_compound(metal, mv, root, rv, group)} + H2O")
+        else:
+            n = rng.randint(1, 12)
+            carbon = 'C' if n == 1 else f"C{n}"
+            if rng.random() < 0.5:
+                corpus.append(f"{carbon}H{2 * n + 2} + O2 -> CO2 + H2O")
+            else:
+                corpus.append(f"{carbon}H{2 * n + 1}OH + O2 -> CO2 + H2O")
+    return corpus
+
+
+# ======================================================================
+# GHI VÀO CSDL
+# ======================================================================
+
+def make_app(url: str):
+    from flask import Flask
+    import models
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    models.db.init_app(app)
+    return app, models
+
+
+def _insert_rows(conn_factory, table, rows: Iterator[Dict[str, Any]]) -> int:
+    from sqlalchemy import insert
+    total = 0
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= SEED_CHUNK:
+            with conn_factory() as conn:
+                conn.execute(insert(table), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        with conn_factory() as conn:
+            conn.execute(insert(table), batch)
+        total += len(batch)
+    return total
+
+
+def seed_database(url: str, size: int, seed: int = DEFAULT_SEED) -> bool:
+    """
+    Tạo CSDL benchmark kích thước `size` (số phản ứng = số luật tính toán = size).
+    Bỏ qua nếu CSDL đã có đúng dữ liệu của (size, seed) (ghi trong bảng nhỏ bench_meta). Trả về True nếu đã ghi.
+    """
+    from sqlalchemy import Column, Integer, MetaData, Table, delete, insert, select
+    app, models = make_app(url)
+    meta = Table('bench_meta', MetaData(), Column('size', Integer), Column('seed', Integer))
+    with app.app_context():
+        engine = models.db.engine
+        models.db.create_all()
+        meta.create(engine, checkfirst=True)
+        with engine.connect() as conn:
+            row = conn.execute(select(meta.c.size, meta.c.seed)).first()
+        if row is not None and (row.size, row.seed) == (size, seed):
+            return False
+
+        print(f"Đang tạo CSDL benchmark: {size} phản ứng, {size} luật tính toán...", file=sys.stderr)
+        with engine.begin() as conn:
+            for model in (models.ReactionModel, models.ChemicalRuleModel, models.ElementModel):
+                conn.execute(delete(model.__table__))
+            conn.execute(delete(meta))
+            conn.execute(insert(models.ElementModel.__table__), [
+                {'mark': mark, 'atomic_number': number, 'atomic_mass': mass, 'valence': valence}
+                for mark, number, mass, valence in ELEMENTS
+            ])
+        _insert_rows(engine.begin, models.ReactionModel.__table__, reaction_rows(size, seed))
+        _insert_rows(engine.begin, models.ChemicalRuleModel.__table__, calculation_rows(size, seed))
+        with engine.begin() as conn:
+            conn.execute(insert(meta), [{'size': size, 'seed': seed}])
+    return True
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Phân vị (nội suy tuyến tính) của dãy đã sắp xếp."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
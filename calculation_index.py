@@ -0,0 +1,104 @@
+# --- File: calculation_index.py ---
+"""
+Chỉ mục tra luật tính toán (chemical_rules) theo tập biến đầu vào, thay cho việc quét toàn bộ luật.
+
+Các luật được xếp vào một trie theo danh sách biến đầu vào đã sắp xếp; luật áp dụng được cho tập
+biến Q là các luật nằm trên những nút có đường đi là tập con của Q. Duyệt trie chỉ đi vào các nhánh
+có biến thuộc Q, nên chi phí phụ thuộc số biến đầu vào và số luật khớp, không phụ thuộc tổng số luật.
+
+Biểu thức của mỗi luật được biên dịch sẵn khi dựng chỉ mục (chỉ mục gắn với snapshot, dựng một lần).
+"""
+
+from types import CodeType
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import knowledge_base
+from chemistry_data import compile_rule_expression
+from knowledge_base import KnowledgeBase
+
+CALCULATION_INDEX = 'calculation_index'
+
+
+class _Node:
+    __slots__ = ('children', 'rules')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        # Vị trí (thứ tự trong bảng) của các luật có đúng tập biến đầu vào của nút này
+        self.rules: List[int] = []
+
+
+class CalculationRuleIndex:
+    """Trie tập biến đầu vào -> luật, kèm biểu thức đã biên dịch của từng luật."""
+
+    def __init__(self, rules: Sequence[Any]):
+        self.rules = list(rules)
+        self.root = _Node()
+        self.compiled: List[Optional[CodeType]] = []
+        for position, rule in enumerate(self.rules):
+            node = self.root
+            for var in sorted(set(rule.required_inputs or ())):
+                node = node.children.setdefault(var, _Node())
+            node.rules.append(position)
+            try:
+                self.compiled.append(compile_rule_expression(rule.expression))
+            except (SyntaxError, TypeError, ValueError):
+                # Biểu thức lỗi: để execute_rule_expression báo lỗi khi thực sự dùng tới
+                self.compiled.append(None)
+
+    @classmethod
+    def from_kb(cls, kb: KnowledgeBase) -> 'CalculationRuleIndex':
+        return cls(kb.chemical_rules)
+
+    def __reduce__(self):
+        # Biểu thức đã biên dịch không pickle được: lưu luật, dựng lại khi nạp snapshot
+        return CalculationRuleIndex, (self.rules,)
+
+    def _matching_nodes(self, available: Iterable[str]):
+        """Các nút (kèm độ sâu = số biến đầu vào) có đường đi là tập con của `available`."""
+        names = sorted(set(available))
+        stack: List[Tuple[_Node, int, int]] = [(self.root, 0, 0)]
+        while stack:
+            node, start, depth = stack.pop()
+            yield node, depth
+            children = node.children
+            if not children:
+                continue
+            for i in range(start, len(names)):
+                child = children.get(names[i])
+                if child is not None:
+                    stack.append((child, i + 1, depth + 1))
+
+    def applicable(self, available: Iterable[str]) -> List[int]:
+        """Vị trí các luật có mọi biến đầu vào nằm trong `available`, theo thứ tự trong bảng."""
+        found: List[int] = []
+        for node, _depth in self._matching_nodes(available):
+            found.extend(node.rules)
+        found.sort()
+        return found
+
+    def most_specific(self, available: Iterable[str]) -> Optional[int]:
+        """
+        Luật áp dụng được dùng nhiều biến đầu vào nhất (cùng số biến: luật đứng trước trong bảng).
+        Chỉ xét luật đầu tiên của mỗi nút khớp, nên chi phí không phụ thuộc số luật.
+        """
+        best: Optional[Tuple[int, int]] = None
+        for node, depth in self._matching_nodes(available):
+            if node.rules:
+                candidate = (depth, -node.rules[0])
+                if best is None or candidate > best:
+                    best = candidate
+        return None if best is None else -best[1]
+
+    def expression(self, position: int):
+        """Biểu thức đã biên dịch của luật (chuỗi gốc nếu không biên dịch được)."""
+        code = self.compiled[position]
+        return code if code is not None else self.rules[position].expression
+
+
+knowledge_base.register_derived(CALCULATION_INDEX, CalculationRuleIndex.from_kb)
+
+
+def current_index() -> CalculationRuleIndex:
+    """Chỉ mục luật tính toán của snapshot đang ghim cho request hiện tại."""
+    return knowledge_base.current().derived(CALCULATION_INDEX)
@@ -0,0 +1,163 @@
+# --- File: calculation_path.py ---
+
+from typing import Any, Dict, Optional, Tuple
+
+from chemistry_data import (
+    get_chemical_rules, execute_rule_expression, find_calculation_path, get_molar_mass
+)
+from metrics import stage
+from task_context import TaskContext
+
+
+def calculate_along_path(known_vars_with_values: Dict[str, float], primary_formula: str, target_var_type: str,
+                         ctx: Optional[TaskContext] = None) -> Tuple[Dict[str, Any], int]:
+    """
+    Tìm chuỗi luật tính toán cho 1 chất duy nhất và thực hiện tính toán theo chuỗi đó.
+
+    Trả về (nội dung phản hồi, mã HTTP) để API trả thẳng về client. Hàm không phụ thuộc
+    request context nên có thể chạy trong tiến trình worker.
+    """
+    current_vars: Dict[str, float] = {}
+    custom_rules = []
+
+    try:
+        molar_mass = get_molar_mass(primary_formula)
+
+        # 1. Định nghĩa Tên biến đã Gán nhãn thực tế
+        mass_var = f"m_{primary_formula}"
+        mol_mass_var = f"M_{primary_formula}"
+        mol_var = f"n_{primary_formula}"
+        conc_var = f"C_{primary_formula}"
+
+        # Nhãn biến mục tiêu cuối cùng
+        target_var_labeled = f"{target_var_type}_{primary_formula}"
+
+        # 2. Thêm Khối lượng Mol M_[Chất]
+        current_vars[mol_mass_var] = molar_mass
+
+        # 3. GÁN NHÃN các biến đầu vào (C, V, m) thành biến cụ thể
+        for var_type, value in known_vars_with_values.items():
+            if var_type == 'V':
+                # Gán nhãn V thành V_dd
+                current_vars['V_dd'] = value
+            elif var_type == 'C':
+                # Gán nhãn C thành C_[Chất]
+                current_vars[conc_var] = value
+            elif var_type == 'm':
+                # Gán nhãn m thành m_[Chất]
+                current_vars[mass_var] = value
+            elif var_type == 'n':
+                # Gán nhãn n thành n_[Chất]
+                current_vars[mol_var] = value
+            elif var_type == 'M':
+                # Gán nhãn M thành M_[Chất] (M này sẽ ghi đè lên M tính toán nếu có)
+                current_vars[mol_mass_var] = value
+
+        # 4. TẠO CÁC LUẬT TÙY CHỈNH (Custom Rules)
+        def create_custom_rule(name, formula, inputs, output, expression):
+            return {
+                'name': name, 'formula': formula, 'description': f'Luật tùy chỉnh cho {primary_formula}',
+                'required_inputs': inputs, 'output_var': output, 'expression': expression
+            }
+
+        # Custom Rule 1: n = m / M
+        custom_rules.append(create_custom_rule(
+            f"Custom_n_tu_m_{primary_formula}", f"{mol_var} = {mass_var} / {mol_mass_var}",
+            [mass_var, mol_mass_var], mol_var, f"{mass_var} / {mol_mass_var}"
+        ))
+
+        # Custom Rule 2: C = n / V_dd
+        custom_rules.append(create_custom_rule(
+            f"Custom_C_tu_n_{primary_formula}", f"{conc_var} = {mol_var} / V_dd",
+            [mol_var, 'V_dd'], conc_var, f"{mol_var} / V_dd"
+        ))
+
+        # Custom Rule 3: n = C * V_dd
+        custom_rules.append(create_custom_rule(
+            f"Custom_n_tu_C_{primary_formula}", f"{mol_var} = {conc_var} * V_dd",
+            [conc_var, 'V_dd'], mol_var, f"{conc_var} * V_dd"
+        ))
+
+        # Custom Rule 4: m = n * M
+        custom_rules.append(create_custom_rule(
+            f"Custom_m_tu_n_{primary_formula}", f"{mass_var} = {mol_var} * {mol_mass_var}",
+            [mol_var, mol_mass_var], mass_var, f"{mol_var} * {mol_mass_var}"
+        ))
+
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+
+    known_vars_set = set(current_vars.keys())
+
+    # Lấy luật chung từ CSDL
+    all_rules_from_db = get_chemical_rules()
+
+    # Thêm thuộc tính .to_dict() cho custom_rules
+    for rule_dict in custom_rules:
+        rule_dict['to_dict'] = lambda self=rule_dict: self
+
+    all_rules_for_search = all_rules_from_db + custom_rules
+
+    # === 5. Tìm kiếm đường đi (path) ===
+    with stage('search'):
+        path_of_rules = find_calculation_path(known_vars_set, target_var_labeled, all_rules_for_search, ctx=ctx)
+
+    if not path_of_rules:
+        if ctx is not None and ctx.timed_out:
+            return {
+                "success": False,
+                "partial": True,
+                "message": f"Hết thời gian cho phép trước khi tìm được chuỗi luật cho '{target_var_labeled}'.",
+                "initial_vars": list(known_vars_set)
+            }, 504
+        return {
+            "success": False,
+            "message": f"Không thể tìm thấy chuỗi luật nào để tính toán biến '{target_var_labeled}' từ các biến đã biết.",
+            "initial_vars": list(known_vars_set)
+        }, 404
+
+    # === 6. Thực hiện tính toán theo chuỗi ===
+    calculation_steps = []
+
+    for i, rule_model_or_dict in enumerate(path_of_rules):
+        try:
+            rule_dict = rule_model_or_dict.to_dict() if hasattr(rule_model_or_dict, 'to_dict') else rule_model_or_dict
+
+            expression = rule_dict['expression']
+            output_var = rule_dict['output_var']
+
+            with stage('evaluate'):
+                result_value = execute_rule_expression(expression, current_vars)
+
+            current_vars[output_var] = result_value
+
+            step_detail = {
+                "step": i + 1,
+                "rule_name": rule_dict.get('name', 'N/A'),
+                "formula": rule_dict.get('formula', 'N/A'),
+                "expression_used": expression,
+                "inputs_used_and_values": {var: current_vars[var] for var in rule_dict['required_inputs']},
+                "output_var": output_var,
+                "result_value": result_value
+            }
+            calculation_steps.append(step_detail)
+
+            if output_var == target_var_labeled:
+                break
+
+        except ValueError as e:
+            return {
+                "success": False,
+                "error": f"Lỗi tính toán ở bước {i + 1} ({rule_dict.get('name', 'N/A')}): {str(e)}",
+                "path_so_far": calculation_steps
+            }, 400
+
+    # 7. Trả kết quả cuối cùng
+    return {
+        "success": True,
+        "message": f"Đã tính toán thành công '{target_var_labeled}' sau {len(calculation_steps)} bước.",
+        "target_var_labeled": target_var_labeled,
+        "final_result": current_vars.get(target_var_labeled),
+        "initial_inputs": known_vars_with_values,
+        "calculation_path_details": calculation_steps
+    }, 200
@@ -1,17 +1,29 @@
 # --- File: chemistry_data.py ---
 
 import collections
+import functools
 import math
 import re
 import json
-import traceback
-from typing import List, Dict, Any, TYPE_CHECKING, Optional, Set
+import logging
+import time
+from types import CodeType
+from typing import List, Dict, Any, TYPE_CHECKING, Optional, Set, Callable, Iterator, Union
 from collections import deque
 
+import knowledge_base
+from knowledge_base import KnowledgeBase
+from metrics import record_engine_run
+from rule_records import CalculationRule, ReactionRule
+from species import canonical_formula, split_species
+from task_context import TaskContext, expired, report
+
 # Giả định cho Type Hinting nếu cần (Tránh lỗi import vòng tròn nếu models.py import chemistry_data)
 if TYPE_CHECKING:
     from models import ReactionModel, ChemicalRuleModel, ElementModel
 
+logger = logging.getLogger(__name__)
+
 # ======================================================================
 # HẰNG SỐ VÀ CACHE DỮ LIỆU TOÀN CỤC
 # ======================================================================
@@ -157,54 +169,282 @@ class ChemicalEquation:
 # CHỨC NĂNG TẢI DỮ LIỆU TỪ CSDL VÀ QUẢN LÝ CACHE
 # ======================================================================
 
-def load_elements_from_db(models_module) -> Dict[str, Dict[str, Any]]:
+# Số dòng đọc mỗi lượt khi duyệt bảng luật bằng con trỏ phía server (stream_results)
+LOAD_BATCH_SIZE = 2000
+
+
+def iter_row_batches(models_module, table, columns=None, ids: Optional[List[int]] = None,
+                     batch_size: int = LOAD_BATCH_SIZE) -> Iterator[List[Any]]:
     """
-    Tải dữ liệu Bảng Tuần Hoàn từ CSDL (bảng 'elements') vào bộ nhớ.
+    Duyệt bảng bằng Core select theo từng lô `batch_size` dòng (yield_per -> con trỏ phía server
+    với MySQL/PostgreSQL), không tạo đối tượng ORM và không giữ toàn bộ kết quả thô trong bộ nhớ.
+    `ids`: chỉ đọc các dòng có id trong danh sách (dùng cho tải lại tăng dần).
     """
-    global ELEMENTS_CACHED, ELEMENTS
-
+    from sqlalchemy import select
+    stmt = select(*(columns if columns is not None else table.c)).order_by(table.c.id)
+    if ids is not None:
+        stmt = stmt.where(table.c.id.in_(ids))
+    with models_module.db.engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(stmt)
+        for batch in result.partitions():
+            yield batch
+
+
+def fetch_elements(models_module) -> Dict[str, Dict[str, Any]]:
+    """Đọc bảng 'elements' thành dict {ký hiệu: {num, mass, valence}}. Ném lỗi nếu truy vấn thất bại."""
     ElementModel = getattr(models_module, 'ElementModel', None)
-
     if not ElementModel:
-        print("[LỖI TẢI ELEMENT] Không tìm thấy ElementModel. Đảm bảo đã định nghĩa.")
-        return ELEMENTS_CACHED
+        raise LookupError("Không tìm thấy ElementModel. Đảm bảo đã định nghĩa.")
+
+    elements: Dict[str, Dict[str, Any]] = {}
+    for batch in iter_row_batches(models_module, ElementModel.__table__):
+        for row in batch:
+            elements[row.mark] = {
+                'num': row.atomic_number,
+                'mass': row.atomic_mass,
+                'valence': row.valence
+            }
+    logger.debug("Các nguyên tố đọc từ CSDL: %s", list(elements))
+    return elements
+
+
+def fetch_reaction_rules(models_module, ids: Optional[List[int]] = None) -> List[ReactionRule]:
+    """Đọc luật phản ứng thành các ReactionRule gọn nhẹ (theo thứ tự id). Ném lỗi nếu truy vấn thất bại."""
+    rules: List[ReactionRule] = []
+    for batch in iter_row_batches(models_module, models_module.ReactionModel.__table__, ids=ids):
+        rules.extend(ReactionRule.from_row(row) for row in batch)
+    return rules
+
+
+def fetch_chemical_rules(models_module, ids: Optional[List[int]] = None) -> List[CalculationRule]:
+    """Đọc luật hóa học chung thành các CalculationRule (theo thứ tự id). Ném lỗi nếu truy vấn thất bại."""
+    ChemicalRuleModel = getattr(models_module, 'ChemicalRuleModel', None)
+    if not ChemicalRuleModel:
+        raise LookupError("Không tìm thấy ChemicalRuleModel.")
+    rules: List[CalculationRule] = []
+    for batch in iter_row_batches(models_module, ChemicalRuleModel.__table__, ids=ids):
+        rules.extend(CalculationRule.from_row(row) for row in batch)
+    return rules
+
+
+def fetch_db_fingerprint(models_module) -> tuple:
+    """
+    Dấu vân tay rẻ của dữ liệu luật trong CSDL (số dòng và id lớn nhất của từng bảng),
+    dùng để phát hiện thay đổi khi CSDL không có changelog.
+    """
+    from sqlalchemy import func
+    session = models_module.db.session
+    fingerprint = []
+    for model in (models_module.ElementModel, models_module.ReactionModel, models_module.ChemicalRuleModel):
+        count, max_id = session.query(func.count(model.id), func.max(model.id)).one()
+        fingerprint.append((model.__tablename__, count, max_id))
+    return tuple(fingerprint)
+
+
+# ----------------------------------------------------------------------
+# Tải lại tăng dần dựa trên bảng kb_changelog (do trigger CSDL ghi)
+# ----------------------------------------------------------------------
+
+# Số thay đổi tối đa áp dụng theo kiểu tăng dần; vượt quá thì tải lại toàn bộ sẽ rẻ hơn
+DELTA_MAX_CHANGES = 5000
+# Số id mỗi truy vấn IN (...) khi đọc lại các dòng đã thay đổi
+DELTA_FETCH_CHUNK = 500
+
+_change_tracking_enabled = False
+
+# False khi các engine đọc luật phản ứng trực tiếp từ CSDL (reaction_index.DbRuleSource):
+# snapshot khi đó không chứa luật phản ứng, chỉ luật tính toán và bảng tuần hoàn
+_reaction_rules_in_memory = True
+
+
+def keep_reaction_rules_in_memory(enabled: bool) -> None:
+    """Bật/tắt việc tải luật phản ứng vào snapshot (gọi trước lần tải đầu tiên)."""
+    global _reaction_rules_in_memory
+    _reaction_rules_in_memory = bool(enabled)
 
-    print("\n[SETUP] BẮT ĐẦU TẢI DỮ LIỆU BẢNG TUẦN HOÀN...")
-    new_elements_cache = {}
 
+def reaction_rules_in_memory() -> bool:
+    return _reaction_rules_in_memory
+
+
+def enable_change_tracking(models_module) -> bool:
+    """
+    Cài trigger changelog (gọi trong app context, sau db.create_all()). Nếu thất bại
+    (CSDL không hỗ trợ/thiếu quyền), hệ thống vẫn chạy nhưng chỉ tải lại toàn bộ.
+    """
+    global _change_tracking_enabled
     try:
-        all_elements = ElementModel.query.all()
-
-        print(all_elements)
-        for element in all_elements:
-            new_elements_cache[element.mark] = {
-                'num': element.atomic_number,
-                'mass': element.atomic_mass,
-                'valence': element.valence
-            }
+        _change_tracking_enabled = bool(models_module.install_change_tracking())
+    except Exception as e:
+        logger.warning("[KB] Không cài được trigger changelog, chỉ hỗ trợ tải lại toàn bộ: %s", e)
+        _change_tracking_enabled = False
+    return _change_tracking_enabled
+
+
+def fetch_changelog_cursor(models_module) -> Optional[int]:
+    """id lớn nhất trong kb_changelog (0 nếu rỗng); None nếu không theo dõi thay đổi."""
+    if not _change_tracking_enabled:
+        return None
+    from sqlalchemy import func
+    ChangeLog = models_module.KBChangeLogModel
+    return models_module.db.session.query(func.max(ChangeLog.id)).scalar() or 0
+
+
+def fetch_changes(models_module, since_id: int, limit: int) -> List[tuple]:
+    """Các dòng changelog (id, table_name, row_id, op) sau `since_id`, theo thứ tự id, tối đa limit + 1 dòng."""
+    ChangeLog = models_module.KBChangeLogModel
+    return (models_module.db.session.query(ChangeLog.id, ChangeLog.table_name, ChangeLog.row_id, ChangeLog.op)
+            .filter(ChangeLog.id > since_id).order_by(ChangeLog.id).limit(limit + 1).all())
+
+
+def _coalesce_changes(changes: List[tuple]) -> Dict[str, tuple]:
+    """Gộp changelog theo bảng thành (tập id cần đọc lại, tập id đã xóa); thao tác sau cùng thắng."""
+    per_table: Dict[str, tuple] = {}
+    for _change_id, table_name, row_id, op in changes:
+        upserted, deleted = per_table.setdefault(table_name, (set(), set()))
+        if op == 'D':
+            upserted.discard(row_id)
+            deleted.add(row_id)
+        else:
+            deleted.discard(row_id)
+            upserted.add(row_id)
+    return per_table
+
+
+def _patch_rules(rules: List[Any], fetch: Callable[[List[int]], List[Any]], upserted: Set[int],
+                 deleted: Set[int]) -> List[Any]:
+    """
+    Trả về danh sách luật mới: chỉ đọc lại các dòng trong `upserted`, bỏ các dòng trong `deleted`.
+    Luật được sửa giữ nguyên vị trí, luật mới được nối vào cuối theo id (giữ thứ tự quét của engine).
+    """
+    if not upserted and not deleted:
+        return rules
+
+    fresh: Dict[int, Any] = {}
+    ids = sorted(upserted)
+    for i in range(0, len(ids), DELTA_FETCH_CHUNK):
+        for rule in fetch(ids[i:i + DELTA_FETCH_CHUNK]):
+            fresh[rule.id] = rule
+    # Dòng có trong changelog nhưng không còn trong bảng: coi như đã xóa
+    removed = deleted | (upserted - fresh.keys())
+
+    patched = []
+    for rule in rules:
+        if rule.id in removed:
+            continue
+        patched.append(fresh.pop(rule.id, rule))
+    patched.extend(fresh[row_id] for row_id in sorted(fresh))
+    return patched
+
+
+def build_knowledge_base(models_module) -> KnowledgeBase:
+    """
+    Dựng snapshot mới từ CSDL (chưa công bố). Nếu bất kỳ truy vấn nào lỗi, ngoại lệ được ném ra
+    và snapshot đang phục vụ được giữ nguyên.
+    """
+    # Đọc con trỏ changelog TRƯỚC khi đọc dữ liệu: thay đổi xảy ra trong lúc tải sẽ được áp lại
+    # ở lần tải tăng dần sau (áp lại một thay đổi là vô hại)
+    cursor = fetch_changelog_cursor(models_module)
+    elements = fetch_elements(models_module)
+    reaction_rules = fetch_reaction_rules(models_module) if _reaction_rules_in_memory else []
+    chemical_rules = fetch_chemical_rules(models_module)
+    return KnowledgeBase(reaction_rules, chemical_rules, elements, source='db', changelog_cursor=cursor)
 
-        ELEMENTS_CACHED = new_elements_cache
-        ELEMENTS = ELEMENTS_CACHED
-        print(f"[SETUP] ĐÃ HOÀN TẤT TẢI: {len(ELEMENTS_CACHED)} nguyên tố đã được tải.")
+
+def build_knowledge_base_delta(models_module, base: KnowledgeBase) -> Optional[KnowledgeBase]:
+    """
+    Dựng snapshot mới bằng cách áp các thay đổi trong changelog kể từ `base` (chưa công bố).
+    Trả về None nếu không có thay đổi; tải lại toàn bộ nếu `base` không có con trỏ changelog
+    hoặc số thay đổi vượt DELTA_MAX_CHANGES.
+    """
+    if base.changelog_cursor is None or not _change_tracking_enabled:
+        return build_knowledge_base(models_module)
+
+    changes = fetch_changes(models_module, base.changelog_cursor, DELTA_MAX_CHANGES)
+    if not changes:
+        return None
+    if len(changes) > DELTA_MAX_CHANGES:
+        logger.info("[KB] Có hơn %d thay đổi, chuyển sang tải lại toàn bộ.", DELTA_MAX_CHANGES)
+        return build_knowledge_base(models_module)
+
+    per_table = _coalesce_changes(changes)
+    empty = (set(), set())
+    reaction_changes = per_table.get(models_module.ReactionModel.__tablename__, empty)
+    if _reaction_rules_in_memory:
+        reaction_rules = _patch_rules(base.reaction_rules, lambda ids: fetch_reaction_rules(models_module, ids),
+                                      *reaction_changes)
+    else:
+        # Engine đọc luật từ các bảng chuẩn hóa: giữ chúng khớp với các cột JSON vừa sửa
+        from migrate_normalise import sync_reaction_links
+        reaction_rules = base.reaction_rules
+        if reaction_changes[0] or reaction_changes[1]:
+            sync_reaction_links(models_module, sorted(reaction_changes[0] | reaction_changes[1]))
+    chemical_rules = _patch_rules(base.chemical_rules, lambda ids: fetch_chemical_rules(models_module, ids),
+                                  *per_table.get(models_module.ChemicalRuleModel.__tablename__, empty))
+    # Bảng tuần hoàn rất nhỏ (~118 dòng) và được khóa theo ký hiệu: đọc lại toàn bộ khi có thay đổi
+    elements = base.elements
+    if models_module.ElementModel.__tablename__ in per_table:
+        elements = fetch_elements(models_module)
+
+    return base.replace(reaction_rules=reaction_rules, chemical_rules=chemical_rules, elements=elements,
+                        source='delta', changelog_cursor=changes[-1][0])
+
+
+def reload_knowledge_base(models_module) -> KnowledgeBase:
+    """Dựng snapshot mới từ CSDL rồi công bố bằng phép hoán đổi tham chiếu (không gián đoạn phục vụ)."""
+    start = time.perf_counter()
+    kb = knowledge_base.publish(build_knowledge_base(models_module))
+    logger.info(
+        "[KB] Đã công bố phiên bản %d: %d phản ứng, %d luật hóa học, %d nguyên tố (%.3fs).",
+        kb.version, len(kb.reaction_rules), len(kb.chemical_rules), len(kb.elements), time.perf_counter() - start
+    )
+    return kb
+
+
+def refresh_knowledge_base(models_module) -> Optional[KnowledgeBase]:
+    """
+    Tải lại tăng dần: chỉ đọc các dòng đã thay đổi kể từ snapshot mới nhất rồi công bố.
+    Trả về snapshot mới, hoặc None nếu CSDL không có thay đổi.
+    """
+    start = time.perf_counter()
+    base = knowledge_base.latest()
+    new_kb = build_knowledge_base_delta(models_module, base)
+    if new_kb is None:
+        return None
+    kb = knowledge_base.publish(new_kb)
+    logger.info(
+        "[KB] Đã công bố phiên bản %d (%s, changelog #%s -> #%s): %d phản ứng, %d luật hóa học (%.3fs).",
+        kb.version, kb.source, base.changelog_cursor, kb.changelog_cursor, len(kb.reaction_rules),
+        len(kb.chemical_rules), time.perf_counter() - start
+    )
+    return kb
+
+
+def load_elements_from_db(models_module) -> Dict[str, Dict[str, Any]]:
+    """
+    Tải dữ liệu Bảng Tuần Hoàn từ CSDL (bảng 'elements') vào bộ nhớ.
+    """
+    logger.info("[SETUP] BẮT ĐẦU TẢI DỮ LIỆU BẢNG TUẦN HOÀN...")
+
+    try:
+        elements = fetch_elements(models_module)
+        knowledge_base.publish(knowledge_base.latest().replace(elements=elements))
+        logger.info("[SETUP] ĐÃ HOÀN TẤT TẢI: %d nguyên tố đã được tải.", len(elements))
 
     except Exception as e:
-        print(f"[LỖI SETUP] LỖI TẢI DỮ LIỆU BẢNG TUẦN HOÀN: {e}")
-        traceback.print_exc()
+        logger.exception("[LỖI SETUP] LỖI TẢI DỮ LIỆU BẢNG TUẦN HOÀN: %s", e)
 
-    return ELEMENTS_CACHED
+    return knowledge_base.latest().elements
 
 
 def load_reactions_from_db(models_module) -> List[Any]:
-    global REACTION_RULES_CACHED, REACTION_RULES
-    ReactionModel = models_module.ReactionModel
     try:
-        all_models = ReactionModel.query.all()
-        REACTION_RULES_CACHED = all_models
-        REACTION_RULES = all_models
-        print(f"\n[DEBUG] ĐÃ HOÀN TẤT TẢI: {len(REACTION_RULES)} luật phản ứng.")
-        return REACTION_RULES
+        all_models = fetch_reaction_rules(models_module)
+        knowledge_base.publish(knowledge_base.latest().replace(reaction_rules=all_models))
+        logger.info("[SETUP] ĐÃ HOÀN TẤT TẢI: %d luật phản ứng.", len(all_models))
+        return all_models
     except Exception as e:
-        print(f"\n[DEBUG] LỖI TẢI LUẬT PHẢN ỨNG: {e}")
+        logger.exception("[LỖI SETUP] LỖI TẢI LUẬT PHẢN ỨNG: %s", e)
         return []
 
 
@@ -212,41 +452,45 @@ def load_chemical_rules_from_db(models_module) -> List[Any]:
     """
     Tải dữ liệu ChemicalRuleModel từ CSDL vào bộ nhớ và cập nhật biến toàn cục CHEMICAL_RULES.
     """
-    global CHEMICAL_RULES_CACHED, CHEMICAL_RULES
-    ChemicalRuleModel = getattr(models_module, 'ChemicalRuleModel', None)
-
-    if not ChemicalRuleModel:
-        # Fallback hoặc cảnh báo nếu lớp model không được tìm thấy
-        print("[WARNING] Không tìm thấy ChemicalRuleModel.")
-        return []
-
-    print("\n[SETUP] BẮT ĐẦU TẢI DỮ LIỆU LUẬT HÓA HỌC CHUNG...")
+    logger.info("[SETUP] BẮT ĐẦU TẢI DỮ LIỆU LUẬT HÓA HỌC CHUNG...")
 
     try:
-        all_models = ChemicalRuleModel.query.all()
+        all_models = fetch_chemical_rules(models_module)
+        knowledge_base.publish(knowledge_base.latest().replace(chemical_rules=all_models))
 
-        num_models = len(all_models)
-        CHEMICAL_RULES_CACHED = all_models
-        CHEMICAL_RULES = all_models
+        logger.info("[SETUP] ĐÃ HOÀN TẤT TẢI: Đã tải thành công %d luật hóa học chung.", len(all_models))
 
-        print(f"[SETUP] ĐÃ HOÀN TẤT TẢI: Đã tải thành công {num_models} luật hóa học chung.")
-
-        return CHEMICAL_RULES_CACHED
+        return all_models
 
     except Exception as e:
-        print(f"[LỖI SETUP] LỖI TẢI LUẬT HÓA HỌC CHUNG TỪ CSDL: {e}")
-        traceback.print_exc()
+        logger.exception("[LỖI SETUP] LỖI TẢI LUẬT HÓA HỌC CHUNG TỪ CSDL: %s", e)
         return []
 
 
+def _sync_legacy_globals(kb: KnowledgeBase) -> None:
+    """Giữ các biến toàn cục cũ (REACTION_RULES, CHEMICAL_RULES, ELEMENTS) trỏ tới snapshot mới nhất."""
+    global ELEMENTS_CACHED, ELEMENTS, REACTION_RULES_CACHED, REACTION_RULES, CHEMICAL_RULES_CACHED, CHEMICAL_RULES
+    ELEMENTS_CACHED = ELEMENTS = kb.elements
+    REACTION_RULES_CACHED = REACTION_RULES = kb.reaction_rules
+    CHEMICAL_RULES_CACHED = CHEMICAL_RULES = kb.chemical_rules
+
+
+knowledge_base.on_publish(_sync_legacy_globals)
+
+
 def get_reaction_rules() -> List[Any]:
-    """Trả về danh sách các luật phản ứng đã được cache (ReactionModel objects)."""
-    return REACTION_RULES
+    """Trả về danh sách các luật phản ứng của snapshot hiện tại (ReactionRule)."""
+    return knowledge_base.current().reaction_rules
 
 
 def get_chemical_rules() -> List[Any]:
-    """Trả về danh sách các luật hóa học chung đã được cache."""
-    return CHEMICAL_RULES
+    """Trả về danh sách các luật hóa học chung của snapshot hiện tại."""
+    return knowledge_base.current().chemical_rules
+
+
+def get_elements() -> Dict[str, Dict[str, Any]]:
+    """Trả về bảng tuần hoàn của snapshot hiện tại."""
+    return knowledge_base.current().elements
 
 
 # ======================================================================
@@ -255,14 +499,15 @@ def get_chemical_rules() -> List[Any]:
 
 def get_molar_mass(formula: str) -> float:
     """
-    Tính khối lượng mol (M) của một công thức hóa học, sử dụng dữ liệu ELEMENTS_CACHED.
+    Tính khối lượng mol (M) của một công thức hóa học, sử dụng bảng tuần hoàn của snapshot hiện tại.
     """
     try:
         compound = Compound(formula)
+        elements = get_elements()
         molar_mass = 0.0
         for element_symbol, count in compound.elements.items():
-            if element_symbol in ELEMENTS:
-                atomic_mass = ELEMENTS[element_symbol]['mass']
+            if element_symbol in elements:
+                atomic_mass = elements[element_symbol]['mass']
                 molar_mass += atomic_mass * count
             else:
                 raise ValueError(f"Nguyên tố '{element_symbol}' không được tìm thấy trong bảng tuần hoàn.")
@@ -275,9 +520,15 @@ def get_molar_mass(formula: str) -> float:
         raise ValueError(f"Không thể phân tích hoặc tính Khối lượng Mol cho công thức: {formula}")
 
 
-def execute_rule_expression(expression: str, inputs: Dict[str, float]) -> float:
+@functools.lru_cache(maxsize=4096)
+def compile_rule_expression(expression: str) -> CodeType:
+    """Biên dịch biểu thức của luật tính toán một lần (dùng lại cho mọi lần thực thi)."""
+    return compile(expression, '<chemical_rule>', 'eval')
+
+
+def execute_rule_expression(expression: Union[str, CodeType], inputs: Dict[str, float]) -> float:
     """
-    Thực thi biểu thức tính toán an toàn (ví dụ: 'm / M_A').
+    Thực thi biểu thức tính toán an toàn (ví dụ: 'm / M_A'); nhận chuỗi hoặc biểu thức đã biên dịch.
     """
     allowed_globals = {
         'math': math,
@@ -290,7 +541,8 @@ def execute_rule_expression(expression: str, inputs: Dict[str, float]) -> float:
         local_vars['abs'] = abs
         local_vars['log10'] = math.log10
 
-        result = eval(expression, allowed_globals, local_vars)
+        code = compile_rule_expression(expression) if isinstance(expression, str) else expression
+        result = eval(code, allowed_globals, local_vars)
         return float(result)
     except NameError as e:
         raise ValueError(f"Lỗi cú pháp trong biểu thức (thiếu biến): {e}")
@@ -300,24 +552,34 @@ def execute_rule_expression(expression: str, inputs: Dict[str, float]) -> float:
         raise ValueError(f"Lỗi thực thi biểu thức: {e}")
 
 
-def find_calculation_path(known_vars: Set[str], target_var: str, all_rules: List[Any]) -> Optional[
-    List[Dict[str, Any]]]:
+def find_calculation_path(known_vars: Set[str], target_var: str, all_rules: List[Any],
+                          ctx: Optional[TaskContext] = None) -> Optional[List[Dict[str, Any]]]:
     """
     Tìm chuỗi luật tính toán...
+    Nếu ctx hết hạn giữa chừng, dừng tìm kiếm và trả về None (ctx.timed_out = True).
     """
     queue = deque([(known_vars, [])])
     visited_states = {tuple(sorted(known_vars))}
     max_steps = 10
+    rules_scanned = 0
+    rules_fired = 0
+    states_visited = 0
 
     while queue and len(queue[0][1]) < max_steps:
+        if expired(ctx):
+            break
         current_vars, current_path = queue.popleft()
+        states_visited += 1
+        report(ctx, states_visited=states_visited, depth=len(current_path), queue_size=len(queue))
 
         if target_var in current_vars:
+            record_engine_run('calculation_path', rules_scanned, rules_fired, states_visited)
             # Mục tiêu đã đạt được. Trả về đường đi.
             # Dùng .to_dict() cho Model, giữ nguyên dict cho Custom Rule
             return [step.to_dict() if hasattr(step, 'to_dict') else step for step in current_path]
 
         for rule in all_rules:
+            rules_scanned += 1
             # === PHẦN SỬA LỖI TẠI ĐÂY ===
             # Chuyển rule sang dict để xử lý thống nhất
             rule_data = rule.to_dict() if hasattr(rule, 'to_dict') else rule
@@ -334,10 +596,12 @@ def find_calculation_path(known_vars: Set[str], target_var: str, all_rules: List
                 new_state = tuple(sorted(new_vars))
 
                 if new_state not in visited_states:
+                    rules_fired += 1
                     new_path = current_path + [rule]  # Lưu trữ đối tượng Model/Dict gốc
                     visited_states.add(new_state)
                     queue.append((new_vars, new_path))
 
+    record_engine_run('calculation_path', rules_scanned, rules_fired, states_visited)
     return None
 
 
@@ -347,23 +611,33 @@ def find_calculation_path(known_vars: Set[str], target_var: str, all_rules: List
 
 def is_react_available(reaction: Any, known_facts: set, initial_conditions: set, check_conditions: bool = True) -> bool:
     """Kiểm tra xem một phản ứng có thể xảy ra hay không (dành cho ReactionModel)."""
-    print("known_facts",known_facts)
     if reaction.is_used:
         return False
 
     if not all(r in known_facts for r in reaction.required_reactants):
         return False
 
+    return conditions_satisfied(reaction, initial_conditions, check_conditions)
+
+
+def conditions_satisfied(reaction: Any, initial_conditions: set, check_conditions: bool = True) -> bool:
+    """Phần kiểm tra điều kiện của is_react_available (engine so khớp chất theo id riêng)."""
     if check_conditions and reaction.required_conditions:
         if not all(c in initial_conditions for c in reaction.required_conditions):
             return False
-
     return True
 
 
 def parse_input_to_set(input_str: str, delimiter='+') -> set:
-    """Chuyển đổi chuỗi đầu vào (phản ứng/điều kiện) thành một set."""
+    """
+    Chuyển đổi chuỗi đầu vào (phản ứng/điều kiện) thành một set.
+    Với danh sách chất (delimiter='+'), mỗi chất được đưa về dạng chuẩn như trong luật đã tải
+    (vd: "H2O(l)" -> "H2O") và dấu '+' của điện tích ion không bị coi là dấu phân cách.
+    """
     if not input_str:
         return set()
-    items = [item.strip() for item in input_str.split(delimiter)]
+    if delimiter == '+':
+        items = [canonical_formula(item) for item in split_species(input_str)]
+    else:
+        items = [item.strip() for item in input_str.split(delimiter)]
     return set(item for item in items if item)
\ No newline at end of file
@@ -0,0 +1,208 @@
+# --- File: fact_closure.py ---
+"""
+Bao đóng tập chất (mọi chất suy ra được và mọi luật sẽ kích hoạt) tính theo kiểu ma trận.
+
+Vế tham gia của các luật được lưu thành ma trận liên thuộc thưa A (luật x chất), sản phẩm thành P.
+Tập chất đã biết là vector boolean x; mỗi vòng, A @ x đếm số chất tham gia đã có của MỌI luật
+cùng lúc, so với vector bậc (số chất tham gia khác nhau) để ra các luật kích hoạt được, rồi
+P.T @ luật_kích_hoạt cho ra các chất mới. Xếp nhiều tập chất ban đầu thành các cột của một ma
+trận thì tính được bao đóng của cả lô trong cùng số phép nhân.
+
+Bao đóng không phụ thuộc thứ tự kích hoạt nên trùng với kết quả cuối của các engine tuần tự;
+engine dùng nó để bỏ qua ngay các luật chắc chắn không kích hoạt và trả lời sớm khi đích
+không thể đạt tới. Cần numpy + scipy; nếu thiếu, dùng bitset số nguyên Python (chậm hơn nhưng
+cùng kết quả).
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import knowledge_base
+from knowledge_base import KnowledgeBase
+from reaction_index import REACTANT_INDEX, ReactantIndex
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover - phụ thuộc tùy chọn
+    np = None
+    sparse = None
+
+logger = logging.getLogger(__name__)
+
+RULE_MATRIX = 'rule_matrix'
+
+CONDITION_MASK_CACHE_SIZE = 64
+
+# Bật bởi api_server (CHEM_ENGINE_BACKEND=matrix); engine chỉ dùng khi luật nằm trong snapshot
+_enabled = False
+
+
+def enable(enabled: bool = True) -> None:
+    """Bật bao đóng cho các engine (gọi trước lần tải đầu tiên để ma trận được dựng sẵn khi công bố)."""
+    global _enabled
+    _enabled = bool(enabled)
+    if _enabled:
+        knowledge_base.register_derived(RULE_MATRIX, RuleMatrix.from_kb)
+        if np is None:
+            logger.warning("[CLOSURE] Thiếu numpy/scipy, bao đóng dùng bitset số nguyên Python.")
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+# ======================================================================
+# MA TRẬN LUẬT (CẤU TRÚC DẪN XUẤT CỦA SNAPSHOT)
+# ======================================================================
+
+class RuleMatrix:
+    """Dạng ma trận (hoặc bitset) của các luật phản ứng, dựng từ ReactantIndex của cùng snapshot."""
+
+    def __init__(self, index: ReactantIndex, rule_conditions: Sequence[Tuple[str, ...]]):
+        self.index = index
+        self.rule_conditions = tuple(rule_conditions)
+        self.n_rules = len(index.reactants)
+        self.n_species = 1 + max((sid for ids in index.reactants + index.products for sid in ids), default=-1)
+        self.has_conditions = any(self.rule_conditions)
+        # Tập điều kiện đầu vào thường lặp lại (vd: "t°"): giữ lại mặt nạ đã tính
+        self._condition_masks: Dict[frozenset, List[bool]] = {}
+
+        self.sparse = np is not None
+        if self.sparse:
+            self._build_sparse()
+        else:
+            self._build_bitsets()
+
+    @classmethod
+    def from_kb(cls, kb: KnowledgeBase) -> 'RuleMatrix':
+        return cls(kb.derived(REACTANT_INDEX), [tuple(r.required_conditions) for r in kb.reaction_rules])
+
+    def __reduce__(self):
+        # Chỉ lưu chỉ mục (đã có cơ chế ánh xạ lại id chất) và điều kiện; ma trận dựng lại khi nạp
+        return RuleMatrix, (self.index, self.rule_conditions)
+
+    def _incidence(self, rows: Sequence[Sequence[int]], n_cols: int):
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indices: List[int] = []
+        for i, ids in enumerate(rows):
+            unique = sorted(set(ids))
+            indices.extend(unique)
+            indptr[i + 1] = indptr[i] + len(unique)
+        data = np.ones(len(indices), dtype=np.int32)
+        return sparse.csr_matrix((data, np.asarray(indices, dtype=np.int64), indptr), shape=(len(rows), n_cols))
+
+    def _build_sparse(self) -> None:
+        self.reactants = self._incidence(self.index.reactants, self.n_species)
+        self.products_t = self._incidence(self.index.products, self.n_species).T.tocsr()
+        self.arity = np.asarray(self.reactants.sum(axis=1)).ravel().astype(np.int32)
+
+    def _build_bitsets(self) -> None:
+        def mask(ids):
+            value = 0
+            for sid in ids:
+                value |= 1 << sid
+            return value
+        self.reactant_masks = [mask(ids) for ids in self.index.reactants]
+        self.product_masks = [mask(ids) for ids in self.index.products]
+
+    def condition_mask(self, input_conditions: Set[str], check_conditions: bool) -> List[bool]:
+        """Luật nào thỏa điều kiện (cùng quy tắc với chemistry_data.conditions_satisfied)."""
+        if not check_conditions or not self.has_conditions:
+            return [True] * self.n_rules
+        key = frozenset(input_conditions)
+        mask = self._condition_masks.get(key)
+        if mask is None:
+            mask = [all(c in key for c in conds) for conds in self.rule_conditions]
+            if len(self._condition_masks) >= CONDITION_MASK_CACHE_SIZE:
+                self._condition_masks.clear()
+            self._condition_masks[key] = mask
+        return mask
+
+    # ------------------------------------------------------------------
+
+    def closure_batch(self, start_sets: Sequence[Iterable[int]], input_conditions: Set[str] = frozenset(),
+                      check_conditions: bool = False) -> List[Tuple[Set[int], Set[int]]]:
+        """
+        Bao đóng của nhiều tập chất ban đầu cùng lúc: mỗi phần tử kết quả là
+        (id các chất đã biết lúc dừng, chỉ số các luật đã kích hoạt).
+        """
+        cond_ok = self.condition_mask(input_conditions, check_conditions)
+        if not self.sparse:
+            return [self._closure_bitset(ids, cond_ok) for ids in start_sets]
+
+        width = len(start_sets)
+        known = np.zeros((self.n_species, width), dtype=bool)
+        extra: List[Set[int]] = []
+        for col, ids in enumerate(start_sets):
+            outside = set()
+            for sid in ids:
+                if sid < self.n_species:
+                    known[sid, col] = True
+                else:
+                    # Chất không xuất hiện trong luật nào: chỉ cần trả lại nguyên vẹn
+                    outside.add(sid)
+            extra.append(outside)
+
+        allowed = np.asarray(cond_ok, dtype=bool)[:, None]
+        fired = np.zeros((self.n_rules, width), dtype=bool)
+        while True:
+            counts = self.reactants @ known.astype(np.int32)
+            ready = (counts == self.arity[:, None]) & allowed & ~fired
+            if not ready.any():
+                break
+            fired |= ready
+            known |= (self.products_t @ ready.astype(np.int32)) > 0
+
+        results = []
+        for col in range(width):
+            facts = set(np.flatnonzero(known[:, col]).tolist()) | extra[col]
+            results.append((facts, set(np.flatnonzero(fired[:, col]).tolist())))
+        return results
+
+    def _closure_bitset(self, start_ids: Iterable[int], cond_ok: List[bool]) -> Tuple[Set[int], Set[int]]:
+        start = set(start_ids)
+        facts = 0
+        for sid in start:
+            if sid < self.n_species:
+                facts |= 1 << sid
+        reactant_masks, product_masks = self.reactant_masks, self.product_masks
+        pending = [i for i in range(self.n_rules) if cond_ok[i]]
+        fired: Set[int] = set()
+        progress = True
+        while progress:
+            progress = False
+            still_pending = []
+            for i in pending:
+                mask = reactant_masks[i]
+                if facts & mask == mask:
+                    facts |= product_masks[i]
+                    fired.add(i)
+                    progress = True
+                else:
+                    still_pending.append(i)
+            pending = still_pending
+
+        known = {sid for sid in start if sid >= self.n_species}
+        known.update(sid for sid, bit in enumerate(reversed(bin(facts)[2:])) if bit == '1')
+        return known, fired
+
+
+# ======================================================================
+# API CHO ENGINE
+# ======================================================================
+
+def closure(start_ids: Iterable[int], input_conditions: Set[str] = frozenset(), check_conditions: bool = False,
+            kb: Optional[KnowledgeBase] = None) -> Tuple[Set[int], Set[int]]:
+    """Bao đóng của một tập chất trên snapshot đang ghim (hoặc `kb`)."""
+    kb = kb or knowledge_base.current()
+    return kb.derived(RULE_MATRIX, RuleMatrix.from_kb).closure_batch([list(start_ids)], input_conditions, check_conditions)[0]
+
+
+def closure_batch(start_sets: Sequence[Iterable[int]], input_conditions: Set[str] = frozenset(),
+                  check_conditions: bool = False,
+                  kb: Optional[KnowledgeBase] = None) -> List[Tuple[Set[int], Set[int]]]:
+    """Bao đóng của nhiều tập chất trong một lần tính (các cột của cùng một ma trận)."""
+    kb = kb or knowledge_base.current()
+    return kb.derived(RULE_MATRIX, RuleMatrix.from_kb).closure_batch([list(ids) for ids in start_sets], input_conditions,
+                                                 check_conditions)
@@ -1,20 +1,80 @@
-from chemistry_data import REACTION_RULES, parse_input_to_set, is_react_available, get_reaction_rules
-import copy
+from chemistry_data import parse_input_to_set, conditions_satisfied
+import hashlib
+import logging
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+import fact_closure
+import knowledge_base
+import result_cache
+from metrics import record_engine_run, log_sampled
+from reaction_index import Agenda, MemoryRuleSource, current_rule_source
+from response_view import COMPACT, FULL, SUMMARY, ResponseView
+from species import REGISTRY
+from task_context import TaskContext, expired, report
 
-# Giả định get_reaction_rules() trả về các đối tượng cần được reset trạng thái.
-def run_forward_chaining(initial_reactants_str: str, reaction_conditions_str: str) -> dict:
+logger = logging.getLogger(__name__)
+
+
+def _reaction_summary(r) -> str:
+    """Tạo chuỗi phản ứng cho báo cáo chi tiết, vd: 'Fe + Cl2 [t°] -> FeCl3'."""
+    conditions_part = f" [{', '.join(r.required_conditions)}]" if r.required_conditions else ''
+    return f"{' + '.join(r.required_reactants)}{conditions_part} -> {' + '.join(r.products)}"
+
+
+def reaction_info(r) -> Dict[str, Any]:
+    """Thông tin của một phản ứng đã kích hoạt (phần tử của reactions_used)."""
+    return {
+        "type": r.type,
+        "description": r.description,
+        "reaction": _reaction_summary(r),
+        "phenomena": r.phenomena,
+        "phenomena_detail": r.phenomena_detail_json
+    }
+
+
+def compact_reaction_info(r) -> Dict[str, Any]:
+    """Phần tử reactions_used ở mức chi tiết summary/compact (không có mô tả, phenomena_detail)."""
+    return {"type": r.type, "reaction": _reaction_summary(r), "phenomena": r.phenomena}
+
+
+def iter_forward_chaining(initial_reactants_str: str, reaction_conditions_str: str,
+                          ctx: Optional[TaskContext] = None) -> Iterator[Dict[str, Any]]:
     """
-    Thực hiện suy luận tiến để tìm các sản phẩm của phản ứng hóa học
-    dựa trên tập hợp các quy tắc đã định sẵn (Chuỗi phản ứng).
+    Suy luận tiến dạng luồng: phát ra từng sự kiện ngay khi được suy ra thay vì đợi tới điểm dừng.
 
-    Nếu reaction_conditions_str rỗng, coi như mọi điều kiện đều được chấp nhận.
+    Các sự kiện (dict, khóa "event"):
+    - "start":    chất ban đầu và điều kiện đã chuẩn hóa.
+    - "reaction": một quy tắc vừa được kích hoạt ("data" có cùng dạng phần tử của reactions_used).
+    - "fact":     một chất mới được suy ra.
+    - "end":      thống kê cuối (số vòng lặp, số phản ứng, số chất mới; "partial" nếu hết giờ).
+
+    Không giữ danh sách phản ứng đã dùng nên bộ nhớ chỉ phụ thuộc số chất đã biết.
+    """
+    for event in _derive(initial_reactants_str, reaction_conditions_str, ctx):
+        kind = event["event"]
+        if kind == "reaction":
+            event["data"] = reaction_info(event.pop("rule"))
+        elif kind == "fact":
+            event["fact"] = REGISTRY.name(event.pop("fact_id"))
+        yield event
+
+
+def _derive(initial_reactants_str: str, reaction_conditions_str: str,
+            ctx: Optional[TaskContext]) -> Iterator[Dict[str, Any]]:
+    """
+    Như iter_forward_chaining nhưng sự kiện "reaction" mang luật ("rule") và sự kiện "fact" mang id chất
+    ("fact_id"): phần dựng thông tin để hiển thị để lại cho nơi tiêu thụ.
     """
-    # Khởi tạo
-    rules = copy.deepcopy(get_reaction_rules())
-    for r in rules: r.is_used = False
+    # Khởi tạo. Trạng thái "đã dùng" được giữ cục bộ theo khóa luật thay vì cờ is_used
+    # trên đối tượng dùng chung, nên không cần deepcopy toàn bộ luật mỗi lần gọi.
+    source = current_rule_source()
+    used_rule_indexes = set()
 
     known_facts = parse_input_to_set(initial_reactants_str, '+')
+    # So khớp chất trên id nguyên (species.REGISTRY) thay vì chuỗi; chất không có trong luật nào
+    # chỉ còn trong known_facts (nguồn luật tra id, không đánh số đầu vào của request)
+    known_ids = source.lookup_set(known_facts)
 
     # Xử lý điều kiện đầu vào
     input_conditions_set = parse_input_to_set(reaction_conditions_str, ',')
@@ -22,62 +82,247 @@ def run_forward_chaining(initial_reactants_str: str, reaction_conditions_str: st
     # Cờ để quyết định có nên kiểm tra điều kiện bắt buộc của quy tắc hay không.
     # Nếu người dùng KHÔNG nhập điều kiện (set rỗng), ta KHÔNG kiểm tra điều kiện bắt buộc của quy tắc.
     check_conditions_flag = len(input_conditions_set) > 0
+    if check_conditions_flag and isinstance(source, MemoryRuleSource):
+        # Chỉ lên lịch các luật có điều kiện bắt buộc nằm trong điều kiện đầu vào (nhóm theo chữ ký)
+        source = source.restrict(input_conditions_set)
 
-    all_deduced_products = set()
-    used_rules_info = []
-    first_reaction_summary = None
+    yield {
+        "event": "start",
+        "initial_reactants": sorted(known_facts),
+        "conditions": sorted(input_conditions_set)
+    }
 
     something_new_deduced = True
     iteration_count = 0
+    rules_scanned = 0
+    new_facts_count = 0
 
-    while something_new_deduced:
+    # Mỗi vòng chỉ xét các luật có chất tham gia vừa được biết, theo đúng thứ tự quét toàn bộ.
+    # Với backend ma trận, bao đóng cho biết trước các luật sẽ kích hoạt nên chỉ cần lên lịch chúng.
+    allowed = None
+    if fact_closure.is_enabled() and isinstance(source, MemoryRuleSource):
+        _facts, allowed = fact_closure.closure(known_ids, input_conditions_set, check_conditions_flag)
+    agenda = Agenda(source, known_ids, allowed)
+
+    while something_new_deduced and not expired(ctx):
+        if iteration_count:
+            agenda.next_round()
         something_new_deduced = False
         iteration_count += 1
-        newly_deduced_products = set()
+        report(ctx, iteration=iteration_count, rules_fired=len(used_rule_indexes), states_visited=len(known_ids))
 
-        for r in rules:
+        for idx in iter(agenda.pop, None):
+            rules_scanned += 1
+            if (rules_scanned & 0xFF) == 0 and expired(ctx):
+                break
             # Chỉ kiểm tra các quy tắc chưa được sử dụng thành công
-            # TRUYỀN input_conditions_set và check_conditions_flag VÀO is_react_available
-            if not r.is_used and is_react_available(r, known_facts, input_conditions_set,
-                                                    check_conditions=check_conditions_flag):
+            if idx in used_rule_indexes:
+                continue
+            reactant_ids, product_ids = source.species(idx)
+            if not known_ids.issuperset(reactant_ids):
+                continue
+            r = source.rule(idx)
+            # TRUYỀN input_conditions_set và check_conditions_flag VÀO conditions_satisfied
+            if conditions_satisfied(r, input_conditions_set, check_conditions=check_conditions_flag):
 
                 # 1. Ghi nhận quy tắc đã được sử dụng
-                r.is_used = True
-
-                # 2. Tạo chuỗi phản ứng cho báo cáo chi tiết
-                reaction_summary = f"{' + '.join(r.required_reactants)}{f' [{', '.join(r.required_conditions)}]' if r.required_conditions else ''} -> {' + '.join(r.products)}"
+                used_rule_indexes.add(idx)
 
-                # Lưu phản ứng đầu tiên/tiêu biểu
-                if first_reaction_summary is None:
-                    first_reaction_summary = reaction_summary
+                # 2. Thông tin phản ứng cho báo cáo chi tiết được dựng bởi nơi tiêu thụ sự kiện (khi cần)
+                if logger.isEnabledFor(logging.DEBUG):
+                    log_sampled(logger, logging.DEBUG, 0.01, "[FC] Vòng %d kích hoạt: %s",
+                                iteration_count, _reaction_summary(r))
 
-                # Lưu thông tin chi tiết phản ứng vào danh sách kết quả (từng bước)
-                used_rules_info.append({
-                    "type": r.type,
-                    "description": r.description,
-                    "reaction": reaction_summary,
-                    "phenomena": r.phenomena,
-                    "phenomena_detail": r.phenomena_detail_json
-                })
+                yield {"event": "reaction", "iteration": iteration_count, "rule": r}
 
                 # 3. Thêm sản phẩm mới vào Known Facts
-                for new_product in r.products:
-                    if new_product not in known_facts:
-                        known_facts.add(new_product)
-                        newly_deduced_products.add(new_product)
+                new_ids = []
+                for pid in product_ids:
+                    if pid not in known_ids:
+                        known_ids.add(pid)
+                        new_ids.append(pid)
+                        new_facts_count += 1
                         something_new_deduced = True
+                        yield {"event": "fact", "iteration": iteration_count, "fact_id": pid}
+                if new_ids:
+                    agenda.add_facts(new_ids)
 
-        all_deduced_products.update(newly_deduced_products)
+    record_engine_run('forward_chaining', rules_scanned, len(used_rule_indexes), iteration_count)
 
-    # Trả về kết quả tổng hợp
-    return {
-        "reactions": first_reaction_summary if first_reaction_summary else "Không có phản ứng nào được kích hoạt",
-        "type": "Phân tích chuỗi phản ứng",
-        "description": "Kết quả suy luận tiến dựa trên các chất ban đầu và điều kiện.",
-        "final_products": sorted(list(all_deduced_products)),
-        "total_facts": sorted(list(known_facts)),
-        "initial_reactants": sorted(list(parse_input_to_set(initial_reactants_str, '+'))),
+    end_event = {
+        "event": "end",
         "iterations": iteration_count,
-        "reactions_used": used_rules_info,
-        "summary": f"Đã sử dụng {len(used_rules_info)} quy tắc để suy luận ra {len(all_deduced_products)} sản phẩm mới."
-    }
\ No newline at end of file
+        "reactions_fired": len(used_rule_indexes),
+        "new_facts": new_facts_count
+    }
+    if ctx is not None and ctx.timed_out:
+        end_event["partial"] = True
+    yield end_event
+
+
+# ======================================================================
+# KẾT QUẢ DẠNG GỌN VÀ PHẢN HỒI THEO YÊU CẦU
+# ======================================================================
+
+# Các trường của phản hồi suy luận tiến, theo thứ tự xuất hiện
+FIELDS = ('reactions', 'type', 'description', 'final_products', 'total_facts', 'initial_reactants', 'iterations',
+          'reactions_used', 'summary', 'reactions_count', 'new_facts_count')
+DEFAULT_FIELDS = {
+    FULL: FIELDS[:9],
+    COMPACT: FIELDS[:9],
+    SUMMARY: ('reactions', 'initial_reactants', 'iterations', 'summary', 'reactions_count', 'new_facts_count'),
+}
+
+
+class Derivation:
+    """
+    Kết quả suy luận tiến dạng gọn: chất ban đầu, id các chất mới và các luật đã kích hoạt theo thứ tự.
+    Đây là thứ được giữ trong result_cache.FORWARD_CHAINING (dùng chung, không được sửa); danh sách đã
+    sắp xếp và thông tin từng phản ứng chỉ được dựng (rồi nhớ lại) khi phản hồi cần tới.
+    """
+
+    __slots__ = ('identity', 'initial_reactants', 'new_fact_ids', 'rules', 'iterations', 'partial', '_memo')
+
+    def __init__(self, identity: str, initial_reactants: List[str], new_fact_ids: List[int], rules: List[Any],
+                 iterations: int, partial: bool):
+        self.identity = identity
+        self.initial_reactants = initial_reactants
+        self.new_fact_ids = new_fact_ids
+        self.rules = rules
+        self.iterations = iterations
+        self.partial = partial
+        self._memo: Dict[str, Any] = {}
+
+    def size(self) -> int:
+        """Kích thước ước lượng cho result_cache."""
+        return 1 + len(self.rules) + len(self.new_fact_ids) + len(self.initial_reactants)
+
+    def final_products(self) -> List[str]:
+        products = self._memo.get('final_products')
+        if products is None:
+            products = self._memo['final_products'] = sorted(REGISTRY.names(self.new_fact_ids))
+        return products
+
+    def total_facts(self) -> List[str]:
+        facts = self._memo.get('total_facts')
+        if facts is None:
+            facts = self._memo['total_facts'] = sorted(set(self.final_products()).union(self.initial_reactants))
+        return facts
+
+    def _builders(self, info, start: int, stop: int) -> Dict[str, Any]:
+        rules = self.rules
+        return {
+            'reactions': lambda: _reaction_summary(rules[0]) if rules else "Không có phản ứng nào được kích hoạt",
+            'type': lambda: "Phân tích chuỗi phản ứng",
+            'description': lambda: "Kết quả suy luận tiến dựa trên các chất ban đầu và điều kiện.",
+            'final_products': self.final_products,
+            'total_facts': self.total_facts,
+            'initial_reactants': lambda: self.initial_reactants,
+            'iterations': lambda: self.iterations,
+            'reactions_used': lambda: [info(r) for r in rules[start:stop]],
+            'summary': lambda: f"Đã sử dụng {len(rules)} quy tắc để suy luận ra {len(self.new_fact_ids)} sản phẩm mới.",
+            'reactions_count': lambda: len(rules),
+            'new_facts_count': lambda: len(self.new_fact_ids),
+        }
+
+    def to_dict(self, view: Optional[ResponseView] = None) -> Dict[str, Any]:
+        """
+        Phản hồi theo `view` (trường, mức chi tiết, trang của reactions_used). Không có view: phản hồi
+        đầy đủ như trước, dựng một lần rồi dùng lại cho các lần trúng cache sau.
+        """
+        if view is None:
+            result = self._memo.get(FULL)
+            if result is None:
+                result = ResponseView().build(self._builders(reaction_info, 0, len(self.rules)), DEFAULT_FIELDS)
+                if self.partial:
+                    result["partial"] = True
+                self._memo[FULL] = result
+            return result
+
+        start, stop, page = 0, len(self.rules), None
+        if view.paginated:
+            start, stop, page = view.page(len(self.rules), self.identity)
+        info = reaction_info if view.verbosity == FULL else compact_reaction_info
+        result = view.build(self._builders(info, start, stop), DEFAULT_FIELDS)
+        if page is not None:
+            result["page"] = page
+        if self.partial:
+            result["partial"] = True
+        return result
+
+
+def _identity(key: tuple) -> str:
+    """Định danh ổn định của một kết quả (đầu vào đã chuẩn hóa + phiên bản dữ liệu), dùng trong cursor."""
+    reactants, conditions, version = key
+    raw = repr((sorted(reactants), sorted(conditions), version)).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+
+def derive(initial_reactants_str: str, reaction_conditions_str: str,
+           ctx: Optional[TaskContext] = None) -> Derivation:
+    """
+    Suy luận tiến và trả về kết quả dạng gọn (Derivation), có cache theo đầu vào + phiên bản luật.
+    Nếu ctx hết hạn, kết quả là một phần (partial) và không được cache.
+    """
+    key = batch_key(initial_reactants_str, reaction_conditions_str) + (knowledge_base.current().version,)
+    # Cùng tập chất/điều kiện trên cùng phiên bản luật luôn cho cùng kết quả: dùng lại kết quả đã tính
+    cache = result_cache.FORWARD_CHAINING
+    if cache.enabled:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    started = time.perf_counter()
+
+    initial_reactants: List[str] = []
+    new_fact_ids: List[int] = []
+    rules: List[Any] = []
+    end_event: Dict[str, Any] = {}
+
+    for event in _derive(initial_reactants_str, reaction_conditions_str, ctx):
+        kind = event["event"]
+        if kind == "reaction":
+            rules.append(event["rule"])
+        elif kind == "fact":
+            new_fact_ids.append(event["fact_id"])
+        elif kind == "start":
+            initial_reactants = event["initial_reactants"]
+        else:
+            end_event = event
+
+    derivation = Derivation(_identity(key), initial_reactants, new_fact_ids, rules,
+                            end_event.get("iterations", 0), bool(end_event.get("partial")))
+    if not derivation.partial and cache.enabled:
+        cache.put(key, derivation, cost=time.perf_counter() - started, size=derivation.size())
+    return derivation
+
+
+def run_forward_chaining(initial_reactants_str: str, reaction_conditions_str: str,
+                         ctx: Optional[TaskContext] = None, view: Optional[ResponseView] = None) -> dict:
+    """
+    Thực hiện suy luận tiến để tìm các sản phẩm của phản ứng hóa học
+    dựa trên tập hợp các quy tắc đã định sẵn (Chuỗi phản ứng).
+
+    Nếu reaction_conditions_str rỗng, coi như mọi điều kiện đều được chấp nhận.
+    Nếu ctx hết hạn, dừng lại và trả về kết quả một phần (có khóa "partial": True).
+    `view`: chọn trường / mức chi tiết / trang của reactions_used (xem response_view); không có view thì
+    trả về phản hồi đầy đủ (dùng chung giữa các lần trúng cache, không được sửa).
+    """
+    return derive(initial_reactants_str, reaction_conditions_str, ctx=ctx).to_dict(view)
+
+
+def batch_key(initial_reactants_str: str, reaction_conditions_str: str) -> tuple:
+    """
+    Khóa so trùng của một đầu vào: các cách viết cho cùng tập chất/điều kiện (thứ tự khác,
+    khoảng trắng, ký hiệu trạng thái...) cho cùng kết quả suy luận nên dùng chung một lần chạy.
+    """
+    return (frozenset(parse_input_to_set(initial_reactants_str, '+')),
+            frozenset(parse_input_to_set(reaction_conditions_str, ',')))
+
+
+def run_forward_chaining_batch(items: List[Tuple[str, str]], ctx: Optional[TaskContext] = None,
+                               view: Optional[ResponseView] = None) -> List[dict]:
+    """
+    Suy luận tiến cho nhiều cặp (chất ban đầu, điều kiện) trên cùng snapshot (cùng chỉ mục luật).
+    Hết giờ giữa chừng: các phần tử còn lại vẫn có kết quả nhưng được đánh dấu "partial".
+    """
+    return [run_forward_chaining(reactants, conditions, ctx=ctx, view=view) for reactants, conditions in items]
@@ -0,0 +1,138 @@
+# --- File: http_cache.py ---
+"""
+HTTP caching có điều kiện cho các endpoint tất định (kết quả chỉ phụ thuộc thân request và snapshot
+cơ sở tri thức).
+
+- ETag = băm của (đường dẫn, thân request đã chuẩn hóa) + phiên bản snapshot (luật phản ứng, luật tính
+  toán, bảng nguyên tố cùng tăng phiên bản khi tải lại). Được tính TRƯỚC khi chạy engine, nên request có
+  If-None-Match khớp được trả lời ngay, không tốn gì: 304 với GET/HEAD; với POST là 412 (RFC 9110
+  §13.1.2 chỉ cho phép 304 với phương thức an toàn). ETag trên phản hồi POST vẫn dùng được với dạng GET
+  tương ứng (cùng ETag), là dạng mà proxy cache và client nên dùng để hỏi lại.
+- Các endpoint tất định nhận thêm dạng GET để proxy cache cục bộ lưu được:
+      GET /api/balance-equation?equation=Fe+%2B+Cl2+-%3E+FeCl3
+      GET /api/identify-chemicals?chemicals=NaOH&chemicals=HCl            (tham số lặp lại -> danh sách)
+      GET /api/calculate_rule?body={"inputs":{"m":10,"M":56}}             (thân JSON đầy đủ)
+  Dạng GET và POST cùng nội dung (cùng giá trị chuỗi) cho cùng ETag.
+- Kết quả một phần ("partial": true, do hết deadline) và phản hồi lỗi không mang ETag.
+
+Cache-Control mặc định là "no-cache" (proxy được lưu nhưng phải hỏi lại, nhận 304 khi dữ liệu chưa đổi);
+HTTP_CACHE_MAX_AGE > 0 cho phép proxy dùng lại trong chừng đó giây mà không hỏi lại.
+"""
+
+import hashlib
+import json
+import re
+from typing import Any, Callable, Dict, Optional
+
+from flask import Response, current_app, g, jsonify, request
+
+import knowledge_base
+import metrics
+
+DEFAULT_MAX_AGE = 0
+BODY_PARAM = 'body'
+
+# Phương thức an toàn: được trả 304 khi If-None-Match khớp
+SAFE_METHODS = ('GET', 'HEAD')
+
+CONDITIONAL_REQUESTS = metrics.counter(
+    'chem_http_conditional_requests_total',
+    'Số request có If-None-Match (result=not_modified|precondition_failed|modified).', ('result',)
+)
+
+# Kết quả một phần không tất định (phụ thuộc deadline): không gắn ETag
+_PARTIAL_MARKER = re.compile(rb'"partial":\s*true')
+
+
+def cacheable(view: Callable) -> Callable:
+    """Đánh dấu view là tất định (đặt dưới @app.route)."""
+    view._chem_cacheable = True
+    return view
+
+
+def _is_cacheable() -> bool:
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, '_chem_cacheable', False)
+
+
+def query_body() -> Optional[Dict[str, Any]]:
+    """Thân request của dạng GET: tham số 'body' (JSON) hoặc các tham số query (lặp lại -> danh sách)."""
+    raw = request.args.get(BODY_PARAM)
+    if raw is not None:
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    data: Dict[str, Any] = {}
+    for key in request.args:
+        values = request.args.getlist(key)
+        data[key] = values if len(values) > 1 else values[0]
+    return data
+
+
+def request_json(silent: bool = False) -> Optional[Dict[str, Any]]:
+    """Thân JSON của request: dạng POST như request.get_json(), dạng GET (và HEAD) lấy từ query string."""
+    if request.method in SAFE_METHODS:
+        return query_body()
+    return request.get_json(silent=silent)
+
+
+def _canonical_request() -> bytes:
+    data = request_json(silent=True)
+    if data is None:
+        body = request.get_data() if request.method not in SAFE_METHODS else request.query_string
+    else:
+        body = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    # Tham số query của POST (vd: ?cursor=...) cũng thay đổi kết quả
+    extra = request.query_string if request.method not in SAFE_METHODS else b''
+    return request.path.encode('utf-8') + b'\0' + body + b'\0' + extra
+
+
+def compute_etag() -> str:
+    digest = hashlib.sha256(_canonical_request()).hexdigest()[:32]
+    return f"v{knowledge_base.current().version}-{digest}"
+
+
+def init_app(app) -> None:
+    """
+    Đăng ký hook ETag/304 cho các view đánh dấu @cacheable. Gọi SAU kb_reload.init_app để ETag dùng
+    đúng snapshot đã ghim cho request.
+    """
+    max_age = int(app.config.get('HTTP_CACHE_MAX_AGE', DEFAULT_MAX_AGE))
+    cache_control = f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+
+    @app.before_request
+    def _http_cache_check():
+        if request.method not in ('GET', 'HEAD', 'POST') or not _is_cacheable():
+            return None
+        etag = compute_etag()
+        g._http_etag = etag
+        if not request.if_none_match:
+            return None
+        if request.if_none_match.contains(etag):
+            if request.method not in SAFE_METHODS:
+                CONDITIONAL_REQUESTS.inc(1, result='precondition_failed')
+                response = jsonify({"success": False, "error": "Điều kiện If-None-Match không thỏa (412)."})
+                response.status_code = 412
+                response.set_etag(etag)
+                return response
+            CONDITIONAL_REQUESTS.inc(1, result='not_modified')
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        CONDITIONAL_REQUESTS.inc(1, result='modified')
+        return None
+
+    @app.after_request
+    def _http_cache_tag(response):
+        etag: Optional[str] = g.pop('_http_etag', None)
+        if etag is None or response.status_code != 200 or response.is_streamed:
+            return response
+        if _PARTIAL_MARKER.search(response.get_data()):
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
@@ -1,22 +1,28 @@
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional
 
 from forward_chaining import run_forward_chaining
 from models import ReactionModel
 from solve_identification_puzzle import solve_identification_puzzle
+from task_context import TaskContext, expired, report
 
 
-def identify_chemicals(unknown_list: List[str]) -> Dict:
-    """Xây dựng ma trận thử nghiệm và gọi hàm giải."""
+def identify_chemicals(unknown_list: List[str], ctx: Optional[TaskContext] = None) -> Dict:
+    """
+    Xây dựng ma trận thử nghiệm và gọi hàm giải.
+    Nếu ctx hết hạn, các cặp chưa thử được coi là 'Khong phan ung' và kết quả có "partial": True.
+    """
 
     # Chuẩn hóa danh sách đầu vào để đảm bảo tính nhất quán (vd: loại bỏ khoảng trắng, sắp xếp)
     clean_list = [c.strip() for c in unknown_list]
 
     test_matrix: Dict[Tuple[str, str], str] = {}
+    pairs_total = len(clean_list) * (len(clean_list) - 1) // 2
 
     # 1. Xây dựng ma trận thử nghiệm
     for i, chemical_A in enumerate(clean_list):
         for j, chemical_B in enumerate(clean_list):
             if i >= j: continue
+            if expired(ctx): break
 
             # 1.1. Chuẩn bị đầu vào cho forward_chaining
             reactants_str = f"{chemical_A} + {chemical_B}"
@@ -25,7 +31,8 @@ def identify_chemicals(unknown_list: List[str]) -> Dict:
             conditions_str = ""
 
             # 1.2. Chạy suy luận tiến
-            result = run_forward_chaining(reactants_str, conditions_str)
+            result = run_forward_chaining(reactants_str, conditions_str, ctx=ctx)
+            report(ctx, pairs_tested=len(test_matrix) + 1, pairs_total=pairs_total)
 
             # 1.3. Trích xuất hiện tượng
             phenomenon = "Khong phan ung"
@@ -44,5 +51,7 @@ def identify_chemicals(unknown_list: List[str]) -> Dict:
 
     # 2. Gọi hàm giải câu đố
     identification_result = solve_identification_puzzle(clean_list, test_matrix)
+    if ctx is not None and ctx.timed_out:
+        identification_result["partial"] = True
 
-    return identification_result
\ No newline at end of file
+    return identification_result
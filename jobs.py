@@ -0,0 +1,335 @@
+# --- File: jobs.py ---
+
+import collections
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import current_app, jsonify, request
+
+import metrics
+import worker_pool
+from balancer import balance_equations
+from forward_chaining import run_forward_chaining
+from identification import identify_chemicals
+from reaction_path import find_reaction_path
+from task_context import TaskContext
+from worker_pool import PoolBusyError
+
+logger = logging.getLogger(__name__)
+
+# ======================================================================
+# HẰNG SỐ VÀ METRIC
+# ======================================================================
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED)
+
+DEFAULT_MAX_JOBS = 1000
+DEFAULT_RESULT_TTL_S = 600.0
+MAX_LONG_POLL_S = 30.0
+
+JOBS_CREATED = metrics.counter('chem_jobs_created_total', 'Số job được tạo.', ('kind',))
+JOBS_DEDUPLICATED = metrics.counter('chem_jobs_deduplicated_total', 'Số yêu cầu gộp vào job đang chờ.', ('kind',))
+JOBS_FINISHED = metrics.counter('chem_jobs_finished_total', 'Số job đã kết thúc.', ('kind', 'status'))
+
+
+# ======================================================================
+# CÁC LOẠI JOB
+# ======================================================================
+
+def _job_identify(params: Dict[str, Any], ctx: TaskContext) -> Tuple[Callable, tuple]:
+    chemicals = params.get('chemicals') or []
+    if not isinstance(chemicals, list) or len(chemicals) < 2:
+        raise ValueError("Cung cấp ít nhất 2 chất cần nhận biết.")
+    return identify_chemicals, (chemicals,)
+
+
+def _job_reaction_path(params: Dict[str, Any], ctx: TaskContext) -> Tuple[Callable, tuple]:
+    if 'reactants' not in params or 'target' not in params:
+        raise ValueError("Thiếu 'reactants' hoặc 'target' trong yêu cầu.")
+    allowed_conditions = params.get('allowed_conditions')
+    if allowed_conditions is None:
+        return find_reaction_path, (params['reactants'], params['target'])
+    return functools.partial(find_reaction_path, allowed_conditions=str(allowed_conditions)), \
+        (params['reactants'], params['target'])
+
+
+def _job_forward_chaining(params: Dict[str, Any], ctx: TaskContext) -> Tuple[Callable, tuple]:
+    if 'reactants' not in params:
+        raise ValueError("Thiếu 'reactants' trong yêu cầu.")
+    return run_forward_chaining, (params['reactants'], params.get('conditions', ''))
+
+
+def _job_balance_batch(params: Dict[str, Any], ctx: TaskContext) -> Tuple[Callable, tuple]:
+    equations = params.get('equations')
+    if not isinstance(equations, list) or not equations:
+        raise ValueError("Thiếu danh sách 'equations' cần cân bằng.")
+    return balance_equations, (equations,)
+
+
+# kind -> hàm kiểm tra tham số, trả về (engine, args)
+JOB_KINDS: Dict[str, Callable[[Dict[str, Any], TaskContext], Tuple[Callable, tuple]]] = {
+    'identify': _job_identify,
+    'reaction_path': _job_reaction_path,
+    'forward_chaining': _job_forward_chaining,
+    'balance_batch': _job_balance_batch,
+}
+
+
+# ======================================================================
+# JOB VÀ JOB STORE
+# ======================================================================
+
+class Job:
+    """Trạng thái của một job bất đồng bộ."""
+
+    __slots__ = ('id', 'kind', 'key', 'status', 'progress', 'result', 'error', 'created_at', 'started_at',
+                 'finished_at', 'deadline', 'updated_at')
+
+    def __init__(self, kind: str, key: str, timeout_s: Optional[float] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = STATUS_QUEUED
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Hạn chạy (theo deadline của ctx) và lần cuối có tiến độ: để phát hiện job mà worker đã chết
+        self.deadline = self.created_at + timeout_s if timeout_s else None
+        self.updated_at = self.created_at
+
+    def expires_at(self, ttl_s: float) -> float:
+        """Job chưa kết thúc bị coi là hỏng sau thời điểm này (deadline + gia hạn, hoặc lần báo tiến độ cuối, + TTL)."""
+        if self.deadline is not None:
+            return self.deadline + worker_pool.DEADLINE_GRACE_S + ttl_s
+        return self.updated_at + ttl_s
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.error is not None:
+            data['error'] = self.error
+        if include_result and self.status == STATUS_DONE:
+            data['result'] = self.result
+        return data
+
+
+class JobStore:
+    """
+    Kho job trong bộ nhớ, có giới hạn số lượng và TTL cho kết quả.
+
+    - Job đang chờ/chạy có cùng khóa (kind + tham số) được gộp lại: yêu cầu thứ hai nhận job_id cũ.
+    - Job đã kết thúc bị xóa sau `result_ttl_s`; khi vượt `max_jobs`, job kết thúc cũ nhất bị xóa trước.
+    - Job chờ/chạy quá hạn (Job.expires_at: worker đã chết hoặc không bao giờ trả kết quả) chuyển sang
+      failed và bỏ khỏi bảng gộp, nên yêu cầu tiếp theo cùng khóa tạo job mới.
+    """
+
+    def __init__(self, max_jobs: int = DEFAULT_MAX_JOBS, result_ttl_s: float = DEFAULT_RESULT_TTL_S):
+        self.max_jobs = max_jobs
+        self.result_ttl_s = result_ttl_s
+        self._jobs: 'collections.OrderedDict[str, Job]' = collections.OrderedDict()
+        self._pending_by_key: Dict[str, str] = {}
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def make_key(kind: str, params: Dict[str, Any]) -> str:
+        raw = json.dumps({'kind': kind, 'params': params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get_or_create(self, kind: str, params: Dict[str, Any],
+                      timeout_s: Optional[float] = None) -> Tuple[Job, bool]:
+        """Trả về (job, created). created=False nghĩa là đã gộp vào job đang chờ/chạy."""
+        key = self.make_key(kind, params)
+        with self._cond:
+            self._purge_locked()
+            job = self._jobs.get(self._pending_by_key.get(key, ''))
+            if job is not None and job.status not in FINISHED_STATUSES:
+                return job, False
+            job = Job(kind, key, timeout_s)
+            self._jobs[job.id] = job
+            self._pending_by_key[key] = job.id
+            self._evict_locked()
+            return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            self._purge_locked()
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Long-poll: chờ tới khi job kết thúc hoặc hết `timeout` giây."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                self._purge_locked()
+                job = self._jobs.get(job_id)
+                remaining = deadline - time.time()
+                if job is None or job.status in FINISHED_STATUSES or remaining <= 0:
+                    return job
+                self._cond.wait(remaining)
+
+    def update_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return
+            job.updated_at = time.time()
+            if job.status == STATUS_QUEUED:
+                job.status = STATUS_RUNNING
+                job.started_at = job.updated_at
+            job.progress.update(progress)
+
+    def finish(self, job_id: str, result: Any = None, error: Optional[str] = None) -> None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            # Job đã bị đánh dấu quá hạn thì kết quả đến muộn bị bỏ qua
+            if job is None or job.status in FINISHED_STATUSES:
+                return
+            self._finish_locked(job, result, error)
+
+    def _finish_locked(self, job: Job, result: Any, error: Optional[str]) -> None:
+        job.status = STATUS_FAILED if error is not None else STATUS_DONE
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        if self._pending_by_key.get(job.key) == job.id:
+            del self._pending_by_key[job.key]
+        self._cond.notify_all()
+        JOBS_FINISHED.inc(1, kind=job.kind, status=job.status)
+
+    def discard(self, job_id: str) -> None:
+        with self._cond:
+            job = self._jobs.pop(job_id, None)
+            if job is not None and self._pending_by_key.get(job.key) == job_id:
+                del self._pending_by_key[job.key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            counts = collections.Counter(job.status for job in self._jobs.values())
+        return dict(counts)
+
+    def _purge_locked(self) -> None:
+        now = time.time()
+        expired_ids: List[str] = []
+        for job_id, job in self._jobs.items():
+            if job.finished_at is not None:
+                if now - job.finished_at > self.result_ttl_s:
+                    expired_ids.append(job_id)
+            elif now > job.expires_at(self.result_ttl_s):
+                logger.warning("Job %s (%s) không kết thúc trước hạn, đánh dấu thất bại.", job_id, job.kind)
+                self._finish_locked(job, None, "Job không kết thúc trước hạn (worker có thể đã dừng).")
+        for job_id in expired_ids:
+            del self._jobs[job_id]
+
+    def _evict_locked(self) -> None:
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.status in FINISHED_STATUSES]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+
+
+store = JobStore()
+
+
+# ======================================================================
+# CHẠY JOB TRÊN WORKER POOL
+# ======================================================================
+
+def submit_job(kind: str, params: Dict[str, Any], timeout_s: Optional[float]) -> Tuple[Job, bool]:
+    """
+    Tạo (hoặc gộp) job và gửi lên worker pool.
+    Ném ValueError nếu tham số không hợp lệ, PoolBusyError nếu pool đầy.
+    """
+    builder = JOB_KINDS.get(kind)
+    if builder is None:
+        raise ValueError(f"Loại job không hợp lệ: '{kind}'. Hỗ trợ: {', '.join(sorted(JOB_KINDS))}.")
+
+    job, created = store.get_or_create(kind, params, timeout_s)
+    if not created:
+        JOBS_DEDUPLICATED.inc(1, kind=kind)
+        return job, False
+
+    ctx = TaskContext.with_timeout(timeout_s, endpoint=f'job:{kind}', job_id=job.id)
+    try:
+        fn, args = builder(params, ctx)
+        pool = worker_pool.get_pool()
+        future = pool.submit(fn, *args, ctx=ctx)
+    except BaseException:
+        store.discard(job.id)
+        raise
+
+    JOBS_CREATED.inc(1, kind=kind)
+
+    def _on_done(f):
+        try:
+            store.finish(job.id, result=pool.collect(f))
+        except Exception as e:
+            logger.exception("Job %s (%s) thất bại: %s", job.id, kind, e)
+            store.finish(job.id, error=str(e))
+
+    future.add_done_callback(_on_done)
+    return job, True
+
+
+# ======================================================================
+# TÍCH HỢP FLASK
+# ======================================================================
+
+def init_app(app) -> None:
+    """Đăng ký endpoint job bất đồng bộ và nối tiến độ từ worker pool vào job store."""
+    store.max_jobs = app.config.get('JOB_MAX_JOBS', DEFAULT_MAX_JOBS)
+    store.result_ttl_s = app.config.get('JOB_RESULT_TTL_S', DEFAULT_RESULT_TTL_S)
+    worker_pool.set_progress_handler(store.update_progress)
+
+    @app.route('/api/jobs', methods=['POST'])
+    def api_create_job():
+        data = request.get_json(silent=True) or {}
+        kind = data.get('kind', '')
+        params = data.get('params') or {}
+        if not isinstance(params, dict):
+            return jsonify({"success": False, "error": "'params' phải là một object."}), 400
+
+        try:
+            job, created = submit_job(kind, params, current_app.config.get('JOB_DEADLINE_S'))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        except PoolBusyError as e:
+            response = jsonify({"success": False, "error": str(e)})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+
+        response = jsonify({"success": True, "deduplicated": not created, "data": job.to_dict(include_result=False)})
+        response.status_code = 202
+        response.headers['Location'] = f"/api/jobs/{job.id}"
+        return response
+
+    @app.route('/api/jobs/<job_id>', methods=['GET'])
+    def api_get_job(job_id: str):
+        wait_s = min(request.args.get('wait', default=0.0, type=float), MAX_LONG_POLL_S)
+        job = store.wait(job_id, wait_s) if wait_s > 0 else store.get(job_id)
+        if job is None:
+            return jsonify({"success": False, "error": f"Không tìm thấy job '{job_id}' (có thể đã hết hạn)."}), 404
+        return jsonify({"success": True, "data": job.to_dict()})
@@ -0,0 +1,331 @@
+# --- File: kb_flat.py ---
+"""
+Bố cục phẳng (flat) của cơ sở tri thức, dùng chung một bản vật lý giữa các tiến trình worker.
+
+Với snapshot dạng đối tượng, mỗi worker (fork) dần sao chép các trang bộ nhớ chứa luật do
+bộ đếm tham chiếu/GC ghi vào đối tượng, nên bộ nhớ tăng tuyến tính theo số worker. Ở đây
+luật phản ứng được ghi ra một file dạng mảng rồi mmap chỉ đọc (mặc định nằm trong /dev/shm):
+mọi tiến trình ánh xạ cùng các trang của page cache và các trang đó không bao giờ bị ghi.
+
+Bố cục file (little-endian, mỗi section căn lề 8 byte):
+    MAGIC (8 byte) | độ dài header (uint32) | header JSON | các section mảng
+
+- Bảng chuỗi: mọi chuỗi (chất, điều kiện, loại, phương trình...) được intern thành một id;
+  nội dung là một blob UTF-8 + mảng offset.
+- Danh sách chất tham gia/sản phẩm/điều kiện: dạng CSR (mảng offset theo luật + mảng id chuỗi).
+- Thuộc tính vô hướng của luật: mảng số (id, id chuỗi; -1 nghĩa là None).
+
+Luật hóa học chung và bảng tuần hoàn rất nhỏ nên được lưu dạng JSON trong header.
+"""
+
+import array
+import collections.abc
+import json
+import mmap
+import os
+import struct
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from knowledge_base import KnowledgeBase
+from rule_records import CalculationRule
+
+MAGIC = b'CHEMFLT1'
+_PREAMBLE = struct.Struct('<8sI')
+_ALIGN = 8
+
+NONE_ID = -1
+
+# Thư mục mặc định: /dev/shm (RAM, dùng chung giữa các tiến trình) nếu có
+DEFAULT_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# Các mảng của luật phản ứng: tên -> typecode
+_REACTION_ARRAYS = {
+    'rx_id': 'q',
+    'rx_type': 'i', 'rx_desc': 'i', 'rx_eq': 'i', 'rx_phen': 'i', 'rx_detail': 'i',
+    'rx_reac_off': 'i', 'rx_reac': 'i',
+    'rx_prod_off': 'i', 'rx_prod': 'i',
+    'rx_cond_off': 'i', 'rx_cond': 'i',
+}
+
+
+# ======================================================================
+# GHI FILE
+# ======================================================================
+
+class _StringTable:
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def add(self, value: Optional[str]) -> int:
+        if value is None:
+            return NONE_ID
+        sid = self.ids.get(value)
+        if sid is None:
+            sid = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return sid
+
+    def encode(self) -> Tuple[array.array, bytes]:
+        offsets = array.array('q', [0])
+        chunks = []
+        total = 0
+        for value in self.values:
+            data = value.encode('utf-8')
+            chunks.append(data)
+            total += len(data)
+            offsets.append(total)
+        return offsets, b''.join(chunks)
+
+
+def _append_csr(offsets: array.array, items: array.array, values: Sequence[str], strings: _StringTable) -> None:
+    items.extend(strings.add(v) for v in values)
+    offsets.append(len(items))
+
+
+def write_flat(kb: KnowledgeBase, path: str) -> Dict[str, Any]:
+    """Ghi cơ sở tri thức ra file phẳng (nguyên tử: file tạm + os.replace). Trả về header."""
+    strings = _StringTable()
+    arrays = {name: array.array(code) for name, code in _REACTION_ARRAYS.items()}
+    for name in ('rx_reac_off', 'rx_prod_off', 'rx_cond_off'):
+        arrays[name].append(0)
+
+    # Tên chất/điều kiện được đưa lên đầu bảng chuỗi để khi mở file có thể giải mã sẵn
+    # (số lượng nhỏ) và đọc danh sách chất chỉ bằng phép tra mảng
+    for rule in kb.reaction_rules:
+        for values in (rule.required_reactants, rule.products, rule.required_conditions):
+            for value in values:
+                strings.add(value)
+    species_count = len(strings.values)
+
+    for rule in kb.reaction_rules:
+        arrays['rx_id'].append(rule.id)
+        arrays['rx_type'].append(strings.add(rule.type))
+        arrays['rx_desc'].append(strings.add(rule.description))
+        arrays['rx_eq'].append(strings.add(rule.equation_string))
+        arrays['rx_phen'].append(strings.add(rule.phenomena))
+        detail = rule.phenomena_detail_json
+        arrays['rx_detail'].append(strings.add(json.dumps(detail, ensure_ascii=False)) if detail is not None else NONE_ID)
+        _append_csr(arrays['rx_reac_off'], arrays['rx_reac'], rule.required_reactants, strings)
+        _append_csr(arrays['rx_prod_off'], arrays['rx_prod'], rule.products, strings)
+        _append_csr(arrays['rx_cond_off'], arrays['rx_cond'], rule.required_conditions, strings)
+
+    str_off, str_blob = strings.encode()
+    sections: List[Tuple[str, str, bytes]] = [('str_off', 'q', str_off.tobytes()), ('str_blob', 'B', str_blob)]
+    sections += [(name, arrays[name].typecode, arrays[name].tobytes()) for name in _REACTION_ARRAYS]
+
+    # Tính offset tương đối của từng section (tính từ đầu vùng dữ liệu), căn lề 8 byte
+    layout: Dict[str, List[Any]] = {}
+    position = 0
+    for name, code, data in sections:
+        layout[name] = [position, code, len(data)]
+        position += len(data) + (-len(data) % _ALIGN)
+
+    header = {
+        'version': kb.version,
+        'changelog_cursor': kb.changelog_cursor,
+        'source': kb.source,
+        'reactions': len(kb.reaction_rules),
+        'strings': len(strings.values),
+        'species': species_count,
+        'sections': layout,
+        'chemical_rules': [rule.to_dict() for rule in kb.chemical_rules],
+        'elements': kb.elements,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b' ' * (-(_PREAMBLE.size + len(header_bytes)) % _ALIGN)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.kbflat-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_PREAMBLE.pack(MAGIC, len(header_bytes)))
+            f.write(header_bytes)
+            for _name, _code, data in sections:
+                f.write(data)
+                f.write(b'\0' * (-len(data) % _ALIGN))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return header
+
+
+# ======================================================================
+# ĐỌC FILE (MMAP, KHÔNG SAO CHÉP)
+# ======================================================================
+
+class FlatStore:
+    """Các mảng của file phẳng, là memoryview trỏ thẳng vào vùng mmap (chỉ đọc)."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = _PREAMBLE.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' không phải file cơ sở tri thức phẳng.")
+        self.path = path
+        self.header: Dict[str, Any] = json.loads(bytes(self._mm[_PREAMBLE.size:_PREAMBLE.size + header_len]))
+        base = _PREAMBLE.size + header_len
+        view = memoryview(self._mm)
+        for name, (offset, code, length) in self.header['sections'].items():
+            section = view[base + offset:base + offset + length]
+            setattr(self, name, section if code == 'B' else section.cast(code))
+        # Tên chất/điều kiện (đầu bảng chuỗi) được giải mã sẵn: ít và được đọc liên tục trong vòng lặp engine
+        self.species: List[str] = [self._decode(sid) for sid in range(self.header['species'])]
+
+    def _decode(self, sid: int) -> str:
+        return str(self.str_blob[self.str_off[sid]:self.str_off[sid + 1]], 'utf-8')
+
+    def string(self, sid: int) -> Optional[str]:
+        """Chuỗi theo id; chuỗi ngoài phần tên chất (phương trình, mô tả...) được giải mã mỗi lần đọc."""
+        if sid == NONE_ID:
+            return None
+        if sid < len(self.species):
+            return self.species[sid]
+        return self._decode(sid)
+
+    def string_list(self, offsets: memoryview, items: memoryview, index: int) -> Tuple[str, ...]:
+        return tuple(map(self.species.__getitem__, items[offsets[index]:offsets[index + 1]]))
+
+    def __len__(self) -> int:
+        return self.header['reactions']
+
+
+class FlatReactionRule:
+    """Khung nhìn (view) tới một luật phản ứng trong FlatStore; cùng thuộc tính với ReactionRule."""
+
+    __slots__ = ('_store', '_index')
+
+    is_used = False
+
+    def __init__(self, store: FlatStore, index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def id(self) -> int:
+        return self._store.rx_id[self._index]
+
+    @property
+    def type(self) -> str:
+        return self._store.string(self._store.rx_type[self._index])
+
+    @property
+    def description(self) -> Optional[str]:
+        return self._store.string(self._store.rx_desc[self._index])
+
+    @property
+    def equation_string(self) -> Optional[str]:
+        return self._store.string(self._store.rx_eq[self._index])
+
+    @property
+    def phenomena(self) -> Optional[str]:
+        return self._store.string(self._store.rx_phen[self._index])
+
+    @property
+    def phenomena_detail_json(self) -> Any:
+        raw = self._store.string(self._store.rx_detail[self._index])
+        return json.loads(raw) if raw is not None else None
+
+    @property
+    def required_reactants(self) -> Tuple[str, ...]:
+        store = self._store
+        return store.string_list(store.rx_reac_off, store.rx_reac, self._index)
+
+    @property
+    def products(self) -> Tuple[str, ...]:
+        store = self._store
+        return store.string_list(store.rx_prod_off, store.rx_prod, self._index)
+
+    @property
+    def required_conditions(self) -> Tuple[str, ...]:
+        store = self._store
+        return store.string_list(store.rx_cond_off, store.rx_cond, self._index)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'type': self.type,
+            'description': self.description,
+            'reactants': list(self.required_reactants),
+            'products': list(self.products),
+            'conditions': list(self.required_conditions),
+            'equation_string': self.equation_string,
+            'phenomena': self.phenomena,
+            'phenomena_detail': self.phenomena_detail_json
+        }
+
+    def __repr__(self):
+        return f"<FlatReactionRule(id={self.id}, {' + '.join(self.required_reactants)} -> {' + '.join(self.products)})>"
+
+
+class FlatRuleList(collections.abc.Sequence):
+    """Danh sách luật phản ứng chỉ đọc trên FlatStore (dùng thay cho list[ReactionRule])."""
+
+    def __init__(self, store: FlatStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [FlatReactionRule(self.store, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return FlatReactionRule(self.store, index)
+
+    def __iter__(self) -> Iterator[FlatReactionRule]:
+        store = self.store
+        for i in range(len(store)):
+            yield FlatReactionRule(store, i)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+
+def open_flat(path: str) -> KnowledgeBase:
+    """Mở file phẳng thành KnowledgeBase (chưa công bố); luật phản ứng nằm trong vùng mmap dùng chung."""
+    store = FlatStore(path)
+    header = store.header
+    chemical_rules = [
+        CalculationRule(d['id'], d['name'], d['formula'], d['description'], d['required_inputs'],
+                        d['output_var'], d['expression'])
+        for d in header['chemical_rules']
+    ]
+    kb = KnowledgeBase(FlatRuleList(store), chemical_rules, header['elements'],
+                       source=f"flat:{header['source']}", changelog_cursor=header['changelog_cursor'])
+    return kb
+
+
+def is_flat(kb: KnowledgeBase) -> bool:
+    return isinstance(kb.reaction_rules, FlatRuleList)
+
+
+def flatten(kb: KnowledgeBase, path: Optional[str] = None) -> KnowledgeBase:
+    """
+    Chuyển snapshot dạng đối tượng sang dạng phẳng: ghi file rồi mmap lại (snapshot đã phẳng giữ nguyên).
+
+    - path=None: file tạm trong DEFAULT_DIR, unlink ngay sau khi mở. Vùng nhớ còn tồn tại tới khi mọi
+      tiến trình đang ánh xạ (tiến trình chính và các worker fork) đóng lại, không để lại file rác.
+    - path cho trước: giữ file để các tiến trình độc lập (không fork) cũng open_flat() cùng một bản.
+    """
+    if is_flat(kb):
+        return kb
+    if path is not None:
+        write_flat(kb, path)
+        return open_flat(path)
+
+    fd, tmp_path = tempfile.mkstemp(prefix='chem-kb-', suffix='.flat', dir=DEFAULT_DIR)
+    os.close(fd)
+    try:
+        write_flat(kb, tmp_path)
+        flat = open_flat(tmp_path)
+    finally:
+        os.unlink(tmp_path)
+    return flat
@@ -0,0 +1,114 @@
+# --- File: kb_reload.py ---
+
+import logging
+import threading
+import time
+from typing import Optional
+
+from flask import g, jsonify, request
+
+import knowledge_base
+from admin_auth import require_admin
+from chemistry_data import fetch_db_fingerprint, refresh_knowledge_base, reload_knowledge_base
+
+logger = logging.getLogger(__name__)
+
+_reload_lock = threading.Lock()
+_last_fingerprint: Optional[tuple] = None
+
+
+def reload_now(app, models_module, full: bool = False) -> Optional[knowledge_base.KnowledgeBase]:
+    """
+    Tải lại cơ sở tri thức trong app context; chỉ một lần tải lại chạy tại một thời điểm.
+
+    - full=True: đọc lại toàn bộ các bảng.
+    - full=False: áp các thay đổi trong changelog kể từ snapshot mới nhất; nếu CSDL không có
+      changelog thì so dấu vân tay và tải lại toàn bộ khi khác.
+
+    Trả về snapshot mới hoặc None nếu không có gì thay đổi.
+    """
+    global _last_fingerprint
+    with _reload_lock, app.app_context():
+        if full:
+            kb = reload_knowledge_base(models_module)
+        elif knowledge_base.latest().changelog_cursor is not None:
+            return refresh_knowledge_base(models_module)
+        else:
+            fingerprint = fetch_db_fingerprint(models_module)
+            if fingerprint == _last_fingerprint:
+                return None
+            kb = reload_knowledge_base(models_module)
+        if kb.changelog_cursor is None:
+            _last_fingerprint = fetch_db_fingerprint(models_module)
+        return kb
+
+
+def _poll_loop(app, models_module, interval_s: float) -> None:
+    while True:
+        time.sleep(interval_s)
+        try:
+            kb = reload_now(app, models_module)
+            if kb is not None:
+                logger.info("[KB] Phát hiện thay đổi trong CSDL, đã tải lại phiên bản %d.", kb.version)
+        except Exception as e:
+            logger.exception("[KB] Lỗi khi kiểm tra/tải lại cơ sở tri thức: %s", e)
+
+
+def start_poller(app, models_module, interval_s: float) -> Optional[threading.Thread]:
+    """Bật luồng nền định kỳ kiểm tra CSDL và tải lại khi có thay đổi (interval_s <= 0: tắt)."""
+    global _last_fingerprint
+    if interval_s <= 0:
+        return None
+    if knowledge_base.latest().changelog_cursor is None:
+        with app.app_context():
+            _last_fingerprint = fetch_db_fingerprint(models_module)
+    thread = threading.Thread(target=_poll_loop, args=(app, models_module, interval_s), name='chem-kb-poller',
+                              daemon=True)
+    thread.start()
+    logger.info("[KB] Bật tự động tải lại mỗi %.1fs.", interval_s)
+    return thread
+
+
+def init_app(app, models_module) -> None:
+    """
+    - Ghim snapshot cho từng request: request đang chạy giữ nguyên phiên bản lúc bắt đầu.
+    - /api/admin/reload: dựng snapshot mới và hoán đổi không gián đoạn
+      (mặc định tăng dần theo changelog; ?full=1 để đọc lại toàn bộ).
+    - /api/admin/kb: thông tin snapshot đang phục vụ.
+    """
+
+    @app.before_request
+    def _kb_pin():
+        g._kb_token = knowledge_base.pin()
+
+    @app.teardown_request
+    def _kb_unpin(_exc):
+        token = g.pop('_kb_token', None)
+        if token is not None:
+            try:
+                knowledge_base.unpin(token)
+            except ValueError:
+                # Token tạo ở ngữ cảnh khác (vd: response dạng luồng kết thúc trên ngữ cảnh mới)
+                pass
+
+    @app.route('/api/admin/reload', methods=['POST'])
+    @require_admin
+    def api_reload_knowledge_base():
+        previous = knowledge_base.latest().version
+        full = request.args.get('full', '').lower() in ('1', 'true', 'yes')
+        try:
+            kb = reload_now(app, models_module, full=full)
+        except Exception as e:
+            logger.exception("[KB] Tải lại thất bại, giữ nguyên phiên bản %d: %s", previous, e)
+            return jsonify({"success": False, "error": str(e), "version": previous}), 500
+        return jsonify({
+            "success": True,
+            "changed": kb is not None,
+            "previous_version": previous,
+            "data": (kb or knowledge_base.latest()).summary(),
+        })
+
+    @app.route('/api/admin/kb', methods=['GET'])
+    @require_admin
+    def api_knowledge_base_info():
+        return jsonify({"success": True, "data": knowledge_base.latest().summary()})
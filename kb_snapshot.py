@@ -0,0 +1,259 @@
+# --- File: kb_snapshot.py ---
+"""
+File snapshot cơ sở tri thức đã biên dịch sẵn, giúp worker khởi động nhanh.
+
+Định dạng file (little-endian):
+    MAGIC (8 byte) | FORMAT_VERSION (uint16) | độ dài header (uint32) | header JSON | payload pickle
+
+Header chứa trạng thái CSDL lúc biên dịch (con trỏ changelog, dấu vân tay các bảng) nên khi khởi động
+chỉ cần vài truy vấn rẻ để biết file còn mới hay không; payload (luật, nguyên tố, cấu trúc dẫn xuất)
+chỉ được đọc khi file dùng được. File do chính hệ thống tạo ra (pickle), không nạp file không tin cậy.
+
+Dòng lệnh:
+    python kb_snapshot.py compile [--out PATH]
+    python kb_snapshot.py info PATH
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import logging
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+import knowledge_base
+from chemistry_data import (
+    fetch_changelog_cursor, fetch_db_fingerprint, reaction_rules_in_memory, refresh_knowledge_base,
+    reload_knowledge_base
+)
+from knowledge_base import KnowledgeBase
+from rule_records import CalculationRule, ReactionRule, records_from_columns, records_to_columns
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CHEMKB\x00\x01'
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct('<8sHI')
+
+# Tăng khi cấu trúc ReactionRule/CalculationRule hoặc payload thay đổi (file cũ sẽ bị bỏ qua)
+PAYLOAD_SCHEMA = 'rule_records-columns/2'
+
+
+class SnapshotFormatError(Exception):
+    """File không phải snapshot hợp lệ hoặc khác phiên bản định dạng."""
+
+
+# ======================================================================
+# TRẠNG THÁI CSDL
+# ======================================================================
+
+def db_state(models_module) -> Dict[str, Any]:
+    """Trạng thái rẻ của CSDL dùng để so khớp với snapshot (gọi trong app context)."""
+    return {
+        'changelog_cursor': fetch_changelog_cursor(models_module),
+        'fingerprint': [list(item) for item in fetch_db_fingerprint(models_module)],
+    }
+
+
+def _counts_match(kb: KnowledgeBase, fingerprint) -> bool:
+    counts = {table: count for table, count, _max_id in fingerprint}
+    return ((counts.get('reactions') == len(kb.reaction_rules) or not reaction_rules_in_memory())
+            and counts.get('chemical_rules') == len(kb.chemical_rules)
+            and counts.get('elements') == len(kb.elements))
+
+
+# ======================================================================
+# GHI / ĐỌC FILE
+# ======================================================================
+
+def write_snapshot(kb: KnowledgeBase, path: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ghi snapshot (kèm mọi cấu trúc dẫn xuất đã đăng ký) ra file một cách nguyên tử:
+    ghi file tạm cùng thư mục rồi os.replace, nên worker đang đọc không bao giờ thấy file dở dang.
+    """
+    kb.warm()
+    # Lưu dạng cột: unpickle vài tuple lớn nhanh hơn nhiều so với hàng trăm nghìn đối tượng riêng lẻ
+    payload = pickle.dumps({
+        'reaction_rules': records_to_columns(kb.reaction_rules, ReactionRule),
+        'chemical_rules': records_to_columns(kb.chemical_rules, CalculationRule),
+        'elements': kb.elements,
+        'derived': kb.derived_items(),
+    }, protocol=pickle.HIGHEST_PROTOCOL)
+    header = {
+        'schema': PAYLOAD_SCHEMA,
+        'created_at': time.time(),
+        'kb_version': kb.version,
+        'changelog_cursor': kb.changelog_cursor,
+        'fingerprint': state['fingerprint'],
+        'counts': {
+            'reactions': len(kb.reaction_rules),
+            'chemical_rules': len(kb.chemical_rules),
+            'elements': len(kb.elements),
+        },
+        'payload_bytes': len(payload),
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.kb-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return header
+
+
+def _read_preamble(f) -> Dict[str, Any]:
+    raw = f.read(_PREAMBLE.size)
+    if len(raw) < _PREAMBLE.size:
+        raise SnapshotFormatError("File snapshot quá ngắn.")
+    magic, format_version, header_len = _PREAMBLE.unpack(raw)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        raise SnapshotFormatError(f"Định dạng snapshot không hỗ trợ (magic={magic!r}, version={format_version}).")
+    header = json.loads(f.read(header_len).decode('utf-8'))
+    if header.get('schema') != PAYLOAD_SCHEMA:
+        raise SnapshotFormatError(f"Schema payload khác ({header.get('schema')} != {PAYLOAD_SCHEMA}).")
+    return header
+
+
+def read_header(path: str) -> Optional[Dict[str, Any]]:
+    """Chỉ đọc header (vài trăm byte). None nếu file không tồn tại hoặc không hợp lệ."""
+    try:
+        with open(path, 'rb') as f:
+            return _read_preamble(f)
+    except FileNotFoundError:
+        return None
+    except (SnapshotFormatError, ValueError, OSError) as e:
+        logger.warning("[KB] Bỏ qua file snapshot '%s': %s", path, e)
+        return None
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """Tạm tắt GC khi tạo hàng loạt đối tượng sống lâu (GC quét lặp lại chúng mà không thu hồi được gì)."""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def read_snapshot(path: str) -> KnowledgeBase:
+    """Đọc toàn bộ file thành KnowledgeBase (chưa công bố), kèm các cấu trúc dẫn xuất đã dựng sẵn."""
+    with open(path, 'rb') as f, _gc_paused():
+        header = _read_preamble(f)
+        payload = pickle.load(f)
+        kb = KnowledgeBase(records_from_columns(payload['reaction_rules'], ReactionRule),
+                           records_from_columns(payload['chemical_rules'], CalculationRule),
+                           payload['elements'],
+                           source='snapshot', changelog_cursor=header.get('changelog_cursor'))
+    kb.attach_derived(payload.get('derived') or {})
+    return kb
+
+
+# ======================================================================
+# KHỞI ĐỘNG TỪ SNAPSHOT
+# ======================================================================
+
+def load_or_build(models_module, path: str, write_if_stale: bool = True) -> KnowledgeBase:
+    """
+    Công bố cơ sở tri thức khi khởi động (gọi trong app context):
+
+    - File còn mới (cùng con trỏ changelog/dấu vân tay CSDL): chỉ đọc file, không quét bảng.
+    - File cũ nhưng CSDL có changelog đầy đủ từ con trỏ của file: đọc file rồi áp phần thay đổi.
+    - Ngược lại: tải lại toàn bộ từ CSDL.
+
+    Khi snapshot công bố khác nội dung file và write_if_stale=True, file được ghi lại cho lần khởi động sau.
+    """
+    start = time.perf_counter()
+    state = db_state(models_module)
+    header = read_header(path)
+
+    kb: Optional[KnowledgeBase] = None
+    if header is not None:
+        file_cursor = header.get('changelog_cursor')
+        db_cursor = state['changelog_cursor']
+        fresh = header.get('fingerprint') == state['fingerprint'] and file_cursor == db_cursor
+        patchable = file_cursor is not None and db_cursor is not None and file_cursor < db_cursor
+        if fresh or patchable:
+            try:
+                kb = knowledge_base.publish(read_snapshot(path))
+                logger.info("[KB] Đã nạp snapshot '%s' (phiên bản %d, %d phản ứng) trong %.3fs.",
+                            path, kb.version, len(kb.reaction_rules), time.perf_counter() - start)
+                if patchable:
+                    kb = refresh_knowledge_base(models_module) or kb
+                    if not _counts_match(kb, state['fingerprint']):
+                        logger.warning("[KB] Snapshot sau khi áp changelog lệch số dòng với CSDL, tải lại toàn bộ.")
+                        kb = None
+                else:
+                    return kb
+            except Exception as e:
+                logger.warning("[KB] Không dùng được snapshot '%s', tải lại toàn bộ: %s", path, e)
+                kb = None
+
+    if kb is None:
+        kb = reload_knowledge_base(models_module)
+
+    if write_if_stale:
+        try:
+            write_snapshot(kb, path, state)
+            logger.info("[KB] Đã ghi snapshot '%s' (phiên bản %d).", path, kb.version)
+        except OSError as e:
+            logger.warning("[KB] Không ghi được snapshot '%s': %s", path, e)
+    return kb
+
+
+# ======================================================================
+# DÒNG LỆNH
+# ======================================================================
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Biên dịch/kiểm tra file snapshot cơ sở tri thức.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_compile = sub.add_parser('compile', help='Đọc CSDL và ghi file snapshot.')
+    p_compile.add_argument('--out', default=os.environ.get('CHEM_KB_SNAPSHOT_PATH') or 'chemistry_kb.snapshot')
+    p_info = sub.add_parser('info', help='In header của file snapshot.')
+    p_info.add_argument('path')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    if args.command == 'info':
+        header = read_header(args.path)
+        if header is None:
+            print(f"Không đọc được snapshot '{args.path}'.", file=sys.stderr)
+            return 1
+        print(json.dumps(header, ensure_ascii=False, indent=2))
+        return 0
+
+    import api_server
+    import models
+    app = api_server.create_app({'KB_LOAD': api_server.KB_LOAD_OFF})
+    with app.app_context():
+        models.db.create_all()
+        api_server.enable_change_tracking(models)
+        start = time.perf_counter()
+        state = db_state(models)
+        kb = reload_knowledge_base(models)
+        header = write_snapshot(kb, args.out, state)
+    print(f"Đã ghi '{args.out}': {header['counts']} ({header['payload_bytes']} byte payload, "
+          f"{time.perf_counter() - start:.2f}s).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
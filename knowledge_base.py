@@ -0,0 +1,163 @@
+# --- File: knowledge_base.py ---
+
+import contextvars
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+
+# ======================================================================
+# ẢNH CHỤP (SNAPSHOT) CƠ SỞ TRI THỨC
+# ======================================================================
+
+KB_VERSION = metrics.gauge('chem_kb_version', 'Phiên bản cơ sở tri thức (luật/nguyên tố) đang phục vụ.')
+KB_RELOADS = metrics.counter('chem_kb_reloads_total', 'Số lần công bố snapshot cơ sở tri thức mới.')
+
+
+class KnowledgeBase:
+    """
+    Ảnh chụp bất biến của toàn bộ dữ liệu mà các engine sử dụng: luật phản ứng, luật hóa học chung
+    và bảng tuần hoàn, gắn với một số phiên bản (version).
+
+    Snapshot được dựng riêng rồi công bố bằng một phép gán tham chiếu (atomic), nên request đang chạy
+    vẫn giữ nguyên snapshot đã lấy lúc bắt đầu. Các chỉ mục/cache dẫn xuất được lưu trong
+    snapshot (derived) nên tự động bị vô hiệu khi có phiên bản mới, không cần xóa toàn cục.
+    """
+
+    def __init__(self, reaction_rules: List[Any], chemical_rules: List[Any], elements: Dict[str, Dict[str, Any]],
+                 version: int = 0, source: str = 'db', changelog_cursor: Optional[int] = None):
+        self.reaction_rules = reaction_rules
+        self.chemical_rules = chemical_rules
+        self.elements = elements
+        self.version = version
+        self.source = source
+        # id lớn nhất của kb_changelog đã được phản ánh trong snapshot (None: không theo dõi thay đổi)
+        self.changelog_cursor = changelog_cursor
+        self.loaded_at = time.time()
+        self._derived: Dict[str, Any] = {}
+        self._derived_lock = threading.Lock()
+
+    def derived(self, name: str, builder: Optional[Callable[['KnowledgeBase'], Any]] = None) -> Any:
+        """
+        Lấy (hoặc dựng một lần) cấu trúc dẫn xuất gắn với snapshot này, vd: chỉ mục luật.
+        Nếu không truyền builder, dùng builder đã đăng ký bằng register_derived().
+        """
+        value = self._derived.get(name)
+        if value is None:
+            with self._derived_lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = (builder or _derived_builders[name])(self)
+                    self._derived[name] = value
+        return value
+
+    def warm(self) -> 'KnowledgeBase':
+        """Dựng trước mọi cấu trúc dẫn xuất đã đăng ký (dùng khi biên dịch snapshot ra file)."""
+        for name in list(_derived_builders):
+            self.derived(name)
+        return self
+
+    def derived_items(self) -> Dict[str, Any]:
+        """Các cấu trúc dẫn xuất đã được dựng (để lưu cùng snapshot)."""
+        return dict(self._derived)
+
+    def attach_derived(self, items: Dict[str, Any]) -> None:
+        """Gắn các cấu trúc dẫn xuất đã dựng sẵn (đọc từ file snapshot) vào snapshot này."""
+        with self._derived_lock:
+            for name, value in items.items():
+                if name in _derived_builders:
+                    self._derived.setdefault(name, value)
+
+    def replace(self, **changes) -> 'KnowledgeBase':
+        """Tạo snapshot mới thay một phần dữ liệu (phiên bản sẽ được gán khi publish)."""
+        return KnowledgeBase(
+            reaction_rules=changes.get('reaction_rules', self.reaction_rules),
+            chemical_rules=changes.get('chemical_rules', self.chemical_rules),
+            elements=changes.get('elements', self.elements),
+            source=changes.get('source', self.source),
+            changelog_cursor=changes.get('changelog_cursor', self.changelog_cursor),
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "changelog_cursor": self.changelog_cursor,
+            "loaded_at": self.loaded_at,
+            "reactions": len(self.reaction_rules),
+            "chemical_rules": len(self.chemical_rules),
+            "elements": len(self.elements),
+        }
+
+    def __repr__(self):
+        return (f"<KnowledgeBase(version={self.version}, reactions={len(self.reaction_rules)}, "
+                f"chemical_rules={len(self.chemical_rules)}, elements={len(self.elements)})>")
+
+
+# Các cấu trúc dẫn xuất (chỉ mục, bảng tra...) dựng từ snapshot: tên -> builder(kb)
+_derived_builders: Dict[str, Callable[[KnowledgeBase], Any]] = {}
+
+
+def register_derived(name: str, builder: Callable[[KnowledgeBase], Any]) -> None:
+    """Đăng ký một cấu trúc dẫn xuất; được dựng lười khi dùng lần đầu hoặc sẵn khi warm()."""
+    _derived_builders[name] = builder
+
+
+# ======================================================================
+# CÔNG BỐ VÀ TRUY CẬP SNAPSHOT HIỆN TẠI
+# ======================================================================
+
+_current: KnowledgeBase = KnowledgeBase([], [], {}, version=0, source='empty')
+_publish_lock = threading.Lock()
+_listeners: List[Callable[[KnowledgeBase], None]] = []
+# Biến đổi áp lên snapshot trước khi công bố (vd: chuyển sang bố cục phẳng dùng chung bộ nhớ)
+_transforms: List[Callable[[KnowledgeBase], KnowledgeBase]] = []
+
+# Snapshot được "ghim" cho request hiện tại (xem pin()/unpin())
+_pinned: contextvars.ContextVar[Optional[KnowledgeBase]] = contextvars.ContextVar('chem_kb_pinned', default=None)
+
+
+def current() -> KnowledgeBase:
+    """Snapshot đang dùng: snapshot đã ghim cho request hiện tại, nếu không thì snapshot mới nhất."""
+    pinned = _pinned.get()
+    return pinned if pinned is not None else _current
+
+
+def latest() -> KnowledgeBase:
+    return _current
+
+
+def publish(kb: KnowledgeBase) -> KnowledgeBase:
+    """Gán phiên bản mới cho snapshot và hoán đổi tham chiếu toàn cục (atomic)."""
+    global _current
+    for transform in list(_transforms):
+        kb = transform(kb)
+    with _publish_lock:
+        kb.version = _current.version + 1
+        _current = kb
+        listeners = list(_listeners)
+    KB_VERSION.set(kb.version)
+    KB_RELOADS.inc(1)
+    for listener in listeners:
+        listener(kb)
+    return kb
+
+
+def on_publish(listener: Callable[[KnowledgeBase], None]) -> None:
+    """Đăng ký hàm được gọi sau mỗi lần công bố snapshot mới (vd: tái tạo worker pool)."""
+    _listeners.append(listener)
+
+
+def add_publish_transform(transform: Callable[[KnowledgeBase], KnowledgeBase]) -> None:
+    """Đăng ký hàm biến đổi snapshot ngay trước khi công bố (chạy ngoài khóa, theo thứ tự đăng ký)."""
+    _transforms.append(transform)
+
+
+def pin(kb: Optional[KnowledgeBase] = None) -> contextvars.Token:
+    """Ghim snapshot cho ngữ cảnh hiện tại (request) để giữ nguyên phiên bản tới khi kết thúc."""
+    return _pinned.set(kb if kb is not None else _current)
+
+
+def unpin(token: contextvars.Token) -> None:
+    _pinned.reset(token)
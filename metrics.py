@@ -0,0 +1,335 @@
+# --- File: metrics.py ---
+
+import bisect
+import contextvars
+import copy
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple, Iterator
+
+from flask import Response, g, has_request_context, request
+
+# ======================================================================
+# HẰNG SỐ
+# ======================================================================
+
+# Các mốc (giây) mặc định cho histogram độ trễ
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Nhãn endpoint cho các giai đoạn chạy ngoài request context (vd: trong tiến trình worker)
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar('chem_current_endpoint', default='')
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# ======================================================================
+# CÁC LOẠI METRIC (Counter, Histogram)
+# ======================================================================
+
+class Counter:
+    """Bộ đếm tăng dần, có thể gắn nhãn (labels)."""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}' for k, v in items]
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def diff(before: dict, after: dict) -> dict:
+        return {k: v - before.get(k, 0.0) for k, v in after.items() if v != before.get(k, 0.0)}
+
+    def merge(self, delta: dict) -> None:
+        with self._lock:
+            for k, v in delta.items():
+                self._values[k] = self._values.get(k, 0.0) + v
+
+
+class Gauge(Counter):
+    """Giá trị có thể tăng/giảm (vd: số tác vụ đang chạy)."""
+
+    type_name = 'gauge'
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Histogram phân bố giá trị (thường là thời gian tính bằng giây)."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [counts theo bucket (không cộng dồn), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = entry
+            entry[0][idx] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                cumulative += c
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+    def snapshot(self) -> Dict[Tuple[str, ...], list]:
+        with self._lock:
+            return copy.deepcopy(self._values)
+
+    @staticmethod
+    def diff(before: dict, after: dict) -> dict:
+        delta = {}
+        for k, (counts, total, count) in after.items():
+            old = before.get(k)
+            if old is None:
+                delta[k] = [list(counts), total, count]
+            elif count != old[2]:
+                delta[k] = [[a - b for a, b in zip(counts, old[0])], total - old[1], count - old[2]]
+        return delta
+
+    def merge(self, delta: dict) -> None:
+        with self._lock:
+            for k, (counts, total, count) in delta.items():
+                entry = self._values.get(k)
+                if entry is None:
+                    entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                    self._values[k] = entry
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+
+
+class Registry:
+    """Tập hợp tất cả metric của tiến trình, xuất ra định dạng văn bản Prometheus."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Chụp giá trị hiện tại (counter/histogram, bỏ qua gauge) để tính phần chênh lệch."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics if not isinstance(m, Gauge)}
+
+    def delta_since(self, before: Dict[str, dict]) -> Dict[str, dict]:
+        delta = {}
+        for name, after in self.snapshot().items():
+            metric = self._metrics[name]
+            d = metric.diff(before.get(name, {}), after)
+            if d:
+                delta[name] = d
+        return delta
+
+    def merge(self, delta: Dict[str, dict]) -> None:
+        """Cộng phần chênh lệch (thường đến từ tiến trình worker) vào registry hiện tại."""
+        for name, d in delta.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(d)
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+              buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# ======================================================================
+# METRIC DÙNG CHUNG CHO API VÀ CÁC ENGINE
+# ======================================================================
+
+HTTP_REQUEST_SECONDS = histogram(
+    'chem_http_request_duration_seconds', 'Độ trễ xử lý request theo endpoint.',
+    ('endpoint', 'method', 'status')
+)
+STAGE_SECONDS = histogram(
+    'chem_stage_duration_seconds', 'Thời gian từng giai đoạn (parse, search, evaluate, serialise).',
+    ('endpoint', 'stage')
+)
+ENGINE_RULES_SCANNED = counter(
+    'chem_engine_rules_scanned_total', 'Số lần kiểm tra luật trong các engine.', ('engine',)
+)
+ENGINE_RULES_FIRED = counter(
+    'chem_engine_rules_fired_total', 'Số luật được kích hoạt (áp dụng thành công).', ('engine',)
+)
+ENGINE_STATES_VISITED = counter(
+    'chem_engine_states_visited_total', 'Số trạng thái/vòng lặp mà engine đã duyệt.', ('engine',)
+)
+ENGINE_RUNS = counter(
+    'chem_engine_runs_total', 'Số lần gọi engine.', ('engine',)
+)
+
+
+def record_engine_run(engine: str, rules_scanned: int, rules_fired: int, states_visited: int) -> None:
+    """Cộng dồn bộ đếm của một lần chạy engine (gọi một lần ở cuối để tránh khóa trong vòng lặp)."""
+    ENGINE_RUNS.inc(1, engine=engine)
+    ENGINE_RULES_SCANNED.inc(rules_scanned, engine=engine)
+    ENGINE_RULES_FIRED.inc(rules_fired, engine=engine)
+    ENGINE_STATES_VISITED.inc(states_visited, engine=engine)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Đo thời gian một giai đoạn xử lý; tự gắn nhãn endpoint nếu đang trong request."""
+    # Ưu tiên nhãn do worker đặt: tiến trình con được fork từ luồng request nên vẫn thấy request context cũ
+    endpoint = current_endpoint.get() or (request.endpoint if has_request_context() else '')
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint or '', stage=name)
+
+
+# ======================================================================
+# LOGGING CÓ LẤY MẪU (SAMPLED LOGGING)
+# ======================================================================
+
+def log_sampled(logger: logging.Logger, level: int, rate: float, msg: str, *args) -> None:
+    """
+    Ghi log với xác suất `rate` (0..1). Dùng cho các vòng lặp nóng để không làm ngập log.
+    Kiểm tra mức log trước để chi phí gần như bằng 0 khi mức log bị tắt.
+    """
+    if logger.isEnabledFor(level) and (rate >= 1.0 or random.random() < rate):
+        logger.log(level, msg, *args)
+
+
+# ======================================================================
+# TÍCH HỢP FLASK
+# ======================================================================
+
+def render_prometheus() -> str:
+    return REGISTRY.render()
+
+
+def init_app(app) -> None:
+    """Đăng ký hook đo độ trễ theo endpoint và endpoint /metrics."""
+
+    @app.before_request
+    def _metrics_start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _metrics_observe(response):
+        start: Optional[float] = g.pop('_metrics_start', None)
+        if start is not None:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                endpoint=request.endpoint or 'unknown',
+                method=request.method,
+                status=response.status_code
+            )
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,141 @@
+# --- File: migrate_normalise.py ---
+"""
+Chuyển dữ liệu phản ứng từ các cột JSON (reactants_json, products_json, conditions_json) sang lược đồ
+chuẩn hóa: bảng `chemicals` và các bảng nối `reaction_reactants`, `reaction_products`, `reaction_conditions`.
+
+Chạy lại nhiều lần vẫn an toàn (các dòng nối của mỗi phản ứng được xóa rồi ghi lại).
+
+    python migrate_normalise.py                 # toàn bộ bảng reactions
+    python migrate_normalise.py --ids 12 15 40  # chỉ một số phản ứng (vd: sau khi sửa tay)
+"""
+
+import argparse
+import logging
+import sys
+import time
+from typing import Dict, Iterable, Optional, Sequence
+
+from sqlalchemy import delete, insert, select
+
+from rule_records import decode_json_list, decode_species_list
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 1000
+
+
+def _chemical_ids(conn, chemicals_table, formulas: Iterable[str]) -> Dict[str, int]:
+    """Lấy id của các chất, tạo mới những chất chưa có."""
+    wanted = set(formulas)
+    if not wanted:
+        return {}
+    ids: Dict[str, int] = {}
+    ordered = sorted(wanted)
+    for i in range(0, len(ordered), MIGRATION_BATCH_SIZE):
+        chunk = ordered[i:i + MIGRATION_BATCH_SIZE]
+        for row in conn.execute(select(chemicals_table.c.id, chemicals_table.c.formula)
+                                .where(chemicals_table.c.formula.in_(chunk))):
+            ids[row.formula] = row.id
+    missing = [f for f in ordered if f not in ids]
+    if missing:
+        conn.execute(insert(chemicals_table), [{'formula': f} for f in missing])
+        for i in range(0, len(missing), MIGRATION_BATCH_SIZE):
+            chunk = missing[i:i + MIGRATION_BATCH_SIZE]
+            for row in conn.execute(select(chemicals_table.c.id, chemicals_table.c.formula)
+                                    .where(chemicals_table.c.formula.in_(chunk))):
+                ids[row.formula] = row.id
+    return ids
+
+
+def write_reaction_links(conn, models_module, rows: Sequence, removed_ids: Sequence[int] = ()) -> int:
+    """
+    Ghi lại các dòng nối cho một lô phản ứng (xóa dòng cũ trước) trên `conn`, trong transaction của nơi gọi.
+    `rows` cần các thuộc tính id, reactants_json, products_json, conditions_json. Trả về số phản ứng đã xử lý.
+    """
+    reactants_t = models_module.ReactionReactantModel.__table__
+    products_t = models_module.ReactionProductModel.__table__
+    conditions_t = models_module.ReactionConditionModel.__table__
+
+    # Giải mã giống hệt luật trong bộ nhớ (rule_records), để các bảng chuẩn hóa khớp với snapshot
+    decoded = [(row.id, decode_species_list(row.reactants_json), decode_species_list(row.products_json),
+                decode_json_list(row.conditions_json)) for row in rows]
+    ids = [reaction_id for reaction_id, _r, _p, _c in decoded] + list(removed_ids)
+    if not ids:
+        return 0
+
+    formulas = {f for _id, reactants, products, _c in decoded for f in reactants + products}
+    chemical_ids = _chemical_ids(conn, models_module.ChemicalModel.__table__, formulas)
+
+    for table in (reactants_t, products_t, conditions_t):
+        conn.execute(delete(table).where(table.c.reaction_id.in_(ids)))
+
+    reactant_rows, product_rows, condition_rows = [], [], []
+    for reaction_id, reactants, products, conditions in decoded:
+        reactant_rows += [{'reaction_id': reaction_id, 'position': pos, 'chemical_id': chemical_ids[f]}
+                          for pos, f in enumerate(reactants)]
+        product_rows += [{'reaction_id': reaction_id, 'position': pos, 'chemical_id': chemical_ids[f]}
+                         for pos, f in enumerate(products)]
+        condition_rows += [{'reaction_id': reaction_id, 'position': pos, 'condition': c}
+                           for pos, c in enumerate(conditions)]
+    for table, batch in ((reactants_t, reactant_rows), (products_t, product_rows), (conditions_t, condition_rows)):
+        if batch:
+            conn.execute(insert(table), batch)
+    return len(decoded)
+
+
+def sync_reaction_links(models_module, reaction_ids: Optional[Sequence[int]] = None,
+                        batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """
+    Đồng bộ các bảng nối từ cột JSON của bảng reactions (gọi trong app context).
+    reaction_ids=None: toàn bộ bảng, duyệt theo id (keyset) và commit theo lô.
+    Phản ứng có trong reaction_ids nhưng đã bị xóa thì các dòng nối của nó cũng bị xóa.
+    """
+    reactions_t = models_module.ReactionModel.__table__
+    columns = (reactions_t.c.id, reactions_t.c.reactants_json, reactions_t.c.products_json,
+               reactions_t.c.conditions_json)
+    engine = models_module.db.engine
+    processed = 0
+
+    if reaction_ids is not None:
+        ids = sorted(set(reaction_ids))
+        for i in range(0, len(ids), batch_size):
+            chunk = ids[i:i + batch_size]
+            with engine.begin() as conn:
+                rows = conn.execute(select(*columns).where(reactions_t.c.id.in_(chunk))).all()
+                found = {row.id for row in rows}
+                processed += write_reaction_links(conn, models_module, rows, [r for r in chunk if r not in found])
+        return processed
+
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(select(*columns).where(reactions_t.c.id > last_id)
+                                .order_by(reactions_t.c.id).limit(batch_size)).all()
+            if not rows:
+                break
+            processed += write_reaction_links(conn, models_module, rows)
+        last_id = rows[-1].id
+        logger.info("[MIGRATE] Đã chuẩn hóa %d phản ứng (tới id %d).", processed, last_id)
+    return processed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Chuẩn hóa dữ liệu phản ứng sang các bảng chemicals/reaction_*.")
+    parser.add_argument('--ids', type=int, nargs='*', help='Chỉ xử lý các phản ứng có id này.')
+    parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    import api_server
+    import models
+    with api_server.create_app({'KB_LOAD': api_server.KB_LOAD_OFF}).app_context():
+        models.db.create_all()
+        start = time.perf_counter()
+        count = sync_reaction_links(models, args.ids, args.batch_size)
+    print(f"Đã chuẩn hóa {count} phản ứng trong {time.perf_counter() - start:.2f}s.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
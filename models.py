@@ -10,6 +10,7 @@ db = SQLAlchemy()
 class JSONEncodedDict(TypeDecorator):
     """Lưu trữ Python dict/list dưới dạng JSON trong CSDL."""
     impl = Text  # Sử dụng kiểu Text (hoặc VARCHAR lớn) trong CSDL
+    cache_ok = True  # Không có trạng thái riêng, an toàn cho cache câu lệnh của SQLAlchemy
 
     def process_bind_param(self, value, dialect):
         # Chuyển đổi từ Python object sang JSON string khi lưu vào DB
@@ -190,4 +191,110 @@ class ElementModel(db.Model):
     def __repr__(self):
         return (
             f"<ElementModel(mark='{self.mark}', num={self.atomic_number}, mass={self.atomic_mass})>"
-        )
\ No newline at end of file
+        )
+
+# ======================================================================
+# LƯỢC ĐỒ CHUẨN HÓA: CHẤT VÀ CÁC BẢNG NỐI CỦA PHẢN ỨNG
+# ======================================================================
+# Cùng dữ liệu với các cột reactants_json/products_json/conditions_json nhưng ở dạng quan hệ
+# có chỉ mục, để CSDL trả lời được "phản ứng nào tiêu thụ chất X" mà không phải tải toàn bộ luật.
+# Đồng bộ từ các cột JSON bằng migrate_normalise.py (hoặc sync_reaction_links()).
+
+class ChemicalModel(db.Model):
+    __tablename__ = 'chemicals'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Công thức chuẩn của chất, vd: H2O, FeCl3
+    formula = db.Column(db.String(100), nullable=False, unique=True, index=True)
+
+    def __repr__(self):
+        return f"<ChemicalModel(id={self.id}, formula='{self.formula}')>"
+
+
+class ReactionReactantModel(db.Model):
+    __tablename__ = 'reaction_reactants'
+
+    reaction_id = db.Column(db.Integer, db.ForeignKey('reactions.id', ondelete='CASCADE'), primary_key=True)
+    # Thứ tự của chất trong phương trình (giữ nguyên thứ tự của reactants_json)
+    position = db.Column(db.SmallInteger, primary_key=True)
+    chemical_id = db.Column(db.Integer, db.ForeignKey('chemicals.id'), nullable=False)
+
+    __table_args__ = (
+        # "Phản ứng nào tiêu thụ chất X"
+        db.Index('ix_reaction_reactants_chemical', 'chemical_id', 'reaction_id'),
+    )
+
+
+class ReactionProductModel(db.Model):
+    __tablename__ = 'reaction_products'
+
+    reaction_id = db.Column(db.Integer, db.ForeignKey('reactions.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.SmallInteger, primary_key=True)
+    chemical_id = db.Column(db.Integer, db.ForeignKey('chemicals.id'), nullable=False)
+
+    __table_args__ = (
+        # "Phản ứng nào tạo ra chất X"
+        db.Index('ix_reaction_products_chemical', 'chemical_id', 'reaction_id'),
+    )
+
+
+class ReactionConditionModel(db.Model):
+    __tablename__ = 'reaction_conditions'
+
+    reaction_id = db.Column(db.Integer, db.ForeignKey('reactions.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.SmallInteger, primary_key=True)
+    # Điều kiện không phải chất (vd: t°, xúc tác, ánh sáng) nên lưu trực tiếp dạng chuỗi
+    condition = db.Column(db.String(100), nullable=False, index=True)
+
+
+# ======================================================================
+# NHẬT KÝ THAY ĐỔI (CHANGELOG) CHO VIỆC TẢI LẠI TĂNG DẦN
+# ======================================================================
+
+class KBChangeLogModel(db.Model):
+    """
+    Mỗi dòng ghi nhận một lần thêm/sửa/xóa trên các bảng luật (do trigger CSDL ghi).
+    Bộ nạp tăng dần chỉ đọc các dòng có id lớn hơn con trỏ của snapshot hiện tại.
+    """
+    __tablename__ = 'kb_changelog'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    # 'I' (thêm), 'U' (sửa), 'D' (xóa)
+    op = db.Column(db.String(1), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
+
+    def __repr__(self):
+        return f"<KBChangeLogModel(id={self.id}, {self.op} {self.table_name}#{self.row_id})>"
+
+
+# Các bảng được theo dõi thay đổi
+TRACKED_TABLES = ('reactions', 'chemical_rules', 'elements')
+
+_TRIGGER_EVENTS = (('ai', 'INSERT', 'NEW', 'I'), ('au', 'UPDATE', 'NEW', 'U'), ('ad', 'DELETE', 'OLD', 'D'))
+
+
+def _changelog_trigger_ddl(dialect_name: str, table: str, suffix: str, event: str, row: str, op: str) -> str:
+    insert = (f"INSERT INTO kb_changelog (table_name, row_id, op) "
+              f"VALUES ('{table}', {row}.id, '{op}')")
+    if dialect_name == 'sqlite':
+        return (f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{suffix} AFTER {event} ON {table} "
+                f"BEGIN {insert}; END")
+    # MySQL/MariaDB
+    return f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{suffix} AFTER {event} ON {table} FOR EACH ROW {insert}"
+
+
+def install_change_tracking() -> bool:
+    """
+    Tạo trigger ghi changelog cho các bảng luật (gọi trong app context, sau db.create_all()).
+    Trả về False nếu CSDL không hỗ trợ hoặc không đủ quyền; khi đó chỉ có thể tải lại toàn bộ.
+    """
+    dialect_name = db.engine.dialect.name
+    if dialect_name not in ('sqlite', 'mysql', 'mariadb'):
+        return False
+    with db.engine.begin() as conn:
+        for table in TRACKED_TABLES:
+            for suffix, event, row, op in _TRIGGER_EVENTS:
+                conn.exec_driver_sql(_changelog_trigger_ddl(dialect_name, table, suffix, event, row, op))
+    return True
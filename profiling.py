@@ -0,0 +1,162 @@
+# --- File: profiling.py ---
+
+import cProfile
+import collections
+import itertools
+import pstats
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional
+
+from flask import g, jsonify, request
+
+from admin_auth import is_admin_request, require_admin
+
+# ======================================================================
+# HẰNG SỐ
+# ======================================================================
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_PARAM = '_profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+DEFAULT_TOP_N = 25
+MAX_STORED_PROFILES = 50
+
+_profiles: Deque[Dict[str, Any]] = collections.deque(maxlen=MAX_STORED_PROFILES)
+_profiles_lock = threading.Lock()
+_profile_ids = itertools.count(1)
+
+
+# ======================================================================
+# TỔNG HỢP KẾT QUẢ cProfile
+# ======================================================================
+
+def _function_label(key) -> str:
+    filename, lineno, funcname = key
+    if filename == '~':
+        # Hàm built-in, ví dụ: <built-in method builtins.eval>
+        return funcname
+    return f"{filename}:{lineno}({funcname})"
+
+
+def summarize_profile(profiler: cProfile.Profile, top_n: int = DEFAULT_TOP_N) -> Dict[str, Any]:
+    """
+    Chuyển kết quả cProfile thành dict gồm:
+    - top_functions: các hàm tốn thời gian nhất (theo tottime), kèm cumtime.
+    - by_function_name: tổng tottime gộp theo tên hàm (vd: to_dict, loads, eval)
+      để so sánh nhanh giữa các nhóm hàm.
+    """
+    stats = pstats.Stats(profiler)
+    rows = []
+    by_name: Dict[str, float] = collections.defaultdict(float)
+
+    for key, (cc, nc, tt, ct, _callers) in stats.stats.items():
+        rows.append({
+            "function": _function_label(key),
+            "ncalls": nc,
+            "tottime": round(tt, 6),
+            "cumtime": round(ct, 6),
+        })
+        by_name[key[2]] += tt
+
+    rows.sort(key=lambda r: r["tottime"], reverse=True)
+    top_names = sorted(by_name.items(), key=lambda kv: kv[1], reverse=True)[:top_n]
+
+    return {
+        "total_time": round(stats.total_tt, 6),
+        "top_functions": rows[:top_n],
+        "by_function_name": [{"function": name, "tottime": round(tt, 6)} for name, tt in top_names],
+    }
+
+
+def is_active() -> bool:
+    """True nếu request hiện tại đang được profile."""
+    return g.get('_profiler') is not None
+
+
+def get_stored_profiles() -> List[Dict[str, Any]]:
+    with _profiles_lock:
+        return list(_profiles)
+
+
+# ======================================================================
+# TÍCH HỢP FLASK
+# ======================================================================
+
+def _profile_requested() -> Optional[str]:
+    """Trả về chế độ profile ('store' hoặc 'inline') nếu request yêu cầu, ngược lại None."""
+    mode = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_PARAM)
+    if not mode:
+        return None
+    if not is_admin_request():
+        return None
+    return 'inline' if mode.lower() == 'inline' else 'store'
+
+
+def init_app(app) -> None:
+    """
+    Đăng ký hook profile theo yêu cầu. Chỉ bật khi cấu hình ADMIN_TOKEN;
+    nếu không, không có hook nào được đăng ký nên không phát sinh chi phí.
+    """
+    if not app.config.get('ADMIN_TOKEN'):
+        return
+
+    @app.before_request
+    def _profiling_start():
+        mode = _profile_requested()
+        if mode is None:
+            return None
+        profiler = cProfile.Profile()
+        g._profiler = profiler
+        g._profile_mode = mode
+        g._profile_started = time.time()
+        profiler.enable()
+        return None
+
+    @app.after_request
+    def _profiling_stop(response):
+        profiler: Optional[cProfile.Profile] = g.pop('_profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+
+        summary = summarize_profile(profiler)
+        profile_id = next(_profile_ids)
+        record = {
+            "id": profile_id,
+            "endpoint": request.endpoint,
+            "path": request.path,
+            "method": request.method,
+            "status": response.status_code,
+            "started_at": g.pop('_profile_started', None),
+            **summary,
+        }
+        with _profiles_lock:
+            _profiles.append(record)
+
+        response.headers[PROFILE_ID_HEADER] = str(profile_id)
+
+        if g.pop('_profile_mode', 'store') == 'inline' and response.is_json:
+            body = response.get_json(silent=True)
+            if isinstance(body, dict):
+                body["profile"] = record
+                response.set_data(app.json.dumps(body))
+        return response
+
+    @app.route('/api/admin/profiles', methods=['GET'])
+    @require_admin
+    def api_list_profiles():
+        items = [
+            {k: p[k] for k in ("id", "endpoint", "path", "method", "status", "started_at", "total_time")}
+            for p in get_stored_profiles()
+        ]
+        return jsonify({"success": True, "data": items})
+
+    @app.route('/api/admin/profiles/<int:profile_id>', methods=['GET'])
+    @require_admin
+    def api_get_profile(profile_id: int):
+        for p in get_stored_profiles():
+            if p["id"] == profile_id:
+                return jsonify({"success": True, "data": p})
+        return jsonify({"success": False, "error": f"Không tìm thấy profile {profile_id}."}), 404
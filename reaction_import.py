@@ -0,0 +1,609 @@
+# --- File: reaction_import.py ---
+"""
+Nhập hàng loạt phản ứng từ file CSV / JSON / JSON Lines vào bảng `reactions`, có kiểm tra từng dòng.
+
+Mỗi phản ứng gồm: type, description, reactants, products, conditions, equation (hoặc equation_string),
+phenomena, phenomena_detail. reactants/products/conditions là danh sách JSON hoặc chuỗi ("Fe + HCl",
+"t°; xt"); nếu thiếu reactants/products thì lấy từ equation.
+
+Kiểm tra (song song trên nhiều tiến trình, theo từng khối dòng):
+- mọi chất đúng cú pháp công thức (ký hiệu nguyên tố, chỉ số, ngoặc cân đối, điện tích, dấu chấm của
+  tinh thể ngậm nước), đọc được bằng Compound và chỉ gồm nguyên tố có trong bảng elements;
+- chất tham gia và sản phẩm không giống hệt nhau;
+- phương trình cân bằng nguyên tố và điện tích (ChemicalEquation.is_balanced). Không có equation thì
+  hệ số được tìm bằng balancer và equation được sinh ra; equation chưa cân bằng bị từ chối kèm gợi ý;
+- equation khớp với reactants/products, độ dài các cột không vượt giới hạn của bảng;
+- không trùng phản ứng đã có trong CSDL hay dòng trước đó trong file (cùng chất tham gia, sản phẩm và
+  điều kiện), nên chạy lại cùng một file không nhập trùng.
+
+Dòng hợp lệ được ghi theo lô, mỗi lô một transaction gồm cả các dòng của bảng chuẩn hóa
+(migrate_normalise.write_reaction_links). Dòng bị từ chối được ghi vào báo cáo JSONL (dòng, lý do, bản ghi).
+
+    python reaction_import.py reactions.csv --report rejected.jsonl
+    python reaction_import.py reactions.jsonl --workers 8 --dry-run
+
+Máy chủ đang chạy nhận dữ liệu mới qua luồng tự tải lại (CHEM_KB_RELOAD_INTERVAL_S) hoặc /api/admin/reload;
+endpoint POST /api/admin/import (cần admin token) nhận cùng các định dạng và tải lại cơ sở tri thức ngay.
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import io
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from flask import current_app, jsonify, request
+from sqlalchemy import insert, select
+
+import kb_reload
+import knowledge_base
+import metrics
+import worker_pool
+from admin_auth import require_admin
+from balancer import balanced_coefficients
+from chemistry_data import ChemicalEquation
+from migrate_normalise import write_reaction_links
+from species import canonical_formula, ion_charge, split_species
+from task_context import TaskContext
+
+logger = logging.getLogger(__name__)
+
+# ======================================================================
+# HẰNG SỐ VÀ METRIC
+# ======================================================================
+
+# Số dòng đọc, kiểm tra rồi ghi trong một transaction
+IMPORT_BATCH_SIZE = 5000
+# Số dòng mỗi tác vụ kiểm tra gửi sang worker
+VALIDATION_CHUNK_SIZE = 500
+# Số dòng tối đa trong một lời gọi /api/admin/import (file lớn hơn: dùng dòng lệnh)
+DEFAULT_MAX_ROWS = 100_000
+# Số dòng bị từ chối trả về trong phản hồi của endpoint
+RESPONSE_REJECTED_LIMIT = 1000
+
+FORMATS = ('csv', 'json', 'jsonl')
+
+IMPORT_ROWS = metrics.counter('chem_import_rows_total', 'Số dòng phản ứng được nhập (result=inserted|rejected).',
+                              ('result',))
+
+# Hệ số đứng trước công thức: "2Fe", "3 Cl2", "2(NH4)2SO4"
+_COEFFICIENT = re.compile(r'^(\d+)\s*(?=[A-Z(\[])')
+_ARROWS = ('->', '→', '⟶')
+# Tinh thể ngậm nước ở dạng chuẩn ("CuSO4.5H2O"): Compound bỏ qua hệ số sau dấu chấm
+_HYDRATE = re.compile(r'^(.+)\.(\d*)H2O$')
+
+# Lõi công thức (đã bỏ điện tích, tinh thể ngậm nước viết thành "A(H2O)n"): ký hiệu nguyên tố, chỉ số, ngoặc
+_FORMULA_TOKEN = re.compile(r'[A-Z][a-z]?|\d+|[()\[\]{}]')
+_CLOSING = {')': '(', ']': '[', '}': '{'}
+
+# (số dòng, bản ghi gốc)
+Record = Tuple[int, Any]
+# (số dòng, dòng sẽ ghi hoặc None, khóa chống trùng hoặc None, lý do từ chối hoặc None)
+Verdict = Tuple[int, Optional[Dict[str, Any]], Optional[tuple], Optional[str]]
+
+
+class ImportRules(NamedTuple):
+    """Dữ liệu worker cần để kiểm tra (gửi sang tiến trình con cùng mỗi khối dòng)."""
+    elements: FrozenSet[str]
+    max_lengths: Dict[str, int]
+
+
+# ======================================================================
+# ĐỌC FILE
+# ======================================================================
+
+def detect_format(filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower().lstrip('.')
+    ext = 'jsonl' if ext == 'ndjson' else ext
+    if ext not in FORMATS:
+        raise ValueError(f"Không nhận ra định dạng của '{filename}' (hỗ trợ: {', '.join(FORMATS)}).")
+    return ext
+
+
+def read_records(stream: TextIO, fmt: str) -> Iterator[Record]:
+    """
+    (số dòng, bản ghi) của từng phản ứng. CSV/JSONL: số dòng trong file; JSON: thứ tự phần tử (từ 1).
+    Dòng JSONL không đọc được vẫn được trả về (dạng chuỗi) để bị từ chối có lý do trong báo cáo.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError:
+                yield line_no, line.rstrip('\n')
+    elif fmt == 'json':
+        data = json.load(stream)
+        if isinstance(data, dict):
+            data = data.get('reactions')
+        if not isinstance(data, list):
+            raise ValueError("File JSON phải là một mảng phản ứng hoặc {\"reactions\": [...]}.")
+        yield from enumerate(data, 1)
+    else:
+        raise ValueError(f"Định dạng không hợp lệ: '{fmt}' (hỗ trợ: {', '.join(FORMATS)}).")
+
+
+# ======================================================================
+# KIỂM TRA MỘT DÒNG (chạy trên worker)
+# ======================================================================
+
+def reaction_key(reactants: Iterable[str], products: Iterable[str], conditions: Iterable[str]) -> tuple:
+    """Khóa chống trùng: cùng tập chất tham gia, sản phẩm (dạng chuẩn) và điều kiện."""
+    return (tuple(sorted(canonical_formula(f) for f in reactants)),
+            tuple(sorted(canonical_formula(f) for f in products)),
+            tuple(sorted(c.strip() for c in conditions)))
+
+
+def _text(record: Dict[str, Any], *names: str) -> str:
+    for name in names:
+        value = record.get(name)
+        if value not in (None, ''):
+            return str(value).strip()
+    return ''
+
+
+def _list_field(record: Dict[str, Any], name: str, species: bool) -> List[str]:
+    value = record.get(name)
+    if value is None:
+        value = record.get(name + '_json')
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith('['):
+            try:
+                value = json.loads(text)
+            except ValueError:
+                raise ValueError(f"'{name}' không phải danh sách JSON hợp lệ") from None
+        elif ';' in text or not species:
+            value = text.split(';')
+        else:
+            value = split_species(text)
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"'{name}' phải là danh sách chuỗi")
+    return [v.strip() for v in value if v.strip()]
+
+
+def _parse_equation(equation: str) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+    """"2Fe + 3Cl2 -> 2FeCl3" -> ([(2, 'Fe'), (3, 'Cl2')], [(2, 'FeCl3')])."""
+    arrow = next((a for a in _ARROWS if a in equation), None)
+    if arrow is None:
+        raise ValueError("phương trình thiếu '->'")
+    sides = []
+    for side in equation.split(arrow, 1):
+        terms = []
+        for item in split_species(side):
+            item = item.strip()
+            match = _COEFFICIENT.match(item)
+            coefficient = int(match.group(1)) if match else 1
+            formula = item[match.end():] if match else item
+            if not formula or coefficient < 1:
+                raise ValueError("phương trình có chất rỗng hoặc hệ số không hợp lệ")
+            terms.append((coefficient, formula))
+        sides.append(terms)
+    return sides[0], sides[1]
+
+
+def _format_equation(left: List[Tuple[int, str]], right: List[Tuple[int, str]]) -> str:
+    def side(terms):
+        return ' + '.join(f"{c if c > 1 else ''}{f}" for c, f in terms)
+    return f"{side(left)} -> {side(right)}"
+
+
+def _core(formula: str) -> Tuple[str, int]:
+    """(công thức Compound đọc đúng được, điện tích): bỏ điện tích, viết "A.nH2O" thành "A(H2O)n"."""
+    core, charge = ion_charge(canonical_formula(formula))
+    core = _HYDRATE.sub(lambda m: f"{m.group(1)}(H2O){m.group(2)}", core)
+    return core, charge
+
+
+def _check_syntax(formula: str, core: str) -> None:
+    """
+    Compound bỏ qua ký tự không nhận ra ("Fe(" đọc thành Fe), nên lõi công thức được kiểm tra trước:
+    chỉ gồm ký hiệu nguyên tố, chữ số và ngoặc cân đối. Sai -> ValueError.
+    """
+    stack: List[str] = []
+    pos = 0
+    while pos < len(core):
+        match = _FORMULA_TOKEN.match(core, pos)
+        if match is None:
+            raise ValueError(f"công thức '{formula}' có ký tự không hợp lệ: '{core[pos]}'")
+        token = match.group()
+        if token in '([{':
+            stack.append(token)
+        elif token in _CLOSING:
+            if not stack or stack.pop() != _CLOSING[token]:
+                raise ValueError(f"công thức '{formula}' có ngoặc không cân đối")
+        pos = match.end()
+    if stack:
+        raise ValueError(f"công thức '{formula}' có ngoặc không cân đối")
+
+
+def _build_equation(left: List[Tuple[int, str]], right: List[Tuple[int, str]],
+                    rules: ImportRules) -> Tuple[ChemicalEquation, int]:
+    """
+    ChemicalEquation (trên lõi không mang điện tích của từng chất, với hệ số đã cho) và tổng điện tích
+    vế trái - vế phải. Chất sai cú pháp, không đọc được hoặc có nguyên tố lạ -> ValueError.
+    """
+    ions = [_core(f) for _c, f in left + right]
+    for (_c, formula), (core, _q) in zip(left + right, ions):
+        _check_syntax(formula, core)
+    eq = ChemicalEquation([core for core, _q in ions[:len(left)]], [core for core, _q in ions[len(left):]])
+    charge = 0
+    for i, (compound, (coefficient, formula), (_ion, q)) in enumerate(zip(eq.reactants + eq.products,
+                                                                             left + right, ions)):
+        if not compound.elements:
+            raise ValueError(f"không đọc được công thức '{formula}'")
+        unknown = sorted(set(compound.elements) - rules.elements) if rules.elements else []
+        if unknown:
+            raise ValueError(f"'{formula}' có nguyên tố không có trong bảng elements: {', '.join(unknown)}")
+        compound.coefficient = coefficient
+        charge += coefficient * q if i < len(left) else -coefficient * q
+    return eq, charge
+
+
+def _suggest(left: List[Tuple[int, str]], right: List[Tuple[int, str]], rules: ImportRules) -> Optional[str]:
+    """Phương trình đã cân bằng (nguyên tố và điện tích) bằng balancer, hoặc None nếu không tìm được."""
+    cores_left = tuple(_core(f)[0] for _c, f in left)
+    cores_right = tuple(_core(f)[0] for _c, f in right)
+    coefficients = balanced_coefficients(cores_left, cores_right)
+    if coefficients is None:
+        return None
+    left = [(c, f) for c, (_old, f) in zip(coefficients[0], left)]
+    right = [(c, f) for c, (_old, f) in zip(coefficients[1], right)]
+    _eq, charge = _build_equation(left, right, rules)
+    return _format_equation(left, right) if charge == 0 else None
+
+
+def validate_record(record: Any, rules: ImportRules) -> Tuple[Dict[str, Any], tuple]:
+    """(dòng sẽ ghi vào bảng reactions, khóa chống trùng); dòng không hợp lệ -> ValueError(lý do)."""
+    if not isinstance(record, dict):
+        raise ValueError("bản ghi không phải object JSON")
+    reaction_type = _text(record, 'type')
+    if not reaction_type:
+        raise ValueError("thiếu 'type'")
+    reactants = _list_field(record, 'reactants', species=True)
+    products = _list_field(record, 'products', species=True)
+    conditions = _list_field(record, 'conditions', species=False)
+
+    equation = _text(record, 'equation', 'equation_string')
+    if equation:
+        left, right = _parse_equation(equation)
+        if not reactants and not products:
+            reactants, products = [f for _c, f in left], [f for _c, f in right]
+        elif (reaction_key(reactants, products, ()) != reaction_key([f for _c, f in left], [f for _c, f in right], ())):
+            raise ValueError("equation không khớp với reactants/products")
+    else:
+        left, right = [(1, f) for f in reactants], [(1, f) for f in products]
+    if not reactants or not products:
+        raise ValueError("thiếu chất tham gia hoặc sản phẩm")
+    key = reaction_key(reactants, products, conditions)
+    if key[0] == key[1]:
+        raise ValueError("chất tham gia và sản phẩm giống hệt nhau")
+
+    eq, charge = _build_equation(left, right, rules)
+    if not equation:
+        equation = _suggest(left, right, rules)
+        if equation is None:
+            raise ValueError("không cân bằng được phương trình")
+    elif not eq.is_balanced() or charge != 0:
+        suggestion = _suggest(left, right, rules)
+        raise ValueError("phương trình chưa cân bằng" + (f" (gợi ý: {suggestion})" if suggestion else ""))
+
+    detail = record.get('phenomena_detail', record.get('phenomena_detail_json'))
+    if isinstance(detail, str) and detail.strip():
+        try:
+            detail = json.loads(detail)
+        except ValueError:
+            raise ValueError("'phenomena_detail' không phải JSON hợp lệ") from None
+    if detail in ('', None):
+        detail = None
+    elif not isinstance(detail, (dict, list)):
+        raise ValueError("'phenomena_detail' phải là object JSON")
+
+    row = {
+        'type': reaction_type,
+        'description': _text(record, 'description') or None,
+        'reactants_json': json.dumps(reactants, ensure_ascii=False),
+        'products_json': json.dumps(products, ensure_ascii=False),
+        'conditions_json': json.dumps(conditions, ensure_ascii=False),
+        'equation_string': equation,
+        'phenomena': _text(record, 'phenomena') or None,
+        'phenomena_detail_json': detail,
+    }
+    for column, limit in rules.max_lengths.items():
+        value = row.get(column)
+        if isinstance(value, str) and len(value) > limit:
+            raise ValueError(f"'{column}' dài hơn {limit} ký tự")
+    return row, key
+
+
+def validate_chunk(records: List[Record], rules: ImportRules, ctx: Optional[TaskContext] = None) -> List[Verdict]:
+    """Kiểm tra một khối dòng (hàm chạy trên worker; ctx chỉ để tương thích worker_pool)."""
+    verdicts: List[Verdict] = []
+    for line, record in records:
+        try:
+            row, key = validate_record(record, rules)
+        except ValueError as e:
+            verdicts.append((line, None, None, str(e)))
+        else:
+            verdicts.append((line, row, key, None))
+    return verdicts
+
+
+# Hàm kiểm tra song song: nhận các khối dòng, trả kết quả từng khối theo đúng thứ tự
+Validator = Callable[[List[List[Record]], ImportRules], List[List[Verdict]]]
+
+
+def validate_inline(chunks: List[List[Record]], rules: ImportRules) -> List[List[Verdict]]:
+    return [validate_chunk(chunk, rules) for chunk in chunks]
+
+
+# ======================================================================
+# GHI VÀO CSDL (gọi trong app context)
+# ======================================================================
+
+def load_rules(models_module) -> ImportRules:
+    db = models_module.db
+    elements = frozenset(mark for (mark,) in db.session.query(models_module.ElementModel.mark))
+    if not elements:
+        logger.warning("[IMPORT] Bảng elements trống: bỏ qua kiểm tra ký hiệu nguyên tố.")
+    columns = models_module.ReactionModel.__table__.columns
+    max_lengths = {c.name: c.type.length for c in columns if getattr(c.type, 'length', None)}
+    return ImportRules(elements, max_lengths)
+
+
+def _json_list(raw: Optional[str]) -> List[str]:
+    try:
+        values = json.loads(raw) if raw else []
+    except ValueError:
+        return []
+    return [v for v in values if isinstance(v, str)] if isinstance(values, list) else []
+
+
+def existing_keys(models_module) -> Dict[tuple, int]:
+    """Khóa chống trùng -> id của các phản ứng đã có."""
+    reactions_t = models_module.ReactionModel.__table__
+    keys: Dict[tuple, int] = {}
+    with models_module.db.engine.connect() as conn:
+        rows = conn.execution_options(yield_per=IMPORT_BATCH_SIZE).execute(
+            select(reactions_t.c.id, reactions_t.c.reactants_json, reactions_t.c.products_json,
+                   reactions_t.c.conditions_json))
+        for row in rows:
+            key = reaction_key(_json_list(row.reactants_json), _json_list(row.products_json),
+                               _json_list(row.conditions_json))
+            keys.setdefault(key, row.id)
+    return keys
+
+
+def _insert_rows(models_module, rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Ghi một lô cùng các dòng của bảng chuẩn hóa trong MỘT transaction; trả về id các dòng vừa ghi.
+    Id lấy từ chính câu INSERT (RETURNING theo thứ tự tham số nếu CSDL hỗ trợ, nếu không thì từng dòng),
+    không đoán theo max(id) nên không lẫn dòng do tiến trình khác ghi cùng lúc.
+    """
+    reactions_t = models_module.ReactionModel.__table__
+    with models_module.db.engine.begin() as conn:
+        if conn.dialect.insert_executemany_returning_sort_by_parameter_order:
+            new_ids = conn.execute(insert(reactions_t).returning(reactions_t.c.id, sort_by_parameter_order=True),
+                                   rows).scalars().all()
+        else:
+            statement = insert(reactions_t)
+            new_ids = [conn.execute(statement, row).inserted_primary_key[0] for row in rows]
+        write_reaction_links(conn, models_module,
+                             [SimpleNamespace(id=reaction_id, **row) for reaction_id, row in zip(new_ids, rows)])
+    return new_ids
+
+
+def import_reactions(models_module, records: Iterable[Record], validate: Validator = validate_inline,
+                     batch_size: int = IMPORT_BATCH_SIZE, chunk_size: int = VALIDATION_CHUNK_SIZE,
+                     dry_run: bool = False,
+                     on_rejected: Optional[Callable[[int, str, Any], None]] = None) -> Dict[str, Any]:
+    """
+    Đọc `records` theo lô `batch_size` dòng: kiểm tra song song (`validate`, mỗi tác vụ `chunk_size` dòng),
+    loại dòng trùng, ghi các dòng hợp lệ (dry_run: không ghi). on_rejected(dòng, lý do, bản ghi) được gọi
+    cho từng dòng bị từ chối. Trả về thống kê (số dòng, thời gian từng bước, tốc độ).
+    """
+    start = time.perf_counter()
+    rules = load_rules(models_module)
+    existing = existing_keys(models_module)
+    seen: Dict[tuple, int] = {}
+    summary = {"total": 0, "inserted": 0, "rejected": 0, "duplicates": 0, "dry_run": dry_run}
+    validate_s = write_s = 0.0
+
+    iterator = iter(records)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            break
+        t0 = time.perf_counter()
+        chunks = [batch[i:i + chunk_size] for i in range(0, len(batch), chunk_size)]
+        verdicts = [v for chunk_verdicts in validate(chunks, rules) for v in chunk_verdicts]
+        validate_s += time.perf_counter() - t0
+
+        originals = dict(batch)
+        rows = []
+        for line, row, key, reason in verdicts:
+            if reason is None:
+                if key in existing:
+                    reason = f"trùng phản ứng đã có (id {existing[key]})"
+                elif key in seen:
+                    reason = f"trùng dòng {seen[key]}"
+                if reason is not None:
+                    summary["duplicates"] += 1
+            if reason is not None:
+                summary["rejected"] += 1
+                if on_rejected is not None:
+                    on_rejected(line, reason, originals[line])
+                continue
+            seen[key] = line
+            rows.append(row)
+
+        if rows and not dry_run:
+            t0 = time.perf_counter()
+            _insert_rows(models_module, rows)
+            write_s += time.perf_counter() - t0
+            summary["inserted"] += len(rows)
+        summary["total"] += len(batch)
+        logger.info("[IMPORT] %d dòng: %d hợp lệ, %d bị từ chối.", summary["total"],
+                    summary["total"] - summary["rejected"], summary["rejected"])
+
+    IMPORT_ROWS.inc(summary["inserted"], result='inserted')
+    IMPORT_ROWS.inc(summary["rejected"], result='rejected')
+    elapsed = time.perf_counter() - start
+    summary.update({
+        "valid": summary["total"] - summary["rejected"],
+        "seconds": round(elapsed, 3),
+        "validate_s": round(validate_s, 3),
+        "write_s": round(write_s, 3),
+        "rows_per_minute": round(summary["total"] / elapsed * 60) if elapsed > 0 else None,
+    })
+    return summary
+
+
+# ======================================================================
+# ENDPOINT QUẢN TRỊ
+# ======================================================================
+
+def _pool_validator(ctx: TaskContext) -> Validator:
+    """Kiểm tra trên worker pool dùng chung của máy chủ (mỗi đợt không quá số worker, để không tràn hàng đợi)."""
+    pool = worker_pool.get_pool()
+
+    def validate(chunks: List[List[Record]], rules: ImportRules) -> List[List[Verdict]]:
+        results: List[List[Verdict]] = []
+        for i in range(0, len(chunks), pool.max_workers):
+            results += pool.run_many(validate_chunk, [(chunk, rules) for chunk in chunks[i:i + pool.max_workers]],
+                                     ctx)
+        return results
+
+    return validate
+
+
+def init_app(app, models_module) -> None:
+    """
+    POST /api/admin/import: nhập phản ứng (thân JSON {"reactions": [...]}, file CSV/JSON/JSONL trong thân
+    request với ?format=..., hoặc upload multipart). ?dry_run=1: chỉ kiểm tra. Toàn bộ file được kiểm tra
+    trước khi ghi (một lô), nên file lỗi định dạng hay pool bận không để lại dữ liệu ghi dở.
+    """
+
+    @app.route('/api/admin/import', methods=['POST'])
+    @require_admin
+    def api_import_reactions():
+        max_rows = int(current_app.config.get('IMPORT_MAX_ROWS', DEFAULT_MAX_ROWS))
+        upload = next(iter(request.files.values()), None)
+        fmt = request.args.get('format')
+        try:
+            if upload is not None:
+                fmt = fmt or detect_format(upload.filename or '')
+                stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig')
+            else:
+                fmt = fmt or ('json' if request.is_json else 'csv')
+                stream = io.StringIO(request.get_data(as_text=True))
+            records = list(itertools.islice(read_records(stream, fmt), max_rows + 1))
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return jsonify({"success": False, "error": f"Không đọc được dữ liệu: {e}"}), 400
+        if len(records) > max_rows:
+            return jsonify({"success": False, "error": f"Quá {max_rows} dòng; hãy dùng 'python reaction_import.py'."}), 413
+
+        rejected: List[Dict[str, Any]] = []
+
+        def _collect(line: int, reason: str, record: Any) -> None:
+            if len(rejected) < RESPONSE_REJECTED_LIMIT:
+                rejected.append({"line": line, "reason": reason, "record": record})
+
+        dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        ctx = TaskContext.with_timeout(None, request.endpoint or '')
+        summary = import_reactions(models_module, records, _pool_validator(ctx), batch_size=max(1, len(records)),
+                                   dry_run=dry_run, on_rejected=_collect)
+        if summary["inserted"]:
+            kb_reload.reload_now(current_app._get_current_object(), models_module)
+        summary["kb_version"] = knowledge_base.latest().version
+        return jsonify({"success": True, "data": summary, "rejected": rejected})
+
+
+# ======================================================================
+# DÒNG LỆNH
+# ======================================================================
+
+def _process_validator(executor: concurrent.futures.Executor) -> Validator:
+    def validate(chunks: List[List[Record]], rules: ImportRules) -> List[List[Verdict]]:
+        return list(executor.map(validate_chunk, chunks, itertools.repeat(rules)))
+    return validate
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Nhập hàng loạt phản ứng (CSV/JSON/JSONL) vào bảng reactions.")
+    parser.add_argument('path', help="File cần nhập ('-' = stdin, cần --format).")
+    parser.add_argument('--format', choices=FORMATS, help='Mặc định theo phần mở rộng của file.')
+    parser.add_argument('--report', help='Ghi các dòng bị từ chối vào file JSONL này.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                        help='Số tiến trình kiểm tra (1 = kiểm tra ngay trên tiến trình chính).')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Số dòng mỗi transaction.')
+    parser.add_argument('--chunk-size', type=int, default=VALIDATION_CHUNK_SIZE, help='Số dòng mỗi tác vụ kiểm tra.')
+    parser.add_argument('--dry-run', action='store_true', help='Chỉ kiểm tra, không ghi vào CSDL.')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    try:
+        fmt = args.format or detect_format(args.path)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    import api_server
+    import models
+
+    report = open(args.report, 'w', encoding='utf-8') if args.report else None
+
+    def _report(line: int, reason: str, record: Any) -> None:
+        if report is not None:
+            report.write(json.dumps({"line": line, "reason": reason, "record": record}, ensure_ascii=False) + '\n')
+
+    executor = None
+    if args.workers > 1:
+        # fork: worker dùng sẵn các module đã nạp, không phải import lại
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.workers,
+                                                          mp_context=multiprocessing.get_context('fork'))
+    validate = _process_validator(executor) if executor is not None else validate_inline
+    source = sys.stdin if args.path == '-' else open(args.path, encoding='utf-8-sig', newline='')
+    try:
+        with api_server.create_app({'KB_LOAD': api_server.KB_LOAD_OFF}).app_context():
+            models.db.create_all()
+            # Trigger changelog: máy chủ đang chạy tải lại tăng dần được các dòng vừa nhập
+            api_server.enable_change_tracking(models)
+            summary = import_reactions(models, read_records(source, fmt), validate, args.batch_size,
+                                       args.chunk_size, args.dry_run, _report)
+    except (ValueError, csv.Error) as e:
+        print(f"Không đọc được '{args.path}': {e}", file=sys.stderr)
+        return 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if report is not None:
+            report.close()
+        if executor is not None:
+            executor.shutdown()
+
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if summary["rejected"] and args.report:
+        print(f"Các dòng bị từ chối: {args.report}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,437 @@
+# --- File: reaction_index.py ---
+"""
+Truy vấn "luật nào tiêu thụ chất X" cho các engine suy luận, thay cho việc quét toàn bộ luật mỗi vòng.
+Chất được biểu diễn bằng id nguyên của species.REGISTRY.
+
+Hai nguồn luật (RuleSource) cùng giao diện:
+- MemoryRuleSource: chỉ mục chất -> luật dựng từ snapshot trong bộ nhớ (mặc định).
+- DbRuleSource: hỏi CSDL qua các bảng chuẩn hóa (chemicals, reaction_reactants) khi cần, dùng khi
+  danh mục phản ứng quá lớn để giữ trong RAM (CHEM_RULE_SOURCE=db). Luật đọc về được giữ trong LRU.
+
+Khi request có điều kiện, MemoryRuleSource.restrict() cho nguồn luật chỉ gồm các luật có điều kiện
+bắt buộc nằm trong tập điều kiện đó (luật được chia nhóm theo chữ ký điều kiện, xem ConditionIndex).
+
+Khóa của luật (key) là số có thứ tự đúng bằng thứ tự quét của engine: chỉ số trong danh sách
+luật (bộ nhớ) hoặc id phản ứng (CSDL, danh sách luật trong bộ nhớ cũng được sắp theo id).
+"""
+
+import collections
+import heapq
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import knowledge_base
+from knowledge_base import KnowledgeBase
+from rule_records import ReactionRule
+from species import REGISTRY
+
+REACTANT_INDEX = 'reactant_index'
+CONDITION_INDEX = 'condition_index'
+
+DB_RULE_CACHE_SIZE = 50000
+DB_QUERY_CHUNK = 500
+
+# Số tập điều kiện đầu vào khác nhau được giữ sẵn nguồn luật đã lọc (vd: {}, {"t°"}, {"t°", "xt"})
+CONDITION_VIEW_CACHE_SIZE = 16
+
+
+# ======================================================================
+# NGUỒN LUẬT TRONG BỘ NHỚ
+# ======================================================================
+
+class ReactantIndex:
+    """
+    Chỉ mục theo id chất (species.REGISTRY): id chất -> các chỉ số luật có chất đó trong vế tham gia
+    (tăng dần), các luật không cần chất nào, và id chất tham gia/sản phẩm của từng luật.
+    """
+
+    __slots__ = ('consumers', 'nullary', 'reactants', 'products')
+
+    def __init__(self, rules: Sequence[Any]):
+        intern_all = REGISTRY.intern_all
+        consumers: Dict[int, List[int]] = collections.defaultdict(list)
+        nullary: List[int] = []
+        reactants: List[Tuple[int, ...]] = []
+        products: List[Tuple[int, ...]] = []
+        for idx, rule in enumerate(rules):
+            reactant_ids = intern_all(rule.required_reactants)
+            reactants.append(reactant_ids)
+            products.append(intern_all(rule.products))
+            if not reactant_ids:
+                nullary.append(idx)
+            for sid in set(reactant_ids):
+                consumers[sid].append(idx)
+        self.consumers: Dict[int, tuple] = {sid: tuple(keys) for sid, keys in consumers.items()}
+        self.nullary = tuple(nullary)
+        self.reactants = tuple(reactants)
+        self.products = tuple(products)
+
+    def __getstate__(self):
+        # Id chất chỉ có nghĩa trong tiến trình tạo ra nó: lưu kèm bảng tên để ánh xạ lại khi nạp
+        top = max((sid for ids in self.reactants + self.products for sid in ids), default=-1)
+        names = tuple(REGISTRY.names(range(top + 1)))
+        return names, self.consumers, self.nullary, self.reactants, self.products
+
+    def __setstate__(self, state):
+        names, consumers, self.nullary, reactants, products = state
+        mapping = REGISTRY.intern_all(names, canonical=True)
+        if mapping == tuple(range(len(names))):
+            # Trường hợp thường gặp: snapshot được nạp trước mọi chất khác nên id trùng khớp
+            self.consumers, self.reactants, self.products = consumers, reactants, products
+            return
+        self.consumers = {mapping[sid]: keys for sid, keys in consumers.items()}
+        self.reactants = tuple(tuple(mapping[sid] for sid in ids) for ids in reactants)
+        self.products = tuple(tuple(mapping[sid] for sid in ids) for ids in products)
+
+
+knowledge_base.register_derived(REACTANT_INDEX, lambda kb: ReactantIndex(kb.reaction_rules))
+
+
+class MemoryRuleSource:
+    """Nguồn luật từ snapshot trong bộ nhớ; chỉ mục được dựng một lần cho mỗi snapshot."""
+
+    def __init__(self, kb: KnowledgeBase):
+        self.kb = kb
+        self.rules = kb.reaction_rules
+        self.index: ReactantIndex = kb.derived(REACTANT_INDEX)
+
+    def nullary_keys(self) -> Sequence[int]:
+        return self.index.nullary
+
+    def consumers_of(self, species_ids: Iterable[int]) -> Dict[int, Sequence[int]]:
+        consumers = self.index.consumers
+        return {sid: consumers.get(sid, ()) for sid in species_ids}
+
+    def prefetch(self, keys: Iterable[int]) -> None:
+        pass
+
+    def lookup(self, formula: str) -> Optional[int]:
+        """Id của chất (dạng chuẩn) nếu nó có trong luật nào đó; không đánh số đầu vào của request."""
+        return REGISTRY.lookup(formula, canonical=True)
+
+    def lookup_set(self, formulas: Iterable[str]) -> Set[int]:
+        return REGISTRY.lookup_set(formulas, canonical=True)
+
+    def rule(self, key: int) -> Any:
+        return self.rules[key]
+
+    def species(self, key: int) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        """(id chất tham gia, id sản phẩm) của luật."""
+        return self.index.reactants[key], self.index.products[key]
+
+    def restrict(self, input_conditions: Iterable[str]) -> 'MemoryRuleSource':
+        """Nguồn luật chỉ gồm các luật có mọi điều kiện bắt buộc nằm trong `input_conditions`."""
+        return self.kb.derived(CONDITION_INDEX).view(self, input_conditions)
+
+
+class ConditionIndex:
+    """
+    Luật chia nhóm theo chữ ký điều kiện (tập required_conditions). Với mỗi chất, các luật tiêu thụ
+    nó được tách theo nhóm, nên nguồn luật đã lọc theo một tập điều kiện đầu vào chỉ cần ghép các
+    nhóm tương thích (chữ ký là tập con của đầu vào) mà không phải xét điều kiện từng luật.
+    """
+
+    def __init__(self, index: ReactantIndex, rule_conditions: Sequence[Tuple[str, ...]]):
+        self.index = index
+        self.rule_conditions = tuple(rule_conditions)
+        signature_ids: Dict[frozenset, int] = {}
+        rule_signature: List[int] = []
+        for conditions in self.rule_conditions:
+            rule_signature.append(signature_ids.setdefault(frozenset(conditions), len(signature_ids)))
+        self.signatures: Tuple[frozenset, ...] = tuple(signature_ids)
+        self.rule_signature = tuple(rule_signature)
+
+        # id chất -> ((chữ ký, các khóa luật tăng dần), ...); luật không cần chất tham gia theo chữ ký
+        self.buckets: Dict[int, Tuple[Tuple[int, tuple], ...]] = {}
+        for sid, keys in index.consumers.items():
+            grouped: Dict[int, List[int]] = collections.defaultdict(list)
+            for key in keys:
+                grouped[rule_signature[key]].append(key)
+            self.buckets[sid] = tuple((sig, tuple(group)) for sig, group in grouped.items())
+        nullary: Dict[int, List[int]] = collections.defaultdict(list)
+        for key in index.nullary:
+            nullary[rule_signature[key]].append(key)
+        self.nullary_buckets = dict(nullary)
+
+        self._views: 'collections.OrderedDict[frozenset, ConditionView]' = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_kb(cls, kb: KnowledgeBase) -> 'ConditionIndex':
+        return cls(kb.derived(REACTANT_INDEX), [tuple(r.required_conditions) for r in kb.reaction_rules])
+
+    def __reduce__(self):
+        # Nhóm chứa id chất: dựng lại từ chỉ mục (đã có cơ chế ánh xạ lại id) khi nạp
+        return ConditionIndex, (self.index, self.rule_conditions)
+
+    def compatible(self, input_conditions: Iterable[str]) -> frozenset:
+        """Các chữ ký (id) thỏa bởi tập điều kiện đầu vào."""
+        available = frozenset(input_conditions)
+        return frozenset(i for i, signature in enumerate(self.signatures) if signature <= available)
+
+    def view(self, source: MemoryRuleSource, input_conditions: Iterable[str]) -> MemoryRuleSource:
+        key = frozenset(input_conditions)
+        with self._lock:
+            view = self._views.get(key)
+            if view is not None:
+                self._views.move_to_end(key)
+                return view
+        allowed = self.compatible(key)
+        if len(allowed) == len(self.signatures):
+            return source
+        view = ConditionView(source, self, allowed)
+        with self._lock:
+            self._views[key] = view
+            while len(self._views) > CONDITION_VIEW_CACHE_SIZE:
+                self._views.popitem(last=False)
+        return view
+
+
+class ConditionView(MemoryRuleSource):
+    """Nguồn luật trong bộ nhớ chỉ gồm các nhóm chữ ký điều kiện tương thích (xem ConditionIndex)."""
+
+    def __init__(self, source: MemoryRuleSource, conditions: ConditionIndex, signatures: frozenset):
+        self.kb = source.kb
+        self.rules = source.rules
+        self.index = source.index
+        self.signatures = signatures
+        self._buckets = conditions.buckets
+        self._nullary = tuple(sorted(key for sig, keys in conditions.nullary_buckets.items()
+                                     if sig in signatures for key in keys))
+        # id chất -> luật tương thích tiêu thụ nó; ghép từ các nhóm ở lần hỏi đầu tiên
+        self._consumers: Dict[int, tuple] = {}
+
+    def nullary_keys(self) -> Sequence[int]:
+        return self._nullary
+
+    def consumers_of(self, species_ids: Iterable[int]) -> Dict[int, Sequence[int]]:
+        result = {}
+        for sid in species_ids:
+            keys = self._consumers.get(sid)
+            if keys is None:
+                signatures = self.signatures
+                keys = ()
+                for sig, group in self._buckets.get(sid, ()):
+                    if sig in signatures:
+                        keys += group
+                self._consumers[sid] = keys
+            result[sid] = keys
+        return result
+
+    def restrict(self, input_conditions: Iterable[str]) -> MemoryRuleSource:
+        return MemoryRuleSource(self.kb).restrict(input_conditions)
+
+
+knowledge_base.register_derived(CONDITION_INDEX, ConditionIndex.from_kb)
+
+
+# ======================================================================
+# NGUỒN LUẬT TỪ CSDL (THEO YÊU CẦU)
+# ======================================================================
+
+class DbRuleSource:
+    """
+    Đọc láng giềng của tập chất trực tiếp từ CSDL (cần dữ liệu đã chuẩn hóa, xem migrate_normalise.py).
+    Giữ tham chiếu tới SQLAlchemy Engine nên dùng được trong worker không có app context;
+    sau khi fork, pool kết nối thừa hưởng được bỏ (dispose(close=False)) theo khuyến nghị của SQLAlchemy.
+    """
+
+    def __init__(self, engine, models_module, cache_size: int = DB_RULE_CACHE_SIZE):
+        self.engine = engine
+        self.reactions = models_module.ReactionModel.__table__
+        self.chemicals = models_module.ChemicalModel.__table__
+        self.reactants = models_module.ReactionReactantModel.__table__
+        self.cache_size = cache_size
+        # id phản ứng -> (luật, id chất tham gia, id sản phẩm)
+        self._cache: 'collections.OrderedDict[int, tuple]' = collections.OrderedDict()
+        self._nullary: Optional[tuple] = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        if os.getpid() != self._pid:
+            self.engine.dispose(close=False)
+            self._pid = os.getpid()
+            with self._lock:
+                self._cache.clear()
+        return self.engine.connect()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._nullary = None
+
+    def nullary_keys(self) -> Sequence[int]:
+        if self._nullary is None:
+            from sqlalchemy import exists, select
+            has_reactant = exists().where(self.reactants.c.reaction_id == self.reactions.c.id)
+            with self._connect() as conn:
+                rows = conn.execute(select(self.reactions.c.id).where(~has_reactant).order_by(self.reactions.c.id))
+                self._nullary = tuple(row.id for row in rows)
+        return self._nullary
+
+    def consumers_of(self, species_ids: Iterable[int]) -> Dict[int, Sequence[int]]:
+        from sqlalchemy import select
+        ids_by_name = {REGISTRY.name(sid): sid for sid in species_ids}
+        names = list(ids_by_name)
+        result: Dict[int, List[int]] = {sid: [] for sid in ids_by_name.values()}
+        with self._connect() as conn:
+            for i in range(0, len(names), DB_QUERY_CHUNK):
+                chunk = names[i:i + DB_QUERY_CHUNK]
+                stmt = (select(self.chemicals.c.formula, self.reactants.c.reaction_id).distinct()
+                        .join(self.chemicals, self.chemicals.c.id == self.reactants.c.chemical_id)
+                        .where(self.chemicals.c.formula.in_(chunk))
+                        .order_by(self.reactants.c.reaction_id))
+                for row in conn.execute(stmt):
+                    result[ids_by_name[row.formula]].append(row.reaction_id)
+        return result
+
+    def lookup(self, formula: str) -> Optional[int]:
+        ids = self.lookup_set((formula,))
+        return next(iter(ids)) if ids else None
+
+    def lookup_set(self, formulas: Iterable[str]) -> Set[int]:
+        """
+        Id các chất (dạng chuẩn) có trong bảng chemicals. Bảng đánh số chỉ được nạp dần khi đọc luật,
+        nên chất chưa có id được tra trong CSDL và chỉ chất có trong danh mục mới được đánh số: đầu vào
+        tùy ý của request vẫn không làm bảng phình ra.
+        """
+        from sqlalchemy import select
+        ids: Set[int] = set()
+        missing: List[str] = []
+        for name in set(formulas):
+            sid = REGISTRY.lookup(name, canonical=True)
+            if sid is None:
+                missing.append(name)
+            else:
+                ids.add(sid)
+        if missing:
+            with self._connect() as conn:
+                for i in range(0, len(missing), DB_QUERY_CHUNK):
+                    chunk = missing[i:i + DB_QUERY_CHUNK]
+                    for row in conn.execute(select(self.chemicals.c.formula).where(self.chemicals.c.formula.in_(chunk))):
+                        ids.add(REGISTRY.intern(row.formula, canonical=True))
+        return ids
+
+    def prefetch(self, keys: Iterable[int]) -> None:
+        """Đọc trước (theo lô) các luật chưa có trong cache."""
+        from sqlalchemy import select
+        with self._lock:
+            missing = sorted(k for k in set(keys) if k not in self._cache)
+        if not missing:
+            return
+        fetched = []
+        with self._connect() as conn:
+            for i in range(0, len(missing), DB_QUERY_CHUNK):
+                chunk = missing[i:i + DB_QUERY_CHUNK]
+                fetched += [ReactionRule.from_row(row) for row in
+                            conn.execute(select(*self.reactions.c).where(self.reactions.c.id.in_(chunk)))]
+        intern_all = REGISTRY.intern_all
+        with self._lock:
+            for rule in fetched:
+                self._cache[rule.id] = (rule, intern_all(rule.required_reactants), intern_all(rule.products))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _entry(self, key: int) -> tuple:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                return entry
+        self.prefetch([key])
+        with self._lock:
+            return self._cache[key]
+
+    def rule(self, key: int) -> Any:
+        return self._entry(key)[0]
+
+    def species(self, key: int) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        return self._entry(key)[1:]
+
+
+# ======================================================================
+# CHỌN NGUỒN LUẬT
+# ======================================================================
+
+_db_source: Optional[DbRuleSource] = None
+
+
+def configure_db_source(engine, models_module, cache_size: int = DB_RULE_CACHE_SIZE) -> DbRuleSource:
+    """Chuyển các engine sang đọc luật phản ứng trực tiếp từ CSDL."""
+    global _db_source
+    _db_source = DbRuleSource(engine, models_module, cache_size)
+    knowledge_base.on_publish(lambda _kb: _db_source.invalidate() if _db_source is not None else None)
+    return _db_source
+
+
+def current_rule_source():
+    """Nguồn luật cho request hiện tại: CSDL nếu đã cấu hình, ngược lại snapshot đang ghim."""
+    if _db_source is not None:
+        return _db_source
+    return MemoryRuleSource(knowledge_base.current())
+
+
+# ======================================================================
+# LỊCH QUÉT LUẬT (AGENDA)
+# ======================================================================
+
+class Agenda:
+    """
+    Thứ tự xét luật tương đương với việc quét tuần tự toàn bộ danh sách luật mỗi vòng, nhưng chỉ
+    xét các luật có ít nhất một chất tham gia vừa được biết:
+
+    - Chất mới do luật ở vị trí k sinh ra: các luật tiêu thụ nó ở vị trí > k được xét ngay trong vòng
+      này (vòng quét tuần tự cũng sẽ gặp chúng sau k), các luật ở vị trí <= k được xét ở vòng sau.
+    - Vòng đầu xét các luật tiêu thụ chất ban đầu và các luật không cần chất tham gia.
+
+    Nhờ vậy thứ tự kích hoạt, số vòng lặp và kết quả giống hệt thuật toán quét toàn bộ.
+    """
+
+    def __init__(self, source, initial_facts: Iterable[int], allowed: Optional[Set[int]] = None):
+        # allowed: nếu biết trước tập luật sẽ kích hoạt (fact_closure), chỉ lên lịch các luật đó
+        self.source = source
+        self.allowed = allowed
+        keys: Set[int] = set(source.nullary_keys())
+        for consumers in source.consumers_of(initial_facts).values():
+            keys.update(consumers)
+        if allowed is not None:
+            keys &= allowed
+        self._heap: List[int] = sorted(keys)
+        self._queued: Set[int] = set(keys)
+        self._next: Set[int] = set()
+        self._cursor = -1
+        source.prefetch(self._heap)
+
+    def pop(self) -> Optional[int]:
+        """Khóa luật tiếp theo cần xét trong vòng hiện tại (None: hết vòng)."""
+        if not self._heap:
+            return None
+        key = heapq.heappop(self._heap)
+        self._queued.discard(key)
+        self._cursor = key
+        return key
+
+    def add_facts(self, facts: Iterable[int]) -> None:
+        """Lên lịch các luật tiêu thụ những chất vừa được suy ra."""
+        allowed = self.allowed
+        for consumers in self.source.consumers_of(facts).values():
+            for key in consumers:
+                if allowed is not None and key not in allowed:
+                    continue
+                if key > self._cursor:
+                    if key not in self._queued:
+                        self._queued.add(key)
+                        heapq.heappush(self._heap, key)
+                else:
+                    self._next.add(key)
+
+    def next_round(self) -> None:
+        """Chuyển sang vòng mới với các luật đã hoãn."""
+        pending = self._next | self._queued
+        self._heap = sorted(pending)
+        self._queued = set(pending)
+        self._next = set()
+        self._cursor = -1
+        self.source.prefetch(self._heap)
@@ -1,21 +1,28 @@
-from chemistry_data import parse_input_to_set, is_react_available, get_reaction_rules
-# Import ReactionModel từ models để sử dụng cho Type Hinting và object
-import models
-from typing import List, Dict, Union, Any, Set
+from chemistry_data import parse_input_to_set, conditions_satisfied
+import heapq
+import itertools
+from typing import List, Dict, Union, Any, Set, Optional, Iterable, Iterator, Tuple, FrozenSet
 
-# Gán ReactionModel cho một alias dễ đọc hơn trong file này
-Reaction = models.ReactionModel
+from metrics import record_engine_run
+import fact_closure
+from reaction_index import CONDITION_INDEX, Agenda, MemoryRuleSource, current_rule_source
+from rule_records import ReactionRule
+from species import REGISTRY, canonical_formula
+from task_context import TaskContext, expired, report
+
+# Luật phản ứng trong snapshot là ReactionRule (cùng thuộc tính với ReactionModel)
+Reaction = ReactionRule
 
 
 def _reaction_to_dict(reaction: Reaction) -> Dict[str, Any]:
     """
-    Chuyển đổi ReactionModel object thành dictionary để trả về API.
+    Chuyển đổi luật phản ứng thành dictionary để trả về API.
     """
-    # Dùng to_dict() của ReactionModel để lấy các thuộc tính đã decode JSON
+    # Dùng to_dict() để lấy các thuộc tính đã decode JSON
     data = reaction.to_dict()
 
-    # Bổ sung các thông tin cần thiết
-    data["is_used"] = reaction.is_used
+    # Bổ sung các thông tin cần thiết (mọi phản ứng trong đường đi đều đã được kích hoạt)
+    data["is_used"] = True
 
     # Lấy description từ cột phenomena (đã được đổi tên trong DB)
     data["description"] = data.pop("phenomena", reaction.phenomena)
@@ -27,15 +34,22 @@ def _reaction_to_dict(reaction: Reaction) -> Dict[str, Any]:
 
     # Nếu không có equation_string (ví dụ: data được tạo thủ công), ta có thể tạo lại
     if not data.get("equation_string"):
-        reactants_str = " + ".join(reaction.required_reactants)
-        products_str = " + ".join(reaction.products)
-        conditions = reaction.required_conditions if reaction.required_conditions else []
-        conditions_str = f" [{', '.join(conditions)}]" if conditions else ""
-        data["equation_string"] = f"{reactants_str}{conditions_str} -> {products_str}"
+        data["equation_string"] = _equation_string(reaction)
 
     return data
 
 
+def _equation_string(reaction: Reaction) -> str:
+    """Chuỗi phương trình của phản ứng; tự tạo lại nếu CSDL không lưu equation_string."""
+    if reaction.equation_string:
+        return reaction.equation_string
+    reactants_str = " + ".join(reaction.required_reactants)
+    products_str = " + ".join(reaction.products)
+    conditions = reaction.required_conditions if reaction.required_conditions else []
+    conditions_str = f" [{', '.join(conditions)}]" if conditions else ""
+    return f"{reactants_str}{conditions_str} -> {products_str}"
+
+
 def _reconstruct_path(target: str, path_map: Dict[str, Reaction]) -> List[Reaction]:
     """Tái tạo chuỗi phản ứng từ đích đến chất ban đầu."""
     reaction_chain: List[Reaction] = []
@@ -64,17 +78,47 @@ def _reconstruct_path(target: str, path_map: Dict[str, Reaction]) -> List[Reacti
     return reaction_chain
 
 
-def find_reaction_path(initial_reactants_str: str, target_chemical: str) -> Dict[str, Any]:
+def iter_reaction_path(initial_reactants_str: str, target_chemical: str,
+                       ctx: Optional[TaskContext] = None,
+                       allowed_conditions: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Tìm đường phản ứng dạng luồng. Các sự kiện (dict, khóa "event"):
+    - "start":    chất ban đầu và chất đích.
+    - "reaction": một phản ứng vừa được kích hoạt (chuỗi phương trình).
+    - "fact":     một chất mới được suy ra và phản ứng tạo ra nó.
+    - "result":   kết quả cuối cùng ("data" giống hệt giá trị trả về của find_reaction_path).
+
+    Nếu có allowed_conditions (kể cả chuỗi rỗng), chỉ dùng các phản ứng có điều kiện nằm trong tập
+    này và chọn đường ít lần đổi điều kiện nhất (xem _iter_constrained_path).
+    """
+    if allowed_conditions is not None:
+        yield from _iter_constrained_path(initial_reactants_str, target_chemical,
+                                          parse_input_to_set(allowed_conditions, ','), ctx)
+        return
+
     # KHÔNG CẦN TẠO BẢN SAO VÀ CHUYỂN ĐỔI SANG Reaction nữa.
-    # Ta sử dụng trực tiếp các đối tượng ReactionModel trong REACTION_RULES.
-    rules: List[Reaction] = get_reaction_rules()
+    # Ta sử dụng trực tiếp các luật (ReactionRule) trong snapshot cơ sở tri thức (hoặc đọc từ CSDL).
+    source = current_rule_source()
 
-    # Đặt lại cờ is_used cho tất cả các luật trước khi chạy thuật toán
-    for r in rules:
-        r.is_used = False
+    # Các luật đã kích hoạt được đánh dấu cục bộ theo khóa (không sửa cờ is_used trên
+    # đối tượng dùng chung, để nhiều request chạy song song không ảnh hưởng lẫn nhau)
+    used_rule_indexes: Set[int] = set()
 
     known_facts: Set[str] = parse_input_to_set(initial_reactants_str, '+')
-    target_chemical = target_chemical.strip()
+    target_chemical = canonical_formula(target_chemical)
+    # So khớp chất trên id nguyên (species.REGISTRY) thay vì chuỗi; chất không có trong luật nào
+    # chỉ còn trong known_facts (nguồn luật tra id, không đánh số đầu vào của request)
+    known_ids: Set[int] = source.lookup_set(known_facts)
+    target_id = source.lookup(target_chemical)
+
+    yield {"event": "start", "initial_reactants": sorted(known_facts), "target": target_chemical}
+
+    if target_chemical in known_facts:
+        yield {"event": "result", "data": _trivial_path(target_chemical, known_facts)}
+        return
+    if target_id is None:
+        yield {"event": "result", "data": _not_found(target_chemical)}
+        return
 
     # path_map lưu trữ {sản phẩm: phản ứng tạo ra nó}
     path_map: Dict[str, Reaction] = {}
@@ -82,45 +126,352 @@ def find_reaction_path(initial_reactants_str: str, target_chemical: str) -> Dict
     something_new_deduced = True
     iteration_count = 0
     target_found = False
+    rules_scanned = 0
+
+    # Chỉ xét các luật tiêu thụ chất vừa được biết (thứ tự giống hệt việc quét toàn bộ luật mỗi vòng);
+    # với backend ma trận, chỉ lên lịch các luật nằm trong bao đóng
+    allowed = None
+    if fact_closure.is_enabled() and isinstance(source, MemoryRuleSource):
+        _facts, allowed = fact_closure.closure(known_ids)
+    agenda = Agenda(source, known_ids, allowed)
 
-    while something_new_deduced and not target_found:
+    while something_new_deduced and not target_found and not expired(ctx):
+        if iteration_count:
+            agenda.next_round()
         something_new_deduced = False
         iteration_count += 1
+        report(ctx, iteration=iteration_count, rules_fired=len(used_rule_indexes), states_visited=len(known_ids))
 
-        for r in rules:
-            # Kiểm tra xem phản ứng có thể xảy ra với các chất hiện có không
-            if is_react_available(r, known_facts, set(), check_conditions=False):
-                r.is_used = True
+        for idx in iter(agenda.pop, None):
+            rules_scanned += 1
+            if (rules_scanned & 0xFF) == 0 and expired(ctx):
+                break
+            # Kiểm tra xem phản ứng có thể xảy ra với các chất hiện có không (đường đi không xét điều kiện)
+            if idx in used_rule_indexes:
+                continue
+            reactant_ids, product_ids = source.species(idx)
+            if known_ids.issuperset(reactant_ids):
+                r = source.rule(idx)
+                used_rule_indexes.add(idx)
+                equation = _equation_string(r)
+                yield {"event": "reaction", "iteration": iteration_count, "reaction": equation}
 
-                for new_product in r.products:  # Sử dụng property .products từ ReactionModel
-                    if new_product not in known_facts:
-                        known_facts.add(new_product)
+                new_ids = []
+                for pid in product_ids:  # id các sản phẩm của luật phản ứng
+                    if pid not in known_ids:
+                        known_ids.add(pid)
+                        new_ids.append(pid)
+                        new_product = REGISTRY.name(pid)
                         path_map[new_product] = r
                         something_new_deduced = True
+                        yield {"event": "fact", "iteration": iteration_count, "fact": new_product, "via": equation}
 
-                        if new_product == target_chemical:
+                        if pid == target_id:
                             target_found = True
                             break
                 if target_found: break
+                agenda.add_facts(new_ids)
             if target_found: break
 
+    record_engine_run('reaction_path', rules_scanned, len(used_rule_indexes), iteration_count)
+
     if target_found:
         reaction_path_objects = _reconstruct_path(target_chemical, path_map)
 
-        # Chuyển đổi chuỗi phản ứng (ReactionModel objects) sang dict
+        # Chuyển đổi chuỗi phản ứng (ReactionRule) sang dict
         path_serializable = [_reaction_to_dict(r) for r in reaction_path_objects]
 
-        known_chemicals_list = sorted(list(known_facts))
+        known_chemicals_list = _known_chemicals(known_ids, known_facts)
 
-        return {
+        result = {
             "success": True,
             "target": target_chemical,
             "path_steps": iteration_count,
             "path": path_serializable,
             "known_chemicals": known_chemicals_list
         }
+    elif ctx is not None and ctx.timed_out:
+        result = {
+            "success": False,
+            "partial": True,
+            "error_message": f"Hết thời gian cho phép trước khi tìm được đường phản ứng tạo ra '{target_chemical}'.",
+            "path_steps": iteration_count,
+            "known_chemicals": _known_chemicals(known_ids, known_facts)
+        }
     else:
-        return {
+        result = _not_found(target_chemical)
+
+    yield {"event": "result", "data": result}
+
+
+# ======================================================================
+# ĐƯỜNG ĐI RÀNG BUỘC ĐIỀU KIỆN
+# ======================================================================
+
+# Chế độ điều kiện của một bước: tập điều kiện đang được duy trì (None: chưa đặt điều kiện nào)
+Regime = Optional[FrozenSet[str]]
+
+
+def _reachable(source, known_ids: Set[int], allowed: Set[str],
+               ctx: Optional[TaskContext]) -> Tuple[Set[int], Set[int]]:
+    """Bao đóng (chất, luật kích hoạt được) chỉ với các luật thỏa `allowed`."""
+    if fact_closure.is_enabled() and isinstance(source, MemoryRuleSource):
+        return fact_closure.closure(known_ids, allowed, True)
+    # Nguồn trong bộ nhớ đã được lọc theo điều kiện (restrict); nguồn CSDL thì kiểm tra từng luật
+    check = not isinstance(source, MemoryRuleSource)
+    species = source.species
+    facts = set(known_ids)
+    fired: Set[int] = set()
+    missing: Dict[int, int] = {}
+    ready = list(source.nullary_keys())
+    frontier = list(facts)
+    while (ready or frontier) and not expired(ctx):
+        for keys in source.consumers_of(frontier).values():
+            for key in keys:
+                count = missing.get(key)
+                if count is None:
+                    count = len(set(species(key)[0]))
+                missing[key] = count - 1
+                if count == 1:
+                    ready.append(key)
+        frontier = []
+        for key in ready:
+            if check and not conditions_satisfied(source.rule(key), allowed, True):
+                continue
+            fired.add(key)
+            for pid in species(key)[1]:
+                if pid not in facts:
+                    facts.add(pid)
+                    frontier.append(pid)
+        ready = []
+    return facts, fired
+
+
+def _iter_constrained_path(initial_reactants_str: str, target_chemical: str, allowed: Set[str],
+                           ctx: Optional[TaskContext]) -> Iterator[Dict[str, Any]]:
+    """
+    Đường phản ứng chỉ dùng các luật có điều kiện nằm trong `allowed`, ít lần đổi điều kiện nhất.
+
+    Một bước có điều kiện C "đổi điều kiện" nếu C khác chế độ đang duy trì; bước không cần điều kiện
+    giữ nguyên chế độ. Tìm kiếm là Dijkstra trên siêu đồ thị (hyperpath): một luật chỉ được kích hoạt
+    khi MỌI chất tham gia đã có nhãn cuối cùng, nhãn của sản phẩm gộp nhãn của tất cả chất tham gia
+    (tổng số lần đổi, tổng số bước, cộng thêm bước này). Đường đi trả về gồm mọi phản ứng tạo ra các
+    chất tham gia đã được suy ra, xếp theo thứ tự thực hiện được từ tập chất ban đầu; số lần đổi điều
+    kiện được tính lại chính xác trên chuỗi đó.
+    """
+    source = current_rule_source()
+    if isinstance(source, MemoryRuleSource):
+        source = source.restrict(allowed)
+
+    known_facts: Set[str] = parse_input_to_set(initial_reactants_str, '+')
+    target_chemical = canonical_formula(target_chemical)
+    initial_ids: Set[int] = source.lookup_set(known_facts)
+    target_id = source.lookup(target_chemical)
+
+    yield {"event": "start", "initial_reactants": sorted(known_facts), "target": target_chemical,
+           "allowed_conditions": sorted(allowed)}
+
+    if target_chemical in known_facts:
+        result = _trivial_path(target_chemical, known_facts)
+        result["condition_changes"] = 0
+        result["allowed_conditions"] = sorted(allowed)
+        yield {"event": "result", "data": result}
+        return
+
+    reachable, usable = _reachable(source, initial_ids, allowed, ctx)
+    if target_id is None or target_id not in reachable:
+        record_engine_run('reaction_path', len(usable), len(usable), 0)
+        if ctx is not None and ctx.timed_out:
+            result = {"success": False, "partial": True,
+                      "error_message": f"Hết thời gian cho phép trước khi tìm được đường phản ứng tạo ra '{target_chemical}'."}
+        else:
+            result = _not_found(target_chemical)
+        yield {"event": "result", "data": result}
+        return
+
+    # Nhãn của chất: (số lần đổi, số bước, chế độ sau khi thực hiện xong chuỗi tạo ra nó); pred: chất -> luật
+    labels: Dict[int, Tuple[int, int, Regime]] = {sid: (0, 0, None) for sid in initial_ids}
+    pred: Dict[int, int] = {}
+    missing: Dict[int, int] = {}
+    heap: List[Tuple[int, int, int, int]] = []
+    tie = itertools.count()
+    signature_of = _signature_lookup(source)
+    species = source.species
+
+    def order(reactant_ids: Iterable[int], signature: FrozenSet[str]) -> List[int]:
+        """Thứ tự thực hiện chuỗi tạo ra các chất tham gia: chuỗi kết thúc ở đúng chế độ của luật làm sau cùng."""
+        return sorted(set(reactant_ids), key=lambda sid: (bool(signature) and labels[sid][2] == signature,
+                                                          labels[sid][:2], sid))
+
+    def fire(key: int) -> None:
+        reactant_ids, product_ids = species(key)
+        signature = signature_of(key)
+        ordered = order(reactant_ids, signature)
+        changes = sum(labels[sid][0] for sid in ordered)
+        steps = sum(labels[sid][1] for sid in ordered) + 1
+        regime = next((labels[sid][2] for sid in reversed(ordered) if labels[sid][2] is not None), None)
+        if signature:
+            changes += signature != regime
+            regime = signature
+        for pid in product_ids:
+            if pid in settled:
+                continue
+            known = labels.get(pid)
+            if known is not None and known[:2] <= (changes, steps):
+                continue
+            labels[pid] = (changes, steps, regime)
+            pred[pid] = key
+            heapq.heappush(heap, (changes, steps, next(tie), pid))
+
+    settled: Set[int] = set()
+    for key in source.nullary_keys():
+        if key in usable:
+            fire(key)
+    for sid in initial_ids:
+        heapq.heappush(heap, (0, 0, next(tie), sid))
+
+    found = False
+    popped = 0
+    while heap:
+        popped += 1
+        if (popped & 0xFF) == 0 and expired(ctx):
+            break
+        changes, steps, _tie, sid = heapq.heappop(heap)
+        if sid in settled:
+            continue
+        settled.add(sid)
+        if sid not in initial_ids:
+            yield {"event": "fact", "iteration": steps, "fact": REGISTRY.name(sid),
+                   "via": _equation_string(source.rule(pred[sid])), "condition_changes": changes}
+        if sid == target_id:
+            found = True
+            break
+        for key in source.consumers_of((sid,))[sid]:
+            if key not in usable:
+                continue
+            count = missing.get(key)
+            if count is None:
+                count = len(set(species(key)[0]))
+            missing[key] = count - 1
+            if count == 1:
+                fire(key)
+
+    record_engine_run('reaction_path', len(usable), len(missing), len(settled))
+
+    if not found and not (ctx is not None and ctx.timed_out):
+        result = _not_found(target_chemical)
+    elif not found:
+        result = {
             "success": False,
-            "error_message": f"Không tìm thấy đường phản ứng để tạo ra '{target_chemical}'."
-        }
\ No newline at end of file
+            "partial": True,
+            "error_message": f"Hết thời gian cho phép trước khi tìm được đường phản ứng tạo ra '{target_chemical}'.",
+            "known_chemicals": _known_chemicals(settled, known_facts)
+        }
+    else:
+        keys = _hyperpath_keys(target_id, pred, initial_ids, species,
+                               lambda key: order(species(key)[0], signature_of(key)))
+        condition_changes, regime = 0, None
+        for key in keys:
+            signature = signature_of(key)
+            if signature:
+                condition_changes += signature != regime
+                regime = signature
+        result = {
+            "success": True,
+            "target": target_chemical,
+            "path_steps": len(keys),
+            "path": [_reaction_to_dict(source.rule(key)) for key in keys],
+            "condition_changes": condition_changes,
+            "allowed_conditions": sorted(allowed),
+            "known_chemicals": _known_chemicals(reachable, known_facts)
+        }
+    yield {"event": "result", "data": result}
+
+
+def _hyperpath_keys(target_id: int, pred: Dict[int, int], initial_ids: Set[int], species,
+                    ordered_reactants) -> List[int]:
+    """
+    Các luật cần thực hiện để tạo ra `target_id`, theo thứ tự thực hiện được: mỗi luật đứng sau mọi luật
+    tạo ra chất tham gia của nó; một luật tạo ra nhiều chất cần dùng chỉ xuất hiện một lần.
+    """
+    keys: List[int] = []
+    available = set(initial_ids)
+    stack: List[Tuple[int, bool]] = [(target_id, False)]
+    while stack:
+        sid, expanded = stack.pop()
+        if sid in available:
+            continue
+        key = pred[sid]
+        if not expanded:
+            stack.append((sid, True))
+            stack.extend((rid, False) for rid in reversed(ordered_reactants(key)) if rid not in available)
+            continue
+        keys.append(key)
+        available.update(species(key)[1])
+    return keys
+
+
+def _signature_lookup(source):
+    """Hàm khóa luật -> tập điều kiện bắt buộc (dùng ConditionIndex của snapshot nếu có)."""
+    if isinstance(source, MemoryRuleSource):
+        conditions = source.kb.derived(CONDITION_INDEX)
+        signatures, rule_signature = conditions.signatures, conditions.rule_signature
+        return lambda key: signatures[rule_signature[key]]
+    cache: Dict[int, FrozenSet[str]] = {}
+
+    def lookup(key: int) -> FrozenSet[str]:
+        signature = cache.get(key)
+        if signature is None:
+            signature = cache[key] = frozenset(source.rule(key).required_conditions)
+        return signature
+    return lookup
+
+
+def _known_chemicals(known_ids: Iterable[int], known_facts: Set[str]) -> List[str]:
+    """Các chất đã biết: theo id, cộng các chất ban đầu chưa được đánh số (không có trong luật nào)."""
+    return sorted(known_facts.union(REGISTRY.names(known_ids)))
+
+
+def _trivial_path(target_chemical: str, known_facts: Set[str]) -> Dict[str, Any]:
+    """Chất đích đã có sẵn trong tập chất ban đầu: đường đi rỗng."""
+    return {
+        "success": True,
+        "target": target_chemical,
+        "path_steps": 0,
+        "path": [],
+        "known_chemicals": sorted(known_facts)
+    }
+
+
+def _not_found(target_chemical: str) -> Dict[str, Any]:
+    return {
+        "success": False,
+        "error_message": f"Không tìm thấy đường phản ứng để tạo ra '{target_chemical}'."
+    }
+
+
+def find_reaction_path(initial_reactants_str: str, target_chemical: str,
+                       ctx: Optional[TaskContext] = None,
+                       allowed_conditions: Optional[str] = None) -> Dict[str, Any]:
+    if fact_closure.is_enabled() and isinstance(current_rule_source(), MemoryRuleSource):
+        # Đích nằm ngoài bao đóng: trả lời ngay, không cần chạy tìm kiếm tới khi cạn luật
+        known_facts = parse_input_to_set(initial_reactants_str, '+')
+        known_ids = REGISTRY.lookup_set(known_facts, canonical=True)
+        target = canonical_formula(target_chemical)
+        target_id = REGISTRY.lookup(target, canonical=True)
+        if target not in known_facts:
+            if target_id is None:
+                return _not_found(target)
+            if allowed_conditions is None:
+                facts, _fired = fact_closure.closure(known_ids)
+            else:
+                facts, _fired = fact_closure.closure(known_ids, parse_input_to_set(allowed_conditions, ','), True)
+            if target_id not in facts:
+                return _not_found(target)
+
+    result: Dict[str, Any] = {}
+    for event in iter_reaction_path(initial_reactants_str, target_chemical, ctx=ctx,
+                                    allowed_conditions=allowed_conditions):
+        if event["event"] == "result":
+            result = event["data"]
+    return result
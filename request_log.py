@@ -0,0 +1,147 @@
+# --- File: request_log.py ---
+"""
+Ghi lại lưu lượng thật của API (phương thức, đường dẫn, thân JSON, mã trả về, độ trễ) vào file JSONL
+để phát lại bằng benchmarks/replay.py.
+
+Bật bằng cấu hình REQUEST_LOG_PATH (CHEM_REQUEST_LOG_PATH); REQUEST_LOG_SAMPLE là tỷ lệ request được ghi.
+Request chỉ đẩy bản ghi vào một hàng đợi có giới hạn; một luồng nền ghi file. Khi hàng đợi đầy, bản ghi
+bị bỏ (đếm trong chem_request_log_records_total{result="dropped"}) thay vì làm chậm request.
+
+Không ghi /metrics và /api/admin/* (có token quản trị); header không được ghi, trừ X-Timeout-Ms
+vì nó thay đổi hành vi của engine.
+
+Mỗi dòng: {"ts", "method", "path", "query", "body", "status", "latency_ms", "endpoint", ...}.
+Với endpoint luồng (NDJSON/SSE), latency_ms chỉ tính tới lúc bắt đầu gửi phản hồi ("streamed": true).
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from flask import g, request
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE = 1.0
+DEFAULT_QUEUE_SIZE = 10000
+# Thân request lớn hơn giới hạn này không được ghi (chỉ ghi kích thước)
+DEFAULT_MAX_BODY_BYTES = 256 * 1024
+
+EXCLUDED_PREFIXES = ('/metrics', '/api/admin/')
+TIMEOUT_HEADER = 'X-Timeout-Ms'
+
+RECORDS = metrics.counter('chem_request_log_records_total', 'Số bản ghi request log (result=written|dropped).',
+                          ('result',))
+
+
+class RequestLogWriter:
+    """Luồng nền ghi các bản ghi (dict) vào file JSONL, mỗi bản ghi một dòng."""
+
+    def __init__(self, path: str, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.path = path
+        self._queue: 'queue.Queue[Optional[Dict[str, Any]]]' = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='chem-request-log', daemon=True)
+        self._thread.start()
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            RECORDS.inc(1, result='dropped')
+            return False
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Ghi nốt các bản ghi còn trong hàng đợi rồi dừng luồng."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    return
+                lines = [record]
+                # Gom các bản ghi đang chờ để ghi và flush một lần
+                while len(lines) < 512:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is None:
+                        self._write(f, lines)
+                        return
+                    lines.append(record)
+                self._write(f, lines)
+
+    @staticmethod
+    def _write(f, records) -> None:
+        try:
+            f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+            f.flush()
+            RECORDS.inc(len(records), result='written')
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("Không ghi được request log: %s", e)
+            RECORDS.inc(len(records), result='dropped')
+
+
+def _request_body(max_body_bytes: int) -> Dict[str, Any]:
+    length = request.content_length or 0
+    if length > max_body_bytes:
+        return {'body_omitted': True, 'body_bytes': length}
+    data = request.get_json(silent=True)
+    return {'body': data} if data is not None else {}
+
+
+def init_app(app) -> None:
+    """Đăng ký hook ghi request log. Không cấu hình REQUEST_LOG_PATH thì không đăng ký gì (không tốn chi phí)."""
+    path = app.config.get('REQUEST_LOG_PATH')
+    if not path:
+        return
+    sample = float(app.config.get('REQUEST_LOG_SAMPLE', DEFAULT_SAMPLE))
+    max_body_bytes = int(app.config.get('REQUEST_LOG_MAX_BODY_BYTES', DEFAULT_MAX_BODY_BYTES))
+    writer = RequestLogWriter(path)
+    atexit.register(writer.close)
+    app.extensions['chem_request_log'] = writer
+    logger.info("Ghi request log vào %s (tỷ lệ %.2f).", path, sample)
+
+    @app.before_request
+    def _request_log_start():
+        if request.path.startswith(EXCLUDED_PREFIXES) or (sample < 1.0 and random.random() >= sample):
+            return None
+        g._request_log_start = time.perf_counter()
+        return None
+
+    @app.after_request
+    def _request_log_record(response):
+        start: Optional[float] = g.pop('_request_log_start', None)
+        if start is None:
+            return response
+        record: Dict[str, Any] = {
+            'ts': round(time.time(), 3),
+            'method': request.method,
+            'path': request.path,
+            'query': request.query_string.decode('latin-1'),
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 3),
+        }
+        record.update(_request_body(max_body_bytes))
+        timeout_ms = request.headers.get(TIMEOUT_HEADER)
+        if timeout_ms:
+            record['timeout_ms'] = timeout_ms
+        if response.is_streamed:
+            record['streamed'] = True
+        writer.submit(record)
+        return response
@@ -0,0 +1,129 @@
+# --- File: response_view.py ---
+"""
+Chọn trường / mức chi tiết và phân trang cho các phản hồi lớn (suy luận tiến, cân bằng phương trình).
+
+Tham số (thân JSON hoặc query string):
+- "fields":    danh sách (hoặc chuỗi cách nhau bởi dấu phẩy) các trường cần trả về.
+- "verbosity": "summary" | "compact" | "full" (mặc định "full" = phản hồi như trước).
+               Mỗi engine khai báo tập trường mặc định cho từng mức; "fields" nếu có sẽ thay tập đó.
+- "limit", "cursor": phân trang danh sách dài (vd: reactions_used). "cursor" là chuỗi mờ lấy từ
+               "page.next_cursor" của trang trước; cursor gắn với đúng kết quả đã sinh ra nó
+               (cùng đầu vào, cùng phiên bản cơ sở tri thức), dùng cho kết quả khác sẽ bị từ chối.
+
+Các trường chỉ được dựng khi được chọn (mỗi trường là một hàm dựng), nên phần tốn kém như danh sách
+đã sắp xếp hay lịch sử cân bằng không tốn gì khi không được yêu cầu.
+"""
+
+import base64
+import json
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+SUMMARY = 'summary'
+COMPACT = 'compact'
+FULL = 'full'
+VERBOSITY_LEVELS = (SUMMARY, COMPACT, FULL)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+
+PARAMS = ('fields', 'verbosity', 'limit', 'cursor')
+
+# Luôn được giữ (nếu có) bất kể "fields": cho biết kết quả có đầy đủ hay không
+ALWAYS_FIELDS = ('success', 'partial', 'page')
+
+
+class ViewError(ValueError):
+    """Tham số fields/verbosity/limit/cursor không hợp lệ (API trả về 400)."""
+
+
+def _encode_cursor(offset: int, identity: str) -> str:
+    raw = json.dumps([offset, identity], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> Tuple[int, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        offset, identity = json.loads(raw)
+        if not isinstance(offset, int) or offset < 0 or not isinstance(identity, str):
+            raise ValueError
+        return offset, identity
+    except (ValueError, TypeError):
+        raise ViewError("'cursor' không hợp lệ.") from None
+
+
+class ResponseView:
+    """Lựa chọn của client cho một phản hồi; gửi được sang worker (pickle)."""
+
+    __slots__ = ('fields', 'verbosity', 'limit', 'offset', 'cursor_identity')
+
+    def __init__(self, fields: Optional[Iterable[str]] = None, verbosity: str = FULL, limit: Optional[int] = None,
+                 cursor: Optional[str] = None):
+        if verbosity not in VERBOSITY_LEVELS:
+            raise ViewError(f"'verbosity' phải là một trong: {', '.join(VERBOSITY_LEVELS)}.")
+        self.fields = frozenset(fields) if fields is not None else None
+        self.verbosity = verbosity
+        self.offset, self.cursor_identity = _decode_cursor(cursor) if cursor else (0, None)
+        if limit is None and cursor:
+            limit = DEFAULT_PAGE_SIZE
+        if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ViewError(f"'limit' phải trong khoảng 1..{MAX_PAGE_SIZE}.")
+        self.limit = limit
+
+    @classmethod
+    def from_params(cls, params: Mapping[str, Any], allowed_fields: Sequence[str]) -> Optional['ResponseView']:
+        """
+        Đọc tham số từ `params` (dict thân JSON hoặc request.args). Không có tham số nào -> None
+        (engine trả về phản hồi đầy đủ như cũ, không tốn thêm gì). Trường lạ -> ViewError.
+        """
+        if not any(params.get(name) not in (None, '') for name in PARAMS):
+            return None
+        fields = params.get('fields')
+        if isinstance(fields, str):
+            fields = [name.strip() for name in fields.split(',') if name.strip()]
+        elif fields is not None and not (isinstance(fields, list) and all(isinstance(n, str) for n in fields)):
+            raise ViewError("'fields' phải là danh sách tên trường.")
+        if fields:
+            unknown = sorted(set(fields) - set(allowed_fields) - set(ALWAYS_FIELDS))
+            if unknown:
+                raise ViewError(f"Trường không hợp lệ: {', '.join(unknown)}. Các trường: {', '.join(allowed_fields)}.")
+        limit = params.get('limit')
+        if limit not in (None, ''):
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                raise ViewError("'limit' phải là số nguyên.") from None
+        else:
+            limit = None
+        return cls(fields or None, str(params.get('verbosity') or FULL), limit, params.get('cursor') or None)
+
+    @property
+    def paginated(self) -> bool:
+        return self.limit is not None
+
+    def selected(self, defaults: Mapping[str, Sequence[str]]) -> Sequence[str]:
+        """Các trường được chọn: "fields" nếu có, nếu không thì tập mặc định của mức chi tiết."""
+        return sorted(self.fields) if self.fields is not None else defaults[self.verbosity]
+
+    def build(self, builders: Mapping[str, Callable[[], Any]], defaults: Mapping[str, Sequence[str]]) -> Dict[str, Any]:
+        """Dựng phản hồi: chỉ gọi hàm dựng của các trường được chọn, theo thứ tự khai báo trong `builders`."""
+        selected = set(self.selected(defaults))
+        return {name: build() for name, build in builders.items() if name in selected}
+
+    def filter(self, result: Dict[str, Any], defaults: Mapping[str, Sequence[str]]) -> Dict[str, Any]:
+        """Lọc một kết quả đã dựng sẵn (giữ thứ tự khóa và các trường ALWAYS_FIELDS)."""
+        selected = set(self.selected(defaults)) | set(ALWAYS_FIELDS)
+        return {name: value for name, value in result.items() if name in selected}
+
+    def page(self, total: int, identity: str) -> Tuple[int, int, Dict[str, Any]]:
+        """
+        (đầu, cuối, thông tin trang) của trang hiện tại trên danh sách `total` phần tử.
+        `identity` định danh kết quả (đầu vào + phiên bản dữ liệu); cursor của kết quả khác -> ViewError.
+        """
+        if self.cursor_identity is not None and self.cursor_identity != identity:
+            raise ViewError("'cursor' không thuộc kết quả này (đầu vào khác hoặc dữ liệu đã được tải lại).")
+        start = min(self.offset, total)
+        stop = min(start + self.limit, total)
+        info = {"offset": start, "limit": self.limit, "total": total,
+                "next_cursor": _encode_cursor(stop, identity) if stop < total else None}
+        return start, stop, info
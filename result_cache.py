@@ -0,0 +1,139 @@
+# --- File: result_cache.py ---
+"""
+Cache kết quả engine có giới hạn, dùng chính sách GreedyDual-Size (LRU có tính chi phí).
+
+Mỗi mục có độ ưu tiên H = L + chi_phí / kích_thước, trong đó chi phí là thời gian đã tốn để tính
+kết quả và kích thước ước lượng bộ nhớ kết quả chiếm; L là "mốc lạm phát", được nâng lên bằng H của
+mục vừa bị loại. Mục có H nhỏ nhất bị loại trước: kết quả rẻ và cồng kềnh bị loại trước kết quả đắt
+và gọn; mục vừa được dùng lại nhận H mới (theo L hiện tại) nên hành vi vẫn gần LRU.
+
+Khóa do nơi gọi quyết định và nên chứa phiên bản cơ sở tri thức; toàn bộ cache cũng được xóa
+khi một snapshot mới được công bố. Tỷ lệ trúng: chem_result_cache_requests_total{result="hit"} / tổng
+(ở chế độ process mỗi worker có cache riêng, metric được gộp về tiến trình chính).
+"""
+
+import heapq
+import itertools
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import knowledge_base
+import metrics
+
+CACHE_REQUESTS = metrics.counter(
+    'chem_result_cache_requests_total', 'Số lần tra cache kết quả engine (result=hit|miss).', ('cache', 'result')
+)
+CACHE_EVICTIONS = metrics.counter(
+    'chem_result_cache_evictions_total', 'Số mục bị loại khỏi cache kết quả vì vượt giới hạn.', ('cache',)
+)
+
+
+class _Entry:
+    __slots__ = ('value', 'cost', 'size', 'priority', 'seq')
+
+    def __init__(self, value: Any, cost: float, size: int):
+        self.value = value
+        self.cost = cost
+        self.size = size
+        self.priority = 0.0
+        self.seq = 0
+
+
+class ResultCache:
+    """
+    - max_entries: số mục tối đa (0 = tắt cache).
+    - max_size: tổng kích thước tối đa (đơn vị do nơi gọi ước lượng, vd: số phần tử trong kết quả).
+    """
+
+    def __init__(self, name: str, max_entries: int = 4096, max_size: int = 1_000_000):
+        self.name = name
+        self.max_entries = max(0, int(max_entries))
+        self.max_size = max(1, int(max_size))
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._inflation = 0.0
+        self._total_size = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _touch_locked(self, key: Hashable, entry: _Entry) -> None:
+        entry.priority = self._inflation + entry.cost / entry.size
+        entry.seq = next(self._seq)
+        heapq.heappush(self._heap, (entry.priority, entry.seq, key))
+        # Heap chứa cả các mục lỗi thời (ưu tiên cũ): dọn lại khi quá lớn so với số mục thực
+        if len(self._heap) > 4 * len(self._entries) + 64:
+            self._heap = [(e.priority, e.seq, k) for k, e in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._touch_locked(key, entry)
+        CACHE_REQUESTS.inc(1, cache=self.name, result='miss' if entry is None else 'hit')
+        return None if entry is None else entry.value
+
+    def put(self, key: Hashable, value: Any, cost: float, size: int = 1) -> None:
+        """Lưu kết quả; `cost` là chi phí tính lại (vd: giây), `size` là kích thước ước lượng (>= 1)."""
+        if not self.enabled:
+            return
+        size = max(1, int(size))
+        if size > self.max_size:
+            return
+        evicted = 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_size -= old.size
+            entry = _Entry(value, max(0.0, cost), size)
+            self._entries[key] = entry
+            self._total_size += size
+            self._touch_locked(key, entry)
+            while len(self._entries) > self.max_entries or self._total_size > self.max_size:
+                priority, seq, victim_key = heapq.heappop(self._heap)
+                victim = self._entries.get(victim_key)
+                if victim is None or victim.seq != seq:
+                    continue
+                del self._entries[victim_key]
+                self._total_size -= victim.size
+                self._inflation = priority
+                evicted += 1
+        if evicted:
+            CACHE_EVICTIONS.inc(evicted, cache=self.name)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._heap.clear()
+            self._inflation = 0.0
+            self._total_size = 0
+
+
+# ======================================================================
+# CACHE DÙNG CHUNG CỦA CÁC ENGINE
+# ======================================================================
+
+FORWARD_CHAINING = ResultCache('forward_chaining')
+
+_CACHES = (FORWARD_CHAINING,)
+
+# Snapshot mới -> mọi kết quả cũ hết hiệu lực (khóa cũng chứa phiên bản, đây là để giải phóng bộ nhớ)
+knowledge_base.on_publish(lambda _kb: [cache.clear() for cache in _CACHES])
+
+
+def configure(max_entries: int, max_size: int) -> None:
+    """Đặt lại giới hạn cho các cache dùng chung (xóa nội dung hiện có)."""
+    for cache in _CACHES:
+        cache.clear()
+        cache.max_entries = max(0, int(max_entries))
+        cache.max_size = max(1, int(max_size))
+
@@ -0,0 +1,171 @@
+# --- File: rule_records.py ---
+
+import json
+import sys
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from species import canonical_formula
+
+# ======================================================================
+# BẢN GHI LUẬT GỌN NHẸ (THAY CHO ĐỐI TƯỢNG ORM TRONG BỘ NHỚ)
+# ======================================================================
+#
+# Các engine chỉ đọc luật nên không cần đối tượng ORM (kèm trạng thái session, identity map,
+# JSON chưa giải mã). Bản ghi dùng __slots__, danh sách chất lưu dưới dạng tuple các chuỗi
+# đã intern (cùng một công thức như 'HCl' chỉ tồn tại một lần trong bộ nhớ).
+# Tên thuộc tính giữ nguyên như ReactionModel/ChemicalRuleModel để engine không phải đổi.
+
+
+_json_decode = json.JSONDecoder().decode
+
+
+def decode_json_list(raw: Optional[str]) -> Tuple[str, ...]:
+    """Giải mã cột JSON dạng list chuỗi; chuỗi rỗng/lỗi -> tuple rỗng (giống ReactionModel.to_dict)."""
+    if not raw or raw == '[]' or not raw.strip():
+        return ()
+    try:
+        values = _json_decode(raw)
+    except json.JSONDecodeError:
+        return ()
+    try:
+        return tuple(map(sys.intern, values))
+    except TypeError:
+        # Phần tử không phải chuỗi: giữ nguyên
+        return tuple(sys.intern(v) if isinstance(v, str) else v for v in values)
+
+
+def decode_species_list(raw: Optional[str]) -> Tuple[str, ...]:
+    """Như decode_json_list nhưng đưa từng chất về dạng chuẩn (species.canonical_formula)."""
+    return tuple(sys.intern(canonical_formula(v)) if isinstance(v, str) else v for v in decode_json_list(raw))
+
+
+class ReactionRule:
+    """Luật phản ứng chỉ đọc, tương thích thuộc tính với ReactionModel."""
+
+    __slots__ = ('id', 'type', 'description', 'required_reactants', 'products', 'required_conditions',
+                 'equation_string', 'phenomena', 'phenomena_detail_json')
+
+    # Luật trong snapshot dùng chung giữa các request nên không bao giờ bị đánh dấu
+    is_used = False
+
+    def __init__(self, id: int, type: str, description: Optional[str], required_reactants: Sequence[str],
+                 products: Sequence[str], required_conditions: Sequence[str], equation_string: Optional[str],
+                 phenomena: Optional[str], phenomena_detail_json: Any):
+        self.id = id
+        self.type = type
+        self.description = description
+        self.required_reactants = tuple(required_reactants)
+        self.products = tuple(products)
+        self.required_conditions = tuple(required_conditions)
+        self.equation_string = equation_string
+        self.phenomena = phenomena
+        self.phenomena_detail_json = phenomena_detail_json
+
+    @classmethod
+    def from_row(cls, row) -> 'ReactionRule':
+        """Dựng từ một dòng Core select trên bảng 'reactions' (cột JSON chưa giải mã)."""
+        return cls(
+            row.id, sys.intern(row.type), row.description,
+            decode_species_list(row.reactants_json), decode_species_list(row.products_json),
+            decode_json_list(row.conditions_json),
+            row.equation_string, row.phenomena, row.phenomena_detail_json,
+        )
+
+    @property
+    def reactants_json(self) -> str:
+        return json.dumps(list(self.required_reactants))
+
+    @property
+    def products_json(self) -> str:
+        return json.dumps(list(self.products))
+
+    @property
+    def conditions_json(self) -> str:
+        return json.dumps(list(self.required_conditions))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'type': self.type,
+            'description': self.description,
+            'reactants': list(self.required_reactants),
+            'products': list(self.products),
+            'conditions': list(self.required_conditions),
+            'equation_string': self.equation_string,
+            'phenomena': self.phenomena,
+            'phenomena_detail': self.phenomena_detail_json
+        }
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f"<ReactionRule(id={self.id}, {' + '.join(self.required_reactants)} -> {' + '.join(self.products)})>"
+
+
+class CalculationRule:
+    """Luật tính toán chỉ đọc, tương thích thuộc tính với ChemicalRuleModel."""
+
+    __slots__ = ('id', 'name', 'formula', 'description', 'required_inputs', 'output_var', 'expression')
+
+    def __init__(self, id: int, name: str, formula: str, description: Optional[str], required_inputs: List[str],
+                 output_var: str, expression: str):
+        self.id = id
+        self.name = name
+        self.formula = formula
+        self.description = description
+        self.required_inputs = required_inputs
+        self.output_var = output_var
+        self.expression = expression
+
+    @classmethod
+    def from_row(cls, row) -> 'CalculationRule':
+        """Dựng từ một dòng Core select trên bảng 'chemical_rules' (required_inputs đã giải mã bởi JSONEncodedDict)."""
+        return cls(
+            row.id, row.name, row.formula, row.description,
+            [sys.intern(v) if isinstance(v, str) else v for v in (row.required_inputs or [])],
+            sys.intern(row.output_var), row.expression,
+        )
+
+    @property
+    def required_vars(self) -> List[str]:
+        return self.required_inputs
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'formula': self.formula,
+            'description': self.description,
+            'required_inputs': self.required_inputs,
+            'output_var': self.output_var,
+            'expression': self.expression
+        }
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f"<CalculationRule(id={self.id}, name='{self.name}', output='{self.output_var}')>"
+
+
+# ======================================================================
+# DẠNG CỘT (DÙNG CHO FILE SNAPSHOT)
+# ======================================================================
+
+def records_to_columns(records: Sequence[Any], cls: type) -> Dict[str, tuple]:
+    """Chuyển danh sách bản ghi thành dict {tên thuộc tính: tuple giá trị} (pickle nhanh và gọn hơn nhiều)."""
+    return {name: tuple(getattr(record, name) for record in records) for name in cls.__slots__}
+
+
+def records_from_columns(columns: Dict[str, tuple], cls: type) -> List[Any]:
+    """Dựng lại danh sách bản ghi từ dạng cột (ngược với records_to_columns)."""
+    return [cls(*values) for values in zip(*(columns[name] for name in cls.__slots__))]
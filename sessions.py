@@ -0,0 +1,268 @@
+# --- File: sessions.py ---
+"""
+Phiên suy luận tiến tăng dần (mô phỏng phòng thí nghiệm: thêm lần lượt từng hóa chất/điều kiện).
+
+Mỗi phiên giữ trên máy chủ tập chất đã biết, các luật đã kích hoạt và với mỗi luật đang dở
+số chất tham gia còn thiếu. Thêm chất chỉ cập nhật các luật tiêu thụ chất đó; luật nào hết thiếu
+thì kích hoạt, sản phẩm mới lại lan tiếp. Kết quả cuối trùng với run_forward_chaining trên toàn bộ
+đầu vào đã thêm (bao đóng không phụ thuộc thứ tự), chỉ khác thứ tự liệt kê phản ứng.
+
+Trường hợp không tăng dần được thì phiên được tính lại từ đầu (trả về "rebuilt": true):
+- lần đầu thêm điều kiện vào phiên chưa có điều kiện (trước đó mọi điều kiện đều được chấp nhận);
+- cơ sở tri thức đã được tải lại sau lần cập nhật trước.
+
+Phiên nằm trong bộ nhớ tiến trình web, có TTL và giới hạn số lượng (loại phiên ít dùng nhất).
+"""
+
+import collections
+import threading
+import time
+import uuid
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from flask import jsonify, request
+
+import knowledge_base
+import metrics
+from chemistry_data import conditions_satisfied, parse_input_to_set
+from forward_chaining import reaction_info
+from reaction_index import current_rule_source
+from species import REGISTRY
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_SESSION_TTL_S = 1800.0
+
+SESSIONS_CREATED = metrics.counter('chem_sessions_created_total', 'Số phiên suy luận tăng dần được tạo.')
+SESSIONS_EVICTED = metrics.counter('chem_sessions_evicted_total', 'Số phiên bị loại (hết hạn hoặc vượt giới hạn).',
+                                   ('reason',))
+SESSIONS_ACTIVE = metrics.gauge('chem_sessions_active', 'Số phiên suy luận tăng dần đang giữ trong bộ nhớ.')
+
+
+# ======================================================================
+# TRẠNG THÁI MỘT PHIÊN
+# ======================================================================
+
+class ForwardChainingSession:
+    """Trạng thái suy luận tiến của một phiên; mọi thao tác phải giữ `lock`."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        # Toàn bộ đầu vào đã thêm (dạng chuẩn), dùng khi phải tính lại từ đầu
+        self.reactants: Set[str] = set()
+        self.conditions: Set[str] = set()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.source = current_rule_source()
+        self.kb_version = knowledge_base.current().version
+        self.known_ids: Set[int] = set()
+        self.input_ids: Set[int] = set()
+        self.fired: Set[int] = set()
+        # khóa luật -> số chất tham gia (khác nhau) còn thiếu; chỉ có các luật đã chạm tới
+        self.missing: Dict[int, int] = {}
+        # Luật đủ chất nhưng chưa thỏa điều kiện: xét lại khi có điều kiện mới
+        self.blocked: Set[int] = set()
+        self.reactions: List[Dict[str, Any]] = []
+        self._queue: Deque[int] = collections.deque(self.source.nullary_keys())
+
+    def add(self, reactants: Set[str], conditions: Set[str]) -> Dict[str, Any]:
+        """Thêm chất/điều kiện và trả về phần thay đổi (phản ứng mới, chất mới) cùng trạng thái hiện tại."""
+        self.last_used = time.time()
+        new_conditions = conditions - self.conditions
+        first_conditions = bool(new_conditions) and not self.conditions
+        self.reactants |= reactants
+        self.conditions |= conditions
+
+        stale = self.kb_version != knowledge_base.current().version
+        rebuilt = stale or (first_conditions and bool(self.fired))
+        if rebuilt:
+            self._reset()
+            reactants = self.reactants
+        elif new_conditions:
+            check = bool(self.conditions)
+            for key in list(self.blocked):
+                if conditions_satisfied(self.source.rule(key), self.conditions, check):
+                    self.blocked.discard(key)
+                    self._queue.append(key)
+
+        reactions_before = len(self.reactions)
+        new_facts: List[str] = []
+        # Chất không có trong luật nào: chỉ giữ trong self.reactants (dạng chuỗi)
+        for sid in self.source.lookup_set(reactants):
+            self.input_ids.add(sid)
+            if sid not in self.known_ids:
+                self._learn(sid)
+        self._propagate(new_facts)
+
+        state = self.to_dict()
+        state.update({
+            'rebuilt': rebuilt,
+            'new_reactions': self.reactions[reactions_before:] if not rebuilt else list(self.reactions),
+            'new_facts': sorted(new_facts),
+        })
+        return state
+
+    def _learn(self, sid: int) -> None:
+        self.known_ids.add(sid)
+        source, fired, missing, queue = self.source, self.fired, self.missing, self._queue
+        for key in source.consumers_of((sid,))[sid]:
+            if key in fired:
+                continue
+            count = missing.get(key)
+            if count is None:
+                count = len(set(source.species(key)[0]))
+            missing[key] = count - 1
+            if count == 1:
+                queue.append(key)
+
+    def _propagate(self, new_facts: List[str]) -> None:
+        check = bool(self.conditions)
+        source, queue = self.source, self._queue
+        while queue:
+            key = queue.popleft()
+            if key in self.fired:
+                continue
+            r = source.rule(key)
+            if not conditions_satisfied(r, self.conditions, check):
+                self.blocked.add(key)
+                continue
+            self.fired.add(key)
+            self.missing.pop(key, None)
+            self.reactions.append(reaction_info(r))
+            for pid in source.species(key)[1]:
+                if pid not in self.known_ids:
+                    self._learn(pid)
+                    if pid not in self.input_ids:
+                        new_facts.append(REGISTRY.name(pid))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'session_id': self.id,
+            'kb_version': self.kb_version,
+            'reactants': sorted(self.reactants),
+            'conditions': sorted(self.conditions),
+            'final_products': sorted(REGISTRY.names(self.known_ids - self.input_ids)),
+            'total_facts': sorted(self.reactants.union(REGISTRY.names(self.known_ids))),
+            'reactions_fired': len(self.fired),
+            'created_at': self.created_at,
+            'last_used': self.last_used,
+        }
+
+
+# ======================================================================
+# KHO PHIÊN
+# ======================================================================
+
+class SessionStore:
+    """Các phiên theo thứ tự dùng gần nhất; phiên quá `ttl_s` giây không dùng hoặc vượt `max_sessions` bị loại."""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, ttl_s: float = DEFAULT_SESSION_TTL_S):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self._sessions: 'collections.OrderedDict[str, ForwardChainingSession]' = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self) -> ForwardChainingSession:
+        session = ForwardChainingSession()
+        with self._lock:
+            self._purge_locked()
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                SESSIONS_EVICTED.inc(1, reason='capacity')
+            SESSIONS_ACTIVE.set(len(self._sessions))
+        SESSIONS_CREATED.inc(1)
+        return session
+
+    def get(self, session_id: str) -> Optional[ForwardChainingSession]:
+        with self._lock:
+            self._purge_locked()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def discard(self, session_id: str) -> bool:
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+            SESSIONS_ACTIVE.set(len(self._sessions))
+            return found
+
+    def _purge_locked(self) -> None:
+        cutoff = time.time() - self.ttl_s
+        # Thứ tự OrderedDict là thứ tự dùng gần nhất: các phiên hết hạn nằm ở đầu
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_used >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+            SESSIONS_EVICTED.inc(1, reason='ttl')
+        SESSIONS_ACTIVE.set(len(self._sessions))
+
+
+store = SessionStore()
+
+
+# ======================================================================
+# TÍCH HỢP FLASK
+# ======================================================================
+
+def _parse_inputs(data: Dict[str, Any]):
+    return (parse_input_to_set(str(data.get('reactants') or ''), '+'),
+            parse_input_to_set(str(data.get('conditions') or ''), ','))
+
+
+def _not_found(session_id: str):
+    return jsonify({"success": False, "error": f"Không tìm thấy phiên '{session_id}' (có thể đã hết hạn)."}), 404
+
+
+def init_app(app) -> None:
+    """
+    Đăng ký endpoint phiên suy luận tăng dần:
+    - POST   /api/sessions                {"reactants": "...", "conditions": "..."} (đều tùy chọn)
+    - POST   /api/sessions/<id>/add       thêm chất/điều kiện, trả về phản ứng và chất mới
+    - GET    /api/sessions/<id>           trạng thái hiện tại
+    - DELETE /api/sessions/<id>
+    """
+    store.max_sessions = app.config.get('SESSION_MAX', DEFAULT_MAX_SESSIONS)
+    store.ttl_s = app.config.get('SESSION_TTL_S', DEFAULT_SESSION_TTL_S)
+
+    @app.route('/api/sessions', methods=['POST'])
+    def api_create_session():
+        reactants, conditions = _parse_inputs(request.get_json(silent=True) or {})
+        session = store.create()
+        with session.lock:
+            state = session.add(reactants, conditions)
+        response = jsonify({"success": True, "data": state})
+        response.status_code = 201
+        response.headers['Location'] = f"/api/sessions/{session.id}"
+        return response
+
+    @app.route('/api/sessions/<session_id>/add', methods=['POST'])
+    def api_session_add(session_id: str):
+        session = store.get(session_id)
+        if session is None:
+            return _not_found(session_id)
+        reactants, conditions = _parse_inputs(request.get_json(silent=True) or {})
+        if not reactants and not conditions:
+            return jsonify({"success": False, "error": "Cần ít nhất 'reactants' hoặc 'conditions'."}), 400
+        with session.lock:
+            state = session.add(reactants, conditions)
+        return jsonify({"success": True, "data": state})
+
+    @app.route('/api/sessions/<session_id>', methods=['GET'])
+    def api_get_session(session_id: str):
+        session = store.get(session_id)
+        if session is None:
+            return _not_found(session_id)
+        with session.lock:
+            return jsonify({"success": True, "data": session.to_dict()})
+
+    @app.route('/api/sessions/<session_id>', methods=['DELETE'])
+    def api_delete_session(session_id: str):
+        if not store.discard(session_id):
+            return _not_found(session_id)
+        return jsonify({"success": True})
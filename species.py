@@ -0,0 +1,187 @@
+# --- File: species.py ---
+"""
+Chuẩn hóa công thức chất và đánh số (intern) thành id nguyên nhỏ.
+
+Cùng một chất có thể được viết nhiều kiểu: " H2O", "H2O(l)", "H₂O", "BaSO4↓", "CuSO4·5H2O",
+"SO4^2-", "HO-"... canonical_formula() đưa tất cả về một dạng duy nhất, được áp dụng cả khi tải
+luật lẫn khi phân tích đầu vào (parse_input_to_set), nên so khớp chất là so khớp chính xác.
+
+SpeciesRegistry gán cho mỗi dạng chuẩn một id nguyên ổn định trong suốt vòng đời tiến trình;
+các engine so khớp/tập hợp trên id thay vì chuỗi. Id chỉ có nghĩa trong một tiến trình
+(worker fork sau khi luật đã được đánh số thì thừa hưởng cùng bảng).
+"""
+
+import functools
+import re
+import sys
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# ======================================================================
+# CHUẨN HÓA CÔNG THỨC
+# ======================================================================
+
+_SUBSCRIPTS = str.maketrans('₀₁₂₃₄₅₆₇₈₉', '0123456789')
+_SUPERSCRIPTS = str.maketrans('⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻', '0123456789+-')
+
+# Ký hiệu trạng thái ở cuối công thức: (l), (s), (g), (aq), (r) rắn, (k) khí, (dd) dung dịch; ↑ khí, ↓ kết tủa.
+# Không bỏ (đặc)/(loãng): nồng độ làm thay đổi phản ứng (vd H2SO4 đặc/loãng với Cu).
+_STATE_SUFFIX = re.compile(r'(?:\s*\((?:l|s|g|aq|r|k|dd|rắn|lỏng|khí)\)|\s*[↑↓])+$', re.IGNORECASE)
+
+# Tinh thể ngậm nước: CuSO4.5H2O, CuSO4·5H2O, CuSO4*5H2O, CuSO4•5H2O -> CuSO4.5H2O
+_HYDRATE = re.compile(r'\s*[·•∙*.]\s*(\d*)\s*H2O$')
+
+# Điện tích ở cuối: Fe3+, Fe^3+, Fe^{3+}, Fe(3+), SO4 2-, SO4^2-, Fe+3 (dạng cũ, chỉ trong dữ liệu luật)
+_CHARGE = re.compile(r'(?:\^?\{(\d*)([+-])\}|\^?\((\d*)([+-])\)|\^(\d*)([+-])|\s+(\d*)([+-])|(\d*)([+-])|([+-])(\d+))$')
+
+# Chỉ gồm ký tự của công thức: được phép bỏ mọi khoảng trắng bên trong
+_FORMULA_CHARS = re.compile(r'[A-Za-z0-9()\[\]{}.·•∙*+\-^\s]+')
+
+# Ion đơn giản thường bị viết đảo thứ tự nguyên tố -> dạng quen dùng
+_ION_ORDER = {
+    'HO': 'OH', 'H4N': 'NH4', 'O4S': 'SO4', 'O3S': 'SO3', 'O3N': 'NO3', 'O2N': 'NO2', 'O4P': 'PO4',
+    'O3C': 'CO3', 'HO4S': 'HSO4', 'HO3C': 'HCO3', 'HS': 'HS', 'O4Mn': 'MnO4', 'O4Cr': 'CrO4',
+    'O7Cr2': 'Cr2O7', 'O2Al': 'AlO2', 'O3Si': 'SiO3', 'HO4P': 'HPO4', 'H2O4P': 'H2PO4', 'CN': 'CN',
+}
+
+
+def _split_charge(formula: str) -> Tuple[str, str]:
+    """Tách (lõi, điện tích chuẩn) với điện tích dạng '3+', '2-', '+', '-' (rỗng nếu không phải ion)."""
+    match = _CHARGE.search(formula)
+    if not match or match.start() == 0:
+        return formula, ''
+    groups = match.groups()
+    if groups[10] is not None:
+        # Dạng cũ "Fe+3": dấu đứng trước số
+        magnitude, sign = groups[11], groups[10]
+    else:
+        magnitude, sign = next((groups[i], groups[i + 1]) for i in range(0, 10, 2) if groups[i + 1] is not None)
+    # Với "SO42-" lõi tách được là "SO" và độ lớn "42": ghép lại vẫn đúng chuỗi ban đầu
+    core = formula[:match.start()].rstrip()
+    if magnitude in ('', '1'):
+        magnitude = ''
+    return core, magnitude + sign
+
+
+@functools.lru_cache(maxsize=65536)
+def canonical_formula(raw: str) -> str:
+    """
+    Dạng chuẩn của một chất: bỏ khoảng trắng, ký hiệu trạng thái, chỉ số dưới/trên Unicode;
+    thống nhất cách viết tinh thể ngậm nước và điện tích ion. Chuỗi không giống công thức
+    (vd: tên gọi) chỉ được gộp khoảng trắng.
+    """
+    text = raw.strip().translate(_SUBSCRIPTS).translate(_SUPERSCRIPTS)
+    text = _STATE_SUFFIX.sub('', text)
+    if not text:
+        return text
+    if not _FORMULA_CHARS.fullmatch(text):
+        return ' '.join(text.split())
+
+    text = _HYDRATE.sub(lambda m: f".{m.group(1)}H2O", text)
+    core, charge = _split_charge(text)
+    core = ''.join(core.split())
+    if charge:
+        core = _ION_ORDER.get(core, core)
+    return core + charge
+
+
+_ELEMENT_SYMBOL = re.compile(r'[A-Z][a-z]?')
+
+
+def ion_charge(formula: str) -> Tuple[str, int]:
+    """
+    (lõi, điện tích) của một chất ở dạng chuẩn; điện tích 0 nếu không phải ion.
+    Dạng chuẩn không tách chỉ số với điện tích ("SO42-"), nên quy ước: nhiều chữ số trước dấu -> chữ số
+    cuối là điện tích (SO42- -> SO4, -2); một chữ số chỉ là điện tích khi đứng sau một ký hiệu nguyên tố
+    (Fe3+ -> Fe, +3; NO3- -> NO3, -1).
+    """
+    core, charge = _split_charge(formula)
+    if not charge:
+        return formula, 0
+    digits, sign = charge[:-1], charge[-1]
+    if len(digits) > 1:
+        core, digits = core + digits[:-1], digits[-1]
+    elif digits and not _ELEMENT_SYMBOL.fullmatch(core):
+        core, digits = core + digits, ''
+    magnitude = int(digits or 1)
+    return core, magnitude if sign == '+' else -magnitude
+
+
+def split_species(input_str: str) -> List[str]:
+    """
+    Tách chuỗi "A + B + C" thành các chất. Dấu '+' đứng ngay sau chất và theo sau là một dấu '+'
+    khác hoặc kết thúc chuỗi là điện tích ion (vd "Fe3+ + OH-", "Na+"), không phải dấu phân cách.
+    """
+    items: List[str] = []
+    start = 0
+    for pos, ch in enumerate(input_str):
+        if ch != '+':
+            continue
+        rest = input_str[pos + 1:].lstrip()
+        is_charge = pos > start and not input_str[pos - 1].isspace() and (not rest or rest[0] == '+')
+        if not is_charge:
+            items.append(input_str[start:pos])
+            start = pos + 1
+    items.append(input_str[start:])
+    return items
+
+
+# ======================================================================
+# BẢNG ĐÁNH SỐ CHẤT
+# ======================================================================
+
+class SpeciesRegistry:
+    """Dạng chuẩn -> id nguyên (0, 1, 2...); chỉ thêm, không bao giờ xóa hoặc đổi id."""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def intern(self, formula: str, canonical: bool = False) -> int:
+        """
+        Id của chất (tạo mới nếu chưa có). canonical=True: `formula` đã ở dạng chuẩn.
+        Chỉ dùng khi dựng cơ sở tri thức hoặc cho chất có trong danh mục CSDL (DbRuleSource): bảng chỉ
+        thêm nên đánh số đầu vào tùy ý của request sẽ làm nó phình mãi.
+        """
+        name = formula if canonical else canonical_formula(formula)
+        sid = self._ids.get(name)
+        if sid is not None:
+            return sid
+        with self._lock:
+            sid = self._ids.get(name)
+            if sid is None:
+                sid = len(self._names)
+                self._names.append(sys.intern(name))
+                self._ids[self._names[sid]] = sid
+        return sid
+
+    def intern_all(self, formulas: Iterable[str], canonical: bool = False) -> Tuple[int, ...]:
+        return tuple(self.intern(f, canonical) for f in formulas)
+
+    def lookup(self, formula: str, canonical: bool = False) -> Optional[int]:
+        """Id của chất nếu đã được đánh số (không tạo mới)."""
+        return self._ids.get(formula if canonical else canonical_formula(formula))
+
+    def name(self, sid: int) -> str:
+        return self._names[sid]
+
+    def names(self, ids: Iterable[int]) -> List[str]:
+        names = self._names
+        return [names[sid] for sid in ids]
+
+    def lookup_set(self, formulas: Iterable[str], canonical: bool = False) -> Set[int]:
+        """
+        Id các chất đã được đánh số (không tạo mới). Chất chưa có id không xuất hiện trong luật nào nên
+        không ảnh hưởng tới suy luận; nơi gọi giữ chúng ở dạng chuỗi nếu cần trả về.
+        """
+        ids = self._ids
+        if not canonical:
+            formulas = map(canonical_formula, formulas)
+        return {sid for sid in map(ids.get, formulas) if sid is not None}
+
+
+REGISTRY = SpeciesRegistry()
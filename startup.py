@@ -0,0 +1,158 @@
+# --- File: startup.py ---
+"""
+Các giai đoạn khởi động của máy chủ (đo thời gian từng giai đoạn) và probe cho bộ điều phối/WSGI.
+
+- GET /healthz: tiến trình còn sống và phục vụ được HTTP (luôn 200, kể cả khi đang tải dữ liệu).
+- GET /readyz:  200 khi cơ sở tri thức đã tải xong và worker pool đã sẵn sàng; 503 khi đang khởi động
+                hoặc khởi động lỗi (kèm lỗi). Thân phản hồi luôn có thời gian từng giai đoạn.
+- Trong lúc chưa sẵn sàng, các request khác (trừ /healthz, /readyz, /metrics) nhận 503 + Retry-After
+  thay vì chạy engine trên cơ sở tri thức rỗng.
+
+Thời gian từng giai đoạn được ghi log và xuất ra gauge chem_startup_phase_seconds{phase} để theo dõi
+hồi quy thời gian khởi động lạnh.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+from flask import current_app, jsonify, request
+
+import knowledge_base
+import metrics
+
+logger = logging.getLogger(__name__)
+
+EXEMPT_PATHS = ('/healthz', '/readyz', '/metrics')
+
+STARTING = 'starting'
+READY = 'ready'
+FAILED = 'failed'
+
+PHASE_SECONDS = metrics.gauge('chem_startup_phase_seconds', 'Thời gian (giây) từng giai đoạn khởi động.', ('phase',))
+READY_GAUGE = metrics.gauge('chem_ready', 'Máy chủ đã sẵn sàng phục vụ (1) hay chưa (0).')
+
+
+class StartupState:
+    """Trạng thái khởi động của một app: thời gian từng giai đoạn, sẵn sàng hay chưa, lỗi nếu có."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.status = STARTING
+        self.error: Optional[str] = None
+        self.total_s: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == READY
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = round(seconds, 4)
+        PHASE_SECONDS.set(seconds, phase=name)
+        logger.info("[STARTUP] %s: %.3fs", name, seconds)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Đo một giai đoạn; lỗi trong giai đoạn được đẩy tiếp lên người gọi."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def mark_ready(self) -> None:
+        self.total_s = round(time.perf_counter() - self._start, 4)
+        self.status = READY
+        READY_GAUGE.set(1)
+        logger.info("[STARTUP] Sẵn sàng sau %.3fs (%s).", self.total_s,
+                    ', '.join(f"{name}={seconds:.3f}s" for name, seconds in self.phases.items()))
+
+    def mark_failed(self, error: BaseException) -> None:
+        self.total_s = round(time.perf_counter() - self._start, 4)
+        message = str(error).strip().splitlines()
+        self.error = f"{type(error).__name__}: {message[0] if message else ''}"
+        self.status = FAILED
+        READY_GAUGE.set(0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "status": self.status,
+            "ready": self.ready,
+            "phases": phases,
+            "total_s": self.total_s,
+            "uptime_s": round(time.time() - self.started_at, 3),
+            "kb_version": knowledge_base.latest().version if self.ready else None,
+            "error": self.error,
+        }
+
+
+def state(app=None) -> StartupState:
+    return (app or current_app).extensions['chem_startup']
+
+
+def run(app, phases: Sequence[Tuple[str, Callable[[], Any]]], background: bool = False) -> Optional[threading.Thread]:
+    """
+    Chạy lần lượt các giai đoạn (tên, hàm) rồi đánh dấu app sẵn sàng.
+    - background=False: chạy ngay, lỗi được ghi nhận (readyz báo lỗi) rồi đẩy lên người gọi.
+    - background=True: chạy trên luồng nền; lỗi chỉ được ghi log và báo qua /readyz.
+    """
+    startup = state(app)
+
+    def _run() -> None:
+        try:
+            for name, fn in phases:
+                with startup.phase(name):
+                    fn()
+        except Exception as e:
+            startup.mark_failed(e)
+            if not background:
+                logger.error("[STARTUP] Khởi động thất bại: %s", startup.error)
+                raise
+            logger.exception("[STARTUP] Khởi động thất bại: %s", e)
+            return
+        startup.mark_ready()
+
+    if not background:
+        _run()
+        return None
+    thread = threading.Thread(target=_run, name='chem-startup', daemon=True)
+    thread.start()
+    return thread
+
+
+def init_app(app, startup: Optional[StartupState] = None) -> StartupState:
+    """
+    Gắn trạng thái khởi động vào app, đăng ký /healthz, /readyz và chốt chặn request khi chưa sẵn sàng.
+    Gọi sớm (ngay sau metrics.init_app) để request bị chặn không chạy các hook phía sau.
+    """
+    startup = startup or StartupState()
+    app.extensions['chem_startup'] = startup
+    READY_GAUGE.set(0)
+
+    @app.before_request
+    def _startup_gate():
+        if startup.ready or request.path in EXEMPT_PATHS:
+            return None
+        response = jsonify({"success": False, "error": "Máy chủ đang khởi động, chưa sẵn sàng."
+                            if startup.status == STARTING else f"Khởi động thất bại: {startup.error}"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        return jsonify({"status": "ok", "uptime_s": round(time.time() - startup.started_at, 3)})
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        return jsonify(startup.to_dict()), 200 if startup.ready else 503
+
+    return startup
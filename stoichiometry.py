@@ -0,0 +1,263 @@
+# --- File: stoichiometry.py ---
+"""
+Tính lượng chất (mol, gam) dọc theo một chuỗi phản ứng trong một lần gọi.
+
+Mỗi bước được cân bằng (hệ số cache theo phương trình, xem balancer.balanced_coefficients), rồi
+lượng chất được lan qua chuỗi: mức phản ứng của bước là min(n_có / hệ_số) trên các chất tham gia đã
+biết lượng (chất giới hạn); chất tham gia chưa biết lượng được coi là dư. Sau bước, chất tham gia bị
+trừ và sản phẩm được cộng theo hệ số.
+
+Lượng ban đầu có thể là số hoặc mảng số (nhiều kịch bản cùng lúc): phép tính mỗi bước làm trên cả
+mảng (numpy nếu có, nếu không thì list Python cho cùng kết quả).
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from balancer import balanced_coefficients
+from chemistry_data import get_molar_mass
+from metrics import record_engine_run, stage
+from reaction_path import find_reaction_path
+from species import canonical_formula, split_species
+from task_context import TaskContext, expired
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - phụ thuộc tùy chọn
+    np = None
+
+Amount = Union[float, List[float]]
+
+
+# ======================================================================
+# PHÉP TÍNH TRÊN MẢNG LƯỢNG CHẤT
+# ======================================================================
+
+def _vector(values: Sequence[float]):
+    return np.asarray(values, dtype=float) if np is not None else [float(v) for v in values]
+
+
+def _scale(values, factor: float):
+    return values * factor if np is not None else [v * factor for v in values]
+
+
+def _add(a, b):
+    return a + b if np is not None else [x + y for x, y in zip(a, b)]
+
+
+# Phần còn lại nhỏ hơn tỷ lệ này của lượng ban đầu là sai số làm tròn (chất đã phản ứng hết)
+_ROUNDING_TOLERANCE = 1e-12
+
+
+def _sub(a, b):
+    if np is not None:
+        remaining = a - b
+        return np.where(remaining <= _ROUNDING_TOLERANCE * a, 0.0, remaining)
+    return [0.0 if x - y <= _ROUNDING_TOLERANCE * x else x - y for x, y in zip(a, b)]
+
+
+def _min_with_argmin(columns: List[Any]) -> Tuple[Any, List[int]]:
+    """Giá trị nhỏ nhất theo từng vị trí của các cột và chỉ số cột đạt giá trị đó."""
+    if np is not None:
+        stacked = np.vstack(columns)
+        which = stacked.argmin(axis=0)
+        return stacked.min(axis=0), which.tolist()
+    values, which = [], []
+    for row in zip(*columns):
+        i = min(range(len(row)), key=row.__getitem__)
+        values.append(row[i])
+        which.append(i)
+    return values, which
+
+
+def _as_list(values) -> List[float]:
+    return values.tolist() if np is not None else list(values)
+
+
+# ======================================================================
+# CHUỖI PHẢN ỨNG
+# ======================================================================
+
+def _parse_step(step: Any) -> Tuple[List[str], List[str]]:
+    """Một bước: chuỗi "A + B -> C" hoặc dict có 'reactants'/'products' (dạng phần tử 'path' của find_reaction_path)."""
+    if isinstance(step, str):
+        parts = step.split('->')
+        if len(parts) != 2:
+            raise ValueError(f"Phương trình không hợp lệ (thiếu '->'): {step}")
+        reactants, products = split_species(parts[0]), split_species(parts[1])
+    elif isinstance(step, dict):
+        reactants, products = step.get('reactants') or [], step.get('products') or []
+    else:
+        raise ValueError(f"Bước phản ứng không hợp lệ: {step!r}")
+    reactants = [canonical_formula(s) for s in reactants if str(s).strip()]
+    products = [canonical_formula(s) for s in products if str(s).strip()]
+    if not reactants or not products:
+        raise ValueError(f"Thiếu chất tham gia hoặc sản phẩm: {step!r}")
+    return reactants, products
+
+
+def _parse_amounts(amounts: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, float], int, bool]:
+    """
+    {"Fe": {"m": 10}} hoặc {"Fe": {"n": [0.1, 0.2]}} -> (mol theo chất, khối lượng mol, số kịch bản, có dùng mảng).
+    """
+    if not isinstance(amounts, dict) or not amounts:
+        raise ValueError("Cần 'amounts' dạng {chất: {\"m\": gam} hoặc {\"n\": mol}}.")
+    parsed: Dict[str, Tuple[str, List[float]]] = {}
+    width, vectorised = 1, False
+    for raw_name, spec in amounts.items():
+        name = canonical_formula(str(raw_name))
+        if not isinstance(spec, dict) or len(spec.keys() & {'m', 'n'}) != 1:
+            raise ValueError(f"Lượng của '{name}' phải có đúng một trong 'm' (gam) hoặc 'n' (mol).")
+        kind = 'm' if 'm' in spec else 'n'
+        value = spec[kind]
+        if isinstance(value, list):
+            if not value:
+                raise ValueError(f"Mảng lượng của '{name}' rỗng.")
+            if vectorised and len(value) != width:
+                raise ValueError("Các mảng lượng chất phải cùng độ dài.")
+            width, vectorised = len(value), True
+            values = [float(v) for v in value]
+        else:
+            values = [float(value)]
+        if any(v < 0 for v in values):
+            raise ValueError(f"Lượng của '{name}' không được âm.")
+        parsed[name] = (kind, values)
+
+    molar_masses: Dict[str, float] = {}
+    moles: Dict[str, Any] = {}
+    for name, (kind, values) in parsed.items():
+        if len(values) == 1:
+            values = values * width
+        if kind == 'm':
+            molar_masses[name] = get_molar_mass(name)
+            moles[name] = _scale(_vector(values), 1.0 / molar_masses[name])
+        else:
+            moles[name] = _vector(values)
+    return moles, molar_masses, width, vectorised
+
+
+def propagate_amounts(path: Sequence[Any], amounts: Dict[str, Any], target: Optional[str] = None,
+                      ctx: Optional[TaskContext] = None) -> Dict[str, Any]:
+    """
+    Lan lượng chất qua chuỗi phản ứng `path` từ lượng ban đầu `amounts`.
+    Nếu có `target`, kết quả có thêm "target" với lượng cuối (mol, gam) của chất đó.
+    Lỗi dữ liệu (phương trình không cân bằng được, công thức không tính được khối lượng mol...)
+    được báo bằng ValueError.
+    """
+    moles, molar_masses, width, vectorised = _parse_amounts(amounts)
+
+    def molar_mass(name: str) -> Optional[float]:
+        if name not in molar_masses:
+            try:
+                molar_masses[name] = get_molar_mass(name)
+            except ValueError:
+                molar_masses[name] = None
+        return molar_masses[name]
+
+    def output(values) -> Amount:
+        values = _as_list(values)
+        return values if vectorised else values[0]
+
+    steps_out: List[Dict[str, Any]] = []
+    for number, step in enumerate(path, start=1):
+        if expired(ctx):
+            break
+        reactants, products = _parse_step(step)
+        coefficients = balanced_coefficients(tuple(reactants), tuple(products))
+        if coefficients is None:
+            raise ValueError(f"Không cân bằng được phương trình ở bước {number}: "
+                             f"{' + '.join(reactants)} -> {' + '.join(products)}")
+        reactant_coeffs, product_coeffs = coefficients
+
+        # Mức phản ứng: chất tham gia đã biết lượng nào cho ít "số lần phản ứng" nhất là chất giới hạn
+        limited = [(name, coeff) for name, coeff in zip(reactants, reactant_coeffs) if name in moles]
+        tracked = {name for name, _coeff in limited}
+        if not limited:
+            raise ValueError(f"Bước {number} không có chất tham gia nào đã biết lượng: "
+                             f"{' + '.join(reactants)} -> {' + '.join(products)}")
+        extent, which = _min_with_argmin([_scale(moles[name], 1.0 / coeff) for name, coeff in limited])
+        limiting = [limited[i][0] for i in which]
+
+        # Chất dư cũng được báo lượng cần dùng, nhưng không được theo dõi tiếp
+        consumed, produced = {}, {}
+        for name, coeff in zip(reactants, reactant_coeffs):
+            used = _scale(extent, coeff)
+            if name in moles:
+                moles[name] = _sub(moles[name], used)
+            consumed[name] = output(used)
+        for name, coeff in zip(products, product_coeffs):
+            made = _scale(extent, coeff)
+            moles[name] = _add(moles[name], made) if name in moles else made
+            produced[name] = output(made)
+
+        steps_out.append({
+            "step": number,
+            "equation": " + ".join(_term(c, s) for c, s in zip(reactant_coeffs, reactants)) + " -> " +
+                        " + ".join(_term(c, s) for c, s in zip(product_coeffs, products)),
+            "coefficients": {"reactants": list(reactant_coeffs), "products": list(product_coeffs)},
+            "extent": output(extent),
+            "limiting_reagent": limiting if vectorised else limiting[0],
+            "excess_reagents": [name for name in reactants if name not in tracked],
+            "consumed_mol": consumed,
+            "produced_mol": produced,
+        })
+
+    record_engine_run('stoichiometry', len(steps_out), len(steps_out), width)
+
+    final = {}
+    for name, values in moles.items():
+        mass = molar_mass(name)
+        final[name] = {
+            "n": output(values),
+            "M": mass,
+            "m": output(_scale(values, mass)) if mass is not None else None,
+        }
+
+    result: Dict[str, Any] = {
+        "success": True,
+        "steps": steps_out,
+        "final_amounts": final,
+        "scenarios": width if vectorised else 1,
+    }
+    if target:
+        target = canonical_formula(target)
+        amount = final.get(target)
+        if amount is None:
+            zeros = output(_vector([0.0] * width))
+            mass = molar_mass(target)
+            amount = {"n": zeros, "M": mass, "m": zeros if mass is not None else None}
+        result["target"] = dict(amount, name=target)
+    if ctx is not None and ctx.timed_out:
+        result["partial"] = True
+    return result
+
+
+def _term(coefficient: int, name: str) -> str:
+    return f"{coefficient}{name}" if coefficient > 1 else name
+
+
+def calculate_stoichiometry(path: Optional[Sequence[Any]], amounts: Dict[str, Any], target: Optional[str] = None,
+                            reactants: Optional[str] = None,
+                            ctx: Optional[TaskContext] = None) -> Tuple[Dict[str, Any], int]:
+    """
+    Điểm vào của API: nếu không có `path`, tìm đường phản ứng từ `reactants` (mặc định: các chất trong
+    `amounts`) tới `target` bằng find_reaction_path rồi tính trên đường đó.
+    Trả về (nội dung phản hồi, mã HTTP) như calculation_path.calculate_along_path.
+    """
+    try:
+        if not path:
+            if not target:
+                return {"success": False, "error": "Cần 'path' hoặc 'target' để tìm đường phản ứng."}, 400
+            start = reactants or ' + '.join(amounts or {})
+            with stage('search'):
+                found = find_reaction_path(start, target, ctx=ctx)
+            if not found.get("success"):
+                status = 504 if found.get("partial") else 404
+                return {"success": False, "error": found.get("error_message"), "partial": found.get("partial", False)}, status
+            # Chất tham gia phụ của đường đi (vd: Cl2) không có trong amounts thì được coi là dư
+            path = found["path"]
+        with stage('evaluate'):
+            result = propagate_amounts(path, amounts, target, ctx=ctx)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    result["path"] = [step if isinstance(step, str) else step.get("equation_string") or step for step in path]
+    return result, 200
@@ -0,0 +1,50 @@
+# --- File: streaming.py ---
+
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+from flask import Response, request, stream_with_context
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_SSE = 'sse'
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+SSE_MIMETYPE = 'text/event-stream'
+
+
+def requested_format() -> str:
+    """SSE nếu client gửi ?format=sse hoặc Accept: text/event-stream; mặc định NDJSON."""
+    fmt = (request.args.get('format') or '').lower()
+    if fmt in (FORMAT_NDJSON, FORMAT_SSE):
+        return fmt
+    if SSE_MIMETYPE in (request.headers.get('Accept') or ''):
+        return FORMAT_SSE
+    return FORMAT_NDJSON
+
+
+def _encode_ndjson(events: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for event in events:
+        yield json.dumps(event, ensure_ascii=False) + '\n'
+
+
+def _encode_sse(events: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for seq, event in enumerate(events):
+        yield f"id: {seq}\nevent: {event.get('event', 'message')}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def stream_events(events: Iterable[Dict[str, Any]]) -> Response:
+    """
+    Trả về response dạng luồng từ một generator sự kiện. Mỗi sự kiện được gửi đi ngay
+    khi sinh ra, nên client nhận byte đầu tiên mà không phải chờ engine chạy xong.
+    """
+    fmt = requested_format()
+    if fmt == FORMAT_SSE:
+        body, mimetype = _encode_sse(events), SSE_MIMETYPE
+    else:
+        body, mimetype = _encode_ndjson(events), NDJSON_MIMETYPE
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tắt buffer của reverse proxy (nginx) để sự kiện tới client ngay lập tức
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
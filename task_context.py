@@ -0,0 +1,84 @@
+# --- File: task_context.py ---
+
+import time
+from typing import Callable, Optional
+
+# Khoảng cách tối thiểu (giây) giữa hai lần báo tiến độ của cùng một tác vụ
+PROGRESS_REPORT_INTERVAL_S = 0.2
+
+# Nơi nhận báo cáo tiến độ (job_id, progress). Trong tiến trình worker, đây là hàm put của
+# hàng đợi liên tiến trình; trong chế độ thread/inline là hàm cập nhật job store trực tiếp.
+_progress_sink: Optional[Callable[[tuple], None]] = None
+
+
+def set_progress_sink(sink: Optional[Callable[[tuple], None]]) -> None:
+    global _progress_sink
+    _progress_sink = sink
+
+
+class TaskContext:
+    """
+    Ngữ cảnh của một tác vụ tìm kiếm: hạn chót (deadline), cờ hết giờ và báo cáo tiến độ.
+
+    Các engine (forward chaining, tìm đường phản ứng, tìm chuỗi luật tính toán, nhận biết)
+    nhận một TaskContext tùy chọn và định kỳ gọi expired() trong vòng lặp để tự dừng
+    (hủy hợp tác - cooperative cancellation), sau đó trả về kết quả một phần.
+
+    Deadline dùng time.time() (đồng hồ hệ thống) để có thể truyền qua các tiến trình worker.
+    Nếu tác vụ thuộc một job bất đồng bộ (job_id khác None), engine gọi report(...) để cập nhật
+    tiến độ (vòng lặp, số trạng thái đã duyệt...); các lần gọi dày đặc được tự động giãn ra.
+    """
+
+    __slots__ = ('deadline', 'endpoint', 'timed_out', 'job_id', '_last_report')
+
+    def __init__(self, deadline: Optional[float] = None, endpoint: str = '', job_id: Optional[str] = None):
+        self.deadline = deadline
+        self.endpoint = endpoint
+        self.timed_out = False
+        self.job_id = job_id
+        self._last_report = 0.0
+
+    @classmethod
+    def with_timeout(cls, timeout_s: Optional[float], endpoint: str = '', job_id: Optional[str] = None) -> 'TaskContext':
+        deadline = time.time() + timeout_s if timeout_s else None
+        return cls(deadline, endpoint, job_id)
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def expired(self) -> bool:
+        """True nếu đã quá hạn; đồng thời ghi nhận timed_out để engine đánh dấu kết quả là một phần."""
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.timed_out = True
+            return True
+        return False
+
+    def report(self, force: bool = False, **progress) -> None:
+        """Báo tiến độ cho job (no-op nếu tác vụ không thuộc job nào)."""
+        if self.job_id is None or _progress_sink is None:
+            return
+        now = time.time()
+        if not force and now - self._last_report < PROGRESS_REPORT_INTERVAL_S:
+            return
+        self._last_report = now
+        _progress_sink((self.job_id, progress))
+
+    def __getstate__(self):
+        return self.deadline, self.endpoint, self.timed_out, self.job_id
+
+    def __setstate__(self, state):
+        self.deadline, self.endpoint, self.timed_out, self.job_id = state
+        self._last_report = 0.0
+
+
+def expired(ctx: Optional[TaskContext]) -> bool:
+    """Tiện ích cho engine: ctx có thể là None (không giới hạn thời gian)."""
+    return ctx is not None and ctx.expired()
+
+
+def report(ctx: Optional[TaskContext], **progress) -> None:
+    """Tiện ích cho engine: báo tiến độ nếu có ctx."""
+    if ctx is not None:
+        ctx.report(**progress)
@@ -0,0 +1,90 @@
+"""
+Fixture dùng chung: app trên CSDL SQLite tạm với một bộ luật nhỏ, worker pool dạng luồng.
+
+Cơ sở tri thức là toàn cục trong tiến trình nên app được tạo một lần cho cả phiên kiểm thử;
+các kiểm thử sửa dữ liệu tự tải lại cơ sở tri thức (kb_reload.reload_now) sau khi sửa.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADMIN_TOKEN = 'test-admin-token'
+
+ELEMENTS = [
+    ('H', 1, 1.008, 1), ('O', 8, 15.999, 2), ('Na', 11, 22.99, 1), ('Cl', 17, 35.45, 1),
+    ('Fe', 26, 55.845, 3), ('C', 6, 12.011, 4), ('Ba', 56, 137.33, 2), ('S', 16, 32.06, 6),
+    ('Cu', 29, 63.546, 2), ('N', 7, 14.007, 3),
+]
+
+# (loại, chất tham gia, sản phẩm, điều kiện, phương trình)
+REACTIONS = [
+    ('thế', ['Fe', 'HCl'], ['FeCl2', 'H2'], [], 'Fe + 2HCl -> FeCl2 + H2'),
+    ('hóa hợp', ['Fe', 'Cl2'], ['FeCl3'], ['t°'], '2Fe + 3Cl2 -> 2FeCl3'),
+    ('trung hòa', ['NaOH', 'HCl'], ['NaCl', 'H2O'], [], 'NaOH + HCl -> NaCl + H2O'),
+    ('trao đổi', ['BaCl2', 'Na2SO4'], ['BaSO4', 'NaCl'], [], 'BaCl2 + Na2SO4 -> BaSO4 + 2NaCl'),
+    ('hóa hợp', ['H2', 'Cl2'], ['HCl'], ['ánh sáng'], 'H2 + Cl2 -> 2HCl'),
+    ('oxi hóa', ['FeCl2', 'Cl2'], ['FeCl3'], [], '2FeCl2 + Cl2 -> 2FeCl3'),
+    ('trao đổi', ['FeCl3', 'NaOH'], ['Fe(OH)3', 'NaCl'], [], 'FeCl3 + 3NaOH -> Fe(OH)3 + 3NaCl'),
+    ('phân hủy', ['Fe(OH)3'], ['Fe2O3', 'H2O'], ['t°'], '2Fe(OH)3 -> Fe2O3 + 3H2O'),
+    ('oxi hóa', ['Cu', 'Cl2'], ['CuCl2'], ['t°'], 'Cu + Cl2 -> CuCl2'),
+    ('trao đổi', ['CuCl2', 'NaOH'], ['Cu(OH)2', 'NaCl'], [], 'CuCl2 + 2NaOH -> Cu(OH)2 + 2NaCl'),
+    ('phân hủy', ['Cu(OH)2'], ['CuO', 'H2O'], ['t°'], 'Cu(OH)2 -> CuO + H2O'),
+]
+
+RULES = [
+    ('n_tu_m', 'n = m / M', ['m', 'M'], 'n', 'm / M'),
+    ('m_tu_n', 'm = n * M', ['n', 'M'], 'm', 'n * M'),
+    ('C_tu_n', 'C = n / V', ['n', 'V'], 'C', 'n / V'),
+]
+
+
+def seed(db, models) -> None:
+    db.drop_all()
+    db.create_all()
+    for mark, number, mass, valence in ELEMENTS:
+        db.session.add(models.ElementModel(mark=mark, atomic_number=number, atomic_mass=mass, valence=valence))
+    for kind, reactants, products, conditions, equation in REACTIONS:
+        db.session.add(models.ReactionModel(
+            type=kind, description=' + '.join(reactants), reactants_json=json.dumps(reactants),
+            products_json=json.dumps(products), conditions_json=json.dumps(conditions),
+            equation_string=equation, phenomena='', phenomena_detail_json={}))
+    for name, formula, inputs, output, expression in RULES:
+        db.session.add(models.ChemicalRuleModel(name=name, formula=formula, description=name,
+                                                required_inputs=inputs, output_var=output, expression=expression))
+    db.session.commit()
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    import api_server
+    import models
+
+    url = 'sqlite:///' + str(tmp_path_factory.mktemp('db') / 'chem.db')
+    app = api_server.create_app({
+        'SQLALCHEMY_DATABASE_URI': url,
+        'KB_LOAD': api_server.KB_LOAD_OFF,
+        'WORKER_MODE': 'thread',
+        'WORKER_COUNT': 2,
+        'WORKER_QUEUE_LIMIT': 2,
+        'ADMIN_TOKEN': ADMIN_TOKEN,
+        'TESTING': True,
+    })
+    with app.app_context():
+        seed(models.db, models)
+    api_server.start(app)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_headers():
+    return {'X-Admin-Token': ADMIN_TOKEN}
@@ -0,0 +1,46 @@
+"""/api/forward-chaining/batch: cùng kết quả với từng lời gọi đơn, gộp đầu vào trùng và mã lỗi."""
+
+import pytest
+
+ITEMS = [
+    {'reactants': 'Fe + HCl + Cl2', 'conditions': ''},
+    {'reactants': 'Fe + Cl2 + NaOH', 'conditions': 't°'},
+    {'reactants': 'NaOH + Cl2 + Fe', 'conditions': ' t° '},
+    {'reactants': 'BaCl2 + Na2SO4'},
+    {'reactants': 'Không có'},
+]
+
+
+def test_batch_matches_single_calls(client):
+    response = client.post('/api/forward-chaining/batch', json={'items': ITEMS})
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['count'] == len(ITEMS) and data['unique'] == len(ITEMS) - 1
+    singles = [client.post('/api/forward-chaining', json=item).get_json()['data'] for item in ITEMS]
+    assert data['results'] == singles
+    assert data['results'][1] == data['results'][2]
+
+
+def test_batch_applies_view_to_every_item(client):
+    body = {'items': ITEMS[:2], 'fields': 'final_products,reactions_count'}
+    results = client.post('/api/forward-chaining/batch', json=body).get_json()['data']['results']
+    assert all(set(result) == {'final_products', 'reactions_count'} for result in results)
+
+
+@pytest.mark.parametrize('body', [
+    {},
+    {'items': []},
+    {'items': 'Fe + HCl'},
+    {'items': [{'reactants': 'Fe + HCl'}, {'conditions': 't°'}]},
+    {'items': [{'reactants': 'Fe + HCl'}], 'cursor': 'abc'},
+])
+def test_batch_rejects_bad_requests(client, body):
+    response = client.post('/api/forward-chaining/batch', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_batch_limits_item_count(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'BATCH_MAX_ITEMS', 2)
+    response = client.post('/api/forward-chaining/batch', json={'items': ITEMS[:3]})
+    assert response.status_code == 413
@@ -0,0 +1,69 @@
+"""Bộ benchmark tổng hợp: dữ liệu có seed lặp lại được, ghi CSDL một lần và phát hiện hồi quy khi so báo cáo."""
+
+import json
+
+from sqlalchemy import create_engine, func, select, table
+
+from benchmarks import synthetic
+from benchmarks.bench_engines import compare_reports
+
+
+def test_generators_are_deterministic():
+    assert list(synthetic.reaction_rows(50)) == list(synthetic.reaction_rows(50))
+    assert list(synthetic.calculation_rows(50)) == list(synthetic.calculation_rows(50))
+    assert synthetic.reactant_queries(50, 10) == synthetic.reactant_queries(50, 10)
+    assert synthetic.equation_corpus(20) == synthetic.equation_corpus(20)
+    assert list(synthetic.reaction_rows(50, seed=1)) != list(synthetic.reaction_rows(50, seed=2))
+
+
+def test_generated_rows_are_well_formed():
+    rows = list(synthetic.reaction_rows(100))
+    assert len(rows) == 100
+    pool = set(synthetic.species_pool(100))
+    for row in rows:
+        assert set(json.loads(row['reactants_json'])) <= pool
+        assert set(json.loads(row['products_json'])) <= pool
+    variables = synthetic.calculation_variables(100)
+    for rule in synthetic.calculation_rows(100):
+        # Đồ thị không chu trình: biến đầu vào luôn đứng trước biến đầu ra
+        assert all(variables.index(v) < variables.index(rule['output_var']) for v in rule['required_inputs'])
+
+
+def test_seed_database_writes_once(tmp_path):
+    url = 'sqlite:///' + str(tmp_path / 'bench.db')
+    assert synthetic.seed_database(url, 40)
+    assert not synthetic.seed_database(url, 40)
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        count = conn.execute(select(func.count()).select_from(table('reactions'))).scalar()
+    engine.dispose()
+    assert count == 40
+    assert synthetic.seed_database(url, 40, seed=7)
+
+
+def test_percentile():
+    assert synthetic.percentile([], 0.5) == 0.0
+    assert synthetic.percentile([1.0, 2.0, 3.0, 4.0], 0.5) == 2.5
+    assert synthetic.percentile([1.0, 2.0, 3.0, 4.0], 1.0) == 4.0
+
+
+def _report(**metrics):
+    row = {'engine': 'forward_chaining', 'size': 100, 'p50_ms': 1.0, 'p90_ms': 2.0, 'p99_ms': 3.0,
+           'throughput_per_s': 1000.0, 'rss_peak_mb': 50.0}
+    row.update(metrics)
+    return {'results': [row]}
+
+
+def test_compare_flags_regressions():
+    rows = compare_reports(_report(), _report(p90_ms=2.5, throughput_per_s=850.0, rss_peak_mb=52.0), threshold=0.10)
+    flagged = {row['metric'] for row in rows if row['regression']}
+    assert flagged == {'p90_ms', 'throughput_per_s'}
+    assert not any(row['regression'] for row in compare_reports(_report(), _report(p50_ms=0.5)))
+
+
+def test_compare_ignores_noise_and_unmatched_rows():
+    rows = compare_reports(_report(p50_ms=0.01), _report(p50_ms=0.04), min_ms=0.05)
+    assert not next(row for row in rows if row['metric'] == 'p50_ms')['regression']
+    other = _report()
+    other['results'][0]['size'] = 1000
+    assert compare_reports(_report(), other) == []
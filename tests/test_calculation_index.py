@@ -0,0 +1,86 @@
+"""Chỉ mục luật tính toán: cùng kết quả với quét toàn bộ bảng luật, và mã trạng thái của /api/calculate_rule."""
+
+import pickle
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks import synthetic
+from calculation_index import CalculationRuleIndex
+from chemistry_data import execute_rule_expression
+from rule_records import CalculationRule
+
+SIZE = 300
+
+
+def scan_applicable(rules, available):
+    return [i for i, rule in enumerate(rules) if all(v in available for v in rule.required_inputs)]
+
+
+def scan_most_specific(rules, available):
+    candidates = [(len(set(rules[i].required_inputs)), -i) for i in scan_applicable(rules, available)]
+    return -max(candidates)[1] if candidates else None
+
+
+@pytest.fixture(scope='module')
+def rules():
+    return [CalculationRule.from_row(SimpleNamespace(id=i + 1, **row))
+            for i, row in enumerate(synthetic.calculation_rows(SIZE))]
+
+
+@pytest.fixture(scope='module')
+def available_sets():
+    rng = random.Random(7)
+    variables = synthetic.calculation_variables(SIZE)
+    return [set(rng.sample(variables, rng.randint(0, 12))) for _ in range(200)]
+
+
+def test_index_matches_linear_scan(rules, available_sets):
+    index = CalculationRuleIndex(rules)
+    matched_any = False
+    for available in available_sets:
+        assert index.applicable(available) == scan_applicable(rules, available)
+        assert index.most_specific(available) == scan_most_specific(rules, available)
+        matched_any = matched_any or index.most_specific(available) is not None
+    assert matched_any
+
+
+def test_compiled_expressions_match_source(rules):
+    index = CalculationRuleIndex(rules)
+    values = {name: float(i % 7 + 1) for i, name in enumerate(synthetic.calculation_variables(SIZE))}
+    for position, rule in enumerate(rules):
+        assert execute_rule_expression(index.expression(position), values) == \
+            execute_rule_expression(rule.expression, values)
+
+
+def test_index_survives_pickling(rules, available_sets):
+    index = pickle.loads(pickle.dumps(CalculationRuleIndex(rules)))
+    for available in available_sets[:20]:
+        assert index.applicable(available) == scan_applicable(rules, available)
+    assert index.compiled[0] is not None
+
+
+def test_best_match_prefers_more_inputs_then_table_order(client):
+    response = client.post('/api/calculate_rule', json={'inputs': {'m': 10, 'M': 2, 'n': 3, 'V': 0.5}})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['rule_used']['name'] == 'n_tu_m' and body['result'] == 5.0
+
+
+def test_all_matches_in_table_order(client):
+    response = client.post('/api/calculate_rule', json={'inputs': {'m': 10, 'M': 2, 'n': 3, 'V': 0.5}, 'match': 'all'})
+    body = response.get_json()
+    assert response.status_code == 200 and body['count'] == 3
+    assert [item['rule_used']['name'] for item in body['results']] == ['n_tu_m', 'm_tu_n', 'C_tu_n']
+    assert [item['result'] for item in body['results']] == [5.0, 6.0, 6.0]
+
+
+@pytest.mark.parametrize('body, status', [
+    ({'inputs': {'x': 1}}, 404),
+    ({'inputs': {'m': 1, 'M': 2}, 'match': 'first'}, 400),
+    ({'inputs': {'m': 1, 'M': 0}}, 400),
+])
+def test_calculate_rule_errors(client, body, status):
+    response = client.post('/api/calculate_rule', json=body)
+    assert response.status_code == status and response.get_json()['success'] is False
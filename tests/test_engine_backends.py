@@ -0,0 +1,125 @@
+"""
+Các backend suy luận tiến (agenda theo chỉ mục, bao đóng ma trận, bố cục phẳng) phải cho đúng kết quả
+của thuật toán gốc: quét tuần tự toàn bộ danh sách luật mỗi vòng tới khi không còn gì mới.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import fact_closure
+import kb_flat
+import knowledge_base
+import result_cache
+from benchmarks import synthetic
+from chemistry_data import conditions_satisfied, parse_input_to_set
+from forward_chaining import derive
+from knowledge_base import KnowledgeBase
+from reaction_index import REACTANT_INDEX
+from rule_records import ReactionRule
+from species import REGISTRY
+
+SIZE = 400
+
+
+def full_scan(rules, reactants_str, conditions_str):
+    """Suy luận tiến tham chiếu: (id các luật theo thứ tự kích hoạt, chất mới, số vòng)."""
+    known = parse_input_to_set(reactants_str, '+')
+    initial = set(known)
+    conditions = parse_input_to_set(conditions_str, ',')
+    used = set()
+    fired = []
+    iterations = 0
+    something_new = True
+    while something_new:
+        something_new = False
+        iterations += 1
+        for i, rule in enumerate(rules):
+            if i in used or not all(r in known for r in rule.required_reactants):
+                continue
+            if not conditions_satisfied(rule, conditions, check_conditions=bool(conditions)):
+                continue
+            used.add(i)
+            fired.append(rule.id)
+            for product in rule.products:
+                if product not in known:
+                    known.add(product)
+                    something_new = True
+    return fired, sorted(known - initial), iterations
+
+
+def _engine(reactants_str, conditions_str):
+    derivation = derive(reactants_str, conditions_str)
+    return [r.id for r in derivation.rules], sorted(REGISTRY.names(derivation.new_fact_ids)), derivation.iterations
+
+
+@pytest.fixture(scope='module')
+def catalogue():
+    rules = [ReactionRule.from_row(SimpleNamespace(id=i + 1, **row))
+             for i, row in enumerate(synthetic.reaction_rows(SIZE))]
+    kb = KnowledgeBase(rules, [], {}, source='synthetic')
+    # Dựng chỉ mục (đánh số chất của luật) trước khi tra id của đầu vào
+    kb.derived(REACTANT_INDEX)
+    return kb
+
+
+@pytest.fixture(scope='module')
+def queries():
+    return synthetic.reactant_queries(SIZE, 40) + [('H2O + X1 + X2', 'xt, t°'), ('Không có', '')]
+
+
+@pytest.fixture
+def pinned():
+    tokens = []
+
+    def _pin(kb):
+        result_cache.FORWARD_CHAINING.clear()
+        tokens.append(knowledge_base.pin(kb))
+
+    yield _pin
+    for token in reversed(tokens):
+        knowledge_base.unpin(token)
+    result_cache.FORWARD_CHAINING.clear()
+
+
+@pytest.fixture
+def matrix_backend():
+    fact_closure.enable(True)
+    yield
+    fact_closure.enable(False)
+
+
+def _assert_matches_full_scan(kb, queries):
+    fired_any = False
+    for reactants, conditions in queries:
+        expected = full_scan(kb.reaction_rules, reactants, conditions)
+        assert _engine(reactants, conditions) == expected, (reactants, conditions)
+        fired_any = fired_any or bool(expected[0])
+    assert fired_any
+
+
+def test_agenda_matches_full_scan(app, catalogue, queries, pinned):
+    pinned(catalogue)
+    _assert_matches_full_scan(catalogue, queries)
+
+
+def test_matrix_backend_matches_full_scan(app, catalogue, queries, pinned, matrix_backend):
+    kb = catalogue.replace()
+    pinned(kb)
+    _assert_matches_full_scan(kb, queries)
+
+
+def test_flat_layout_matches_full_scan(app, catalogue, queries, pinned, matrix_backend):
+    kb = kb_flat.flatten(catalogue)
+    pinned(kb)
+    _assert_matches_full_scan(kb, queries)
+
+
+def test_closure_equals_final_facts(app, catalogue, queries):
+    for reactants, conditions in queries:
+        fired, new_facts, _iterations = full_scan(catalogue.reaction_rules, reactants, conditions)
+        start = REGISTRY.lookup_set(parse_input_to_set(reactants, '+'), canonical=True)
+        condition_set = parse_input_to_set(conditions, ',')
+        facts, rules = fact_closure.closure(start, condition_set, bool(condition_set), kb=catalogue)
+        assert facts - start == REGISTRY.lookup_set(new_facts, canonical=True)
+        assert {catalogue.reaction_rules[i].id for i in rules} == set(fired)
@@ -0,0 +1,58 @@
+"""ETag/304 cho các endpoint tất định."""
+
+import pytest
+
+BALANCE = {'equation': 'Fe + Cl2 -> FeCl3'}
+
+
+def _etag(client):
+    response = client.get('/api/balance-equation', query_string=BALANCE)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def test_get_and_post_share_etag(client):
+    post = client.post('/api/balance-equation', json=BALANCE)
+    assert post.status_code == 200
+    assert post.headers['ETag'] == _etag(client)
+
+
+def test_get_if_none_match_returns_304(client):
+    etag = _etag(client)
+    response = client.get('/api/balance-equation', query_string=BALANCE, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag and not response.data
+
+
+def test_head_if_none_match_returns_304(client):
+    etag = _etag(client)
+    response = client.head('/api/balance-equation', query_string=BALANCE, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_post_if_none_match_returns_412(client):
+    etag = _etag(client)
+    response = client.post('/api/balance-equation', json=BALANCE, headers={'If-None-Match': etag})
+    assert response.status_code == 412
+    assert response.json['success'] is False
+
+
+@pytest.mark.parametrize('method', ['get', 'post'])
+def test_stale_etag_runs_the_endpoint(client, method):
+    headers = {'If-None-Match': '"v0-stale"'}
+    if method == 'get':
+        response = client.get('/api/balance-equation', query_string=BALANCE, headers=headers)
+    else:
+        response = client.post('/api/balance-equation', json=BALANCE, headers=headers)
+    assert response.status_code == 200
+
+
+def test_etag_changes_with_request_body(client):
+    other = client.get('/api/balance-equation', query_string={'equation': 'H2 + Cl2 -> HCl'})
+    assert other.headers['ETag'] != _etag(client)
+
+
+def test_errors_are_not_tagged(client):
+    response = client.post('/api/balance-equation', json={})
+    assert response.status_code == 400
+    assert 'ETag' not in response.headers
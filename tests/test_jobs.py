@@ -0,0 +1,83 @@
+"""Job bất đồng bộ: gộp yêu cầu trùng, hết hạn job chưa kết thúc, mã trạng thái của endpoint."""
+
+import time
+
+import jobs
+import worker_pool
+from jobs import STATUS_DONE, STATUS_FAILED, JobStore
+
+
+def test_pending_jobs_are_deduplicated():
+    store = JobStore()
+    job, created = store.get_or_create('identify', {'chemicals': ['A', 'B']}, 10)
+    again, created_again = store.get_or_create('identify', {'chemicals': ['A', 'B']}, 10)
+    assert created and not created_again and again is job
+
+
+def test_finished_or_failed_job_releases_its_key():
+    store = JobStore()
+    job, _ = store.get_or_create('identify', {'chemicals': ['A', 'B']}, 10)
+    store.finish(job.id, error='boom')
+    assert store.get(job.id).status == STATUS_FAILED
+    fresh, created = store.get_or_create('identify', {'chemicals': ['A', 'B']}, 10)
+    assert created and fresh.id != job.id
+
+
+def test_stuck_job_expires_after_deadline_and_ttl():
+    store = JobStore(result_ttl_s=5)
+    job, _ = store.get_or_create('identify', {'chemicals': ['A', 'B']}, 10)
+    job.deadline = time.time() - 10 - worker_pool.DEADLINE_GRACE_S
+    assert store.get(job.id).status == STATUS_FAILED
+    fresh, created = store.get_or_create('identify', {'chemicals': ['A', 'B']}, 10)
+    assert created and fresh.id != job.id
+    # Kết quả đến muộn của job đã quá hạn bị bỏ qua
+    store.finish(job.id, result={'late': True})
+    assert store.get(job.id).status == STATUS_FAILED and store.get(job.id).result is None
+
+
+def test_job_without_deadline_expires_after_silence():
+    store = JobStore(result_ttl_s=5)
+    job, _ = store.get_or_create('identify', {'chemicals': ['A', 'B']})
+    store.update_progress(job.id, {'iteration': 1})
+    assert store.get(job.id).status == 'running'
+    job.updated_at = time.time() - 6
+    assert store.get(job.id).status == STATUS_FAILED
+
+
+def test_expired_results_are_purged():
+    store = JobStore(result_ttl_s=5)
+    job, _ = store.get_or_create('identify', {'chemicals': ['A', 'B']}, 10)
+    store.finish(job.id, result=1)
+    job.finished_at = time.time() - 6
+    assert store.get(job.id) is None
+
+
+def test_job_endpoint_round_trip(client):
+    response = client.post('/api/jobs', json={'kind': 'forward_chaining', 'params': {'reactants': 'Fe + HCl'}})
+    assert response.status_code == 202
+    job_id = response.json['data']['job_id']
+    data = client.get(f'/api/jobs/{job_id}?wait=5').json['data']
+    assert data['status'] == STATUS_DONE
+    assert 'FeCl2' in data['result']['final_products']
+
+
+def test_job_endpoint_errors(client):
+    assert client.post('/api/jobs', json={'kind': 'nope'}).status_code == 400
+    assert client.post('/api/jobs', json={'kind': 'identify', 'params': []}).status_code == 400
+    assert client.post('/api/jobs', json={'kind': 'identify', 'params': {'chemicals': ['A']}}).status_code == 400
+    assert client.get('/api/jobs/unknown').status_code == 404
+
+
+def test_job_endpoint_busy(client):
+    pool = worker_pool.get_pool()
+    releases = [pool.reserve('test') for _ in range(pool.max_workers + pool.max_queue)]
+    try:
+        response = client.post('/api/jobs', json={'kind': 'balance_batch', 'params': {'equations': ['H2 + O2 -> H2O']}})
+        assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+    finally:
+        for release in releases:
+            release()
+    # Job bị từ chối không giữ khóa gộp
+    job, created = jobs.store.get_or_create('balance_batch', {'equations': ['H2 + O2 -> H2O']})
+    jobs.store.discard(job.id)
+    assert created
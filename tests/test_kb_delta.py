@@ -0,0 +1,68 @@
+"""Tải lại tăng dần theo changelog: kết quả phải trùng với đọc lại toàn bộ CSDL."""
+
+import json
+
+import chemistry_data
+import kb_reload
+import knowledge_base
+import models
+from chemistry_data import build_knowledge_base, refresh_knowledge_base
+
+
+def _as_dicts(rules):
+    return sorted((rule.to_dict() for rule in rules), key=lambda d: d['id'])
+
+
+def _assert_matches_full_rebuild(kb):
+    full = build_knowledge_base(models)
+    assert _as_dicts(kb.reaction_rules) == _as_dicts(full.reaction_rules)
+    assert _as_dicts(kb.chemical_rules) == _as_dicts(full.chemical_rules)
+    assert kb.elements == full.elements
+    assert kb.changelog_cursor == full.changelog_cursor
+
+
+def test_delta_reload_matches_full_rebuild(app):
+    db = models.db
+    with app.app_context():
+        kb_reload.reload_now(app, models, full=True)
+        assert knowledge_base.latest().changelog_cursor is not None
+        assert refresh_knowledge_base(models) is None
+
+        added = models.ReactionModel(type='thế', reactants_json=json.dumps(['Mg', 'HCl']),
+                                     products_json=json.dumps(['MgCl2', 'H2']), conditions_json='[]',
+                                     equation_string='Mg + 2HCl -> MgCl2 + H2')
+        db.session.add(added)
+        rule = db.session.query(models.ChemicalRuleModel).filter_by(name='C_tu_n').one()
+        old_expression = rule.expression
+        rule.expression = '(n) / V'
+        db.session.commit()
+
+        kb = refresh_knowledge_base(models)
+        assert kb is not None and kb.source == 'delta'
+        assert kb is knowledge_base.latest()
+        _assert_matches_full_rebuild(kb)
+        assert any(r.required_reactants == ('Mg', 'HCl') for r in kb.reaction_rules)
+
+        # Xóa và hoàn tác: trạng thái CSDL trở lại như ban đầu cho các kiểm thử khác
+        db.session.delete(added)
+        rule.expression = old_expression
+        db.session.commit()
+        kb = refresh_knowledge_base(models)
+        _assert_matches_full_rebuild(kb)
+        assert not any(r.required_reactants == ('Mg', 'HCl') for r in kb.reaction_rules)
+
+
+def test_too_many_changes_fall_back_to_full_reload(app, monkeypatch):
+    db = models.db
+    monkeypatch.setattr(chemistry_data, 'DELTA_MAX_CHANGES', 1)
+    with app.app_context():
+        kb_reload.reload_now(app, models, full=True)
+        element = db.session.query(models.ElementModel).filter_by(mark='N').one()
+        element.atomic_mass, old_mass = 14.0, element.atomic_mass
+        db.session.commit()
+        element.atomic_mass = old_mass
+        db.session.commit()
+
+        kb = refresh_knowledge_base(models)
+        assert kb is not None and kb.source == 'db'
+        _assert_matches_full_rebuild(kb)
@@ -0,0 +1,61 @@
+"""Bố cục phẳng (mmap): cùng dữ liệu với snapshot dạng đối tượng, engine cho cùng kết quả."""
+
+import pytest
+
+import kb_flat
+import knowledge_base
+import result_cache
+from forward_chaining import run_forward_chaining
+from reaction_path import find_reaction_path
+
+INPUTS = [('Fe + HCl + Cl2', ''), ('Fe + Cl2 + NaOH', 't°'), ('Cu + Cl2 + NaOH', ''), ('BaCl2 + Na2SO4', '')]
+PATHS = [('Fe + Cl2 + NaOH', 'Fe2O3', None), ('Cu + Cl2 + NaOH', 'CuO', 't°'), ('Fe + HCl', 'Fe2O3', None)]
+
+
+def _run_all(kb):
+    result_cache.FORWARD_CHAINING.clear()
+    token = knowledge_base.pin(kb)
+    try:
+        derived = [run_forward_chaining(reactants, conditions) for reactants, conditions in INPUTS]
+        paths = [find_reaction_path(reactants, target, allowed_conditions=allowed)
+                 for reactants, target, allowed in PATHS]
+    finally:
+        knowledge_base.unpin(token)
+        result_cache.FORWARD_CHAINING.clear()
+    return derived, paths
+
+
+@pytest.fixture
+def objects_kb(app):
+    kb = knowledge_base.latest()
+    assert not kb_flat.is_flat(kb) and kb.reaction_rules
+    return kb
+
+
+def test_flat_layout_keeps_rules(objects_kb):
+    flat = kb_flat.flatten(objects_kb)
+    assert kb_flat.is_flat(flat) and kb_flat.flatten(flat) is flat
+    assert [r.to_dict() for r in flat.reaction_rules] == [r.to_dict() for r in objects_kb.reaction_rules]
+    assert [r.to_dict() for r in flat.chemical_rules] == [r.to_dict() for r in objects_kb.chemical_rules]
+    assert flat.elements == objects_kb.elements
+    assert flat.changelog_cursor == objects_kb.changelog_cursor
+
+    rules = flat.reaction_rules
+    assert rules[-1].id == objects_kb.reaction_rules[-1].id
+    assert [r.id for r in rules[1:3]] == [r.id for r in objects_kb.reaction_rules[1:3]]
+    with pytest.raises(IndexError):
+        rules[len(rules)]
+
+
+def test_flat_file_can_be_reopened(objects_kb, tmp_path):
+    path = str(tmp_path / 'kb.flat')
+    flat = kb_flat.flatten(objects_kb, path)
+    reopened = kb_flat.open_flat(path)
+    assert [r.to_dict() for r in reopened.reaction_rules] == [r.to_dict() for r in flat.reaction_rules]
+    assert reopened.source == f'flat:{objects_kb.source}'
+
+
+def test_engines_match_on_flat_layout(objects_kb):
+    baseline = _run_all(objects_kb)
+    assert _run_all(kb_flat.flatten(objects_kb)) == baseline
+    assert baseline[1][0]['success']
@@ -0,0 +1,58 @@
+"""Tải lại nóng: request giữ snapshot đã ghim, endpoint quản trị hoán đổi snapshot và giữ bản cũ khi lỗi."""
+
+import kb_reload
+import knowledge_base
+from knowledge_base import KnowledgeBase
+
+
+def test_pinned_snapshot_survives_publish(app):
+    pinned = knowledge_base.latest()
+    token = knowledge_base.pin()
+    try:
+        newer = knowledge_base.publish(pinned.replace(source='test'))
+        assert newer.version == pinned.version + 1
+        assert knowledge_base.current() is pinned
+        assert knowledge_base.latest() is newer
+    finally:
+        knowledge_base.unpin(token)
+    assert knowledge_base.current() is newer
+
+
+def test_replace_keeps_data_but_drops_derived(app):
+    kb = KnowledgeBase([], [], {'H': {}}, source='test')
+    kb.derived('probe', lambda _kb: object())
+    copy = kb.replace(chemical_rules=['rule'])
+    assert copy.elements is kb.elements and copy.chemical_rules == ['rule']
+    assert copy.derived_items() == {}
+
+
+def test_admin_endpoints_require_token(client):
+    assert client.post('/api/admin/reload').status_code == 403
+    assert client.get('/api/admin/kb').status_code == 403
+    assert client.get('/api/admin/kb', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+
+
+def test_full_reload_publishes_new_version(client, admin_headers):
+    before = knowledge_base.latest()
+    response = client.post('/api/admin/reload?full=1', headers=admin_headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] and body['changed'] and body['previous_version'] == before.version
+    assert body['data']['version'] == before.version + 1
+    assert len(knowledge_base.latest().reaction_rules) == len(before.reaction_rules)
+
+    info = client.get('/api/admin/kb', headers=admin_headers).get_json()
+    assert info['data']['version'] == knowledge_base.latest().version
+
+
+def test_failed_reload_keeps_serving_snapshot(client, admin_headers, monkeypatch):
+    before = knowledge_base.latest()
+
+    def _broken(_models):
+        raise RuntimeError('mất kết nối CSDL')
+
+    monkeypatch.setattr(kb_reload, 'reload_knowledge_base', _broken)
+    response = client.post('/api/admin/reload?full=1', headers=admin_headers)
+    assert response.status_code == 500
+    assert response.get_json()['version'] == before.version
+    assert knowledge_base.latest() is before
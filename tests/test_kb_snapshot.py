@@ -0,0 +1,77 @@
+"""File snapshot biên dịch sẵn: đọc lại đúng dữ liệu, dùng ngay khi còn mới, áp changelog khi cũ."""
+
+import kb_reload
+import kb_snapshot
+import knowledge_base
+import models
+from chemistry_data import build_knowledge_base
+
+
+def _as_dicts(rules):
+    return [rule.to_dict() for rule in rules]
+
+
+def _assert_same_data(kb, expected):
+    assert _as_dicts(kb.reaction_rules) == _as_dicts(expected.reaction_rules)
+    assert _as_dicts(kb.chemical_rules) == _as_dicts(expected.chemical_rules)
+    assert kb.elements == expected.elements
+
+
+def _no_full_reload(_models):
+    raise AssertionError('không được quét lại toàn bộ CSDL')
+
+
+def test_round_trip_keeps_rules_and_derived(app, tmp_path):
+    path = str(tmp_path / 'kb.snapshot')
+    with app.app_context():
+        kb = kb_reload.reload_now(app, models, full=True)
+        header = kb_snapshot.write_snapshot(kb, path, kb_snapshot.db_state(models))
+    assert header['counts']['reactions'] == len(kb.reaction_rules)
+    assert kb_snapshot.read_header(path)['changelog_cursor'] == kb.changelog_cursor
+
+    loaded = kb_snapshot.read_snapshot(path)
+    _assert_same_data(loaded, kb)
+    assert loaded.source == 'snapshot' and loaded.changelog_cursor == kb.changelog_cursor
+    assert set(loaded.derived_items()) == set(kb.derived_items())
+
+
+def test_fresh_snapshot_is_used_without_reading_tables(app, tmp_path, monkeypatch):
+    path = str(tmp_path / 'kb.snapshot')
+    with app.app_context():
+        kb_snapshot.load_or_build(models, path)
+        monkeypatch.setattr(kb_snapshot, 'reload_knowledge_base', _no_full_reload)
+        kb = kb_snapshot.load_or_build(models, path)
+        assert kb.source == 'snapshot' and kb is knowledge_base.latest()
+        _assert_same_data(kb, build_knowledge_base(models))
+
+
+def test_stale_snapshot_is_patched_from_changelog(app, tmp_path, monkeypatch):
+    path = str(tmp_path / 'kb.snapshot')
+    db = models.db
+    with app.app_context():
+        kb_snapshot.load_or_build(models, path)
+        rule = db.session.query(models.ChemicalRuleModel).filter_by(name='m_tu_n').one()
+        old_formula = rule.formula
+        rule.formula = 'm = n × M'
+        db.session.commit()
+        try:
+            monkeypatch.setattr(kb_snapshot, 'reload_knowledge_base', _no_full_reload)
+            kb = kb_snapshot.load_or_build(models, path)
+            assert kb.source == 'delta'
+            _assert_same_data(kb, build_knowledge_base(models))
+            # File được ghi lại với con trỏ changelog mới
+            assert kb_snapshot.read_header(path)['changelog_cursor'] == kb.changelog_cursor
+        finally:
+            rule.formula = old_formula
+            db.session.commit()
+            kb_reload.reload_now(app, models, full=True)
+
+
+def test_invalid_file_falls_back_to_database(app, tmp_path):
+    path = tmp_path / 'kb.snapshot'
+    path.write_bytes(b'not a snapshot')
+    assert kb_snapshot.read_header(str(path)) is None
+    with app.app_context():
+        kb = kb_snapshot.load_or_build(models, str(path))
+        assert kb.source == 'db'
+    assert kb_snapshot.read_header(str(path))['changelog_cursor'] == kb.changelog_cursor
@@ -0,0 +1,32 @@
+"""Bộ đếm, thời gian từng giai đoạn và endpoint /metrics."""
+
+import metrics
+
+
+def test_metrics_endpoint_exposes_request_and_engine_counters(client):
+    client.post('/api/forward-chaining', json={'reactants': 'Fe + HCl', 'conditions': ''})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    text = response.get_data(as_text=True)
+    assert 'endpoint="api_forward_chaining"' in text
+    assert 'chem_engine_runs_total{engine="forward_chaining"}' in text
+    assert 'endpoint="api_forward_chaining",stage="search"' in text
+
+
+def test_counter_and_histogram_render():
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter('t_total', 'Đếm thử.', ('kind',)))
+    histogram = registry.register(metrics.Histogram('t_seconds', 'Thời gian thử.', ('kind',)))
+    counter.inc(2, kind='a')
+    histogram.observe(0.02, kind='a')
+    text = registry.render()
+    assert 't_total{kind="a"} 2' in text
+    assert 't_seconds_count{kind="a"} 1' in text
+    assert '# TYPE t_seconds histogram' in text
+
+
+def test_stage_records_duration():
+    with metrics.stage('unit-test'):
+        pass
+    assert 'stage="unit-test"' in metrics.render_prometheus()
@@ -0,0 +1,103 @@
+"""Bảng chuẩn hóa: giải mã giống luật trong bộ nhớ, và nguồn luật CSDL cho cùng kết quả với snapshot."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import select
+
+import kb_reload
+import knowledge_base
+import models
+import reaction_index
+import result_cache
+from forward_chaining import run_forward_chaining
+from migrate_normalise import sync_reaction_links
+from reaction_path import find_reaction_path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INPUTS = [('Fe + HCl + Cl2', ''), ('Fe + Cl2 + NaOH', 't°'), ('Cu + Cl2 + NaOH + Zn', ''), ('BaCl2 + Na2SO4', '')]
+PATHS = [('Fe + Cl2 + NaOH', 'Fe2O3', None), ('Fe + Cl2 + NaOH', 'Fe2O3', 't°'), ('Zn + HCl', 'ZnCl2', None)]
+
+
+@pytest.fixture(scope='module')
+def normalised(app):
+    with app.app_context():
+        # Chất/điều kiện viết kèm khoảng trắng và ký hiệu trạng thái: phải được chuẩn hóa như trong bộ nhớ
+        models.db.session.add(models.ReactionModel(
+            type='thế', reactants_json=json.dumps([' Zn ', 'HCl(dd)']), products_json=json.dumps(['ZnCl2', 'H2↑']),
+            conditions_json=json.dumps([' t° ']), equation_string='Zn + 2HCl -> ZnCl2 + H2'))
+        models.db.session.commit()
+        sync_reaction_links(models)
+    kb_reload.reload_now(app, models, full=True)
+    return app
+
+
+def _linked_species(table, reaction_id):
+    chemicals_t = models.ChemicalModel.__table__
+    with models.db.engine.connect() as conn:
+        return tuple(conn.execute(select(chemicals_t.c.formula).join(table, table.c.chemical_id == chemicals_t.c.id)
+                                  .where(table.c.reaction_id == reaction_id).order_by(table.c.position)).scalars())
+
+
+def _linked_conditions(reaction_id):
+    conditions_t = models.ReactionConditionModel.__table__
+    with models.db.engine.connect() as conn:
+        return tuple(conn.execute(select(conditions_t.c.condition).where(conditions_t.c.reaction_id == reaction_id)
+                                  .order_by(conditions_t.c.position)).scalars())
+
+
+def test_link_tables_match_in_memory_rules(normalised):
+    with normalised.app_context():
+        for rule in knowledge_base.current().reaction_rules:
+            assert _linked_species(models.ReactionReactantModel.__table__, rule.id) == rule.required_reactants
+            assert _linked_species(models.ReactionProductModel.__table__, rule.id) == rule.products
+            assert _linked_conditions(rule.id) == rule.required_conditions
+
+
+def _run_all():
+    result_cache.FORWARD_CHAINING.clear()
+    derived = [run_forward_chaining(reactants, conditions) for reactants, conditions in INPUTS]
+    paths = [find_reaction_path(reactants, target, allowed_conditions=allowed) for reactants, target, allowed in PATHS]
+    return derived, paths
+
+
+def test_db_rule_source_matches_memory(normalised, monkeypatch):
+    with normalised.app_context():
+        baseline = _run_all()
+        monkeypatch.setattr(reaction_index, '_db_source', None)
+        reaction_index.configure_db_source(models.db.engine, models)
+        from_db = _run_all()
+    result_cache.FORWARD_CHAINING.clear()
+    assert from_db == baseline
+    assert baseline[1][2]['success']
+
+
+# Tiến trình mới: bảng đánh số chất còn trống, chỉ nguồn luật CSDL được cấu hình (không nạp snapshot)
+DB_ONLY_SCRIPT = """
+import json, sys
+from sqlalchemy import create_engine
+import models, reaction_index, species
+from tests.test_normalised_schema import INPUTS, PATHS
+from forward_chaining import run_forward_chaining
+from reaction_path import find_reaction_path
+
+assert len(species.REGISTRY) == 0
+reaction_index.configure_db_source(create_engine(sys.argv[1]), models)
+derived = [run_forward_chaining(reactants, conditions) for reactants, conditions in INPUTS]
+paths = [find_reaction_path(reactants, target, allowed_conditions=allowed) for reactants, target, allowed in PATHS]
+print(json.dumps([derived, paths]))
+"""
+
+
+def test_db_rule_source_with_empty_registry(normalised):
+    with normalised.app_context():
+        baseline = json.loads(json.dumps(list(_run_all())))
+    result_cache.FORWARD_CHAINING.clear()
+    output = subprocess.run([sys.executable, '-c', DB_ONLY_SCRIPT, normalised.config['SQLALCHEMY_DATABASE_URI']],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert json.loads(output) == baseline
+    assert baseline[0][0]['final_products'] and baseline[1][2]['success']
@@ -0,0 +1,27 @@
+"""Profile theo yêu cầu: chỉ với admin token, lưu lại và xem qua /api/admin/profiles."""
+
+BODY = {'reactants': 'Fe + HCl + Cl2', 'conditions': ''}
+
+
+def test_profile_ignored_without_admin_token(client):
+    response = client.post('/api/forward-chaining', json=BODY, headers={'X-Profile': 'inline'})
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers and 'profile' not in response.json
+
+
+def test_inline_profile(client, admin_headers):
+    response = client.post('/api/forward-chaining', json=BODY, headers={**admin_headers, 'X-Profile': 'inline'})
+    assert response.status_code == 200
+    profile = response.json['profile']
+    assert profile['endpoint'] == 'api_forward_chaining'
+    assert profile['top_functions'] and profile['total_time'] >= 0
+
+
+def test_stored_profile_listing(client, admin_headers):
+    response = client.post('/api/forward-chaining?_profile=1', json=BODY, headers=admin_headers)
+    profile_id = int(response.headers['X-Profile-Id'])
+    listing = client.get('/api/admin/profiles', headers=admin_headers).json['data']
+    assert profile_id in [p['id'] for p in listing]
+    assert client.get(f'/api/admin/profiles/{profile_id}', headers=admin_headers).status_code == 200
+    assert client.get('/api/admin/profiles/999999', headers=admin_headers).status_code == 404
+    assert client.get('/api/admin/profiles').status_code == 403
@@ -0,0 +1,120 @@
+"""Nhập hàng loạt phản ứng: kiểm tra dòng, ghi id và bảng chuẩn hóa cùng transaction, mã lỗi endpoint."""
+
+import json
+
+import pytest
+from sqlalchemy import select
+
+import models
+import reaction_import
+from reaction_import import import_reactions, validate_inline
+
+
+def _links(reaction_ids):
+    reactants_t = models.ReactionReactantModel.__table__
+    chemicals_t = models.ChemicalModel.__table__
+    with models.db.engine.connect() as conn:
+        rows = conn.execute(select(reactants_t.c.reaction_id, chemicals_t.c.formula)
+                            .join(chemicals_t, chemicals_t.c.id == reactants_t.c.chemical_id)
+                            .where(reactants_t.c.reaction_id.in_(reaction_ids))).all()
+    links = {}
+    for reaction_id, formula in rows:
+        links.setdefault(reaction_id, set()).add(formula)
+    return links
+
+
+@pytest.mark.parametrize('returning', [True, False])
+def test_insert_rows_returns_ids_and_writes_links(app, monkeypatch, returning):
+    with app.app_context():
+        dialect = models.db.engine.dialect
+        monkeypatch.setattr(dialect, 'insert_executemany_returning_sort_by_parameter_order', returning)
+        rows = [{'type': 'test', 'description': None, 'reactants_json': json.dumps([f'Q{returning}{i}', 'O2']),
+                 'products_json': json.dumps([f'Q{returning}{i}O']), 'conditions_json': '[]',
+                 'equation_string': None, 'phenomena': None, 'phenomena_detail_json': None} for i in range(3)]
+        ids = reaction_import._insert_rows(models, rows)
+        assert len(ids) == 3
+        stored = {r.id: r.reactants_json for r in models.ReactionModel.query.filter(models.ReactionModel.id.in_(ids))}
+        assert [stored[i] for i in ids] == [row['reactants_json'] for row in rows]
+        assert _links(ids) == {i: {f'Q{returning}{n}', 'O2'} for n, i in enumerate(ids)}
+
+
+def test_insert_rows_rolls_back_links_with_rows(app, monkeypatch):
+    def fail(*_args, **_kwargs):
+        raise RuntimeError('boom')
+
+    with app.app_context():
+        before = models.ReactionModel.query.count()
+        monkeypatch.setattr(reaction_import, 'write_reaction_links', fail)
+        with pytest.raises(RuntimeError):
+            reaction_import._insert_rows(models, [{'type': 'test', 'reactants_json': '["Na"]',
+                                                   'products_json': '["Na2O"]', 'conditions_json': '[]'}])
+        assert models.ReactionModel.query.count() == before
+
+
+def test_import_rejects_invalid_and_duplicate_rows(app):
+    records = [
+        (1, {'type': 'hóa hợp', 'equation': '4Na + O2 -> 2Na2O'}),
+        (2, {'type': 'thế', 'equation': 'Fe + 2HCl -> FeCl2 + H2'}),
+        (3, {'type': 'x', 'equation': 'Cu + O2 -> CuO'}),
+        (4, {'type': 'x', 'reactants': 'Zz + O2', 'products': 'ZzO'}),
+        (5, {'type': 'hóa hợp', 'equation': '4Na + O2 -> 2Na2O'}),
+    ]
+    rejected = {}
+    with app.app_context():
+        summary = import_reactions(models, records, validate_inline,
+                                   on_rejected=lambda line, reason, _record: rejected.update({line: reason}))
+    assert summary['inserted'] == 1 and summary['rejected'] == 4 and summary['duplicates'] == 2
+    assert set(rejected) == {2, 3, 4, 5}
+    assert '2Cu + O2 -> 2CuO' in rejected[3]
+
+
+@pytest.mark.parametrize('equation, reason', [
+    ('Fe( -> Fe', 'ngoặc không cân đối'),
+    ('Fe] -> Fe', 'ngoặc không cân đối'),
+    ('Fe{ -> Fe', 'ngoặc không cân đối'),
+    ('Fe(] + Cl2 -> FeCl2', 'ngoặc không cân đối'),
+    ('Fe + Cl2! -> FeCl2', 'ký tự không hợp lệ'),
+    ('CuSO4.Fe -> CuSO4 + Fe', 'ký tự không hợp lệ'),
+    ('Fe -> Fe', 'giống hệt nhau'),
+    ('Fe + HCl -> HCl + Fe', 'giống hệt nhau'),
+])
+def test_validate_rejects_malformed_species(equation, reason):
+    rules = reaction_import.ImportRules(frozenset(), {})
+    with pytest.raises(ValueError, match=reason):
+        reaction_import.validate_record({'type': 'x', 'equation': equation}, rules)
+
+
+@pytest.mark.parametrize('equation', [
+    'CuSO4.5H2O -> CuSO4 + 5H2O',
+    'Fe3+ + 3OH- -> Fe(OH)3',
+    '4Fe + 3[O2] -> 2Fe2O3',
+])
+def test_validate_accepts_charges_hydrates_and_brackets(equation):
+    row, _key = reaction_import.validate_record({'type': 'x', 'equation': equation},
+                                                reaction_import.ImportRules(frozenset(), {}))
+    assert row['equation_string'] == equation
+
+
+def test_endpoint_requires_admin(client):
+    assert client.post('/api/admin/import', json={'reactions': []}).status_code == 403
+
+
+def test_endpoint_rejects_unreadable_body(client, admin_headers):
+    response = client.post('/api/admin/import?format=json', data=b'{bad', headers=admin_headers)
+    assert response.status_code == 400
+
+
+def test_endpoint_limits_rows(app, client, admin_headers, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMPORT_MAX_ROWS', 2)
+    response = client.post('/api/admin/import', json={'reactions': [{'type': 'x'}] * 3}, headers=admin_headers)
+    assert response.status_code == 413
+
+
+def test_endpoint_imports_and_reloads(client, admin_headers):
+    body = {'reactions': [{'type': 'hóa hợp', 'reactants': ['H2', 'O2'], 'products': ['H2O'], 'conditions': ['t°']}]}
+    response = client.post('/api/admin/import?dry_run=1', json=body, headers=admin_headers)
+    assert response.status_code == 200 and response.json['data']['inserted'] == 0
+    response = client.post('/api/admin/import', json=body, headers=admin_headers)
+    assert response.status_code == 200 and response.json['data']['inserted'] == 1
+    facts = client.post('/api/forward-chaining', json={'reactants': 'H2 + O2', 'conditions': 't°'}).json['data']
+    assert 'H2O' in facts['final_products']
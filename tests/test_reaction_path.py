@@ -0,0 +1,74 @@
+"""Tìm đường phản ứng: đường đi trả về phải thực hiện được từ tập chất ban đầu."""
+
+import pytest
+
+from chemistry_data import parse_input_to_set
+from reaction_path import find_reaction_path
+from species import canonical_formula
+
+
+def replay(initial: str, path, allowed=None):
+    """Thực hiện lần lượt các phản ứng của đường đi; trả về tập chất cuối cùng."""
+    known = parse_input_to_set(initial, '+')
+    for step in path:
+        reactants = {canonical_formula(r) for r in step['reactants']}
+        assert reactants <= known, f"{step['equation_string']}: thiếu {sorted(reactants - known)}"
+        if allowed is not None:
+            assert set(step['conditions']) <= allowed
+        known |= {canonical_formula(p) for p in step['products']}
+    return known
+
+
+def count_changes(path) -> int:
+    changes, regime = 0, None
+    for step in path:
+        signature = frozenset(step['conditions'])
+        if signature:
+            changes += signature != regime
+            regime = signature
+    return changes
+
+
+@pytest.mark.parametrize('initial, target, allowed', [
+    ('Fe + Cl2 + NaOH', 'Fe2O3', 't°'),
+    ('Fe + Cl2 + NaOH', 'Fe2O3', None),
+    ('Fe + HCl + Cl2 + NaOH', 'Fe(OH)3', ''),
+    ('Cu + Cl2 + NaOH', 'CuO', 't°'),
+    ('Fe + H2 + Cl2 + NaOH', 'Fe2O3', 't°, ánh sáng'),
+])
+def test_path_replays_from_initial_set(app, initial, target, allowed):
+    result = find_reaction_path(initial, target, allowed_conditions=allowed)
+    assert result['success'], result
+    allowed_set = None if allowed is None else parse_input_to_set(allowed, ',')
+    assert canonical_formula(target) in replay(initial, result['path'], allowed_set)
+    if allowed is not None:
+        assert result['path_steps'] == len(result['path'])
+        assert result['condition_changes'] == count_changes(result['path'])
+
+
+def test_constrained_path_includes_every_derived_reactant(app):
+    result = find_reaction_path('Fe + Cl2 + NaOH', 'Fe2O3', allowed_conditions='t°')
+    equations = [step['equation_string'] for step in result['path']]
+    assert equations == ['2Fe + 3Cl2 -> 2FeCl3', 'FeCl3 + 3NaOH -> Fe(OH)3 + 3NaCl', '2Fe(OH)3 -> Fe2O3 + 3H2O']
+    # Cả hai bước đều dưới t°, bước giữa không cần điều kiện
+    assert result['condition_changes'] == 1
+
+
+def test_constrained_path_respects_allowed_conditions(app):
+    # HCl chỉ tạo được dưới ánh sáng; không có Fe + Cl2 [t°] thì không tới được FeCl3
+    result = find_reaction_path('Fe + H2 + Cl2 + NaOH', 'Fe(OH)3', allowed_conditions='')
+    assert not result['success']
+
+
+@pytest.mark.parametrize('allowed', [None, 't°', ''])
+def test_target_in_initial_set_is_trivial_path(app, allowed):
+    result = find_reaction_path('Fe + Cl2', 'Fe', allowed_conditions=allowed)
+    assert result['success']
+    assert result['path'] == [] and result['path_steps'] == 0
+
+
+def test_endpoint_target_in_initial_set(client):
+    response = client.post('/api/find-reaction-path',
+                           json={'reactants': 'Fe + Cl2 + NaOH', 'target': 'Fe', 'allowed_conditions': 't°'})
+    assert response.status_code == 200
+    assert response.json['data']['path'] == []
@@ -0,0 +1,92 @@
+"""Request log và phát lại: ghi đúng request cần ghi, đọc/lập lịch log và phát lại trong tiến trình."""
+
+import json
+
+from flask import Flask, jsonify, request
+
+import request_log
+from benchmarks import replay
+
+
+def _logged_app(path):
+    app = Flask('request-log-test')
+    app.config['REQUEST_LOG_PATH'] = str(path)
+
+    @app.route('/api/echo', methods=['POST'])
+    def echo():
+        return jsonify(request.get_json()), 201
+
+    @app.route('/api/admin/secret', methods=['POST'])
+    def secret():
+        return jsonify({})
+
+    @app.route('/metrics')
+    def metrics_page():
+        return 'ok'
+
+    request_log.init_app(app)
+    return app
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_requests_are_logged_except_admin_and_metrics(tmp_path):
+    path = tmp_path / 'requests.jsonl'
+    app = _logged_app(path)
+    client = app.test_client()
+    client.post('/api/echo?x=1', json={'reactants': 'Fe + HCl'}, headers={'X-Timeout-Ms': '250'})
+    client.post('/api/admin/secret', json={'token': 'bí mật'})
+    client.get('/metrics')
+    app.extensions['chem_request_log'].close()
+
+    records = _read(path)
+    assert len(records) == 1
+    record = records[0]
+    assert (record['method'], record['path'], record['query'], record['status']) == ('POST', '/api/echo', 'x=1', 201)
+    assert record['body'] == {'reactants': 'Fe + HCl'} and record['timeout_ms'] == '250'
+    assert record['endpoint'] == 'echo' and record['latency_ms'] >= 0
+
+
+def test_logging_is_off_without_path():
+    app = Flask('request-log-off')
+    request_log.init_app(app)
+    assert 'chem_request_log' not in app.extensions
+
+
+def test_load_records_skips_stateful_and_omitted(tmp_path):
+    path = tmp_path / 'log.jsonl'
+    lines = [{'path': '/api/forward-chaining', 'body': {}}, {'path': '/api/sessions/abc/add', 'body': {}},
+             {'path': '/api/jobs/1'}, {'path': '/api/balance-equation', 'body_omitted': True}]
+    path.write_text('\n'.join(json.dumps(line) for line in lines) + '\n\n', encoding='utf-8')
+    assert [r['path'] for r in replay.load_records(str(path))] == ['/api/forward-chaining']
+    assert len(replay.load_records(str(path), include_stateful=True)) == 3
+
+
+def test_schedule_modes():
+    records = [{'ts': 100.0}, {'ts': 101.0}, {'ts': 103.0}]
+    assert [due for due, _ in replay.schedule(records, 1, rate=None, speed=None, poisson=False, seed=1)] == [None] * 3
+    assert [due for due, _ in replay.schedule(records, 2, rate=2.0, speed=None, poisson=False, seed=1)] == \
+        [0.0, 0.5, 1.0, 1.5, 2.0, 2.5]
+    assert [due for due, _ in replay.schedule(records, 2, rate=None, speed=2.0, poisson=False, seed=1)] == \
+        [0.0, 0.5, 1.5, 1.5, 2.0, 3.0]
+
+
+def test_in_process_replay_reproduces_statuses(client):
+    records = [
+        {'method': 'POST', 'path': '/api/forward-chaining', 'body': {'reactants': 'Fe + HCl'}, 'status': 200},
+        {'method': 'POST', 'path': '/api/forward-chaining', 'body': {}, 'status': 400},
+        {'method': 'POST', 'path': '/api/balance-equation', 'body': {'equation': 'H2 + O2 -> H2O'}, 'status': 200},
+        {'method': 'GET', 'path': '/api/forward-chaining', 'query': 'reactants=Fe%20%2B%20HCl', 'status': 200},
+    ]
+    target = replay.InProcessClient(client.application)
+    before = replay._cache_counts(target.metrics_text())
+    results, elapsed = replay.replay(target, replay.schedule(records, 3, None, None, False, 0), concurrency=2)
+    report = replay.build_report(results, elapsed, before, replay._cache_counts(target.metrics_text()))
+
+    assert report['total']['requests'] == 12 and report['total']['status_mismatch'] == 0
+    assert report['total']['client_errors'] == 3 and report['total']['error_rate'] == 0.0
+    assert report['endpoints']['/api/forward-chaining']['requests'] == 9
+    assert report['result_cache']['hits'] > 0
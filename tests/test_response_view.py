@@ -0,0 +1,82 @@
+"""Phản hồi gọn/phân trang: chọn trường, mức chi tiết, duyệt cursor và mã lỗi 400 cho tham số sai."""
+
+import pytest
+
+import forward_chaining
+
+BODY = {'reactants': 'Fe + HCl + Cl2 + NaOH + Cu', 'conditions': 't°'}
+
+
+def _forward(client, **params):
+    response = client.post('/api/forward-chaining', json=dict(BODY, **params))
+    return response.status_code, response.get_json()
+
+
+def test_default_response_is_full(client):
+    status, body = _forward(client)
+    assert status == 200
+    assert set(body['data']) == set(forward_chaining.FIELDS[:9])
+    assert len(body['data']['reactions_used']) >= 5
+
+
+def test_fields_and_verbosity(client):
+    _status, full = _forward(client)
+    _status, picked = _forward(client, fields='final_products, reactions_count')
+    assert picked['data'] == {'final_products': full['data']['final_products'],
+                              'reactions_count': len(full['data']['reactions_used'])}
+
+    _status, summary = _forward(client, verbosity='summary')
+    assert set(summary['data']) == set(forward_chaining.DEFAULT_FIELDS['summary'])
+
+    _status, compact = _forward(client, verbosity='compact')
+    assert len(compact['data']['reactions_used']) == len(full['data']['reactions_used'])
+    assert len(str(compact['data']['reactions_used'])) < len(str(full['data']['reactions_used']))
+
+
+def test_cursor_walks_every_reaction(client):
+    _status, full = _forward(client)
+    collected, cursor = [], None
+    while True:
+        params = {'limit': 2} if cursor is None else {'cursor': cursor, 'limit': 2}
+        status, body = _forward(client, **params)
+        assert status == 200
+        collected.extend(body['data']['reactions_used'])
+        page = body['data']['page']
+        assert page['total'] == len(full['data']['reactions_used'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert collected == full['data']['reactions_used']
+
+
+def test_cursor_from_another_result_is_rejected(client):
+    _status, body = _forward(client, limit=1)
+    cursor = body['data']['page']['next_cursor']
+    response = client.post('/api/forward-chaining', json={'reactants': 'Fe + HCl', 'cursor': cursor})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('params', [
+    {'fields': 'final_products,bogus'},
+    {'fields': [1, 2]},
+    {'verbosity': 'tiny'},
+    {'limit': 0},
+    {'limit': 'nhiều'},
+    {'cursor': '%%%'},
+])
+def test_bad_view_parameters(client, params):
+    status, body = _forward(client, **params)
+    assert status == 400 and body['success'] is False
+
+
+def test_query_string_parameters(client):
+    response = client.get('/api/forward-chaining', query_string={'reactants': 'Fe + HCl', 'fields': 'final_products'})
+    assert response.status_code == 200
+    assert response.get_json()['data'] == {'final_products': ['FeCl2', 'H2']}
+
+
+def test_balance_equation_summary(client):
+    response = client.post('/api/balance-equation', json={'equation': 'Fe + Cl2 -> FeCl3', 'verbosity': 'summary'})
+    assert response.status_code == 200
+    full = client.post('/api/balance-equation', json={'equation': 'Fe + Cl2 -> FeCl3'}).get_json()
+    assert len(str(response.get_json())) < len(str(full))
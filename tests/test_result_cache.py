@@ -0,0 +1,70 @@
+"""Cache kết quả engine: chính sách GreedyDual-Size, dùng lại kết quả suy luận và vô hiệu theo phiên bản."""
+
+import time
+
+import knowledge_base
+import result_cache
+from forward_chaining import derive
+from result_cache import ResultCache
+from task_context import TaskContext
+
+
+def test_cheap_entries_are_evicted_first():
+    cache = ResultCache('test', max_entries=2)
+    cache.put('cheap', 1, cost=0.001)
+    cache.put('expensive', 2, cost=1.0)
+    cache.put('medium', 3, cost=0.1)
+    assert cache.get('cheap') is None
+    assert cache.get('expensive') == 2 and cache.get('medium') == 3
+
+
+def test_recently_used_entry_survives():
+    cache = ResultCache('test', max_entries=2)
+    cache.put('a', 1, cost=0.5)
+    cache.put('b', 2, cost=0.5)
+    cache.get('a')
+    # Cùng chi phí: mục ít được dùng gần đây nhất bị loại trước (như LRU)
+    cache.put('c', 3, cost=0.5)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_size_limits():
+    cache = ResultCache('test', max_entries=10, max_size=10)
+    cache.put('too-big', 1, cost=1.0, size=11)
+    assert cache.get('too-big') is None
+    cache.put('a', 1, cost=1.0, size=6)
+    cache.put('b', 2, cost=1.0, size=6)
+    assert len(cache) == 1 and cache.get('b') == 2
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResultCache('test', max_entries=0)
+    cache.put('a', 1, cost=1.0)
+    assert not cache.enabled and cache.get('a') is None and len(cache) == 0
+
+
+def test_equivalent_inputs_share_one_derivation(app):
+    result_cache.FORWARD_CHAINING.clear()
+    first = derive('Fe + Cl2 + NaOH', 't°')
+    assert derive(' NaOH+Fe + Cl2(k)', 't°') is first
+    assert derive('Fe + Cl2 + NaOH', '') is not first
+
+
+def test_partial_results_are_not_cached(app):
+    result_cache.FORWARD_CHAINING.clear()
+    expired = TaskContext(deadline=time.time() - 1)
+    partial = derive('Fe + HCl + Cl2', '', ctx=expired)
+    assert partial.partial and len(result_cache.FORWARD_CHAINING) == 0
+    complete = derive('Fe + HCl + Cl2', '')
+    assert not complete.partial and complete.rules
+
+
+def test_publish_invalidates_cached_results(app):
+    result_cache.FORWARD_CHAINING.clear()
+    before = derive('Fe + HCl + Cl2', '')
+    assert len(result_cache.FORWARD_CHAINING) == 1
+    knowledge_base.publish(knowledge_base.latest().replace())
+    assert len(result_cache.FORWARD_CHAINING) == 0
+    after = derive('Fe + HCl + Cl2', '')
+    assert after is not before and after.to_dict() == before.to_dict()
@@ -0,0 +1,50 @@
+"""Bộ nạp luật bằng Core select: cùng dữ liệu với đối tượng ORM, đọc theo lô và theo id cho kết quả như nhau."""
+
+import models
+from chemistry_data import fetch_chemical_rules, fetch_elements, fetch_reaction_rules, iter_row_batches
+from rule_records import decode_json_list, decode_species_list
+from species import canonical_formula
+
+
+def _orm_reaction(model):
+    data = model.to_dict()
+    for key in ('reactants', 'products'):
+        data[key] = [canonical_formula(v) for v in data[key]]
+    return data
+
+
+def test_reaction_records_match_orm(app):
+    with app.app_context():
+        orm = [_orm_reaction(m) for m in models.ReactionModel.query.order_by(models.ReactionModel.id)]
+        assert [rule.to_dict() for rule in fetch_reaction_rules(models)] == orm
+
+
+def test_chemical_rule_records_match_orm(app):
+    with app.app_context():
+        orm = [m.to_dict() for m in models.ChemicalRuleModel.query.order_by(models.ChemicalRuleModel.id)]
+        assert [rule.to_dict() for rule in fetch_chemical_rules(models)] == orm
+
+
+def test_elements_match_orm(app):
+    with app.app_context():
+        expected = {m.mark: {'num': m.atomic_number, 'mass': m.atomic_mass, 'valence': m.valence}
+                    for m in models.ElementModel.query}
+        assert fetch_elements(models) == expected
+
+
+def test_batches_and_id_filter(app):
+    table = models.ReactionModel.__table__
+    with app.app_context():
+        batches = list(iter_row_batches(models, table, batch_size=3))
+        assert all(len(batch) <= 3 for batch in batches)
+        ids = [row.id for batch in batches for row in batch]
+        assert ids == sorted(ids) and len(ids) == models.ReactionModel.query.count()
+
+        picked = ids[1::2]
+        assert [rule.id for rule in fetch_reaction_rules(models, picked)] == picked
+
+
+def test_decode_helpers_tolerate_bad_json():
+    assert decode_json_list(None) == () and decode_json_list('  ') == () and decode_json_list('[oops') == ()
+    assert decode_json_list('["a", 1]') == ('a', 1)
+    assert decode_species_list('[" H2O(l) ", "BaSO4↓"]') == ('H2O', 'BaSO4')
@@ -0,0 +1,77 @@
+"""Phiên suy luận tăng dần: kết quả trùng với một lần suy luận trên toàn bộ đầu vào, mã lỗi của endpoint."""
+
+import time
+
+import pytest
+
+import knowledge_base
+from sessions import SessionStore
+
+STEPS = [
+    [{'reactants': 'Fe'}, {'reactants': 'Cl2'}, {'reactants': 'NaOH + HCl'}],
+    [{'reactants': 'Cu + NaOH'}, {'conditions': 't°'}, {'reactants': 'Cl2'}],
+    [{'reactants': 'H2 + Cl2'}, {'reactants': 'Fe + X-lạ'}, {'reactants': 'BaCl2 + Na2SO4'}],
+]
+
+
+def _joined(steps, key, separator):
+    return separator.join(step[key] for step in steps if step.get(key))
+
+
+@pytest.mark.parametrize('steps', STEPS)
+def test_session_matches_full_run(client, steps):
+    response = client.post('/api/sessions', json=steps[0])
+    assert response.status_code == 201
+    state = response.get_json()['data']
+    assert response.headers['Location'] == f"/api/sessions/{state['session_id']}"
+    for step in steps[1:]:
+        response = client.post(f"/api/sessions/{state['session_id']}/add", json=step)
+        assert response.status_code == 200
+        state = response.get_json()['data']
+
+    full = client.post('/api/forward-chaining', json={
+        'reactants': _joined(steps, 'reactants', ' + '), 'conditions': _joined(steps, 'conditions', ', '),
+    }).get_json()['data']
+    assert state['final_products'] == full['final_products']
+    assert state['total_facts'] == full['total_facts']
+    assert state['reactions_fired'] == len(full['reactions_used'])
+
+
+def test_first_condition_rebuilds_session(client):
+    state = client.post('/api/sessions', json={'reactants': 'Cu + Cl2 + NaOH'}).get_json()['data']
+    assert 'CuO' in state['final_products']
+    state = client.post(f"/api/sessions/{state['session_id']}/add", json={'conditions': 'ánh sáng'}).get_json()['data']
+    assert state['rebuilt'] and 'CuO' not in state['final_products']
+
+
+def test_session_is_rebuilt_after_reload(client):
+    state = client.post('/api/sessions', json={'reactants': 'Fe + HCl'}).get_json()['data']
+    knowledge_base.publish(knowledge_base.latest().replace())
+    state = client.post(f"/api/sessions/{state['session_id']}/add", json={'reactants': 'Cl2'}).get_json()['data']
+    assert state['rebuilt'] and state['kb_version'] == knowledge_base.latest().version
+    assert 'FeCl3' in state['final_products']
+
+
+def test_session_error_codes(client):
+    assert client.get('/api/sessions/missing').status_code == 404
+    assert client.post('/api/sessions/missing/add', json={'reactants': 'Fe'}).status_code == 404
+    assert client.delete('/api/sessions/missing').status_code == 404
+
+    session_id = client.post('/api/sessions', json={}).get_json()['data']['session_id']
+    assert client.post(f'/api/sessions/{session_id}/add', json={}).status_code == 400
+    assert client.get(f'/api/sessions/{session_id}').status_code == 200
+    assert client.delete(f'/api/sessions/{session_id}').status_code == 200
+    assert client.get(f'/api/sessions/{session_id}').status_code == 404
+
+
+def test_store_evicts_least_recently_used_and_expired(app):
+    store = SessionStore(max_sessions=2, ttl_s=60)
+    first, second = store.create(), store.create()
+    store.get(first.id)
+    third = store.create()
+    assert store.get(second.id) is None
+    assert store.get(first.id) is first and store.get(third.id) is third
+
+    first.last_used = time.time() - 61
+    store.get(third.id)
+    assert store.get(first.id) is None
@@ -0,0 +1,47 @@
+"""Chuẩn hóa công thức và bảng đánh số chất: đầu vào của request không được đánh số."""
+
+import pytest
+
+from forward_chaining import run_forward_chaining
+from reaction_path import find_reaction_path
+from species import REGISTRY, canonical_formula, ion_charge, split_species
+
+
+@pytest.mark.parametrize('raw, expected', [
+    (' H2O ', 'H2O'), ('H₂O(l)', 'H2O'), ('BaSO4↓', 'BaSO4'), ('CuSO4·5H2O', 'CuSO4.5H2O'),
+    ('Fe^3+', 'Fe3+'), ('Fe(3+)', 'Fe3+'), ('HO-', 'OH-'),
+])
+def test_canonical_formula(raw, expected):
+    assert canonical_formula(raw) == expected
+
+
+def test_split_species_keeps_ion_charges():
+    assert split_species('Fe3+ + OH-') == ['Fe3+ ', ' OH-']
+    assert [s.strip() for s in split_species('Na+ + Cl-')] == ['Na+', 'Cl-']
+
+
+@pytest.mark.parametrize('formula, expected', [
+    ('Fe3+', ('Fe', 3)), ('NO3-', ('NO3', -1)), ('SO42-', ('SO4', -2)), ('NaCl', ('NaCl', 0)),
+])
+def test_ion_charge(formula, expected):
+    assert ion_charge(formula) == expected
+
+
+def test_lookup_set_does_not_intern():
+    size = len(REGISTRY)
+    assert REGISTRY.lookup_set(['Unobtainium-1', 'Unobtainium-2']) == set()
+    assert REGISTRY.lookup('Unobtainium-1') is None
+    assert len(REGISTRY) == size
+
+
+def test_requests_with_unknown_species_do_not_grow_registry(app, client):
+    size = len(REGISTRY)
+    result = run_forward_chaining('Fe + HCl + Xq1', '')
+    assert 'Xq1' in result['total_facts'] and 'FeCl2' in result['final_products']
+    assert not find_reaction_path('Fe + Xq2', 'Xq3')['success']
+    assert find_reaction_path('Fe + Xq4', 'Xq4')['success']
+    assert not find_reaction_path('Fe + Xq5', 'Xq6', allowed_conditions='t°')['success']
+    response = client.post('/api/sessions', json={'reactants': 'Fe + HCl + Xq7'})
+    assert response.status_code == 201
+    assert 'Xq7' in response.json['data']['total_facts']
+    assert len(REGISTRY) == size
@@ -0,0 +1,68 @@
+"""App factory và probe khởi động: /healthz, /readyz, chốt chặn 503 khi chưa sẵn sàng và cấu hình sai."""
+
+import pytest
+
+import api_server
+import startup
+
+
+@pytest.fixture
+def cold_app(tmp_path):
+    """App mới chưa chạy các giai đoạn tải dữ liệu (KB_LOAD=off)."""
+    app = api_server.create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'cold.db'),
+        'KB_LOAD': api_server.KB_LOAD_OFF,
+        'TESTING': True,
+    })
+    yield app
+    startup.READY_GAUGE.set(1)
+
+
+def test_ready_app_reports_phases(client):
+    assert client.get('/healthz').status_code == 200
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['ready'] and body['status'] == startup.READY and body['error'] is None
+    assert {'imports', 'config', 'extensions', 'schema', 'knowledge_base', 'worker_pool', 'kb_poller'} <= set(body['phases'])
+    assert body['kb_version'] is not None
+
+
+def test_requests_wait_until_ready(cold_app):
+    client = cold_app.test_client()
+    assert client.get('/healthz').status_code == 200
+    assert client.get('/metrics').status_code == 200
+    readyz = client.get('/readyz')
+    assert readyz.status_code == 503 and readyz.get_json()['status'] == startup.STARTING
+
+    blocked = client.post('/api/forward-chaining', json={'reactants': 'Fe + HCl'})
+    assert blocked.status_code == 503 and blocked.headers['Retry-After'] == '1'
+
+    startup.run(cold_app, [('noop', lambda: None)])
+    assert client.get('/readyz').status_code == 200
+    assert client.post('/api/balance-equation', json={'equation': 'H2 + O2 -> H2O'}).status_code == 200
+
+
+def test_failed_startup_is_reported(cold_app):
+    def _broken():
+        raise RuntimeError('không kết nối được CSDL\nchi tiết')
+
+    with pytest.raises(RuntimeError):
+        startup.run(cold_app, [('schema', _broken)])
+    client = cold_app.test_client()
+    body = client.get('/readyz').get_json()
+    assert body['status'] == startup.FAILED and body['error'] == 'RuntimeError: không kết nối được CSDL'
+    assert 'schema' in body['phases']
+    blocked = client.post('/api/forward-chaining', json={'reactants': 'Fe'})
+    assert blocked.status_code == 503 and 'thất bại' in blocked.get_json()['error']
+
+
+def test_background_startup(cold_app):
+    thread = startup.run(cold_app, [('slow', lambda: None)], background=True)
+    thread.join(5)
+    assert startup.state(cold_app).ready
+
+
+def test_invalid_kb_load_is_rejected():
+    with pytest.raises(ValueError):
+        api_server.create_app({'KB_LOAD': 'lazy'})
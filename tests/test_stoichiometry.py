@@ -0,0 +1,65 @@
+"""/api/stoichiometry: cân bằng từng bước, chất giới hạn, nhiều kịch bản và mã lỗi."""
+
+import pytest
+
+from chemistry_data import get_molar_mass
+
+
+def _post(client, body):
+    response = client.post('/api/stoichiometry', json=body)
+    return response.status_code, response.get_json()
+
+
+def test_limiting_reagent(client):
+    status, body = _post(client, {'path': ['Fe + Cl2 -> FeCl3'], 'amounts': {'Fe': {'n': 0.2}, 'Cl2': {'n': 0.2}},
+                                  'target': 'FeCl3'})
+    assert status == 200
+    step = body['steps'][0]
+    assert step['equation'] == '2Fe + 3Cl2 -> 2FeCl3'
+    assert step['limiting_reagent'] == 'Cl2'
+    assert body['target']['n'] == pytest.approx(0.2 * 2 / 3)
+    assert body['final_amounts']['Fe']['n'] == pytest.approx(0.2 - 0.2 * 2 / 3)
+    assert body['final_amounts']['Cl2']['n'] == pytest.approx(0)
+
+
+def test_masses_and_excess_reagents(client):
+    fe_mass = get_molar_mass('Fe')
+    status, body = _post(client, {'path': ['Fe + Cl2 -> FeCl3'], 'amounts': {'Fe': {'m': fe_mass * 0.2}},
+                                  'target': 'FeCl3'})
+    assert status == 200
+    assert body['steps'][0]['excess_reagents'] == ['Cl2']
+    assert body['target']['m'] == pytest.approx(0.2 * get_molar_mass('FeCl3'))
+
+
+def test_scenarios_are_vectorised(client):
+    status, body = _post(client, {'path': ['Fe + Cl2 -> FeCl3'], 'amounts': {'Fe': {'n': [0.2, 0.6]}},
+                                  'target': 'FeCl3'})
+    assert status == 200 and body['scenarios'] == 2
+    assert body['target']['n'] == pytest.approx([0.2, 0.6])
+
+
+def test_path_is_searched_when_missing(client):
+    status, body = _post(client, {'amounts': {'Fe': {'n': 0.2}}, 'reactants': 'Fe + Cl2 + NaOH', 'target': 'Fe2O3'})
+    assert status == 200
+    assert body['path'][-1] == '2Fe(OH)3 -> Fe2O3 + 3H2O'
+    assert body['target']['n'] == pytest.approx(0.1)
+
+
+@pytest.mark.parametrize('body', [
+    {'path': ['Fe + Cl2 -> FeCl3']},
+    {'path': 'Fe + Cl2 -> FeCl3', 'amounts': {'Fe': {'n': 1}}},
+    {'path': ['Fe + Cl2 = FeCl3'], 'amounts': {'Fe': {'n': 1}}},
+    {'path': ['Fe -> Cl2'], 'amounts': {'Fe': {'n': 1}}},
+    {'path': ['Fe + Cl2 -> FeCl3'], 'amounts': {'Fe': {'n': -1}}},
+    {'path': ['Fe + Cl2 -> FeCl3'], 'amounts': {'Fe': {'n': 1, 'm': 2}}},
+    {'path': ['Fe + Cl2 -> FeCl3'], 'amounts': {'Cu': {'n': 1}}},
+    {'amounts': {'Fe': {'n': 1}}},
+])
+def test_bad_requests(client, body):
+    status, response = _post(client, body)
+    assert status == 400 and response['success'] is False
+
+
+def test_unreachable_target(client):
+    status, body = _post(client, {'amounts': {'Cu': {'n': 1}}, 'target': 'Fe2O3'})
+    assert status == 404 and body['success'] is False
@@ -0,0 +1,77 @@
+"""Luồng sự kiện NDJSON/SSE: nội dung sự kiện và giới hạn chung với worker pool."""
+
+import json
+
+import pytest
+
+import worker_pool
+
+STREAMS = [
+    ('/api/forward-chaining/stream', {'reactants': 'Fe + HCl + Cl2'}),
+    ('/api/find-reaction-path/stream', {'reactants': 'Fe + Cl2 + NaOH', 'target': 'Fe2O3', 'allowed_conditions': 't°'}),
+]
+
+
+@pytest.fixture
+def full_pool(app):
+    """Chiếm mọi chỗ của worker pool; nhả lại sau kiểm thử."""
+    pool = worker_pool.get_pool()
+    releases = [pool.reserve('test') for _ in range(pool.max_workers + pool.max_queue)]
+    yield pool
+    for release in releases:
+        release()
+
+
+def _events(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+def test_forward_chaining_stream_ndjson(client):
+    response = client.post('/api/forward-chaining/stream', json={'reactants': 'Fe + HCl'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    events = _events(response)
+    assert events[0]['event'] == 'start' and events[-1]['event'] == 'end'
+    assert {'FeCl2', 'H2'} <= {e['fact'] for e in events if e['event'] == 'fact'}
+
+
+def test_reaction_path_stream_sse(client):
+    response = client.post('/api/find-reaction-path/stream?format=sse', json=STREAMS[1][1])
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    assert 'event: start' in body and 'event: result' in body
+
+
+@pytest.mark.parametrize('path, body', [(path, {}) for path, _body in STREAMS])
+def test_stream_missing_fields(client, path, body):
+    assert client.post(path, json=body).status_code == 400
+
+
+@pytest.mark.parametrize('path, body', STREAMS)
+def test_stream_rejected_when_pool_full(client, full_pool, path, body):
+    response = client.post(path, json=body)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+@pytest.mark.parametrize('path, body', STREAMS)
+def test_stream_releases_its_slot(client, path, body):
+    pool = worker_pool.get_pool()
+    for _ in range(3):
+        response = client.post(path, json=body)
+        assert response.status_code == 200
+        response.get_data()
+        response.close()
+    releases = [pool.reserve('test') for _ in range(pool.max_workers + pool.max_queue)]
+    for release in releases:
+        release()
+
+
+def test_reserve_release_is_idempotent():
+    pool = worker_pool.WorkerPool(1, 0, worker_pool.MODE_THREAD)
+    release = pool.reserve('test')
+    with pytest.raises(worker_pool.PoolBusyError):
+        pool.reserve('test')
+    release()
+    release()
+    pool.reserve('test')()
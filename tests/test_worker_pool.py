@@ -0,0 +1,101 @@
+"""Worker pool: deadline, kết quả một phần, từ chối khi đầy (503) và hết giờ (504)."""
+
+import threading
+import time
+
+import pytest
+
+import api_server
+import worker_pool
+from task_context import TaskContext
+from worker_pool import PoolBusyError, TaskTimeoutError, WorkerPool
+
+
+def _add(a, b, ctx):
+    return a + b
+
+
+def _until_deadline(ctx):
+    while not ctx.expired():
+        time.sleep(0.001)
+    return {'partial': True}
+
+
+def _wait(event, ctx):
+    return event.wait(5)
+
+
+def _sleep(seconds, ctx):
+    time.sleep(seconds)
+    return {'slept': seconds}
+
+
+@pytest.mark.parametrize('mode', [worker_pool.MODE_THREAD, worker_pool.MODE_INLINE, worker_pool.MODE_PROCESS])
+def test_run_returns_result(mode):
+    pool = WorkerPool(1, 1, mode)
+    try:
+        assert pool.run(_add, 2, 3, ctx=TaskContext.with_timeout(5, 'test')) == 5
+        assert pool.run_many(_add, [(1, 1), (2, 2)], TaskContext.with_timeout(5, 'test')) == [2, 4]
+    finally:
+        pool.shutdown(wait=True)
+
+
+def test_engine_stops_at_deadline_with_partial_result():
+    pool = WorkerPool(1, 0, worker_pool.MODE_THREAD)
+    ctx = TaskContext.with_timeout(0.05, 'test')
+    assert pool.run(_until_deadline, ctx=ctx) == {'partial': True}
+    assert ctx.timed_out
+    pool.shutdown(wait=True)
+
+
+def test_task_ignoring_deadline_raises_timeout(monkeypatch):
+    monkeypatch.setattr(worker_pool, 'DEADLINE_GRACE_S', 0.05)
+    pool = WorkerPool(1, 0, worker_pool.MODE_THREAD)
+    with pytest.raises(TaskTimeoutError):
+        pool.run(_sleep, 0.5, ctx=TaskContext.with_timeout(0.05, 'test'))
+    pool.shutdown(wait=True)
+
+
+def test_submit_rejects_when_queue_full():
+    pool = WorkerPool(1, 1, worker_pool.MODE_THREAD)
+    gate = threading.Event()
+    ctx = TaskContext.with_timeout(5, 'test')
+    futures = [pool.submit(_wait, gate, ctx=ctx) for _ in range(2)]
+    with pytest.raises(PoolBusyError):
+        pool.submit(_wait, gate, ctx=ctx)
+    gate.set()
+    for future in futures:
+        pool.collect(future)
+    # Chỗ được nhả khi tác vụ xong
+    assert pool.run(_add, 1, 2, ctx=ctx) == 3
+    pool.shutdown(wait=True)
+
+
+def test_endpoint_returns_503_when_pool_full(client):
+    pool = worker_pool.get_pool()
+    releases = [pool.reserve('test') for _ in range(pool.max_workers + pool.max_queue)]
+    try:
+        response = client.post('/api/find-reaction-path', json={'reactants': 'Fe + HCl', 'target': 'FeCl2'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        for release in releases:
+            release()
+    assert client.post('/api/find-reaction-path', json={'reactants': 'Fe + HCl', 'target': 'FeCl2'}).status_code == 200
+
+
+def test_endpoint_returns_504_when_engine_overruns(client, monkeypatch):
+    monkeypatch.setattr(worker_pool, 'DEADLINE_GRACE_S', 0.05)
+    monkeypatch.setattr(api_server, 'find_reaction_path', lambda *args, ctx, **kwargs: _sleep(0.5, ctx))
+    response = client.post('/api/find-reaction-path', json={'reactants': 'Fe', 'target': 'Fe2O3'},
+                           headers={'X-Timeout-Ms': '50'})
+    assert response.status_code == 504
+    assert response.json['partial'] is True
+    time.sleep(0.5)
+
+
+def test_timeout_header_can_only_shorten_deadline(app):
+    with app.test_request_context(headers={'X-Timeout-Ms': '100'}):
+        assert api_server._request_timeout() == pytest.approx(0.1)
+    with app.test_request_context(headers={'X-Timeout-Ms': str(10 ** 9)}):
+        assert api_server._request_timeout() == app.config['REQUEST_DEADLINE_S']
@@ -0,0 +1,308 @@
+# --- File: worker_pool.py ---
+
+import atexit
+import concurrent.futures
+import contextvars
+import gc
+import logging
+import multiprocessing
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+import metrics
+import task_context
+from task_context import TaskContext
+
+logger = logging.getLogger(__name__)
+
+# ======================================================================
+# HẰNG SỐ VÀ METRIC
+# ======================================================================
+
+MODE_PROCESS = 'process'
+MODE_THREAD = 'thread'
+MODE_INLINE = 'inline'
+
+# Thời gian chờ thêm sau deadline (engine cần một chút thời gian để dừng và trả kết quả một phần)
+DEADLINE_GRACE_S = 1.0
+
+POOL_IN_FLIGHT = metrics.gauge('chem_pool_in_flight', 'Số tác vụ đang chạy hoặc chờ trong worker pool.')
+POOL_REJECTED = metrics.counter('chem_pool_rejected_total', 'Số tác vụ bị từ chối do hàng đợi đầy.', ('endpoint',))
+POOL_TIMEOUTS = metrics.counter('chem_pool_timeouts_total', 'Số tác vụ vượt quá deadline.', ('endpoint',))
+
+
+class PoolBusyError(Exception):
+    """Hàng đợi của worker pool đã đầy; API trả về 503 ngay lập tức."""
+
+
+class TaskTimeoutError(Exception):
+    """Tác vụ không kết thúc kể cả sau deadline + thời gian gia hạn."""
+
+
+# Hàm xử lý báo cáo tiến độ (job_id, progress) ở tiến trình chính (do module jobs đăng ký)
+_progress_handler: Optional[Callable[[str, dict], None]] = None
+
+
+def set_progress_handler(handler: Optional[Callable[[str, dict], None]]) -> None:
+    """
+    Đăng ký nơi nhận tiến độ của các tác vụ. Ở chế độ thread/inline tác vụ chạy trong cùng
+    tiến trình nên gọi thẳng handler; ở chế độ process tiến độ đi qua hàng đợi liên tiến trình.
+    """
+    global _progress_handler
+    _progress_handler = handler
+    task_context.set_progress_sink(_dispatch_progress if handler is not None else None)
+
+
+def _dispatch_progress(item: tuple) -> None:
+    if _progress_handler is not None:
+        job_id, progress = item
+        _progress_handler(job_id, progress)
+
+
+# ======================================================================
+# HÀM CHẠY TRONG WORKER
+# ======================================================================
+
+def _init_worker(progress_queue) -> None:
+    """Khởi tạo tiến trình worker: tiến độ được gửi về tiến trình chính qua hàng đợi."""
+    task_context.set_progress_sink(progress_queue.put if progress_queue is not None else None)
+
+
+def _execute(fn: Callable, args: tuple, kwargs: dict) -> Any:
+    ctx: TaskContext = kwargs['ctx']
+    # Báo "đã bắt đầu chạy" để job chuyển từ queued sang running
+    ctx.report(force=True)
+    return fn(*args, **kwargs)
+
+
+def _run_in_worker(fn: Callable, args: tuple, kwargs: dict, endpoint: str) -> Tuple[Any, dict]:
+    """
+    Chạy engine trong tiến trình worker, trả về (kết quả, phần chênh lệch metric).
+    Metric do engine ghi trong tiến trình con sẽ được cộng lại vào registry của tiến trình chính.
+    """
+    token = metrics.current_endpoint.set(endpoint)
+    before = metrics.REGISTRY.snapshot()
+    try:
+        result = _execute(fn, args, kwargs)
+    finally:
+        metrics.current_endpoint.reset(token)
+    return result, metrics.REGISTRY.delta_since(before)
+
+
+# ======================================================================
+# WORKER POOL
+# ======================================================================
+
+class WorkerPool:
+    """
+    Pool giới hạn cho các engine nặng CPU.
+
+    - max_workers: số tiến trình (hoặc luồng) worker.
+    - max_queue: số tác vụ tối đa được chờ thêm ngoài số đang chạy; vượt quá -> PoolBusyError.
+    - mode: 'process' (mặc định), 'thread' hoặc 'inline' (chạy ngay trên luồng request, dùng khi debug).
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, mode: str = MODE_PROCESS):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.mode = mode
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._progress_queue = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.mode == MODE_PROCESS:
+                    # Chuyển mọi đối tượng hiện có (bộ luật đã tải) sang thế hệ vĩnh viễn của GC: GC trong
+                    # worker không duyệt/ghi vào chúng nữa nên các trang nhớ dùng chung sau fork ít bị sao chép
+                    gc.freeze()
+                    mp_context = multiprocessing.get_context('fork')
+                    self._progress_queue = mp_context.SimpleQueue()
+                    threading.Thread(
+                        target=self._drain_progress, args=(self._progress_queue,),
+                        name='chem-progress', daemon=True
+                    ).start()
+                    # fork: worker thừa hưởng dữ liệu luật đã tải sẵn trong bộ nhớ của tiến trình chính
+                    self._executor = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=mp_context,
+                        initializer=_init_worker, initargs=(self._progress_queue,)
+                    )
+                else:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='chem-worker'
+                    )
+            return self._executor
+
+    def submit(self, fn: Callable, *args, ctx: TaskContext, **kwargs) -> concurrent.futures.Future:
+        """
+        Gửi tác vụ vào pool (không chặn). Ném PoolBusyError nếu hàng đợi đầy.
+        `ctx` được truyền cho engine dưới dạng tham số từ khóa `ctx`.
+        """
+        self._acquire(ctx.endpoint)
+        kwargs['ctx'] = ctx
+        try:
+            if self.mode == MODE_INLINE:
+                future: concurrent.futures.Future = concurrent.futures.Future()
+                try:
+                    future.set_result((_execute(fn, args, kwargs), {}))
+                except BaseException as e:
+                    future.set_exception(e)
+            elif self.mode == MODE_PROCESS:
+                future = self._get_executor().submit(_run_in_worker, fn, args, kwargs, ctx.endpoint)
+            else:
+                # Luồng dùng chung registry nên không cần gộp metric; chạy trong bản sao contextvars
+                # để engine thấy snapshot cơ sở tri thức đã ghim cho request
+                run_ctx = contextvars.copy_context()
+                future = self._get_executor().submit(run_ctx.run, lambda: (_execute(fn, args, kwargs), {}))
+        except BaseException:
+            self._release()
+            raise
+
+        future.add_done_callback(lambda _f: self._release())
+        return future
+
+    def reserve(self, endpoint: str) -> Callable[[], None]:
+        """
+        Giữ một chỗ trong giới hạn của pool cho tác vụ chạy ngoài worker (vd luồng sự kiện chạy trên luồng
+        request), để nó chịu cùng giới hạn hàng đợi. Ném PoolBusyError nếu đầy; trả về hàm nhả chỗ
+        (gọi nhiều lần cũng chỉ nhả một lần).
+        """
+        self._acquire(endpoint)
+        held = [True]
+        lock = threading.Lock()
+
+        def release() -> None:
+            with lock:
+                if not held[0]:
+                    return
+                held[0] = False
+            self._release()
+        return release
+
+    def _acquire(self, endpoint: str) -> None:
+        if not self._slots.acquire(blocking=False):
+            POOL_REJECTED.inc(1, endpoint=endpoint)
+            raise PoolBusyError("Máy chủ đang bận, vui lòng thử lại sau.")
+        POOL_IN_FLIGHT.inc(1)
+
+    def _release(self) -> None:
+        POOL_IN_FLIGHT.dec(1)
+        self._slots.release()
+
+    @staticmethod
+    def _drain_progress(progress_queue) -> None:
+        """Luồng nền: chuyển tiến độ từ các tiến trình worker tới handler (job store)."""
+        while True:
+            item = progress_queue.get()
+            if item is None:
+                return
+            _dispatch_progress(item)
+
+    @staticmethod
+    def collect(future: concurrent.futures.Future, timeout: Optional[float] = None) -> Any:
+        """Lấy kết quả của future trả về bởi submit(), đồng thời gộp metric của worker."""
+        result, metric_delta = future.result(timeout=timeout)
+        if metric_delta:
+            metrics.REGISTRY.merge(metric_delta)
+        return result
+
+    def run(self, fn: Callable, *args, ctx: TaskContext, **kwargs) -> Any:
+        """
+        Gửi tác vụ và chờ kết quả trong giới hạn deadline của ctx (+ thời gian gia hạn).
+        Ném PoolBusyError (hàng đợi đầy) hoặc TaskTimeoutError (engine không kịp dừng).
+        """
+        future = self.submit(fn, *args, ctx=ctx, **kwargs)
+        remaining = ctx.remaining()
+        wait_s = None if remaining is None else remaining + DEADLINE_GRACE_S
+        try:
+            result = self.collect(future, timeout=wait_s)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            POOL_TIMEOUTS.inc(1, endpoint=ctx.endpoint)
+            raise TaskTimeoutError("Tác vụ vượt quá thời gian cho phép.")
+
+        if isinstance(result, dict) and result.get('partial'):
+            POOL_TIMEOUTS.inc(1, endpoint=ctx.endpoint)
+        return result
+
+    def run_many(self, fn: Callable, arg_lists: List[tuple], ctx: TaskContext) -> List[Any]:
+        """
+        Chạy fn(*args, ctx=ctx) cho từng phần tử của arg_lists song song trên các worker, trả kết quả
+        theo đúng thứ tự. Tất cả dùng chung deadline của ctx; nếu hàng đợi không nhận hết thì các tác vụ
+        đã gửi vẫn chạy xong nhưng lời gọi ném PoolBusyError.
+        """
+        futures = [self.submit(fn, *args, ctx=ctx) for args in arg_lists]
+        remaining = ctx.remaining()
+        wait_s = None if remaining is None else remaining + DEADLINE_GRACE_S
+        results = []
+        try:
+            for future in futures:
+                results.append(self.collect(future, timeout=wait_s))
+                remaining = ctx.remaining()
+                wait_s = None if remaining is None else remaining + DEADLINE_GRACE_S
+        except concurrent.futures.TimeoutError:
+            for future in futures:
+                future.cancel()
+            POOL_TIMEOUTS.inc(1, endpoint=ctx.endpoint)
+            raise TaskTimeoutError("Tác vụ vượt quá thời gian cho phép.")
+        return results
+
+    def recycle(self) -> None:
+        """
+        Bỏ executor hiện tại để lần submit tiếp theo tạo worker mới. Ở chế độ process, worker mới
+        được fork từ tiến trình chính nên thừa hưởng snapshot cơ sở tri thức vừa công bố;
+        các tác vụ đang chạy trên worker cũ vẫn hoàn tất với snapshot cũ.
+        """
+        if self.mode == MODE_PROCESS:
+            self.shutdown(wait=False)
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Đóng pool; các tác vụ đã nhận vẫn được chạy xong (wait=False: đóng ở luồng nền)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            progress_queue, self._progress_queue = self._progress_queue, None
+
+        def _close():
+            if executor is not None:
+                executor.shutdown(wait=True)
+            if progress_queue is not None:
+                progress_queue.put(None)
+
+        if wait:
+            _close()
+        else:
+            threading.Thread(target=_close, name='chem-pool-shutdown', daemon=True).start()
+
+
+# ======================================================================
+# POOL DÙNG CHUNG CỦA ỨNG DỤNG
+# ======================================================================
+
+_pool: Optional[WorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def configure_pool(max_workers: int, max_queue: int, mode: str = MODE_PROCESS) -> WorkerPool:
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, WorkerPool(max_workers, max_queue, mode)
+    if old is not None:
+        old.shutdown(wait=False)
+    logger.info("Worker pool: mode=%s, workers=%d, queue=%d", mode, _pool.max_workers, _pool.max_queue)
+    return _pool
+
+
+def get_pool() -> WorkerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool
+
+
+@atexit.register
+def _shutdown_pool() -> None:
+    if _pool is not None:
+        _pool.shutdown(wait=False)